@@ -0,0 +1,474 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Static hazard analyzer (snurisc5.py analyze). Splits the text of a
+#   program into basic blocks, finds the data hazards that stall the
+#   pipeline of the target machine along with their expected stalls, and
+#   optionally reorders independent instructions within each block to
+#   hide them and writes a new executable.
+#
+#==========================================================================
+
+import sys
+
+from consts import *
+from isa import *
+from program import *
+from stages import Signals, SP, P_N, P_PUSH, P_POP, BR_COND
+from config import *
+from rvc import expand
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+# Kinds of hazards, by what the producer computes
+H_LOAD      = 'load-use'                # a register loaded by lw
+H_POP       = 'pop-use'                 # a register loaded by pop
+H_SP        = 'sp'                      # sp updated by push or pop
+H_ALU       = 'alu-use'                 # an ALU result (split EX)
+H_BRANCH    = 'branch'                  # an operand of a branch resolved in ID
+
+HAZARDS     = [ H_LOAD, H_POP, H_SP, H_ALU, H_BRANCH ]
+
+
+#--------------------------------------------------------------------------
+#   Inst: an instruction in the text with the registers it reads and writes
+#--------------------------------------------------------------------------
+
+class Inst(object):
+
+    def __init__(self, pc, inst, raw):
+        self.pc         = pc
+        self.inst       = inst                  # expanded to 32 bits for RV32C
+        self.raw        = raw                   # the encoding in the text (2 or 4 bytes)
+
+        sig = Signals(inst)
+        self.valid      = sig.valid
+        self.p_type     = sig.p_type
+        self.branch     = sig.br_type != BR_N   # branches and jumps
+        self.cond       = sig.br_type in BR_COND
+        self.link       = sig.br_type in [ BR_J, BR_JR ] and sig.rd != 0     # calls
+        self.mem        = bool(sig.dmem_en)
+        self.load       = self.mem and sig.dmem_rw == M_XRD
+        self.reads      = [ int(r) for r, oen in [ (sig.rs1, sig.rs1_oen), (sig.rs2, sig.rs2_oen) ]
+                            if oen and r != 0 ]
+        self.writes     = [ int(SP) ]                   if self.p_type == P_PUSH        else \
+                          [ int(sig.rd), int(SP) ]      if self.p_type == P_POP         else \
+                          [ int(sig.rd) ]               if sig.rf_wen and sig.rd != 0   else \
+                          [ ]
+        self.loaded     = [ int(sig.rd) ] if self.load and sig.rd != 0 else [ ]
+
+        # Instructions that stay where they are: the end of a block, system
+        # calls, stores (which may hit a device, e.g. the exit of SimCtl),
+        # AUIPC (whose result depends on its pc), and anything illegal
+        self.pinned     = self.branch or not self.valid or inst in [ ECALL, EBREAK ] or \
+                          (self.mem and not self.load) or RISCV.opcode(inst) == AUIPC
+
+        # Direct branch and jump targets
+        self.target     = None
+        if self.cond:
+            self.target = (pc + int(SWORD(RISCV.imm_b(inst)))) & 0xffffffff
+        elif sig.br_type == BR_J:
+            self.target = (pc + int(SWORD(RISCV.imm_j(inst)))) & 0xffffffff
+
+    # Whether the block ends after this instruction
+    def ends_block(self):
+        return self.branch or self.inst == EBREAK or not self.valid
+
+    # Whether the instruction after this one can run next: it does unless
+    # this one always jumps away (but a call returns to it) or stops
+    def falls_through(self):
+        return not self.ends_block() or self.cond or self.link
+
+    def asm(self):
+        return Program.disasm(WORD(self.pc), self.inst)
+
+
+#--------------------------------------------------------------------------
+#   Timing: when each instruction leaves ID, from the hazard rules of
+#   Control (and DeepControl for split stages)
+#--------------------------------------------------------------------------
+
+class Timing(object):
+
+    # The stages after ID are numbered by their distance from ID, starting
+    # at 0 for EX. An ALU result (or the sp update of push/pop) can be
+    # forwarded from the last EX sub-stage on, and a loaded value from the
+    # last MM sub-stage on. A branch resolved in ID needs them one stage later.
+    def __init__(self, machine):
+        self.alu_ready  = 1 if SPLIT_EX in machine.split else 0
+        self.load_ready = self.alu_ready + (2 if SPLIT_MM in machine.split else 1)
+        self.early      = machine.resolve == RESOLVE_ID
+
+    # Distance from ID at which c can read reg written by p
+    def ready(self, p, reg, c):
+        r = self.load_ready if reg in p.loaded else self.alu_ready
+        return r + 1 if self.early and c.branch else r
+
+    # Returns the cycle in which c leaves ID, when the previous instruction
+    # left it in cycle t. last maps each register to its latest producer,
+    # the cycle in which that left ID, and its position in the block.
+    def issue(self, c, t, last):
+        t += 1
+        for reg in c.reads:
+            if reg in last:
+                p, tp, k = last[reg]
+                t = max(t, tp + 1 + self.ready(p, reg, c))
+        return t
+
+    def retire(self, c, t, k, last):
+        if c.inst == ECALL:
+            last.clear()            # the next instruction waits until ECALL leaves WB
+        else:
+            for reg in c.writes:
+                last[reg] = (c, t, k)
+
+    def kind(self, p, reg, c):
+        return H_POP    if reg in p.loaded and p.p_type == P_POP   else \
+               H_LOAD   if reg in p.loaded                          else \
+               H_SP     if reg == SP and p.p_type != P_N            else \
+               H_BRANCH if self.early and c.branch and self.alu_ready == 0 else \
+               H_ALU
+
+    # Runs the instructions of a block from an empty pipeline. Returns the
+    # stall cycles and the hazards as (producer, consumer, register, kind,
+    # stalls). A hazard is a consumer closer to its producer than the
+    # forwarding allows, or an sp dependency between neighbors around
+    # push/pop. Its stalls are 0 if an earlier hazard already covers them.
+    def run(self, seq):
+        last = { }
+        hazards = [ ]
+        t = stalls = 0
+        for k, c in enumerate(seq):
+            ts = self.issue(c, t, last)
+            found = [ ]
+            for reg in c.reads:
+                if reg not in last:
+                    continue
+                p, tp, kp = last[reg]
+                r = self.ready(p, reg, c)
+                if k - kp - 1 < r or (reg == SP and k - kp == 1 and (p.p_type != P_N or c.p_type != P_N)):
+                    binding = tp + 1 + r == ts and ts > t + 1 and not any(f[4] for f in found)
+                    found.append((p, c, reg, self.kind(p, reg, c), ts - t - 1 if binding else 0))
+            hazards += found
+            stalls += ts - t - 1
+            t = ts
+            self.retire(c, t, k, last)
+        return stalls, hazards
+
+
+#--------------------------------------------------------------------------
+#   Analyzer: basic blocks of the text and their hazards
+#--------------------------------------------------------------------------
+
+class Analyzer(object):
+
+    # data holds the (start, end) ranges of data in the text (see
+    # Program.data_ranges()), which are not decoded
+    def __init__(self, machine, image, data = ()):
+        self.machine    = machine
+        self.timing     = Timing(machine)
+        self.entry, self.segments = image
+        self.data       = sorted(data)
+
+        # Segments in imem hold the text
+        start, end = machine.imem_start, machine.imem_start + machine.imem_size
+        self.text = [ (vaddr, memsz, data) for vaddr, memsz, data in self.segments
+                      if start <= vaddr < end ]
+        self.insts = [ ]
+        for vaddr, memsz, data in self.text:
+            self.insts += self.decode(vaddr, data)
+        self.skipped = 0                    # bytes of data left out
+        for vaddr, memsz, data in self.text:
+            self.skipped += len(data) - sum(len(c.raw) for c in self.insts if vaddr <= c.pc < vaddr + len(data))
+        self.all_blocks = self.split()
+        self.blocks = self.reachable(self.all_blocks)
+
+    # Returns the end of the data range that holds pc, or None
+    def data_end(self, pc):
+        for start, end in self.data:
+            if start <= pc < end:
+                return end
+        return None
+
+    # Decodes the instructions of a text segment, 16 bits at a time with
+    # RV32C, skipping the data in it
+    def decode(self, vaddr, data):
+        insts = [ ]
+        i = 0
+        while i + 2 <= len(data):
+            end = self.data_end(vaddr + i)
+            if end is not None:
+                i = end - vaddr
+                continue
+            p = int.from_bytes(data[i:i+2], byteorder='little')
+            if self.machine.rvc and p & 3 != 3:
+                insts.append(Inst(vaddr + i, expand(p), data[i:i+2]))
+                i += 2
+            elif i + 4 <= len(data):
+                inst = WORD(int.from_bytes(data[i:i+4], byteorder='little'))
+                insts.append(Inst(vaddr + i, inst, data[i:i+4]))
+                i += 4
+            else:
+                break
+        return insts
+
+    # Blocks start at the entry point, at the targets of direct branches and
+    # jumps, and after the instructions that end a block. Indirect jumps
+    # are assumed to land on one of these (e.g. the return address of JAL).
+    def split(self):
+        leaders = { self.entry }
+        for i, c in enumerate(self.insts):
+            if c.target is not None:
+                leaders.add(c.target)
+            if c.ends_block() and i + 1 < len(self.insts):
+                leaders.add(self.insts[i + 1].pc)
+        blocks = [ ]
+        for i, c in enumerate(self.insts):
+            if not blocks or c.pc in leaders or c.pc != blocks[-1][-1].pc + len(blocks[-1][-1].raw):
+                blocks.append([ ])
+            blocks[-1].append(c)
+        return blocks
+
+    # Returns the blocks that the program can reach from the entry point
+    # through direct branches and jumps, and by falling through (also past
+    # a call, which returns there). Only these are analyzed and reordered,
+    # so that words that are never run (data the ranges do not cover, or
+    # code reached only through a pointer) are left as they are.
+    def reachable(self, blocks):
+        starts = { b[0].pc : b for b in blocks }
+        seen = set()
+        work = [ self.entry ]
+        while work:
+            pc = work.pop()
+            if pc in seen or pc not in starts:
+                continue
+            seen.add(pc)
+            c = starts[pc][-1]
+            if c.target is not None:
+                work.append(c.target)
+            if c.falls_through():
+                work.append(c.pc + len(c.raw))
+        return [ b for b in blocks if b[0].pc in seen ]
+
+    # Reorders the instructions of a block to hide its stalls, keeping the
+    # pinned ones in place. Within the runs between them, an instruction
+    # goes after those it depends on through a register, and loads and
+    # stores stay in order. The list is scheduled greedily: the instruction
+    # that can leave ID first, then the one with the longest path to the
+    # end of the run, then program order.
+    def reorder(self, block):
+        timing = self.timing
+        order = [ ]
+        last = { }
+        t = 0
+        for run in self.runs(block):
+            n = len(run)
+            preds = [ set() for _ in range(n) ]
+            succs = [ [ ] for _ in range(n) ]
+            for j in range(n):
+                for i in range(j):
+                    a, b = run[i], run[j]
+                    raw = set(a.writes) & set(b.reads)
+                    if raw or set(a.reads) & set(b.writes) or set(a.writes) & set(b.writes) or \
+                       (a.mem and b.mem) or a.pinned or b.pinned:
+                        preds[j].add(i)
+                        w = 1 + max([ timing.ready(a, reg, b) for reg in raw ] + [ 0 ])
+                        succs[i].append((j, w))
+            height = [ 0 ] * n
+            for i in reversed(range(n)):
+                height[i] = max([ w + height[j] for j, w in succs[i] ] + [ 0 ])
+
+            left = list(range(n))
+            done = set()
+            while left:
+                ready = [ i for i in left if preds[i] <= done ]
+                best = min(ready, key = lambda i: (timing.issue(run[i], t, last), -height[i], i))
+                t = timing.issue(run[best], t, last)
+                timing.retire(run[best], t, len(order), last)
+                order.append(run[best])
+                left.remove(best)
+                done.add(best)
+        return order
+
+    # Splits a block into runs of movable instructions, with each pinned
+    # instruction in a run of its own
+    def runs(self, block):
+        runs = [ [ ] ]
+        for c in block:
+            if c.pinned:
+                runs += [ [ c ], [ ] ]
+            else:
+                runs[-1].append(c)
+        return [ r for r in runs if r ]
+
+    # Returns the segments of the executable with the blocks in order laid
+    # out in place of the original ones. A reordered block has the same
+    # size and keeps its pinned instructions at their addresses, so no
+    # branch or AUIPC needs to be adjusted.
+    def rewrite(self, order):
+        images = { vaddr : bytearray(data) for vaddr, memsz, data in self.text }
+        for block, new in zip(self.blocks, order):
+            pc = block[0].pc
+            for vaddr, memsz, data in self.text:
+                if vaddr <= pc < vaddr + len(data):
+                    break
+            image = images[vaddr]
+            for c in new:
+                image[pc - vaddr:pc - vaddr + len(c.raw)] = c.raw
+                pc += len(c.raw)
+
+        segments = [ ]
+        for vaddr, memsz, data in self.segments:
+            if vaddr in images:
+                segments.append((vaddr, bytes(images[vaddr]).ljust(memsz, b'\0'), PF_R | PF_X))
+            else:
+                segments.append((vaddr, bytes(data).ljust(memsz, b'\0'), PF_R | PF_W))
+        return segments
+
+
+#--------------------------------------------------------------------------
+#   Report
+#--------------------------------------------------------------------------
+
+def show_machine(timing):
+    print("Hazard window: %d instruction(s) after an ALU result or sp update, %d after a load%s" % \
+          (timing.alu_ready, timing.load_ready,
+           ", one more for branches and jumps (resolved in ID)" if timing.early else ""))
+
+
+def show_hazards(analyzer):
+    total = 0
+    counts = { h : [ 0, 0 ] for h in HAZARDS }
+    stalled = 0
+    for block in analyzer.blocks:
+        stalls, hazards = analyzer.timing.run(block)
+        if not hazards:
+            continue
+        end = block[-1].pc + len(block[-1].raw) - 1
+        print("Block 0x%08x - 0x%08x (%d instructions): %d stall(s)" % (block[0].pc, end, len(block), stalls))
+        for p, c, reg, kind, n in hazards:
+            print("  0x%08x: %-28s -> 0x%08x: %-28s %-8s %-4s %d stall(s)" % \
+                  (p.pc, p.asm(), c.pc, c.asm(), kind, rname[reg], n))
+            counts[kind][0] += 1
+            counts[kind][1] += n
+        total += stalls
+        stalled += 1 if stalls else 0
+    print("Total: %d hazards, %d stall cycles in %d of %d blocks (each block run once)" % \
+          (sum(n for n, s in counts.values()), total, stalled, len(analyzer.blocks)))
+    print("  " + ", ".join("%s %d (%d stalls)" % (h, counts[h][0], counts[h][1]) for h in HAZARDS))
+    return total
+
+
+#--------------------------------------------------------------------------
+#   Utility functions for command line parsing
+#--------------------------------------------------------------------------
+
+def show_usage(name):
+    print("SNURISC5 analyzer: finds the data hazards of a program without running it")
+    print("Usage: %s analyze [--config file] [--resolve s] [--split l] [-o output] filename" % name)
+    print("\tfilename: RISC-V executable file name or assembly source (.s)")
+    print("\t--config, --resolve, --split describe the target machine as for a run (single issue only)")
+    print("\t-o reorders independent instructions within basic blocks to hide the stalls")
+    print("\t   and writes the result to the executable file output")
+
+
+# Returns (filename, Machine, output), or None on an error
+def parse_args(args):
+    if len(args) < 3 or len(args) % 2 != 1:
+        return None
+
+    config = None
+    overrides = { }
+    output = None
+    index = 2
+    while index < len(args) - 1:
+        if args[index] == '--config':
+            config = args[index + 1]
+        elif args[index] == '--resolve':
+            if args[index + 1] not in RESOLVE_STAGES:
+                print("Invalid branch resolution stage '%s'" % args[index + 1])
+                return None
+            overrides['resolve'] = args[index + 1]
+        elif args[index] == '--split':
+            split = [ s for s in args[index + 1].split(',') if s ]
+            if any(s not in SPLITS for s in split):
+                print("Invalid stages to split '%s'" % args[index + 1])
+                return None
+            overrides['split'] = split
+        elif args[index] == '-o':
+            output = args[index + 1]
+        else:
+            print("Invalid option '%s'" % args[index])
+            return None
+        index += 2
+
+    try:
+        machine = Machine.load(config, overrides) if config else Machine(overrides)
+    except IOError:
+        print("Machine description %s not found" % config)
+        return None
+    except ValueError as e:
+        print("Invalid machine description: %s" % e)
+        return None
+
+    if machine.issue > 1:
+        print("The analyzer supports only a single-issue pipeline")
+        return None
+
+    return args[-1], machine, output
+
+
+#--------------------------------------------------------------------------
+#   Analyzer main
+#--------------------------------------------------------------------------
+
+def analyze_main(argv):
+    args = parse_args(argv)
+    if not args:
+        show_usage(argv[0])
+        sys.exit()
+    filename, machine, output = args
+
+    prog = Program()
+    try:
+        image = prog.read(filename)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    analyzer = Analyzer(machine, image, prog.data_ranges(filename))
+    if not analyzer.blocks:
+        print("No text in imem in %s" % filename)
+        sys.exit(1)
+    print("Text: %d instructions in %d basic blocks (%d reachable), %d bytes of data skipped" % \
+          (len(analyzer.insts), len(analyzer.all_blocks), len(analyzer.blocks), analyzer.skipped))
+    show_machine(analyzer.timing)
+    before = show_hazards(analyzer)
+
+    if output is None:
+        return
+
+    order = [ ]
+    after = changed = 0
+    for block in analyzer.blocks:
+        new = analyzer.reorder(block)
+        stalls, _ = analyzer.timing.run(block)
+        new_stalls, _ = analyzer.timing.run(new)
+        if new_stalls < stalls:
+            changed += 1
+        else:
+            new, new_stalls = block, stalls
+        order.append(new)
+        after += new_stalls
+    try:
+        Program.save(output, analyzer.entry, analyzer.rewrite(order))
+    except IOError as e:
+        print("Cannot write %s: %s" % (output, e.strerror))
+        sys.exit(1)
+    print("Reordered %d blocks: %d -> %d stall cycles. Written to %s" % (changed, before, after, output))
@@ -0,0 +1,52 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   devices.s: Uses the memory-mapped devices on the bus
+#
+#==========================================================================
+
+
+# Prints a message kept in imem (ROM) through the UART, measures the loop
+# with the timer and the region-of-interest markers, and exits through the
+# simulation control device.
+
+    .equ    SIMCTL, 0x00100000  # +0: exit, +4: region of interest
+    .equ    TIMER, 0x0200bff8   # +0: cycle counter (low word)
+    .equ    UART, 0x10000000    # +0: tx
+
+    .text
+    .align  2
+    .globl  _start
+_start:
+    li      s2, SIMCTL
+    li      s3, TIMER
+    li      s4, UART
+
+    li      t0, 1
+    sw      t0, 4(s2)           # begin the region of interest
+    lw      s0, 0(s3)           # s0 <- start cycle
+
+    la      a1, msg
+loop:
+    lw      t1, 0(a1)           # four characters from imem
+    li      t2, 4
+next:
+    andi    t3, t1, 0xff
+    beqz    t3, done
+    sw      t3, 0(s4)           # send a character
+    srli    t1, t1, 8
+    addi    t2, t2, -1
+    bnez    t2, next
+    addi    a1, a1, 4
+    j       loop
+done:
+    lw      s1, 0(s3)
+    sub     s1, s1, s0          # s1 <- cycles spent in the loop
+    sw      zero, 4(s2)         # end the region of interest
+
+    sw      zero, 0(s2)         # exit(0)
+
+    .align  2
+msg:
+    .string "Hello from the UART!\n"
@@ -0,0 +1,52 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   hello.s: Makes system calls to the proxy kernel
+#
+#==========================================================================
+
+
+# Prints a message with write(), grows the heap with brk(), reads the
+# simulated clock with gettimeofday(), and exits with status 3.
+
+    .equ    SYS_WRITE, 64
+    .equ    SYS_EXIT, 93
+    .equ    SYS_GETTIMEOFDAY, 169
+    .equ    SYS_BRK, 214
+
+    .text
+    .align  2
+    .globl  _start
+_start:
+    lui     sp, 0x80020         # set the stack pointer to 0x80020000
+
+    li      a0, 1               # write(1, msg, len)
+    la      a1, msg
+    li      a2, 14
+    li      a7, SYS_WRITE
+    ecall
+
+    li      a0, 0               # s0 <- brk(0): current end of the heap
+    li      a7, SYS_BRK
+    ecall
+    mv      s0, a0
+    addi    a0, a0, 64          # brk(s0 + 64)
+    li      a7, SYS_BRK
+    ecall
+    sw      a0, 0(s0)           # the new heap word is usable
+
+    addi    sp, sp, -16         # gettimeofday(sp, 0)
+    mv      a0, sp
+    li      a1, 0
+    li      a7, SYS_GETTIMEOFDAY
+    ecall
+    lw      s1, 8(sp)           # s1 <- microseconds
+
+    li      a0, 3               # exit(3)
+    li      a7, SYS_EXIT
+    ecall
+
+    .data
+msg:
+    .string "Hello, world!\n"
@@ -0,0 +1,83 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   muldiv.s: Uses the RV32M multiply and divide instructions
+#
+#==========================================================================
+
+
+# Computes 10! with mul and gcd(1071, 462) = 21 with rem, then checks the
+# results the ISA defines for the corner cases of division. After the
+# execution, a0 = 3628800 (10!) and a1 = 21, and a2 should be 0 (the number
+# of failed checks). The dependent instructions after each mul and rem
+# wait in ID while the multiplier/divider works.
+
+
+    .text
+    .align  2
+    .globl  _start
+_start:
+    li      a0, 1               # a0 <- 1
+    li      t0, 10
+fact:
+    mul     a0, a0, t0          # a0 <- a0 * t0
+    addi    t0, t0, -1
+    bnez    t0, fact
+
+    li      t0, 1071
+    li      t1, 462
+gcd:
+    rem     t2, t0, t1          # t2 <- t0 % t1
+    mv      t0, t1
+    mv      t1, t2
+    bnez    t1, gcd
+    mv      a1, t0              # a1 <- gcd
+
+    li      a2, 0               # a2 <- failed checks
+    li      t0, 7
+    li      t1, -1
+    li      t2, 0x80000000
+
+    div     t3, t0, zero        # x / 0 = -1
+    addi    t3, t3, 1
+    snez    t3, t3
+    add     a2, a2, t3
+
+    remu    t3, t0, zero        # x % 0 = x
+    sub     t3, t3, t0
+    snez    t3, t3
+    add     a2, a2, t3
+
+    div     t3, t2, t1          # -2^31 / -1 = -2^31
+    sub     t3, t3, t2
+    snez    t3, t3
+    add     a2, a2, t3
+
+    rem     t3, t2, t1          # -2^31 % -1 = 0
+    snez    t3, t3
+    add     a2, a2, t3
+
+    li      t4, -7
+    rem     t3, t4, t0          # -7 % 7 = 0, -7 / 2 = -3 (rounds toward zero)
+    snez    t3, t3
+    add     a2, a2, t3
+    li      t5, 2
+    div     t3, t4, t5
+    addi    t3, t3, 3
+    snez    t3, t3
+    add     a2, a2, t3
+
+    mulh    t3, t1, t1          # high word of (-1) * (-1) = 0
+    snez    t3, t3
+    add     a2, a2, t3
+    mulhu   t3, t1, t1          # high word of 0xffffffff^2 = 0xfffffffe
+    addi    t3, t3, 2
+    snez    t3, t3
+    add     a2, a2, t3
+    mulhsu  t3, t1, t1          # high word of (-1) * 0xffffffff = -1
+    addi    t3, t3, 1
+    snez    t3, t3
+    add     a2, a2, t3
+
+    ebreak
@@ -0,0 +1,44 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   psum.s: Per-core partial sums for multi-core runs (--cores n)
+#
+#==========================================================================
+
+
+# Every core starts here with its hart id k in a0. Core k adds up the
+# integers from 100*k+1 to 100*(k+1), keeps the result in x31 and stores
+# it to the k-th word of dmem. Each core also gets its own 4KB stack.
+# For core 0, x31 should be 5050 (= 0x13ba) at the end.
+
+    .text
+    .align  2
+    .globl  _start
+_start:                         # code entry point
+    lui     sp, 0x80020         # sp = 0x80020000 - k * 4096
+    slli    t2, a0, 12
+    sub     sp, sp, t2
+    li      t1, 100
+    li      t0, 0               # t0 = 100 * k
+    mv      t2, a0
+Scale:
+    beqz    t2, Sum
+    add     t0, t0, t1
+    addi    t2, t2, -1
+    j       Scale
+Sum:
+    add     t1, t0, t1          # t1 = 100 * (k + 1)
+    addi    t0, t0, 1
+    li      x31, 0
+Loop:
+    add     x31, x31, t0
+    addi    t0, t0, 1
+    ble     t0, t1, Loop
+    push    x31                 # exercise the private stack
+    pop     t3
+    lui     t4, 0x80010         # result[k] = sum
+    slli    t2, a0, 2
+    add     t4, t4, t2
+    sw      t3, 0(t4)
+    ebreak
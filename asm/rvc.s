@@ -0,0 +1,56 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   rvc.s: Mixes RV32C compressed and 32-bit instructions
+#
+#==========================================================================
+
+
+# Sums the array below twice: first with a loop the assembler compresses
+# under .option rvc, then with one written with explicit c.* mnemonics.
+# Some of the 32-bit instructions between compressed ones start at pc%4 == 2
+# and straddle two words. Run it on a machine with rvc enabled, e.g.
+#
+#   ../snurisc5.py -l 1 --config ../configs/rvc.json rvc.s
+#
+# After the execution, a0 = a1 = 55 (1 + 2 + ... + 10), and a2 = 0.
+
+
+    .text
+    .align  2
+    .globl  _start
+_start:
+    .option rvc
+    la      a3, array           # not compressed (pc-relative)
+    li      a4, 10
+    li      a0, 0
+loop1:
+    lw      a5, 0(a3)           # c.lw
+    add     a0, a0, a5          # c.add
+    addi    a3, a3, 4           # c.addi
+    addi    a4, a4, -1          # c.addi
+    bnez    a4, loop1           # 32-bit: branches refer to labels
+
+    .option norvc
+    la      a3, array
+    c.li    a4, 10
+    c.li    a1, 0
+loop2:
+    c.lw    a5, 0(a3)
+    addi    a5, a5, 0           # 32-bit, straddles a word boundary
+    c.add   a1, a5
+    c.addi  a3, 4
+    c.addi  a4, -1
+    c.bnez  a4, loop2
+
+    sub     a2, a0, a1          # a2 <- 0 if both sums agree
+    c.jal   done
+    c.li    a2, -1              # skipped
+done:
+    c.ebreak
+
+    .data
+    .align  2
+array:
+    .word   1, 2, 3, 4, 5, 6, 7, 8, 9, 10
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   A small two-pass RV32IMC assembler (plus push/pop) so that assembly
+#   sources can be run without the cross toolchain. The memory layout
+#   follows asm/link.ld.
+#
+#==========================================================================
+
+import os
+import sys
+import hashlib
+
+from consts import *
+from isa import *
+from program import *
+from components import rname
+from rvc import compress
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+ASM_VERSION     = 3                 # bump to invalidate cached images
+ASM_CACHE_DIR   = '__pycache__'
+
+TEXT_BASE       = 0x80000000
+DATA_BASE       = 0x80010000
+PAGE_SIZE       = 0x1000
+
+C_NOP           = 0x0001            # c.nop, fills a 2-byte gap in .text
+
+# Output sections in link.ld order, and the input sections mapped to them
+SECTIONS        = [ '.text.init', '.tohost', '.text', '.data', '.bss' ]
+SECTION_ALIAS   = {
+    '.rodata'   : '.data',
+    '.sdata'    : '.data',
+    '.srodata'  : '.data',
+    '.sbss'     : '.bss',
+}
+
+# Register names: x0-x31, ABI names, and fp
+regnum = { 'x%d' % i : i for i in range(NUM_REGS) }
+regnum.update({ name : i for i, name in enumerate(rname) })
+regnum['fp'] = 8
+
+# Real instructions by mnemonic
+opcodes = { v[IN_NAME] : k for k, v in isa.items() }
+
+# Compressed mnemonics and the 32-bit instructions they are written as,
+# with 'a0', 'a1', .. standing for their operands
+C_FORMS = {
+    'c.nop'     : ('nop', [ ]),
+    'c.ebreak'  : ('ebreak', [ ]),
+    'c.addi'    : ('addi', [ 'a0', 'a0', 'a1' ]),
+    'c.li'      : ('addi', [ 'a0', 'zero', 'a1' ]),
+    'c.lui'     : ('lui', [ 'a0', 'a1' ]),
+    'c.addi16sp': ('addi', [ 'a0', 'a0', 'a1' ]),     # c.addi16sp sp, imm
+    'c.addi4spn': ('addi', [ 'a0', 'a1', 'a2' ]),     # c.addi4spn rd, sp, imm
+    'c.slli'    : ('slli', [ 'a0', 'a0', 'a1' ]),
+    'c.srli'    : ('srli', [ 'a0', 'a0', 'a1' ]),
+    'c.srai'    : ('srai', [ 'a0', 'a0', 'a1' ]),
+    'c.andi'    : ('andi', [ 'a0', 'a0', 'a1' ]),
+    'c.mv'      : ('add', [ 'a0', 'zero', 'a1' ]),
+    'c.add'     : ('add', [ 'a0', 'a0', 'a1' ]),
+    'c.sub'     : ('sub', [ 'a0', 'a0', 'a1' ]),
+    'c.xor'     : ('xor', [ 'a0', 'a0', 'a1' ]),
+    'c.or'      : ('or', [ 'a0', 'a0', 'a1' ]),
+    'c.and'     : ('and', [ 'a0', 'a0', 'a1' ]),
+    'c.lw'      : ('lw', [ 'a0', 'a1' ]),
+    'c.sw'      : ('sw', [ 'a0', 'a1' ]),
+    'c.lwsp'    : ('lw', [ 'a0', 'a1' ]),
+    'c.swsp'    : ('sw', [ 'a0', 'a1' ]),
+    'c.j'       : ('jal', [ 'zero', 'a0' ]),
+    'c.jal'     : ('jal', [ 'ra', 'a0' ]),
+    'c.jr'      : ('jalr', [ 'zero', 'a0', '0' ]),
+    'c.jalr'    : ('jalr', [ 'ra', 'a0', '0' ]),
+    'c.beqz'    : ('beq', [ 'a0', 'zero', 'a1' ]),
+    'c.bnez'    : ('bne', [ 'a0', 'zero', 'a1' ]),
+}
+
+# Instructions that .option rvc leaves uncompressed, as their operands are
+# relative to the pc
+PCREL_OPS = [ 'auipc', 'la', 'lla' ]
+
+IGNORED_DIRECTIVES = [ '.globl', '.global', '.local', '.type', '.size', '.file',
+                       '.ident', '.attribute', '.weak', '.hidden',
+                       '.cfi_startproc', '.cfi_endproc', '.loc' ]
+
+
+class AsmError(Exception):
+
+    def __init__(self, filename, lineno, msg):
+        super().__init__("%s:%d: %s" % (filename, lineno, msg))
+
+
+#--------------------------------------------------------------------------
+#   Assembler
+#--------------------------------------------------------------------------
+
+class Assembler(object):
+
+    def __init__(self, filename = '<string>'):
+        self.filename   = filename
+        self.symbols    = { }
+        self.base       = { }
+        self.lineno     = 0
+        self.rvc        = False             # set by .option rvc
+        self.labels     = False             # set when an operand refers to a label
+        self.data_ranges = [ ]              # (start, end) of the data directives in the text
+
+    def error(self, msg):
+        raise AsmError(self.filename, self.lineno, msg)
+
+
+    #----------------------------------------------------------------------
+    #   Operand parsing
+    #----------------------------------------------------------------------
+
+    def reg(self, s):
+        r = regnum.get(s.strip())
+        if r is None:
+            self.error("invalid register '%s'" % s)
+        return r
+
+    def value(self, expr, pc, final):
+        # Evaluates 'term (+|- term)*' where a term is a number, a character
+        # literal, '.', a symbol, or %hi()/%lo()/%pcrel_hi()/%pcrel_lo()
+        expr = expr.strip()
+        for fn in [ '%hi', '%lo', '%pcrel_hi', '%pcrel_lo' ]:
+            if expr.startswith(fn + '(') and expr.endswith(')'):
+                v = self.value(expr[len(fn) + 1:-1], pc, final)
+                if fn.startswith('%pcrel'):
+                    v -= pc
+                lo = ((v & 0xfff) ^ 0x800) - 0x800
+                return lo if fn.endswith('lo') else ((v - lo) >> 12) & 0xfffff
+
+        total, sign, term = 0, 1, ''
+        for c in expr + '+':
+            if c in '+-' and term.strip():
+                total += sign * self.term(term.strip(), pc, final)
+                sign, term = (1 if c == '+' else -1), ''
+            elif c == '-' and not term.strip():
+                sign = -sign
+            elif c == '+' and not term.strip():
+                pass
+            else:
+                term += c
+        return total
+
+    def term(self, t, pc, final):
+        if t == '.':
+            self.labels = True
+            return pc
+        if len(t) == 3 and t[0] == t[2] == "'":
+            return ord(t[1])
+        try:
+            return int(t, 0)
+        except ValueError:
+            pass
+        if t in self.symbols:
+            sect, off = self.symbols[t]
+            if sect is not None:
+                self.labels = True
+            return off if sect is None else self.base.get(sect, 0) + off
+        if final:
+            self.error("undefined symbol '%s'" % t)
+        self.labels = True
+        return 0
+
+    def known(self, expr):
+        # Returns the value of expr if it does not depend on any label or '.'
+        # (its value is final in pass 1), or None. A label defined earlier
+        # resolves in pass 1 too, but to its offset before the section bases
+        # are set.
+        saved, self.labels = self.labels, False
+        try:
+            v = self.value(expr, 0, True)
+        except AsmError:
+            v = None
+        if self.labels:
+            v = None
+        self.labels = saved
+        return v
+
+    def mem(self, s, pc, final):
+        # Parses 'offset(reg)'
+        s = s.strip()
+        if not s.endswith(')') or '(' not in s:
+            self.error("invalid memory operand '%s'" % s)
+        off, r = s[:-1].split('(', 1)
+        return (self.value(off, pc, final) if off.strip() else 0), self.reg(r)
+
+    def imm(self, v, bits, signed = True):
+        lo, hi = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1) if signed else (0, (1 << bits) - 1)
+        if not lo <= v <= hi:
+            self.error("immediate %d out of range [%d, %d]" % (v, lo, hi))
+        return v
+
+    def offset(self, target, pc, bits):
+        off = target - pc
+        if off & 1:
+            self.error("misaligned branch target 0x%08x" % target)
+        return self.imm(off, bits)
+
+
+    #----------------------------------------------------------------------
+    #   Instructions
+    #----------------------------------------------------------------------
+
+    def c_form(self, op, args):
+        # Returns the 32-bit instruction for the compressed mnemonic op
+        op32, form = C_FORMS[op]
+        n = len(set(a for a in form if a.startswith('a')))
+        if len(args) != n:
+            self.error("'%s' takes %d operand(s)" % (op, n))
+        return op32, [ args[int(a[1:])] if a.startswith('a') else a for a in form ]
+
+    def size(self, op, args):
+        # Number of bytes that an instruction (or pseudo-instruction) takes.
+        # Under .option rvc, instructions with a compressed form take 2 unless
+        # they are pc-relative or refer to a label.
+        if op in C_FORMS:
+            return 2
+        if op == 'li':
+            if len(args) != 2:
+                self.error("li takes two operands")
+            v = self.known(args[1])
+            n = 8
+            if v is not None and (-2048 <= v < 2048 or (v & 0xfff) == 0):
+                n = 4
+        elif op in [ 'la', 'lla' ]:
+            return 8
+        else:
+            n = 4
+        if not self.rvc or n != 4 or op in PCREL_OPS:
+            return n
+        self.labels = False
+        w = self.encode(op, args, 0, False, n)[0]
+        opcode = RISCV.opcode(w)
+        if self.labels or opcode == ILLEGAL or isa[opcode][IN_TYPE] in [ B_TYPE, J_TYPE ] \
+           or compress(w) is None:
+            return n
+        return 2
+
+    def compressed(self, op, args, pc, final):
+        # Returns the 16-bit parcel of an instruction that takes 2 bytes
+        if op in C_FORMS:
+            op, args = self.c_form(op, args)
+        p = compress(self.encode(op, args, pc, final, WORD_SIZE)[0])
+        if p is None:
+            self.error("no compressed form for '%s %s'" % (op, ', '.join(args)))
+        return p
+
+    def encode(self, op, args, pc, final, nbytes):
+        R, V, M = self.reg, (lambda e: self.value(e, pc, final)), (lambda e: self.mem(e, pc, final))
+        n = len(args)
+
+        def nargs(k):
+            if n != k:
+                self.error("'%s' takes %d operand(s)" % (op, k))
+
+        # Pseudo-instructions
+        if op == 'nop':
+            nargs(0); return [ RISCV.enc_i(ADDI, 0, 0, 0) ]
+        if op == 'li':
+            rd, v = R(args[0]), V(args[1])
+            v = self.imm(v if v < (1 << 31) else v - (1 << 32), 32)
+            lo = ((v & 0xfff) ^ 0x800) - 0x800
+            if nbytes == WORD_SIZE:
+                if -2048 <= v < 2048:
+                    return [ RISCV.enc_i(ADDI, rd, 0, v) ]
+                return [ RISCV.enc_u(LUI, rd, v) ]
+            return [ RISCV.enc_u(LUI, rd, v - lo), RISCV.enc_i(ADDI, rd, rd, lo) ]
+        if op in [ 'la', 'lla' ]:
+            nargs(2)
+            rd, v = R(args[0]), V(args[1]) - pc
+            lo = ((v & 0xfff) ^ 0x800) - 0x800
+            return [ RISCV.enc_u(AUIPC, rd, v - lo), RISCV.enc_i(ADDI, rd, rd, lo) ]
+        if op == 'mv':
+            nargs(2); return [ RISCV.enc_i(ADDI, R(args[0]), R(args[1]), 0) ]
+        if op == 'not':
+            nargs(2); return [ RISCV.enc_i(XORI, R(args[0]), R(args[1]), -1) ]
+        if op == 'neg':
+            nargs(2); return [ RISCV.enc_r(SUB, R(args[0]), 0, R(args[1])) ]
+        if op == 'seqz':
+            nargs(2); return [ RISCV.enc_i(SLTIU, R(args[0]), R(args[1]), 1) ]
+        if op == 'snez':
+            nargs(2); return [ RISCV.enc_r(SLTU, R(args[0]), 0, R(args[1])) ]
+        if op == 'sltz':
+            nargs(2); return [ RISCV.enc_r(SLT, R(args[0]), R(args[1]), 0) ]
+        if op == 'sgtz':
+            nargs(2); return [ RISCV.enc_r(SLT, R(args[0]), 0, R(args[1])) ]
+        if op in [ 'beqz', 'bnez', 'blez', 'bgez', 'bltz', 'bgtz' ]:
+            nargs(2)
+            rs = R(args[0])
+            base, rs1, rs2 = { 'beqz': (BEQ, rs, 0), 'bnez': (BNE, rs, 0),
+                               'blez': (BGE, 0, rs), 'bgez': (BGE, rs, 0),
+                               'bltz': (BLT, rs, 0), 'bgtz': (BLT, 0, rs) }[op]
+            return [ RISCV.enc_b(base, rs1, rs2, self.offset(V(args[1]), pc, 13)) ]
+        if op in [ 'bgt', 'ble', 'bgtu', 'bleu' ]:
+            nargs(3)
+            base = { 'bgt': BLT, 'ble': BGE, 'bgtu': BLTU, 'bleu': BGEU }[op]
+            return [ RISCV.enc_b(base, R(args[1]), R(args[0]), self.offset(V(args[2]), pc, 13)) ]
+        if op in [ 'j', 'tail' ]:
+            nargs(1); return [ RISCV.enc_j(JAL, 0, self.offset(V(args[0]), pc, 21)) ]
+        if op == 'call':
+            nargs(1); return [ RISCV.enc_j(JAL, 1, self.offset(V(args[0]), pc, 21)) ]
+        if op == 'jr':
+            nargs(1); return [ RISCV.enc_i(JALR, 0, R(args[0]), 0) ]
+        if op == 'ret':
+            nargs(0); return [ RISCV.enc_i(JALR, 0, 1, 0) ]
+        if op == 'jal' and n == 1:
+            return [ RISCV.enc_j(JAL, 1, self.offset(V(args[0]), pc, 21)) ]
+        if op == 'jalr':
+            if n == 1:
+                return [ RISCV.enc_i(JALR, 1, R(args[0]), 0) ]
+            if n == 2:
+                off, rs1 = M(args[1])
+                return [ RISCV.enc_i(JALR, R(args[0]), rs1, self.imm(off, 12)) ]
+            nargs(3)
+            return [ RISCV.enc_i(JALR, R(args[0]), R(args[1]), self.imm(V(args[2]), 12)) ]
+
+        # Real instructions
+        base = opcodes.get(op)
+        if base is None:
+            self.error("unknown instruction '%s'" % op)
+        t = isa[base][IN_TYPE]
+        if t == R_TYPE:
+            nargs(3); return [ RISCV.enc_r(base, R(args[0]), R(args[1]), R(args[2])) ]
+        if t == I_TYPE:
+            nargs(3); return [ RISCV.enc_i(base, R(args[0]), R(args[1]), self.imm(V(args[2]), 12)) ]
+        if t == IS_TYPE:
+            nargs(3); return [ RISCV.enc_i(base, R(args[0]), R(args[1]), self.imm(V(args[2]), 5, False)) ]
+        if t == IL_TYPE:
+            nargs(2)
+            off, rs1 = M(args[1])
+            return [ RISCV.enc_i(base, R(args[0]), rs1, self.imm(off, 12)) ]
+        if t == S_TYPE:
+            nargs(2)
+            off, rs1 = M(args[1])
+            return [ RISCV.enc_s(base, rs1, R(args[0]), self.imm(off, 12)) ]
+        if t == U_TYPE:
+            nargs(2); return [ RISCV.enc_u(base, R(args[0]), self.imm(V(args[1]), 20, False) << 12) ]
+        if t == B_TYPE:
+            nargs(3); return [ RISCV.enc_b(base, R(args[0]), R(args[1]), self.offset(V(args[2]), pc, 13)) ]
+        if t == J_TYPE:
+            nargs(2); return [ RISCV.enc_j(base, R(args[0]), self.offset(V(args[1]), pc, 21)) ]
+        if t == P_TYPE:
+            nargs(1)
+            r = R(args[0])
+            return [ RISCV.enc_r(base, r, 0, 0) if op == 'pop' else RISCV.enc_r(base, 0, 0, r) ]
+        nargs(0)
+        return [ base ]
+
+
+    #----------------------------------------------------------------------
+    #   Directives
+    #----------------------------------------------------------------------
+
+    def data(self, op, args, pc, final):
+        # Returns the bytes emitted by a data directive
+        if op in [ '.word', '.4byte', '.long' ]:
+            return b''.join((self.value(a, pc, final) & 0xffffffff).to_bytes(4, 'little') for a in args)
+        if op in [ '.half', '.short', '.2byte' ]:
+            return b''.join((self.value(a, pc, final) & 0xffff).to_bytes(2, 'little') for a in args)
+        if op in [ '.byte' ]:
+            return bytes(self.value(a, pc, final) & 0xff for a in args)
+        if op in [ '.space', '.zero', '.skip' ]:
+            fill = self.value(args[1], pc, final) & 0xff if len(args) > 1 else 0
+            return bytes([ fill ]) * self.value(args[0], pc, final)
+        if op in [ '.ascii', '.asciz', '.string' ]:
+            out = b''
+            for a in args:
+                a = a.strip()
+                if not (len(a) >= 2 and a[0] == a[-1] == '"'):
+                    self.error("invalid string %s" % a)
+                s = a[1:-1].encode('latin-1').decode('unicode_escape').encode('latin-1')
+                out += s + (b'\0' if op != '.ascii' else b'')
+            return out
+        return None
+
+
+    #----------------------------------------------------------------------
+    #   Driver
+    #----------------------------------------------------------------------
+
+    @staticmethod
+    def split(line):
+        # Strips comments and splits 'label: op a, b, c' into its parts,
+        # keeping commas inside string literals
+        out, quoted = '', False
+        for c in line:
+            if c == '"':
+                quoted = not quoted
+            elif c == '#' and not quoted:
+                break
+            out += c
+        labels = [ ]
+        out = out.strip()
+        while ':' in out and not out.startswith('"'):
+            head, rest = out.split(':', 1)
+            if not head.strip() or ' ' in head.strip() or '"' in head:
+                break
+            labels.append(head.strip())
+            out = rest.strip()
+        if not out:
+            return labels, None, [ ]
+        parts = out.split(None, 1)
+        op = parts[0].lower()
+        args, cur, quoted = [ ], '', False
+        for c in (parts[1] if len(parts) > 1 else ''):
+            if c == '"':
+                quoted = not quoted
+            if c == ',' and not quoted:
+                args.append(cur.strip())
+                cur = ''
+            else:
+                cur += c
+        if cur.strip():
+            args.append(cur.strip())
+        return labels, op, args
+
+    def assemble(self, source):
+        # Pass 1: assign section offsets to every label and item
+        items = [ ]
+        size = { s : 0 for s in SECTIONS }
+        sect = '.text'
+        for self.lineno, line in enumerate(source.splitlines(), 1):
+            labels, op, args = self.split(line)
+            for l in labels:
+                if l in self.symbols:
+                    self.error("symbol '%s' already defined" % l)
+                self.symbols[l] = (sect, size[sect])
+            if op is None:
+                continue
+            if op in [ '.text', '.data', '.bss' ] or op == '.section':
+                name = op if op != '.section' else args[0] if args else self.error(".section needs a name")
+                name = SECTION_ALIAS.get(name, name)
+                if name.startswith('.text.') and name != '.text.init':
+                    name = '.text'
+                if name not in size:
+                    self.error("unsupported section '%s'" % name)
+                sect = name
+            elif op in [ '.align', '.p2align', '.balign' ]:
+                n = self.value(args[0], 0, True)
+                align = n if op == '.balign' else (1 << n)
+                pad = (-size[sect]) % align
+                if pad:
+                    fill = sect.startswith('.text') and pad % 2 == 0
+                    items.append((self.lineno, sect, size[sect], '.nops' if fill else '.zero', [ str(pad) ], 0))
+                    size[sect] += pad
+            elif op in [ '.equ', '.set' ]:
+                if len(args) != 2:
+                    self.error("%s takes two operands" % op)
+                self.symbols[args[0]] = (None, self.value(args[1], 0, True))
+            elif op == '.option':
+                if args and args[0] in [ 'rvc', 'norvc' ]:
+                    self.rvc = args[0] == 'rvc'
+            elif op in IGNORED_DIRECTIVES:
+                pass
+            elif op.startswith('.'):
+                b = self.data(op, args, 0, False)
+                if b is None:
+                    self.error("unsupported directive '%s'" % op)
+                items.append((self.lineno, sect, size[sect], op, args, len(b)))
+                size[sect] += len(b)
+            else:
+                if size[sect] % 2:
+                    self.error("misaligned instruction")
+                n = self.size(op, args)
+                items.append((self.lineno, sect, size[sect], op, args, n))
+                size[sect] += n
+
+        # Place the sections as link.ld does
+        addr = TEXT_BASE
+        for s in [ '.text.init', '.tohost', '.text' ]:
+            addr += (-addr) % PAGE_SIZE if s != '.text.init' else 0
+            self.base[s] = addr
+            addr += size[s]
+        text_end = addr
+        self.base['.data'] = DATA_BASE
+        self.base['.bss'] = DATA_BASE + size['.data'] + ((-size['.data']) % WORD_SIZE)
+        data_end = self.base['.bss'] + size['.bss']
+
+        # Pass 2: encode
+        text = bytearray(text_end - TEXT_BASE)
+        data = bytearray(data_end - DATA_BASE)
+        for self.lineno, sect, off, op, args, n in items:
+            pc = self.base[sect] + off
+            if op == '.nops':
+                pad = int(args[0])
+                b = C_NOP.to_bytes(2, 'little') * (pad % WORD_SIZE // 2) + \
+                    int(NOP).to_bytes(WORD_SIZE, 'little') * (pad // WORD_SIZE)
+            elif op.startswith('.'):
+                b = self.data(op, args, pc, True)
+                if sect in [ '.text.init', '.tohost', '.text' ] and b:
+                    self.data_ranges.append((pc, pc + len(b)))
+            elif n == 2:
+                b = self.compressed(op, args, pc, True).to_bytes(2, 'little')
+            else:
+                b = b''.join(int(w).to_bytes(WORD_SIZE, 'little') for w in self.encode(op, args, pc, True, n))
+            if sect == '.bss':
+                if any(b):
+                    self.error("initialized data in .bss")
+                continue
+            image, start = (text, TEXT_BASE) if sect in [ '.text.init', '.tohost', '.text' ] else (data, DATA_BASE)
+            image[pc - start : pc - start + len(b)] = b
+
+        entry = self.value('_start', 0, True) if '_start' in self.symbols else self.base['.text']
+        segments = [ ]
+        if text:
+            segments.append((TEXT_BASE, bytes(text), PF_R | PF_X))
+        if data:
+            segments.append((DATA_BASE, bytes(data), PF_R | PF_W))
+        return WORD(entry), segments
+
+
+    #----------------------------------------------------------------------
+    #   Cached builds
+    #----------------------------------------------------------------------
+
+    @staticmethod
+    def build(filename):
+        # Returns the path of an ELF image for the assembly source, assembling
+        # it only if no image for the same source contents is cached yet
+        with open(filename, 'rb') as f:
+            source = f.read()
+        key = hashlib.sha256(b'%d:' % ASM_VERSION + source).hexdigest()[:16]
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), ASM_CACHE_DIR)
+        cached = os.path.join(cache_dir, '%s.%s.elf' % (os.path.basename(filename), key))
+        if os.path.exists(cached):
+            return cached
+
+        entry, segments = Assembler(filename).assemble(source.decode('utf-8'))
+        os.makedirs(cache_dir, exist_ok = True)
+        tmp = cached + '.%d.tmp' % os.getpid()
+        Program.save(tmp, entry, segments)
+        os.replace(tmp, cached)
+        return cached
+
+
+#--------------------------------------------------------------------------
+#   Assembler main
+#--------------------------------------------------------------------------
+
+def main():
+
+    args = sys.argv[1:]
+    if len(args) not in [ 1, 3 ] or (len(args) == 3 and args[1] != '-o'):
+        print("Usage: %s filename.s [-o output]" % sys.argv[0])
+        sys.exit()
+
+    src = args[0]
+    out = args[2] if len(args) == 3 else os.path.splitext(src)[0]
+    try:
+        with open(src) as f:
+            entry, segments = Assembler(src).assemble(f.read())
+    except (IOError, AsmError) as e:
+        print(e)
+        sys.exit(1)
+    Program.save(out, entry, segments)
+
+
+if __name__ == '__main__':
+    main()
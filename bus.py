@@ -0,0 +1,237 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   System bus: maps address ranges to memories and memory-mapped devices
+#   (UART, timer, simulation control) through a page-indexed table.
+#
+#==========================================================================
+
+from consts import *
+from program import Stat
+from components import Memory
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+PAGE_SHIFT      = 12                    # regions are dispatched in 4KB pages
+
+# Device registers (offsets from the base address of the device)
+UART_TX         = 0x0                   # W: sends the low byte
+UART_STATUS     = 0x4                   # R: 1 (the transmitter is always ready)
+UART_SIZE       = 0x8
+
+TIMER_LO        = 0x0                   # R: cycle counter, low word
+TIMER_HI        = 0x4                   # R: cycle counter, high word
+TIMER_SIZE      = 0x8
+
+SIMCTL_EXIT     = 0x0                   # W: ends the run with the exit code written
+SIMCTL_ROI      = 0x4                   # W: 1 begins, 0 ends the region of interest
+SIMCTL_SIZE     = 0x8
+
+MASK32          = 0xffffffff
+
+
+#--------------------------------------------------------------------------
+#   ROM: a memory the program can read and execute but not write
+#--------------------------------------------------------------------------
+
+class ROM(Memory):
+
+    def access(self, valid, addr, data, fcn):
+        if valid and fcn == M_XWR:
+            return ( WORD(0), False )
+        return Memory.access(self, valid, addr, data, fcn)
+
+
+#--------------------------------------------------------------------------
+#   Device: a memory-mapped device with word-sized registers
+#--------------------------------------------------------------------------
+
+class Device(object):
+
+    def __init__(self, bus, start, size):
+        self.bus        = bus
+        self.mem_start  = start
+        self.mem_end    = start + size
+
+    def access(self, valid, addr, data, fcn):
+        if not valid:
+            return ( WORD(0), True )
+        off = int(addr) - self.mem_start
+        val = None
+        if off & 3 == 0 and 0 <= off < self.mem_end - self.mem_start:
+            if fcn == M_XRD:
+                val = self.read(off)
+            elif fcn == M_XWR:
+                val = 0 if self.write(off, int(data)) else None
+        res = ( WORD(0), False ) if val is None else ( WORD(val), True )
+
+        # Results are recorded for the reference model of cosim
+        if self.bus.record is not None:
+            self.bus.record.append(res + ( self.bus.halt, ))
+        return res
+
+    # Returns the register value, or None if it cannot be read
+    def read(self, off):
+        return None
+
+    # Returns False if the register cannot be written
+    def write(self, off, data):
+        return False
+
+
+class UART(Device):
+
+    # Output goes to the stdout buffer of the proxy kernel, so that it is
+    # kept in order with write() system calls
+    def __init__(self, bus, start, kernel):
+        super().__init__(bus, start, UART_SIZE)
+        self.kernel     = kernel
+
+    def read(self, off):
+        return 1 if off == UART_STATUS else 0
+
+    def write(self, off, data):
+        if off != UART_TX:
+            return False
+        self.kernel.put(1, bytes([ data & 0xff ]))
+        return True
+
+
+class Timer(Device):
+
+    def __init__(self, bus, start):
+        super().__init__(bus, start, TIMER_SIZE)
+
+    def read(self, off):
+        clock = self.bus.clock()
+        return clock & MASK32 if off == TIMER_LO else (clock >> 32) & MASK32
+
+
+class SimCtl(Device):
+
+    def __init__(self, bus, start, kernel):
+        super().__init__(bus, start, SIMCTL_SIZE)
+        self.kernel     = kernel
+        self.roi_start  = None
+
+    def read(self, off):
+        return 0
+
+    def write(self, off, data):
+        if off == SIMCTL_EXIT:
+            self.kernel.exit(data)
+            self.bus.halt = True
+        elif data:
+            self.roi_start = self.bus.clock()
+        elif self.roi_start is not None:
+            Stat.roi_cycles += self.bus.clock() - self.roi_start
+            Stat.roi_count  += 1
+            self.roi_start  = None
+        return True
+
+
+#--------------------------------------------------------------------------
+#   Bus: dispatches accesses to the region that holds the address
+#--------------------------------------------------------------------------
+
+class Bus(object):
+
+    def __init__(self):
+        self.pages      = { }           # page number -> Memory or Device
+        self.code       = { }           # page number -> (words, start, end) of memories to fetch from
+        self.halt       = False         # set when SimCtl ends the run
+        self.record     = None          # results of device accesses, for cosim
+        self.clock      = lambda: int(Stat.cycle)
+
+    # Regions are dispatched by page, so no two regions may share a page.
+    # Only memories can be fetched from.
+    def map(self, dev, fetch = False):
+        first = int(dev.mem_start) >> PAGE_SHIFT
+        last = int(dev.mem_end - 1) >> PAGE_SHIFT
+        for p in range(first, last + 1):
+            if p in self.pages:
+                raise ValueError("Region 0x%08x - 0x%08x overlaps another region" % (dev.mem_start, dev.mem_end - 1))
+        for p in range(first, last + 1):
+            self.pages[p] = dev
+            if fetch:
+                self.code[p] = ( dev.mem, int(dev.mem_start), int(dev.mem_end) )
+        return dev
+
+    def device(self, addr):
+        dev = self.pages.get(int(addr) >> PAGE_SHIFT)
+        return dev if dev is not None and dev.mem_start <= addr < dev.mem_end else None
+
+    # Data access from the MM stage, as Memory.access()
+    def access(self, valid, addr, data, fcn):
+        if not valid:
+            return ( WORD(0), True )
+        dev = self.pages.get(int(addr) >> PAGE_SHIFT)
+        if dev is None:
+            return ( WORD(0), False )
+        return dev.access(True, addr, data, fcn)
+
+    # Instruction fetch from the IF stage. It reads the words of the memory
+    # directly, as this is done every cycle.
+    def fetch(self, valid, addr):
+        if not valid:
+            return ( WORD(0), True )
+        a = int(addr)
+        region = self.code.get(a >> PAGE_SHIFT)
+        if region is None or a & 3 or not region[1] <= a < region[2]:
+            return ( WORD(0), False )
+        return ( region[0][(a - region[1]) >> 2], True )
+
+    # For the functional model: read() returns None on an error, and
+    # write() returns the exception (EXC_EBREAK if the program has exited)
+    def read(self, addr):
+        val, status = self.access(True, addr, 0, M_XRD)
+        return int(val) if status else None
+
+    def write(self, addr, data):
+        val, status = self.access(True, addr, data, M_XWR)
+        if not status:
+            return EXC_DMEM_ERROR
+        if self.halt:
+            self.halt = False
+            return EXC_EBREAK
+        return EXC_NONE
+
+
+#--------------------------------------------------------------------------
+#   BusReplay: repeats the device accesses recorded on a Bus (for cosim)
+#--------------------------------------------------------------------------
+
+class BusReplay(object):
+
+    def __init__(self, bus, record):
+        self.bus        = bus
+        self.record     = record
+        self.last       = None          # (addr, data) of the last successful write
+
+    def result(self, addr):
+        # Returns (value, status, halt) of the access to addr
+        if isinstance(self.bus.pages.get(addr >> PAGE_SHIFT), Device):
+            return self.record.popleft() if self.record else ( 0, False, False )
+        return None
+
+    def read(self, addr):
+        res = self.result(addr)
+        if res is None:
+            return self.bus.read(addr)
+        return int(res[0]) if res[1] else None
+
+    def write(self, addr, data):
+        res = self.result(addr)
+        if res is None:
+            exc = self.bus.write(addr, data)
+        else:
+            exc = EXC_DMEM_ERROR if not res[1] else EXC_EBREAK if res[2] else EXC_NONE
+        if exc != EXC_DMEM_ERROR:
+            self.last = (addr, data)
+        return exc
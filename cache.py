@@ -0,0 +1,154 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Timing models for instruction and data caches. Only tags are kept;
+#   the data itself stays in the Memory objects.
+#
+#==========================================================================
+
+import numpy as np
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+REPL_LRU        = 'lru'
+REPL_FIFO       = 'fifo'
+REPL_RANDOM     = 'random'
+
+WRITE_BACK      = 'wb'          # write-allocate, dirty lines written back on eviction
+WRITE_THROUGH   = 'wt'          # no-write-allocate, writes absorbed by a write buffer
+
+CACHE_DEFAULTS = {
+    'size'      : 4096,         # bytes
+    'line'      : 32,           # bytes
+    'ways'      : 1,
+    'repl'      : REPL_LRU,
+    'write'     : WRITE_BACK,
+    'lat'       : 10,           # miss penalty in cycles
+}
+
+
+#--------------------------------------------------------------------------
+#   Cache: a set-associative cache with NumPy tag arrays
+#--------------------------------------------------------------------------
+
+class Cache(object):
+
+    def __init__(self, name, size, line, ways, repl, write, lat):
+        if line < 4 or line & (line - 1):
+            raise ValueError("%s: line size %d is not a power of two >= 4" % (name, line))
+        if ways < 1 or size % (line * ways):
+            raise ValueError("%s: size %d is not a multiple of line size x ways" % (name, size))
+        if repl not in [ REPL_LRU, REPL_FIFO, REPL_RANDOM ]:
+            raise ValueError("%s: unknown replacement policy '%s'" % (name, repl))
+        if write not in [ WRITE_BACK, WRITE_THROUGH ]:
+            raise ValueError("%s: unknown write policy '%s'" % (name, write))
+        if lat < 0:
+            raise ValueError("%s: negative miss latency %d" % (name, lat))
+
+        self.name       = name
+        self.size       = size
+        self.line       = line
+        self.ways       = ways
+        self.repl       = repl
+        self.write      = write
+        self.lat        = lat
+        self.sets       = size // (line * ways)
+
+        self.tags       = np.full((self.sets, ways), -1, dtype = np.int64)
+        self.dirty      = np.zeros((self.sets, ways), dtype = np.bool_)
+        self.stamp      = np.zeros((self.sets, ways), dtype = np.uint64)
+        self.tick       = 0
+        self.rng        = np.random.default_rng(0)
+
+        self.reads          = 0
+        self.writes         = 0
+        self.read_misses    = 0
+        self.write_misses   = 0
+        self.writebacks     = 0
+        self.stall_cycles   = 0
+
+    # Parses 'size=8192,ways=2,...' on top of CACHE_DEFAULTS
+    @staticmethod
+    def parse(name, spec):
+        return Cache(name, **Cache.params(name, spec))
+
+    # Returns the parameters given by spec, which is either a string as
+    # for parse() or a dict such as { 'size' : '8k', 'ways' : 2 }
+    @staticmethod
+    def params(name, spec):
+        if isinstance(spec, str):
+            spec = dict(item.partition('=')[::2] for item in spec.split(',') if item)
+        params = dict(CACHE_DEFAULTS)
+        for key, val in spec.items():
+            if key not in params:
+                raise ValueError("%s: unknown parameter '%s'" % (name, key))
+            if isinstance(CACHE_DEFAULTS[key], int) and not isinstance(val, int):
+                val = str(val)
+                scale = 1024 if val[-1:] in [ 'k', 'K' ] else 1
+                try:
+                    val = int(val[:-1] if scale > 1 else val) * scale
+                except ValueError:
+                    raise ValueError("%s: invalid value '%s' for '%s'" % (name, val, key))
+            params[key] = val
+        return params
+
+    # Looks up addr and updates the cache state
+    # Returns the number of cycles the access stalls the pipeline
+    def access(self, addr, write):
+        block   = int(addr) // self.line
+        s       = block % self.sets
+        tag     = block // self.sets
+        row     = self.tags[s]
+        self.tick += 1
+
+        if write:
+            self.writes += 1
+        else:
+            self.reads += 1
+
+        hit = np.flatnonzero(row == tag)
+        if hit.size:
+            w = hit[0]
+            if self.repl == REPL_LRU:
+                self.stamp[s, w] = self.tick
+            if write and self.write == WRITE_BACK:
+                self.dirty[s, w] = True
+            return 0
+
+        if write:
+            self.write_misses += 1
+            if self.write == WRITE_THROUGH:
+                return 0
+        else:
+            self.read_misses += 1
+
+        # Fill the line, evicting a victim if the set is full
+        stall = self.lat
+        empty = np.flatnonzero(row < 0)
+        if empty.size:
+            w = empty[0]
+        else:
+            if self.repl == REPL_RANDOM:
+                w = self.rng.integers(self.ways)
+            else:
+                w = np.argmin(self.stamp[s])
+            if self.dirty[s, w]:
+                self.writebacks += 1
+                stall += self.lat
+        row[w] = tag
+        self.dirty[s, w] = write
+        self.stamp[s, w] = self.tick
+        self.stall_cycles += stall
+        return stall
+
+    def summary(self):
+        n = self.reads + self.writes
+        m = self.read_misses + self.write_misses
+        return "%s: %d accesses, %d misses (%.2f%%), %d writebacks, %d stall cycles" % \
+               (self.name, n, m, 0.0 if n == 0 else m * 100.0 / n, self.writebacks, self.stall_cycles)
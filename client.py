@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Thin client for the simulation daemon (snurisc5.py serve). Takes the
+#   same options as snurisc5.py, sends them to the daemon, and shows the
+#   output of the run as it is streamed back. Only the standard library
+#   is imported, so starting a run costs no more than connecting.
+#
+#==========================================================================
+
+import os
+import sys
+import json
+import socket
+import tempfile
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+# The default socket of the daemon, one per user
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'snurisc5-%d.sock' % os.getuid())
+
+# Protocol: a request is one line of JSON,
+#   { "args": [ ... ], "cwd": ..., "elf": ..., "output": ... }
+# where args is the command line of snurisc5.py including the program name,
+# relative paths in it are relative to cwd, elf is an optional executable
+# image (base64) that the last argument names, and output is false to get
+# only the stats. The daemon answers with lines of JSON, each with a type:
+#   output: a chunk of the stdout or stderr (stream) of the run (data)
+#   stats:  the counters of Stat after the run
+#   exit:   the exit status of snurisc5.py for the run (status), last
+#   error:  the request could not be run (message), last
+# Several requests may be sent one after another on a connection.
+
+
+#--------------------------------------------------------------------------
+#   Utility functions for command line parsing
+#--------------------------------------------------------------------------
+
+def show_usage(name):
+    print("SNURISC5 client: runs the simulator on a daemon started with 'snurisc5.py serve'")
+    print("Usage: %s [--socket path] [snurisc5.py options] filename" % name)
+    print("\t--socket connects to the daemon at path (default: %s)" % SOCKET_PATH)
+    print("\tthe other options are those of snurisc5.py")
+
+
+# Returns (socket path, command line for the daemon), or None on an error
+def parse_args(args):
+    path = SOCKET_PATH
+    rest = [ args[0] ]
+    index = 1
+    while index < len(args):
+        if args[index] == '--socket':
+            if index + 1 == len(args):
+                return None
+            path = args[index + 1]
+            index += 2
+        else:
+            rest.append(args[index])
+            index += 1
+    if len(rest) < 2:
+        return None
+    return path, rest
+
+
+#--------------------------------------------------------------------------
+#   Client main
+#--------------------------------------------------------------------------
+
+def main():
+
+    args = parse_args(sys.argv)
+    if not args:
+        show_usage(sys.argv[0])
+        sys.exit()
+    path, cmdline = args
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        print("Cannot connect to the daemon at %s: %s" % (path, e.strerror))
+        sys.exit(1)
+
+    with sock, sock.makefile('rb') as f:
+        req = { 'args' : cmdline, 'cwd' : os.getcwd() }
+        sock.sendall(json.dumps(req).encode() + b'\n')
+        for line in f:
+            msg = json.loads(line)
+            if msg['type'] == 'output':
+                out = sys.stdout if msg['stream'] == 'stdout' else sys.stderr
+                out.buffer.write(msg['data'].encode('utf-8', 'surrogateescape'))
+                out.buffer.flush()
+            elif msg['type'] == 'error':
+                print("Daemon error: %s" % msg['message'])
+                sys.exit(1)
+            elif msg['type'] == 'exit':
+                sys.exit(msg['status'])
+    print("Connection to the daemon closed")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Commit log: one record for each instruction retired from WB, written
+#   into preallocated NumPy columns and flushed in compressed chunks
+#   (--commit-log), and a converter to the text format of
+#   'spike --log-commits'.
+#
+#==========================================================================
+
+import os
+import sys
+import gzip
+import struct
+
+import numpy as np
+
+from consts import *
+from isa import *
+from stages import SP, P_PUSH, P_POP
+from pk import REG_A0
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+MAGIC           = b'SNURISC5 commit log 1\n'
+CHUNK           = 64 * 1024             # records in a chunk
+LEVEL           = 6                     # gzip compression level
+
+# Flags of a record
+F_RD            = 1                     # writes rd (never x0)
+F_RD2           = 2                     # writes a second register (sp of pop)
+F_LOAD          = 4                     # reads addr
+F_STORE         = 8                     # writes data to addr
+
+# Columns of a chunk, in the order they are written
+COLUMNS = [
+    ('hart',    np.uint8),
+    ('cycle',   np.uint64),             # cycle in which the instruction left WB
+    ('pc',      np.uint32),
+    ('inst',    np.uint32),             # expanded to 32 bits for RV32C
+    ('flags',   np.uint8),
+    ('rd',      np.uint8),
+    ('rd_val',  np.uint32),
+    ('rd2',     np.uint8),
+    ('rd2_val', np.uint32),
+    ('addr',    np.uint32),
+    ('data',    np.uint32),
+]
+
+
+#--------------------------------------------------------------------------
+#   CommitLog: collects and writes the records
+#--------------------------------------------------------------------------
+
+class CommitLog(object):
+
+    # A file holds MAGIC and then chunks, each a record count (32 bits)
+    # followed by the columns for that many records, all compressed with gzip
+    def __init__(self, filename):
+        self.name       = "Commit log"
+        self.filename   = filename
+        self.f          = gzip.open(filename, 'wb', compresslevel = LEVEL)
+        self.f.write(MAGIC)
+        self.cols       = [ np.zeros(CHUNK, dtype = dtype) for name, dtype in COLUMNS ]
+        self.n          = 0             # records in the columns
+        self.records    = 0
+        self.size       = 0             # bytes of the compressed file, once closed
+
+    # Called by WB for each instruction retired in the cycle (latch t),
+    # after the register file has been written. Instructions that raise
+    # an exception do not commit.
+    def record(self, cpu, t):
+        if t.exception:
+            return
+        flags = rd = rd_val = rd2 = rd2_val = addr = data = 0
+        if t.c_rf_wen:
+            if t.p_type == P_PUSH:
+                rd, rd_val = SP, t.wbdata
+            elif t.p_type == P_POP:
+                rd, rd_val, rd2, rd2_val = t.rd, t.wbdata, SP, t.sp_data_plus4
+                flags = F_RD2
+            else:
+                rd, rd_val = t.rd, t.wbdata
+        if t.inst == ECALL:
+            rd, rd_val = REG_A0, cpu.rf.reg[REG_A0]     # the result of the system call
+        if rd:
+            flags |= F_RD
+        if t.c_dmem_en:
+            addr = t.sp_data if t.p_type == P_POP else t.alu_out
+            if t.c_dmem_rw == M_XWR:
+                flags |= F_STORE
+                data = t.rs2_data
+            else:
+                flags |= F_LOAD
+        i = self.n
+        c_hart, c_cycle, c_pc, c_inst, c_flags, c_rd, c_rd_val, c_rd2, c_rd2_val, c_addr, c_data = self.cols
+        c_hart[i], c_cycle[i], c_pc[i], c_inst[i], c_flags[i] = cpu.hartid, cpu.stat.cycle, t.pc, t.inst, flags
+        c_rd[i], c_rd_val[i], c_rd2[i], c_rd2_val[i], c_addr[i], c_data[i] = rd, rd_val, rd2, rd2_val, addr, data
+        self.n = i + 1
+        if self.n == CHUNK:
+            self.flush()
+
+    def flush(self):
+        n = self.n
+        if n == 0:
+            return
+        self.f.write(struct.pack('<I', n))
+        for col in self.cols:
+            self.f.write(col[:n].tobytes())
+        self.records += n
+        self.n = 0
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        self.f.close()
+        self.f = None
+        self.size = os.path.getsize(self.filename)
+
+    def summary(self):
+        return "%s: %d instructions written to %s (%d bytes, %.2f bytes/instruction)" % \
+               (self.name, self.records, self.filename, self.size,
+                0.0 if self.records == 0 else self.size / self.records)
+
+    # Yields the chunks of a commit log as dictionaries of columns
+    @staticmethod
+    def read(filename):
+        with gzip.open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a commit log" % filename)
+            while True:
+                head = f.read(4)
+                if len(head) < 4:
+                    return
+                n = struct.unpack('<I', head)[0]
+                chunk = { }
+                for name, dtype in COLUMNS:
+                    size = n * np.dtype(dtype).itemsize
+                    buf = f.read(size)
+                    if len(buf) < size:
+                        raise ValueError("%s is truncated" % filename)
+                    chunk[name] = np.frombuffer(buf, dtype = dtype)
+                yield chunk
+
+    # Writes a commit log in the format of 'spike --log-commits' (machine
+    # mode, 32-bit registers)
+    @staticmethod
+    def to_spike(filename, out):
+        for chunk in CommitLog.read(filename):
+            cols = [ chunk[name].tolist() for name, dtype in COLUMNS ]
+            for hart, cycle, pc, inst, flags, rd, rd_val, rd2, rd2_val, addr, data in zip(*cols):
+                line = "core %3d: 3 0x%08x (0x%08x)" % (hart, pc, inst)
+                if flags & F_RD:
+                    line += " x%-2d 0x%08x" % (rd, rd_val)
+                if flags & F_RD2:
+                    line += " x%-2d 0x%08x" % (rd2, rd2_val)
+                if flags & F_LOAD:
+                    line += " mem 0x%08x" % addr
+                elif flags & F_STORE:
+                    line += " mem 0x%08x 0x%08x" % (addr, data)
+                out.write(line + '\n')
+
+
+#--------------------------------------------------------------------------
+#   Converter main
+#--------------------------------------------------------------------------
+
+def main():
+
+    args = sys.argv[1:]
+    if len(args) not in [ 1, 3 ] or (len(args) == 3 and args[1] != '-o'):
+        print("Usage: %s commit-log [-o output]" % sys.argv[0])
+        print("\tconverts a commit log of snurisc5.py --commit-log to the text of spike --log-commits")
+        sys.exit()
+
+    try:
+        if len(args) == 3:
+            with open(args[2], 'w') as out:
+                CommitLog.to_spike(args[0], out)
+        else:
+            CommitLog.to_spike(args[0], sys.stdout)
+    except (IOError, ValueError, EOFError) as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
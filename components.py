@@ -102,6 +102,7 @@ class Memory(object):
         self.mem_start  = mem_start
         self.mem_end    = mem_start + mem_size
         self.mem        = WORD([0] * self.mem_words)
+        self.on_write   = None          # called with the address on every write
 
     def access(self, valid, addr, data, fcn):
 
@@ -115,12 +116,20 @@ class Memory(object):
             res = ( val, True )
         elif fcn == M_XWR:
             self.mem[(addr - self.mem_start) // self.word_size] = WORD(data) 
+            if self.on_write is not None:
+                self.on_write(addr)
             res = ( WORD(0), True )
         else:
             res = ( WORD(0), False )
 
         return res
 
+    # Writes a word regardless of the access rights of the bus (ELF loading, GDB)
+    def load(self, addr, data):
+        self.mem[(addr - self.mem_start) // self.word_size] = WORD(data)
+        if self.on_write is not None:
+            self.on_write(addr)
+
     def dump(self, skipzero = False):
 
         print("Memory 0x%08x - 0x%08x" % (self.mem_start, self.mem_end - 1))
@@ -171,12 +180,172 @@ class ALU(object):
             output = alu2
         elif alufun == ALU_SEQ:
             output = WORD(1) if (alu1 == alu2) else WORD(0)
+        elif alufun in MULDIV_OPS:
+            output = WORD(muldiv(alufun, int(alu1), int(alu2)))
         else:
             output = WORD(0)
 
         return output
 
 
+# RV32M operations on unsigned 32-bit ints. Division by zero and overflow
+# give the results defined by the ISA instead of trapping.
+def sext32(a):
+    return (a ^ 0x80000000) - 0x80000000
+
+def div32(a, b):
+    if b == 0:
+        return 0xffffffff
+    a, b = sext32(a), sext32(b)
+    q = abs(a) // abs(b)
+    return (-q if (a < 0) != (b < 0) else q) & 0xffffffff
+
+def rem32(a, b):
+    if b == 0:
+        return a
+    a, b = sext32(a), sext32(b)
+    r = abs(a) % abs(b)
+    return (-r if a < 0 else r) & 0xffffffff
+
+def muldiv(alufun, a, b):
+    if alufun == ALU_MUL:
+        return (a * b) & 0xffffffff
+    elif alufun == ALU_MULH:
+        return ((sext32(a) * sext32(b)) >> 32) & 0xffffffff
+    elif alufun == ALU_MULHSU:
+        return ((sext32(a) * b) >> 32) & 0xffffffff
+    elif alufun == ALU_MULHU:
+        return (a * b) >> 32
+    elif alufun == ALU_DIV:
+        return div32(a, b)
+    elif alufun == ALU_DIVU:
+        return a // b if b else 0xffffffff
+    elif alufun == ALU_REM:
+        return rem32(a, b)
+    else:
+        return a % b if b else a
+
+
+#--------------------------------------------------------------------------
+#   MulDiv: models the timing of the multi-cycle multiplier/divider in EX
+#--------------------------------------------------------------------------
+
+class MulDiv(object):
+
+    # mul_lat and div_lat are the cycles an operation spends in EX
+    def __init__(self, name, mul_lat, div_lat):
+        self.name           = name
+        self.mul_lat        = mul_lat
+        self.div_lat        = div_lat
+        self.muls           = 0
+        self.divs           = 0
+        self.stall_cycles   = 0         # cycles the pipeline waited only for this unit
+
+    # Starts an operation and returns the cycles it stays in EX after the first one
+    def access(self, alufun):
+        if alufun in MUL_OPS:
+            self.muls += 1
+            return self.mul_lat - 1
+        self.divs += 1
+        return self.div_lat - 1
+
+    # Programs without RV32M instructions show nothing
+    def summary(self):
+        if self.muls + self.divs == 0:
+            return None
+        return "%s: %d multiplies (%d cycles), %d divides (%d cycles), %d stall cycles" % \
+               (self.name, self.muls, self.mul_lat, self.divs, self.div_lat, self.stall_cycles)
+
+
+#--------------------------------------------------------------------------
+#   FetchCounter: counts the imem traffic of the IF stage
+#--------------------------------------------------------------------------
+
+class FetchCounter(object):
+
+    def __init__(self, name):
+        self.name           = name
+        self.insts          = 0         # instructions passed to ID (including squashed ones)
+        self.compressed     = 0         # RV32C instructions among them
+        self.reads          = 0         # imem words read
+        self.split_stalls   = 0         # cycles spent reading the first half of a split instruction
+
+    def summary(self):
+        if self.insts == 0:
+            return None
+        size = (4 * self.insts - 2 * self.compressed) / self.insts
+        return "%s: %d instructions (%d compressed, %.2f bytes each), %d imem reads (%.2f bytes/instruction), %d split stalls" % \
+               (self.name, self.insts, self.compressed, size, self.reads,
+                4.0 * self.reads / self.insts, self.split_stalls)
+
+
+#--------------------------------------------------------------------------
+#   IssueCounter: issue slot utilization of a multiple-issue pipeline
+#--------------------------------------------------------------------------
+
+class IssueCounter(object):
+
+    def __init__(self, name, width, stat):
+        self.name           = name
+        self.width          = width
+        self.stat           = stat      # retired instructions and cycles of the core
+        self.issued         = [ 0 ] * (width + 1)   # cycles by the number of instructions issued
+        self.held           = { }       # reason -> times an instruction waited for the next cycle
+
+    def summary(self):
+        cycles = sum(self.issued)
+        if cycles == 0:
+            return None
+        used = sum(n * c for n, c in enumerate(self.issued))
+        held = sorted(self.held.items(), key = lambda r: -r[1])
+        return "%s: %d-wide, IPC = %.3f, %d of %d issue slots used (%.2f%%), cycles issuing %s: %s%s" % \
+               (self.name, self.width, self.stat.icount / max(self.stat.cycle, 1), used,
+                self.width * cycles, used * 100.0 / (self.width * cycles),
+                '/'.join('%d' % n for n in range(self.width, -1, -1)),
+                '/'.join('%d' % c for c in reversed(self.issued)),
+                "" if not held else ", held by " + ", ".join("%s %d" % r for r in held))
+
+
+#--------------------------------------------------------------------------
+#   CPIStack: breaks the CPI of a single-issue pipeline down by cause
+#--------------------------------------------------------------------------
+
+# Causes of a cycle in which no instruction enters EX
+CPI_FILL        = 'fill'            # pipeline (re)started
+CPI_ICACHE      = 'I-cache'
+CPI_SPLIT       = 'split fetch'     # first half of an RV32C split instruction
+CPI_LOAD_USE    = 'load-use'
+CPI_ALU_USE     = 'ALU-use'         # ALU result not ready yet (split EX)
+CPI_BRANCH      = 'branch operands' # early branch resolution waiting for its operands
+CPI_MISPREDICT  = 'mispredict'
+CPI_ECALL       = 'ecall'
+CPI_DCACHE      = 'D-cache'
+CPI_MULDIV      = 'mul/div'
+CPI_OTHER       = 'other'           # drain at the end, and cancelled instructions
+
+class CPIStack(object):
+
+    def __init__(self, name, stat):
+        self.name           = name
+        self.stat           = stat      # retired instructions and cycles of the core
+        self.lost           = { }       # cause -> cycles in which nothing entered EX
+
+    # Called by ID for each cycle in which it passes nothing to EX
+    def add(self, cause):
+        self.lost[cause] = self.lost.get(cause, 0) + 1
+
+    # Every retired instruction accounts for one cycle (the base CPI of 1).
+    # The rest is the cycles lost in ID by cause, and the pipeline drain.
+    def summary(self):
+        n = self.stat.icount
+        if not self.lost or n == 0:
+            return None
+        other = self.lost.get(CPI_OTHER, 0) + self.stat.cycle - n - sum(self.lost.values())
+        lost = sorted([ c for c in self.lost.items() if c[0] != CPI_OTHER ], key = lambda c: -c[1])
+        return "%s: CPI %.3f = base 1.000 + %s" % (self.name, self.stat.cycle / n,
+               " + ".join("%s %.3f" % (c, k / n) for c, k in lost + [ (CPI_OTHER, other) ]))
+
+
 #--------------------------------------------------------------------------
 #   Adder: models a simple 32-bit adder
 #--------------------------------------------------------------------------
@@ -0,0 +1,237 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Machine description: the memory map, branch prediction, RV32C support,
+#   multiplier/divider latencies, caches, number of cores, issue width,
+#   branch resolution stage, and pipeline depth of the target, optionally
+#   loaded from a JSON or TOML file.
+#
+#==========================================================================
+
+from consts import *
+from cache import Cache
+from bus import PAGE_SHIFT, UART_SIZE, TIMER_SIZE, SIMCTL_SIZE
+
+
+#--------------------------------------------------------------------------
+#   Configurations: the default machine
+#--------------------------------------------------------------------------
+
+IMEM_START  = WORD(0x80000000)      # IMEM: 0x80000000 - 0x8000ffff (64KB)
+IMEM_SIZE   = WORD(64 * 1024)
+DMEM_START  = WORD(0x80010000)      # DMEM: 0x80010000 - 0x8001ffff (64KB)
+DMEM_SIZE   = WORD(64 * 1024)
+
+SIMCTL_START = 0x00100000
+TIMER_START = 0x0200bff8
+UART_START  = 0x10000000
+
+BTB_K       = 4                     # the BTB has 2^k entries
+
+MUL_LAT     = 3                     # cycles a multiply spends in EX
+DIV_LAT     = 32                    # cycles a divide or remainder spends in EX
+
+PRED_BTB    = 'btb'                 # predicts taken for the targets in the BTB
+PRED_NONE   = 'none'                # always predicts not taken
+
+PREDICTORS  = [ PRED_BTB, PRED_NONE ]
+
+RESOLVE_EX  = 'ex'                  # branches resolve in EX (2-cycle mispredict penalty)
+RESOLVE_ID  = 'id'                  # early branch resolution in ID (1-cycle penalty)
+
+RESOLVE_STAGES = [ RESOLVE_EX, RESOLVE_ID ]
+
+SPLIT_IF    = 'if'                  # stages that can be split into two sub-stages
+SPLIT_EX    = 'ex'
+SPLIT_MM    = 'mm'
+
+SPLITS      = [ SPLIT_IF, SPLIT_EX, SPLIT_MM ]
+
+DEVICES     = { 'uart' : UART_SIZE, 'timer' : TIMER_SIZE, 'simctl' : SIMCTL_SIZE }
+
+MACHINE_DEFAULTS = {
+    'memory'    : {
+        'imem'      : { 'start' : int(IMEM_START), 'size' : int(IMEM_SIZE) },
+        'dmem'      : { 'start' : int(DMEM_START), 'size' : int(DMEM_SIZE) },
+        'uart'      : { 'start' : UART_START },         # null or false removes a device
+        'timer'     : { 'start' : TIMER_START },
+        'simctl'    : { 'start' : SIMCTL_START },
+    },
+    'btb'       : { 'entries' : 2 ** BTB_K },
+    'predictor' : PRED_BTB,
+    'rvc'       : False,                # RV32C compressed instructions
+    'muldiv'    : { 'mul_lat' : MUL_LAT, 'div_lat' : DIV_LAT },
+    'cores'     : 1,
+    'issue'     : 1,                    # 1, or 2 for the dual-issue variant
+    'resolve'   : RESOLVE_EX,           # stage that resolves branches and jumps
+    'split'     : [ ],                  # stages split into two sub-stages (if, ex, mm)
+    'icache'    : None,                 # cache parameters (see cache.py), null or false if none
+    'dcache'    : None,
+}
+
+
+#--------------------------------------------------------------------------
+#   Machine: a validated machine description
+#--------------------------------------------------------------------------
+
+class Machine(object):
+
+    # desc is a (partial) description in the form of MACHINE_DEFAULTS.
+    # Raises ValueError if it is not valid.
+    def __init__(self, desc = None):
+        d = self.desc = Machine.merge(MACHINE_DEFAULTS, desc or { }, 'machine')
+        mem = Machine.table(d, 'memory')
+
+        self.imem_start, self.imem_size = Machine.region(mem, 'imem', True)
+        self.dmem_start, self.dmem_size = Machine.region(mem, 'dmem', True)
+        self.devices = { }              # name -> start address
+        for name in DEVICES:
+            if mem[name] not in [ None, False ]:
+                self.devices[name] = Machine.region(mem, name, False)[0]
+
+        # Regions are dispatched by page on the bus
+        pages = { }
+        for name, start, end in [ ('imem', self.imem_start, self.imem_start + self.imem_size),
+                                  ('dmem', self.dmem_start, self.dmem_start + self.dmem_size) ] + \
+                                [ (name, start, start + DEVICES[name]) for name, start in self.devices.items() ]:
+            for p in range(start >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1):
+                if p in pages:
+                    raise ValueError("memory.%s shares the page at 0x%08x with memory.%s" % \
+                                     (name, p << PAGE_SHIFT, pages[p]))
+                pages[p] = name
+
+        entries = Machine.number(d['btb'], 'entries', 'btb')
+        if entries < 1 or entries & (entries - 1):
+            raise ValueError("btb.entries %d is not a power of two" % entries)
+        self.btb_k = entries.bit_length() - 1
+
+        self.predictor = d['predictor']
+        if self.predictor not in PREDICTORS:
+            raise ValueError("unknown predictor '%s' (%s)" % (self.predictor, ', '.join(PREDICTORS)))
+
+        self.rvc = d['rvc']
+        if not isinstance(self.rvc, bool):
+            raise ValueError("rvc should be true or false")
+
+        self.mul_lat = Machine.number(d['muldiv'], 'mul_lat', 'muldiv')
+        self.div_lat = Machine.number(d['muldiv'], 'div_lat', 'muldiv')
+        if self.mul_lat < 1 or self.div_lat < 1:
+            raise ValueError("muldiv latencies should be at least 1 cycle")
+
+        self.cores = Machine.number(d, 'cores', 'machine')
+        if self.cores < 1:
+            raise ValueError("invalid number of cores %d" % self.cores)
+
+        self.issue = Machine.number(d, 'issue', 'machine')
+        if self.issue not in [ 1, 2 ]:
+            raise ValueError("issue width %d is not 1 or 2" % self.issue)
+        if self.issue > 1 and self.rvc:
+            raise ValueError("rvc is supported only with issue width 1")
+
+        self.resolve = d['resolve']
+        if self.resolve not in RESOLVE_STAGES:
+            raise ValueError("unknown branch resolution stage '%s' (%s)" % (self.resolve, ', '.join(RESOLVE_STAGES)))
+        if self.issue > 1 and self.resolve != RESOLVE_EX:
+            raise ValueError("early branch resolution is supported only with issue width 1")
+
+        self.split = d['split']
+        if not isinstance(self.split, list) or any(s not in SPLITS for s in self.split) or \
+           len(set(self.split)) != len(self.split):
+            raise ValueError("split should be a list of distinct stages (%s)" % ', '.join(SPLITS))
+        if self.issue > 1 and self.split:
+            raise ValueError("split stages are supported only with issue width 1")
+
+        # Cache geometry is checked by building a cache once. Like devices,
+        # caches are removed by null or false.
+        self.icache = self.dcache = None
+        for key, name in [ ('icache', "I-cache"), ('dcache', "D-cache") ]:
+            if d[key] is not None and d[key] is not False:
+                if not isinstance(d[key], (dict, str)):
+                    raise ValueError("%s should be a table" % key)
+                params = Cache.params(name, d[key])
+                Cache(name, **params)
+                setattr(self, key, params)
+
+    # Loads a JSON (or, with Python 3.11+, TOML) file and applies the
+    # overrides on top of it
+    @staticmethod
+    def load(filename, overrides = None):
+        desc = Machine.read(filename)
+        if not isinstance(desc, dict):
+            raise ValueError("%s: not a machine description" % filename)
+        return Machine(Machine.merge(desc, overrides or { }, 'machine', False))
+
+    # Returns the contents of a JSON or TOML file
+    @staticmethod
+    def read(filename):
+        if filename.endswith('.toml'):
+            try:
+                import tomllib                  # Python 3.11 or later
+            except ImportError:
+                raise ValueError("%s: TOML files need Python 3.11 or later" % filename)
+            with open(filename, 'rb') as f:
+                try:
+                    desc = tomllib.load(f)
+                except tomllib.TOMLDecodeError as e:
+                    raise ValueError("%s: %s" % (filename, e))
+        else:
+            import json
+            with open(filename) as f:
+                try:
+                    desc = json.load(f)
+                except json.JSONDecodeError as e:
+                    raise ValueError("%s: %s" % (filename, e))
+        return desc
+
+    # Returns base updated with over. If check is set, keys must be in base.
+    @staticmethod
+    def merge(base, over, path, check = True):
+        if not isinstance(over, dict):
+            raise ValueError("%s should be a table" % path)
+        d = dict(base)
+        for key, val in over.items():
+            if check and key not in base:
+                raise ValueError("unknown key '%s.%s'" % (path, key))
+            if isinstance(d.get(key), dict) and isinstance(val, dict):
+                val = Machine.merge(d[key], val, '%s.%s' % (path, key), check)
+            d[key] = val
+        return d
+
+    # Returns d[key], which should be a table (dict)
+    @staticmethod
+    def table(d, key):
+        if not isinstance(d[key], dict):
+            raise ValueError("%s should be a table" % key)
+        return d[key]
+
+    # Returns d[key] as an int. Strings may be hex and use a k or M suffix.
+    # d is a table at path.
+    @staticmethod
+    def number(d, key, path):
+        if not isinstance(d, dict):
+            raise ValueError("%s should be a table" % path)
+        val = d.get(key)
+        if isinstance(val, str):
+            scale = { 'k' : 1024, 'K' : 1024, 'M' : 1024 * 1024 }.get(val[-1:], 1)
+            try:
+                val = int(val[:-1] if scale > 1 else val, 0) * scale
+            except ValueError:
+                pass
+        if not isinstance(val, int) or isinstance(val, bool):
+            raise ValueError("invalid value '%s' for %s.%s" % (d.get(key), path, key))
+        return val
+
+    @staticmethod
+    def region(mem, name, sized):
+        r = mem[name]
+        path = 'memory.%s' % name
+        if not isinstance(r, dict):
+            raise ValueError("%s should be a table" % path)
+        start = Machine.number(r, 'start', path)
+        size = Machine.number(r, 'size', path) if sized else DEVICES[name]
+        if start & 3 or size <= 0 or size & 3 or start + size > 1 << 32:
+            raise ValueError("invalid region 0x%x (%d bytes) for %s" % (start, size, path))
+        return start, size
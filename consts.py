@@ -176,8 +176,20 @@ ALU_SLTU            = 10
 ALU_COPY1           = 11
 ALU_COPY2           = 12
 ALU_SEQ             = 13        # Set if equal
+ALU_MUL             = 14        # RV32M: low word of the product
+ALU_MULH            = 15        # high word, signed x signed
+ALU_MULHSU          = 16        # high word, signed x unsigned
+ALU_MULHU           = 17        # high word, unsigned x unsigned
+ALU_DIV             = 18
+ALU_DIVU            = 19
+ALU_REM             = 20
+ALU_REMU            = 21
 ALU_X               = 0
 
+MUL_OPS             = frozenset([ ALU_MUL, ALU_MULH, ALU_MULHSU, ALU_MULHU ])
+DIV_OPS             = frozenset([ ALU_DIV, ALU_DIVU, ALU_REM, ALU_REMU ])
+MULDIV_OPS          = MUL_OPS | DIV_OPS
+
 
 #--------------------------------------------------------------------------
 #   csignal[CS_WB_SEL]: Writeback select signal
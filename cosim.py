@@ -0,0 +1,177 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Co-simulation checker. Runs the functional reference model on its own
+#   copy of the architectural state and compares it with every instruction
+#   (or every N-th instruction) retired from the WB stage.
+#
+#==========================================================================
+
+import collections
+
+from consts import *
+from isa import *
+from program import *
+from stages import SP, P_PUSH, P_POP
+from functional import Functional
+from pk import Replay, REG_A0
+from bus import BusReplay
+
+
+#--------------------------------------------------------------------------
+#   StoreLog: dmem word list that remembers the last store
+#--------------------------------------------------------------------------
+
+class StoreLog(list):
+
+    def __setitem__(self, index, value):
+        self.last = (index, value)
+        list.__setitem__(self, index, value)
+
+
+#--------------------------------------------------------------------------
+#   Cosim: lockstep checker against the functional model
+#--------------------------------------------------------------------------
+
+class Cosim(object):
+
+    # The reference state is copied from the cpu, so this should be created
+    # right before the pipeline starts at pc
+    def __init__(self, cpu, pc, every = 1):
+        self.cpu        = cpu
+        self.every      = every
+        self.ref        = Functional(cpu)
+
+        # System calls and device accesses are run by the pipeline and
+        # replayed by the reference
+        cpu.kernel.record = collections.deque()
+        self.ref.kernel = Replay(cpu.kernel.record)
+        cpu.bus.record = collections.deque()
+        self.ref.io     = BusReplay(cpu.bus, cpu.bus.record)
+        self.x          = [ int(v) for v in cpu.rf.reg ]
+        self.x[0]       = 0
+        self.d          = StoreLog(cpu.dmem.mem.tolist())
+        self.ds         = int(cpu.dmem.mem_start)
+        self.pc         = int(pc)
+        self.exc        = EXC_NONE
+
+        self.retired    = 0         # retirements seen from WB
+        self.pending    = 0         # retirements not yet executed by the reference
+        self.checked    = 0
+        self.diverged   = False
+
+    # Called by WB for each retired instruction (latch t) after the register
+    # file has been written. Returns False on a divergence.
+    def retire(self, t):
+        self.retired += 1
+        if self.retired % self.every:
+            self.pending += 1
+            return True
+
+        # Catch up on the unchecked retirements with translated blocks
+        if self.pending and not self.catch_up(t):
+            return False
+
+        self.d.last = None
+        self.ref.io.last = None
+        before = list(self.x)
+        pc = self.pc
+        self.pc, k, self.exc, taken = self.ref.step(pc, self.x, self.d)
+        self.checked += 1
+
+        diffs = [ ]
+        if int(t.pc) != pc or k != 1:
+            diffs.append("pc: pipe 0x%08x, ref 0x%08x%s" % (t.pc, pc,
+                         "" if k == 1 else " (%s)" % EXC_MSG[self.exc]))
+        else:
+            # Register writes of the instruction, including the sp update of
+            # push/pop, and anything else the reference wrote
+            writes = { }
+            if t.c_rf_wen:
+                if t.p_type == P_PUSH:
+                    writes[int(SP)] = int(t.wbdata)
+                elif t.p_type == P_POP:
+                    writes[int(t.rd)] = int(t.wbdata)
+                    writes[int(SP)] = int(t.sp_data_plus4)
+                else:
+                    writes[int(t.rd)] = int(t.wbdata)
+            if t.inst == ECALL:
+                writes[REG_A0] = int(self.cpu.rf.reg[REG_A0])
+            for r in range(1, NUM_REGS):
+                if r in writes and writes[r] != self.x[r]:
+                    diffs.append("R[%d]: pipe 0x%08x, ref 0x%08x" % (r, writes[r], self.x[r]))
+                elif r not in writes and before[r] != self.x[r]:
+                    diffs.append("R[%d]: pipe not written, ref 0x%08x" % (r, self.x[r]))
+
+            # Store address and data
+            pstore = (int(t.alu_out), int(t.rs2_data)) \
+                     if t.c_dmem_en and t.c_dmem_rw == M_XWR and not t.exception & EXC_DMEM_ERROR else None
+            rstore = (self.ds + 4 * self.d.last[0], self.d.last[1]) if self.d.last else self.ref.io.last
+            if pstore != rstore and t.inst != ECALL:
+                diffs.append("store: pipe %s, ref %s" % (self.fmt_store(pstore), self.fmt_store(rstore)))
+
+        # When sampling, the whole register file is compared as well
+        if not diffs and self.every > 1:
+            diffs = self.compare_rf()
+
+        if diffs:
+            self.report("retirement %d, 0x%08x: %s" % (self.retired, t.pc, Program.disasm(t.pc, t.inst)), diffs)
+            return False
+        return True
+
+    # Runs the reference over the pending retirements
+    def catch_up(self, t = None):
+        pc, n, self.exc = self.ref.execute(self.pc, self.x, self.d, self.pending)
+        if n != self.pending:
+            where = "retirement %d" % (self.retired - self.pending + n + 1) if t is None else \
+                    "retirement %d, 0x%08x: %s" % (self.retired, t.pc, Program.disasm(t.pc, t.inst))
+            self.report(where, [ "ref stopped at 0x%08x (%s) after %d of %d unchecked retirements" % \
+                                 (pc, EXC_MSG[self.exc], n, self.pending) ])
+            return False
+        self.pc, self.pending = pc, 0
+        return True
+
+    def compare_rf(self):
+        return [ "R[%d]: pipe 0x%08x, ref 0x%08x" % (r, self.cpu.rf.reg[r], self.x[r])
+                 for r in range(1, NUM_REGS) if int(self.cpu.rf.reg[r]) != self.x[r] ]
+
+    @staticmethod
+    def fmt_store(s):
+        return "-" if s is None else "M[0x%08x] <- 0x%08x" % s
+
+    def report(self, where, diffs):
+        self.diverged = True
+        print("Cosim: divergence at %s" % where)
+        for d in diffs:
+            print("    %s" % d)
+
+    # Checks how the pipeline stopped (exception at pc) and the final
+    # registers and dmem. Returns False on a divergence.
+    def finish(self, exception, pc):
+        if self.diverged:
+            return False
+        if self.pending and not self.catch_up():
+            return False
+
+        # Exceptions that are not retired from WB (illegal instruction,
+        # imem error) are not seen by retire()
+        ref_pc, ref_exc = self.pc, self.exc
+        if ref_exc == EXC_NONE:
+            ref_pc, k, ref_exc, taken = self.ref.step(self.pc, self.x, self.d)
+
+        diffs = [ ]
+        if ref_exc != exception or ref_pc != int(pc):
+            diffs.append("exit: pipe %s at 0x%08x, ref %s at 0x%08x" % \
+                         (EXC_MSG.get(int(exception), "none"), pc, EXC_MSG[ref_exc], ref_pc))
+        diffs += self.compare_rf()
+        mem = self.cpu.dmem.mem.tolist()
+        diffs += [ "M[0x%08x]: pipe 0x%08x, ref 0x%08x" % (self.ds + 4 * i, mem[i], self.d[i])
+                   for i in range(len(mem)) if mem[i] != self.d[i] ][:8]
+        if diffs:
+            self.report("exit", diffs)
+            return False
+        print("Cosim: %d of %d retirements checked, no divergence" % (self.checked, self.retired))
+        return True
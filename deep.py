@@ -0,0 +1,367 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Deeper pipelines: IF, EX, and MM can each be split into two sub-stages.
+#   The first half does the work of the original stage and the second half
+#   (IF2, EX2, MM2) only holds the instruction for another cycle, while the
+#   results count as ready at the end of the second half. The forwarding
+#   paths, stall lengths, and mispredict penalty follow from the depth.
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+from program import *
+from stages import *
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+# Forwarded value for a register written by the instruction in each stage
+# after ID, and for sp updated by push/pop there
+FWD_DEEP_REG = {
+    S_EX    : FWD_REG[S_EX],
+    S_EX2   : lambda: Pipe.EX2.alu_out,
+    S_MM    : FWD_REG[S_MM],
+    S_MM2   : lambda: Pipe.MM2.wbdata,
+    S_WB    : FWD_REG[S_WB],
+}
+
+FWD_DEEP_SP = dict(FWD_SP)
+FWD_DEEP_SP[(S_EX2, P_PUSH)]    = lambda: Pipe.EX2.alu_out
+FWD_DEEP_SP[(S_EX2, P_POP)]     = lambda: Pipe.EX2.alu_out
+FWD_DEEP_SP[(S_MM2, P_PUSH)]    = lambda: Pipe.MM2.wbdata
+FWD_DEEP_SP[(S_MM2, P_POP)]     = lambda: Pipe.MM2.sp_data_plus4
+
+
+#--------------------------------------------------------------------------
+#   IF2: second half of a split IF
+#--------------------------------------------------------------------------
+
+class IF2(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = FetchLatch()  # Pipe.IF2.reg (filled by IF like Pipe.ID.reg)
+        self.nxt            = FetchLatch()  # Pipe.IF2.nxt (back buffer)
+        self.reg.bubble(WORD(0))
+        self.nxt.bubble(WORD(0))
+
+        #--------------------------------------------------
+
+        # Internal signals:----------------------------
+        #
+        #   self.out                # Pipe.IF2.out (IF/ID latch being filled)
+        #
+        #----------------------------------------------
+
+    def compute(self):
+
+        r = self.reg
+        o = self.out = Pipe.ID.nxt
+        o.pc, o.inst, o.exception = r.pc, r.inst, r.exception
+        o.pcplus4, o.taken, o.cause = r.pcplus4, r.taken, r.cause
+
+    # Same as IF: IF2 is stalled and cancelled along with IF
+    def update(self):
+
+        o = self.out
+        if Pipe.CTL.ID_bubble:
+            Pipe.ID.reg.bubble(o.pc, CPI_MISPREDICT)
+        elif not Pipe.CTL.ID_stall:
+            Pipe.ID.reg, Pipe.ID.nxt = o, Pipe.ID.reg
+
+        Pipe.log(S_IF2, o.pc, o.inst, '# -')
+
+    def flush(self, pc):
+        self.reg.bubble(WORD(0))
+        self.nxt.bubble(WORD(0))
+
+
+#--------------------------------------------------------------------------
+#   EX2: second half of a split EX
+#--------------------------------------------------------------------------
+
+class EX2(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))     # Pipe.EX2.reg
+
+        #--------------------------------------------------
+
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.EX2.t (latch of the instruction in EX2)
+        #   self.pc                 # Pipe.EX2.pc
+        #   self.inst               # Pipe.EX2.inst
+        #   self.exception          # Pipe.EX2.exception
+        #   self.pcplus4            # Pipe.EX2.pcplus4
+        #   self.alu_out            # Pipe.EX2.alu_out
+        #   self.brjmp_target       # Pipe.EX2.brjmp_target
+        #   self.jump_reg_target    # Pipe.EX2.jump_reg_target
+        #
+        #----------------------------------------------
+
+    def compute(self):
+
+        t = self.t              = self.reg
+        self.pc                 = t.pc
+        self.inst               = t.inst
+        self.exception          = t.exception
+        self.pcplus4            = t.pcplus4
+        self.alu_out            = t.alu_out
+
+    # Branches resolve here, with the targets computed by EX. They are only
+    # needed on a mispredict, so they are computed again on demand (alu_out
+    # holds pc + 4 for jumps).
+    @property
+    def brjmp_target(self):
+        return Pipe.cpu.adder_brtarget.op(self.t.pc, self.t.op2_data)
+
+    @property
+    def jump_reg_target(self):
+        return Pipe.cpu.adder_brtarget.op(self.t.op1_data, self.t.op2_data) & WORD(0xfffffffe)
+
+    def update(self):
+
+        t = self.t
+        if Pipe.CTL.MM_stall:
+            pass                    # MM keeps its instruction; EX2 holds this one
+        elif Pipe.CTL.MM_bubble:
+            Pipe.MM.reg             = InstLatch.bubble(self.pc, self.exception)
+        else:
+            Pipe.MM.reg             = t
+
+            # for BTB
+            if Pipe.cpu.resolver is not self:
+                pass
+            elif (self.inst != BUBBLE) and (t.taken == TAKEN_1) and (Pipe.CTL.pc_sel != PC_BRJMP):
+                Pipe.cpu.btb.remove(self.pc)
+            elif (self.inst != BUBBLE) and (t.taken == TAKEN_0) and (Pipe.CTL.pc_sel == PC_BRJMP):
+                Pipe.cpu.btb.add(self.pc, self.brjmp_target)
+
+        Pipe.log(S_EX2, self.pc, self.inst, '# -' if self.inst == BUBBLE else '# alu_out=0x%08x' % self.alu_out)
+
+    def flush(self, pc):
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))
+
+
+#--------------------------------------------------------------------------
+#   MM2: second half of a split MM
+#--------------------------------------------------------------------------
+
+class MM2(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))     # Pipe.MM2.reg
+
+        #--------------------------------------------------
+
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.MM2.t (latch of the instruction in MM2)
+        #   self.exception          # Pipe.MM2.exception
+        #   self.wbdata             # Pipe.MM2.wbdata
+        #   self.sp_data_plus4      # Pipe.MM2.sp_data_plus4
+        #
+        #----------------------------------------------
+
+    def compute(self):
+
+        t = self.t          = self.reg
+        self.exception      = t.exception
+        self.wbdata         = t.wbdata
+        self.sp_data_plus4  = t.sp_data_plus4
+
+    def update(self):
+
+        t = self.t
+        Pipe.WB.reg         = t
+        Pipe.log(S_MM2, t.pc, t.inst, '# -' if t.inst == BUBBLE or not t.c_rf_wen else '# wbdata=0x%08x' % self.wbdata)
+
+    def flush(self, pc):
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))
+
+
+#--------------------------------------------------------------------------
+#   DeepControl: control logic for any depth (executed in ID stage)
+#--------------------------------------------------------------------------
+
+# The stages after ID are numbered by their distance from ID, starting at 0
+# for EX. An ALU result can be forwarded from the last EX sub-stage on, and
+# a loaded value from the last MM sub-stage on. With early branch resolution,
+# a branch in ID gets them only from the stage after that.
+class DeepControl(Control):
+
+    def __init__(self):
+        super().__init__()
+
+        # Set by setup() -------------------------------
+        #
+        #   self.after              # stages after ID
+        #   self.ids                # their stage numbers (S_EX, S_EX2, ...)
+        #   self.alu_ready          # distance from which ALU results are forwarded
+        #   self.load_ready         # distance from which loaded values are forwarded
+        #   self.mm_in              # stage that feeds MM (EX or EX2)
+        #   self.mm_side            # MM and MM2, whose exceptions cancel the instruction entering MM
+        #
+        #----------------------------------------------
+
+    # pipeline is the list of all stages
+    def setup(self, pipeline, ids):
+        n = ids.index(S_ID) + 1
+        self.after          = pipeline[n:]
+        self.ids            = ids[n:]
+        self.alu_ready      = self.ids.index(S_EX2 if S_EX2 in self.ids else S_EX)
+        self.load_ready     = self.ids.index(S_MM2 if S_MM2 in self.ids else S_MM)
+        self.mm_in          = self.after[self.ids.index(S_MM) - 1]
+        self.mm_side        = [ s for s, i in zip(self.after, self.ids) if i in [ S_MM, S_MM2 ] ]
+        self.deep_maps      = { }
+
+    # Returns the forwarding map for key (as fwd_map()) and, for each
+    # register in it, (ready, ready for a branch resolved in ID, loaded).
+    # key holds (rd, p_type, load) for each stage after ID.
+    def deep_map(self, key):
+        maps = self.deep_maps.get(key)
+        if maps is None:
+            fwd, ready = { }, { }
+            for i in reversed(range(len(key))):
+                rd, p_type, load = key[i]
+                s = self.ids[i]
+                if p_type != P_N:
+                    fwd[int(SP)] = FWD_DEEP_SP[(s, p_type)]
+                    ready[int(SP)] = (i >= self.alu_ready, i > self.alu_ready, False)
+                if rd != 0:
+                    r = self.load_ready if load else self.alu_ready
+                    fwd[rd] = FWD_DEEP_REG[s]
+                    ready[rd] = (i >= r, i > r, load)
+            maps = self.deep_maps[key] = (fwd, ready)
+        return maps
+
+    def gen(self, inst):
+
+        sig = self.decode(inst)
+        if sig.exception:
+            Pipe.ID.exception |= sig.exception
+            inst = inst if sig.valid else BUBBLE
+
+        self.MM_stall       = False
+        self.EX_stall       = False
+
+        self.br_type        = sig.br_type
+        self.op1_sel        = sig.op1_sel
+        self.op2_sel        = sig.op2_sel
+        self.alu_fun        = sig.alu_fun
+        self.wb_sel         = sig.wb_sel
+        self.rf_wen         = sig.rf_wen
+        self.dmem_en        = sig.dmem_en
+        self.dmem_rw        = sig.dmem_rw
+
+        lat = [ s.reg for s in self.after ]
+
+        # The resolving stage (EX or EX2) selects the next PC, unless ID does
+        res = Pipe.cpu.resolver
+        if Pipe.cpu.early_branch:
+            self.pc_sel         = PC_4
+            self.right_predict  = True
+            self.redirect       = None
+        else:
+            t = res.reg
+            self.pc_sel         = PC_SEL[t.c_br_type][bool(res.alu_out)]
+            self.right_predict  = (self.pc_sel, t.taken) in RIGHT_PREDICT
+            self.redirect       = None                  if self.right_predict       else \
+                                  res.jump_reg_target   if self.pc_sel == PC_JALR   else \
+                                  res.pcplus4           if t.taken == TAKEN_1       else \
+                                  res.brjmp_target
+
+        # Forwarding sources. As in Control, the c_rf_wen signal of MM is
+        # taken from the stage since a dmem exception disables it.
+        self.fwd, ready     = self.deep_map(tuple(
+                                (int(t.rd) if (Pipe.MM.c_rf_wen if s is Pipe.MM else t.c_rf_wen) else 0,
+                                 t.p_type, t.c_dmem_en and t.c_dmem_rw == M_XRD)
+                                for s, t in zip(self.after, lat)))
+
+        # A source register written by an instruction whose result is not
+        # ready stalls ID and IF (and bubbles EX)
+        self.load_use       = False
+        self.alu_use        = False
+        self.branch_wait    = False
+        for rs, oen in [ (Pipe.ID.rs1, sig.rs1_oen), (Pipe.ID.rs2, sig.rs2_oen) ]:
+            r = ready.get(rs) if oen else None
+            if r is None:
+                pass
+            elif not r[0]:
+                if r[2]:
+                    self.load_use = True
+                else:
+                    self.alu_use = True
+            elif Pipe.cpu.early_branch and sig.br_type != BR_N and not r[1]:
+                self.branch_wait = True
+        wait                = self.load_use or self.alu_use or self.branch_wait
+
+        # A mispredict cancels every instruction before the resolving stage
+        self.mispredict     = not self.right_predict
+        self.IF_stall       = wait and not self.mispredict
+        self.ID_stall       = wait and not self.mispredict
+        self.ID_bubble      = self.mispredict
+        self.EX_bubble      = wait or self.mispredict
+        self.EX_squash      = self.mispredict and res is not Pipe.EX
+
+        # ECALL is run by the proxy kernel as it leaves WB. The instruction
+        # after it waits in ID until then.
+        if not self.mispredict and any(t.inst == ECALL for t in lat):
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.EX_bubble  = True
+
+        # D-cache miss: everything up to MM is stalled, including the branch
+        # to be resolved
+        if Pipe.MM.stall:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
+            self.EX_squash  = False
+            self.MM_stall   = True
+
+        # Multiply/divide in progress: IF through EX are stalled, unless the
+        # instruction in EX is cancelled by a mispredict in EX2
+        elif Pipe.EX.stall and not self.EX_squash:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
+
+        # The instruction cancelled in EX has been issued, so the CPI stack
+        # charges its cycle here
+        if self.EX_squash and Pipe.EX.reg.inst != BUBBLE:
+            Pipe.cpu.cpi.add(CPI_MISPREDICT)
+
+        # As in Control, an instruction with an exception, and any instruction
+        # after one in MM, become BUBBLE as they enter MM
+        x = self.mm_in
+        self.MM_bubble = (x.exception and (x.exception != EXC_EBREAK)) or \
+                         any(s.exception for s in self.mm_side)
+
+        if inst == BUBBLE:
+            return False
+        else:
+            return True
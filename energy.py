@@ -0,0 +1,297 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Activity counters and energy model (--energy). The pipeline is sampled
+#   at the end of every cycle, and each event is counted in a list at a
+#   fixed index. Weighted by the energy table, the counts give the energy
+#   and energy-delay product of the run and of each function.
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+from program import *
+from stages import BTB, P_PUSH, P_POP, BR_COND
+from pipe import Pipe
+from config import Machine, SPLIT_IF, SPLIT_EX, SPLIT_MM
+
+
+#--------------------------------------------------------------------------
+#   Events
+#--------------------------------------------------------------------------
+
+EV_CYCLE        = 0         # cycles (leakage and clock)
+EV_INST         = 1         # instructions retired (no energy of their own)
+EV_RF_READ      = 2         # register file read ports used by ID
+EV_RF_WRITE     = 3
+EV_RF_WRITE2    = 4         # the second write port (sp of pop)
+EV_ADDER        = 5         # the pc+4 adder in IF and the branch target adder
+EV_IMEM_READ    = 6
+EV_DMEM_READ    = 7
+EV_DMEM_WRITE   = 8
+EV_BTB_LOOKUP   = 9
+EV_BTB_UPDATE   = 10        # entries added or removed
+EV_LATCH        = 11        # pipeline registers loaded (held ones are clock-gated)
+EV_ALU          = 12        # EV_ALU + ALU_*: operations by function
+
+# Names of the ALU functions in the energy table
+ALU_NAMES = {
+    ALU_ADD     : 'add',
+    ALU_SUB     : 'sub',
+    ALU_SLL     : 'sll',
+    ALU_SRL     : 'srl',
+    ALU_SRA     : 'sra',
+    ALU_AND     : 'and',
+    ALU_OR      : 'or',
+    ALU_XOR     : 'xor',
+    ALU_SLT     : 'slt',
+    ALU_SLTU    : 'sltu',
+    ALU_COPY1   : 'copy1',
+    ALU_COPY2   : 'copy2',
+    ALU_SEQ     : 'seq',
+    ALU_MUL     : 'mul',
+    ALU_MULH    : 'mulh',
+    ALU_MULHSU  : 'mulhsu',
+    ALU_MULHU   : 'mulhu',
+    ALU_DIV     : 'div',
+    ALU_DIVU    : 'divu',
+    ALU_REM     : 'rem',
+    ALU_REMU    : 'remu',
+}
+
+N_EVENTS        = EV_ALU + len(ALU_NAMES) + 1       # ALU_X is counted, but costs nothing
+
+# Name of each event in the energy table and the component it is charged to
+EVENTS = [
+    ('leakage',     'leakage'),
+    (None,          None),
+    ('rf_read',     'rf'),
+    ('rf_write',    'rf'),
+    ('rf_write2',   'rf'),
+    ('adder',       'adders'),
+    ('imem_read',   'imem'),
+    ('dmem_read',   'dmem'),
+    ('dmem_write',  'dmem'),
+    ('btb_lookup',  'btb'),
+    ('btb_update',  'btb'),
+    ('latch',       'latches'),
+] + [ (ALU_NAMES.get(f), 'alu' if f in ALU_NAMES else None) for f in range(N_EVENTS - EV_ALU) ]
+
+COMPONENTS  = [ 'imem', 'dmem', 'rf', 'alu', 'adders', 'btb', 'latches', 'leakage' ]
+
+# Energy per event in pJ, and the clock for the delay. The defaults are
+# rough figures for a small 45nm core, and only the ratios matter for
+# comparing two runs. configs/energy.json spells them out.
+ENERGY_DEFAULTS = {
+    'clock_mhz'     : 500,
+    'leakage'       : 5.0,          # per cycle
+    'rf_read'       : 1.0,          # per read port used
+    'rf_write'      : 1.2,
+    'rf_write2'     : 1.2,
+    'adder'         : 0.1,
+    'imem_read'     : 10.0,         # per word
+    'dmem_read'     : 10.0,
+    'dmem_write'    : 12.0,
+    'btb_lookup'    : 2.0,
+    'btb_update'    : 2.5,
+    'latch'         : 1.5,          # per pipeline register loaded
+    'alu'           : {
+        'add' : 0.1,  'sub' : 0.1,  'sll' : 0.2,  'srl' : 0.2,  'sra' : 0.2,
+        'and' : 0.05, 'or' : 0.05,  'xor' : 0.05, 'slt' : 0.1,  'sltu' : 0.1,
+        'copy1' : 0.02, 'copy2' : 0.02, 'seq' : 0.1,
+        'mul' : 3.1,  'mulh' : 3.1, 'mulhsu' : 3.1, 'mulhu' : 3.1,
+        'div' : 10.0, 'divu' : 10.0, 'rem' : 10.0, 'remu' : 10.0,
+    },
+}
+
+FUNCTIONS_SHOWN = 10        # functions listed in the report, by energy
+
+
+# Returns the energy table in a JSON or TOML file on top of the defaults.
+# Raises ValueError if it is not valid (and IOError if it cannot be read).
+def load_table(filename):
+    desc = Machine.read(filename)
+    table = Machine.merge(ENERGY_DEFAULTS, desc, 'energy')
+    for path, d in [ ('energy', table), ('energy.alu', table['alu']) ]:
+        if not isinstance(d, dict):
+            raise ValueError("%s should be a table" % path)
+        for key, val in d.items():
+            if isinstance(val, dict):
+                continue
+            if not isinstance(val, (int, float)) or isinstance(val, bool) or val < 0:
+                raise ValueError("invalid value '%s' for %s.%s" % (val, path, key))
+    if table['clock_mhz'] <= 0:
+        raise ValueError("energy.clock_mhz should be positive")
+    return table
+
+
+#--------------------------------------------------------------------------
+#   Activity: counts the events of a core, by function
+#--------------------------------------------------------------------------
+
+class Activity(object):
+
+    names           = { }       # function names by address (Program.symbols())
+
+    # The events of a cycle are charged to the function of the instruction
+    # retired in it (or of the last one). A function is entered when the
+    # instruction after a call (JAL/JALR linking ra or t0) retires, and left
+    # after a return (JALR to ra or t0 without linking) retires.
+    def __init__(self, name, cpu, table):
+        self.name       = name
+        self.table      = table
+        self.weights    = [ 0.0 if key is None else table['alu'][key] if comp == 'alu' else table[key]
+                            for key, comp in EVENTS ]
+
+        # Pipeline registers: the pc and one after each stage but WB. IF
+        # stalls the pc, and ID, EX and MM stall the registers in front of
+        # them (two if the stage before them is split).
+        split           = cpu.machine.split
+        self.latches    = 5 + len(split)
+        self.held       = [ 1, 1 + (SPLIT_IF in split), 1 + (SPLIT_EX in split), 1 + (SPLIT_MM in split) ]
+
+        self.count      = [ 0 ] * N_EVENTS     # counters of the current function
+        self.funcs      = { }                   # entry pc -> counters
+        self.stack      = [ ]                   # counters of the callers
+        self.entering   = True                  # the next instruction retired starts a function
+        self.ex         = None                  # latch of the last operation in EX
+        self.btb        = cpu.btb               # BTB whose counters were last seen,
+        self.seen       = (0, 0)                # and its lookups and updates then
+
+    # Called by Pipe.count() at the end of every cycle of the core, after
+    # all the stages have been updated
+    def sample(self, cpu):
+        wb = Pipe.WB
+        if self.entering and wb.inst != BUBBLE:
+            self.enter(int(wb.pc))
+        c = self.count
+        C = Pipe.CTL
+        c[EV_CYCLE] += 1
+        h = self.held
+        c[EV_LATCH] += self.latches - h[0] * C.IF_stall - h[1] * C.ID_stall - \
+                       h[2] * C.EX_stall - h[3] * C.MM_stall
+
+        # IF: a fetch completed, as counted by the Fetch counters
+        IF = Pipe.IF
+        if not C.IF_stall and not IF.miss:
+            c[EV_ADDER] += 1
+            if IF.addr is not None:
+                c[EV_IMEM_READ] += 1
+
+        # ID reads the register file again in every cycle it is stalled
+        inst = Pipe.ID.inst
+        if inst != BUBBLE:
+            sig = C.decode(inst)
+            c[EV_RF_READ] += sig.rs1_oen + sig.rs2_oen
+
+        # EX: one operation for each instruction, however long it stays
+        t = Pipe.EX.t
+        if t is not self.ex and t.inst != BUBBLE:
+            self.ex = t
+            c[EV_ALU + t.c_alu_fun] += 1
+            if t.c_br_type in BR_COND or t.c_br_type == BR_J:
+                c[EV_ADDER] += 1
+
+        # MM: dmem is accessed once the D-cache (if any) has the line
+        mm = Pipe.MM
+        t = mm.t
+        if t.c_dmem_en and not mm.stall:
+            c[EV_DMEM_WRITE if t.c_dmem_rw == M_XWR else EV_DMEM_READ] += 1
+
+        # BTB: lookups by IF and updates by the resolving stage. A BTB
+        # replaced by SNURISC5.apply() carries on with the same counters.
+        btb = cpu.btb
+        if isinstance(btb, BTB):
+            lookups, updates = btb.lookups, btb.adds + btb.removes
+            if btb is self.btb:
+                c[EV_BTB_LOOKUP] += lookups - self.seen[0]
+                c[EV_BTB_UPDATE] += updates - self.seen[1]
+            self.btb, self.seen = btb, (lookups, updates)
+
+        # WB writes rd, and sp through the second port for pop
+        if wb.inst == BUBBLE:
+            return
+        t = wb.t
+        c[EV_INST] += 1
+        if t.c_rf_wen:
+            if t.p_type == P_POP:
+                c[EV_RF_WRITE2] += 1
+                if t.rd != 0:
+                    c[EV_RF_WRITE] += 1
+            elif t.rd != 0 or t.p_type == P_PUSH:
+                c[EV_RF_WRITE] += 1
+
+        if t.c_br_type == BR_J or t.c_br_type == BR_JR:
+            rd = int(t.rd)
+            if rd == 1 or rd == 5:
+                self.stack.append(self.count)
+                self.entering = True
+            elif rd == 0 and t.c_br_type == BR_JR and RISCV.rs1(wb.inst) in [ 1, 5 ] and self.stack:
+                self.count = self.stack.pop()
+
+    # Switches to the counters of the function at pc. The first function
+    # also takes the cycles before the first instruction retired.
+    def enter(self, pc):
+        self.entering = False
+        if not self.funcs:
+            self.funcs[pc] = self.count
+            return
+        c = self.funcs.get(pc)
+        if c is None:
+            c = self.funcs[pc] = [ 0 ] * N_EVENTS
+        self.count = c
+
+    # Returns the energy in pJ for counters
+    def energy(self, counts):
+        return sum(n * w for n, w in zip(counts, self.weights))
+
+    # Returns the counters of the whole run
+    def totals(self):
+        funcs = list(self.funcs.values()) or [ self.count ]
+        return [ sum(col) for col in zip(*funcs) ]
+
+    # Returns the activity counts of the whole run by event name
+    def counts(self):
+        total = self.totals()
+        counts = { key : n for (key, comp), n in zip(EVENTS, total) if key is not None and comp != 'alu' }
+        counts['cycles'], counts['instructions'] = total[EV_CYCLE], total[EV_INST]
+        del counts['leakage']
+        counts['alu'] = { ALU_NAMES[f] : total[EV_ALU + f] for f in ALU_NAMES }
+        return counts
+
+    def summary(self):
+        total = self.totals()
+        cycles = total[EV_CYCLE]
+        if cycles == 0:
+            return None
+        mhz = self.table['clock_mhz']
+        e = self.energy(total)
+        lines = [ "%s: %.3f nJ in %d cycles (%.3f us at %g MHz), %.2f pJ/cycle, %.2f pJ/instruction, EDP %.4g nJ*us" % \
+                  (self.name, e / 1000, cycles, cycles / mhz, mhz, e / cycles,
+                   e / max(total[EV_INST], 1), e / 1000 * cycles / mhz) ]
+
+        comp = { name : 0.0 for name in COMPONENTS }
+        for (key, name), n, w in zip(EVENTS, total, self.weights):
+            if name is not None:
+                comp[name] += n * w
+        lines.append("  by component: " + ", ".join("%s %.1f%%" % (name, 0.0 if e == 0 else comp[name] * 100.0 / e)
+                                                   for name in COMPONENTS))
+        lines.append("  activity: %d RF reads, %d RF writes (+%d on the second port), %d adder uses, "
+                     "%d imem reads, %d dmem reads, %d dmem writes, %d BTB lookups, %d BTB updates, %d latch loads" % \
+                     tuple(total[i] for i in [ EV_RF_READ, EV_RF_WRITE, EV_RF_WRITE2, EV_ADDER, EV_IMEM_READ,
+                                               EV_DMEM_READ, EV_DMEM_WRITE, EV_BTB_LOOKUP, EV_BTB_UPDATE, EV_LATCH ]))
+        lines.append("  ALU operations: " + ", ".join("%s %d" % (ALU_NAMES[f], total[EV_ALU + f])
+                                                     for f in sorted(ALU_NAMES) if total[EV_ALU + f]))
+
+        funcs = sorted(((self.energy(c), pc, c) for pc, c in self.funcs.items()), key = lambda f: -f[0])
+        lines.append("  by function:")
+        for ef, pc, c in funcs[:FUNCTIONS_SHOWN]:
+            lines.append("    %-20s %10.3f nJ (%5.1f%%) in %8d cycles, %8d instructions, EDP %.4g nJ*us" % \
+                         (Activity.names.get(pc, "0x%08x" % pc), ef / 1000, 0.0 if e == 0 else ef * 100.0 / e,
+                          c[EV_CYCLE], c[EV_INST], ef / 1000 * c[EV_CYCLE] / mhz))
+        if len(funcs) > FUNCTIONS_SHOWN:
+            lines.append("    ... and %d more" % (len(funcs) - FUNCTIONS_SHOWN))
+        return '\n'.join(lines)
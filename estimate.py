@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Analytic timing estimator. Computes the cycle count of the 5-stage
+#   pipeline from a retired-instruction trace using the hazard rules of
+#   Control.gen(), vectorized with NumPy. It assumes the default machine
+#   but for the BTB size: 4-byte fetch (no RV32C), no caches, no split
+#   stages, and branches resolved in EX.
+#
+#==========================================================================
+
+import sys
+
+from consts import *
+from isa import *
+from program import *
+from stages import csignals
+from functional import Functional, Trace, OPCODES
+from snurisc5 import SNURISC5
+from config import BTB_K, MUL_LAT, DIV_LAT
+
+
+#--------------------------------------------------------------------------
+#   Per-opcode tables, indexed by Trace.op
+#--------------------------------------------------------------------------
+
+OP_LOAD     = np.array([ csignals[op][CS_MEM_EN] and csignals[op][CS_MEM_FCN] == M_XRD
+                         for op in OPCODES ], dtype = np.bool_)
+OP_RS1_OEN  = np.array([ csignals[op][CS_RS1_OEN] for op in OPCODES ], dtype = np.bool_)
+OP_RS2_OEN  = np.array([ csignals[op][CS_RS2_OEN] for op in OPCODES ], dtype = np.bool_)
+OP_BR_TYPE  = np.array([ csignals[op][CS_BR_TYPE] for op in OPCODES ], dtype = np.int8)
+
+# Instructions that look up and update the BTB: conditional branches and JAL
+OP_BTB      = np.isin(OP_BR_TYPE, [ BR_NE, BR_EQ, BR_GE, BR_GEU, BR_LT, BR_LTU, BR_J ])
+OP_JALR     = OP_BR_TYPE == BR_JR
+OP_ECALL    = np.array([ op == ECALL for op in OPCODES ], dtype = np.bool_)
+OP_MUL      = np.array([ csignals[op][CS_ALU_FUN] in MUL_OPS for op in OPCODES ], dtype = np.bool_)
+OP_DIV      = np.array([ csignals[op][CS_ALU_FUN] in DIV_OPS for op in OPCODES ], dtype = np.bool_)
+
+PIPE_FILL       = 4                     # cycles until the first instruction retires
+LOAD_USE_STALL  = 1                     # EX bubble inserted by a load-use hazard
+MISPREDICT      = 2                     # IF and ID are flushed on a misprediction
+ECALL_STALL     = 3                     # the next instruction waits in ID until ECALL leaves WB
+MUL_STALL       = MUL_LAT - 1           # a multiply stays in EX for MUL_LAT cycles
+DIV_STALL       = DIV_LAT - 1
+
+
+#--------------------------------------------------------------------------
+#   Estimator: cycle counts of a trace under different BTB sizes
+#--------------------------------------------------------------------------
+
+class Estimator(object):
+
+    def __init__(self, trace):
+        self.trace  = trace
+        op          = trace.op
+
+        # Load-use hazard: a load in EX whose rd is read by the instruction
+        # in ID (the next retired one; loads are never mispredicted)
+        rd, nxt     = trace.rd[:-1], op[1:]
+        self.stalls = int(np.count_nonzero(OP_LOAD[op[:-1]] & (rd != 0) &
+                        (((rd == trace.rs1[1:]) & OP_RS1_OEN[nxt]) |
+                         ((rd == trace.rs2[1:]) & OP_RS2_OEN[nxt]))))
+
+        # JALR targets are never predicted
+        self.jalr   = int(np.count_nonzero(OP_JALR[op]))
+
+        # System calls drain the pipeline (except for the final exit)
+        self.ecalls = int(np.count_nonzero(OP_ECALL[op[:-1]]))
+
+        # The multiplier/divider holds IF through EX until its result is ready
+        self.muls   = int(np.count_nonzero(OP_MUL[op]))
+        self.divs   = int(np.count_nonzero(OP_DIV[op]))
+
+        # BTB accesses in program order
+        sel         = OP_BTB[op]
+        self.pc     = trace.pc[sel]
+        self.taken  = trace.taken[sel]
+        n           = len(self.pc)
+
+        # Whether the previous access by the same pc was taken
+        order       = np.argsort(self.pc, kind = 'stable')
+        spc         = self.pc[order]
+        prev        = np.zeros(n, dtype = np.bool_)
+        if n > 1:
+            same    = spc[1:] == spc[:-1]
+            prev[order[1:]] = same & self.taken[order[:-1]]
+        self.prev_taken = prev
+
+    def mispredicts(self, k):
+        # The BTB is updated only on a misprediction: a taken miss adds the
+        # entry and a not-taken hit removes it. So an access hits iff the
+        # last taken access to its set came from the same pc and that pc
+        # has not been seen not taken since.
+        n = len(self.pc)
+        if n == 0:
+            return self.jalr
+        index = (self.pc >> 2) & ((1 << k) - 1)
+        order = np.argsort(index, kind = 'stable')
+        sidx = index[order]
+        pos = np.arange(n)
+        start = np.maximum.accumulate(np.where(np.r_[True, sidx[1:] != sidx[:-1]], pos, 0))
+        last = np.maximum.accumulate(np.where(self.taken[order], pos, -1))
+        last = np.r_[-1, last[:-1]]                 # exclusive of the access itself
+        valid = last >= start
+        hit_sorted = valid & (self.pc[order][np.where(valid, last, 0)] == self.pc[order])
+        hit = np.empty(n, dtype = np.bool_)
+        hit[order] = hit_sorted
+        hit &= self.prev_taken
+        return int(np.count_nonzero(hit != self.taken)) + self.jalr
+
+    def cycles(self, k):
+        # Returns (cycles, mispredicts) for a 2^k-entry BTB
+        m = self.mispredicts(k)
+        n = self.trace.size
+        if n == 0:
+            return 0, 0
+        return n + PIPE_FILL + LOAD_USE_STALL * self.stalls + MISPREDICT * m + ECALL_STALL * self.ecalls + \
+               MUL_STALL * self.muls + DIV_STALL * self.divs, m
+
+
+#--------------------------------------------------------------------------
+#   Utility functions for command line parsing
+#--------------------------------------------------------------------------
+
+def show_usage(name):
+    print("Usage: %s [-b k1,k2,...] [-o trace] filename" % name)
+    print("\tfilename: RISC-V executable, assembly source (.s), or saved trace (.npz)")
+    print("\t-b lists the BTB sizes 2^k to estimate (default: %d)" % BTB_K)
+    print("\t-o saves the retired-instruction trace to a .npz file")
+
+
+def parse_args(args):
+    if len(args) < 2 or len(args) % 2 != 0:
+        return None, None, None
+
+    ks = [ BTB_K ]
+    out = None
+    index = 1
+    while args[index].startswith('-'):
+        if args[index] == '-b':
+            try:
+                ks = [ int(k) for k in args[index + 1].split(',') ]
+            except ValueError:
+                print("Invalid btb sizes '%s'" % args[index + 1])
+                return None, None, None
+        elif args[index] == '-o':
+            out = args[index + 1]
+        else:
+            print("Invalid option '%s'" % args[index])
+            return None, None, None
+        index += 2
+
+    if len(args) != index + 1:
+        print("Invalid argument '%s'" % args[index + 1:])
+        return None, None, None
+
+    return args[index], ks, out
+
+
+#--------------------------------------------------------------------------
+#   Estimator main
+#--------------------------------------------------------------------------
+
+def main():
+
+    filename, ks, out = parse_args(sys.argv)
+    if not filename:
+        show_usage(sys.argv[0])
+        sys.exit()
+
+    if filename.endswith('.npz'):
+        trace = Trace.load(filename)
+    else:
+        cpu = SNURISC5()
+        entry_point = Program().load(cpu, filename)
+        if not entry_point:
+            sys.exit()
+        pc, n, exception, trace = Functional(cpu).run(entry_point, trace = True)
+        if exception != EXC_EBREAK:
+            print("Execution stopped at 0x%08x before ebreak, estimates cover %d instructions" % (pc, n))
+    if out:
+        trace.save(out)
+
+    e = Estimator(trace)
+    print("%d instructions, %d load-use stalls, %d jalr redirects" % (trace.size, e.stalls, e.jalr))
+    for k in ks:
+        cycles, m = e.cycles(k)
+        print("k = %2d: %d cycles, %d mispredicts. CPI = %.3f" % \
+              (k, cycles, m, 0.0 if trace.size == 0 else cycles / trace.size))
+
+
+if __name__ == '__main__':
+    main()
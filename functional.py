@@ -0,0 +1,494 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Functional (untimed) execution: a per-instruction reference interpreter
+#   and a basic-block translation engine for fast-forwarding and profiling.
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+from program import *
+from components import sext32, div32, rem32
+from rvc import expand
+from stages import csignals, ptypes, SP, P_N, P_PUSH, P_POP
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+MASK32          = 0xffffffff
+MAX_BLOCK_SIZE  = 64                    # instructions per translated block
+
+# Python expressions over unsigned 32-bit ints for each ALU function.
+# They are used as source templates by the translator and compiled into
+# functions for the interpreter, so both share the same semantics.
+ALU_EXPR = {
+    ALU_ADD     : '(({a}) + ({b})) & 0xffffffff',
+    ALU_SUB     : '(({a}) - ({b})) & 0xffffffff',
+    ALU_AND     : '({a}) & ({b})',
+    ALU_OR      : '({a}) | ({b})',
+    ALU_XOR     : '({a}) ^ ({b})',
+    ALU_SLT     : 'int((({a}) ^ 0x80000000) < (({b}) ^ 0x80000000))',
+    ALU_SLTU    : 'int(({a}) < ({b}))',
+    ALU_SLL     : '(({a}) << (({b}) & 0x1f)) & 0xffffffff',
+    ALU_SRL     : '({a}) >> (({b}) & 0x1f)',
+    ALU_SRA     : '(((({a}) ^ 0x80000000) - 0x80000000) >> (({b}) & 0x1f)) & 0xffffffff',
+    ALU_COPY1   : '({a})',
+    ALU_COPY2   : '({b})',
+    ALU_SEQ     : 'int(({a}) == ({b}))',
+    ALU_MUL     : '(({a}) * ({b})) & 0xffffffff',
+    ALU_MULH    : '((sext32({a}) * sext32({b})) >> 32) & 0xffffffff',
+    ALU_MULHSU  : '((sext32({a}) * ({b})) >> 32) & 0xffffffff',
+    ALU_MULHU   : '(({a}) * ({b})) >> 32',
+    ALU_DIV     : 'div32({a}, {b})',
+    ALU_DIVU    : '(({a}) // ({b}) if ({b}) else 0xffffffff)',
+    ALU_REM     : 'rem32({a}, {b})',
+    ALU_REMU    : '(({a}) % ({b}) if ({b}) else ({a}))',
+    ALU_X       : '0',
+}
+
+# Names the expressions refer to, for the namespace of translated blocks
+ALU_NAMES = { 'sext32' : sext32, 'div32' : div32, 'rem32' : rem32 }
+
+ALU_FN = { k : eval('lambda a, b: ' + v.format(a = 'a', b = 'b')) for k, v in ALU_EXPR.items() }
+
+# Branch condition in terms of the ALU output, as in Control.gen()
+BR_COND = {
+    BR_NE       : 'not ({o})',
+    BR_EQ       : '({o})',
+    BR_GE       : 'not ({o})',
+    BR_GEU      : 'not ({o})',
+    BR_LT       : '({o})',
+    BR_LTU      : '({o})',
+}
+
+BR_FN = { k : eval('lambda o: ' + v.format(o = 'o')) for k, v in BR_COND.items() }
+
+IMM_FN = {
+    OP2_IMI     : RISCV.imm_i,
+    OP2_IMS     : RISCV.imm_s,
+    OP2_IMU     : RISCV.imm_u,
+    OP2_IMJ     : RISCV.imm_j,
+    OP2_IMB     : RISCV.imm_b,
+}
+
+CLASS_INDEX = { CL_ALU : 0, CL_MEM : 1, CL_CTRL : 2 }
+
+# Returned by translated blocks and step() for ECALL, which the caller then
+# hands to the proxy kernel. It never leaves this module.
+EXC_ECALL       = 0x100
+
+# Opcodes are recorded in traces as small indices into this list
+OPCODES         = list(isa.keys())
+OP_INDEX        = { op : n for n, op in enumerate(OPCODES) }
+
+
+#--------------------------------------------------------------------------
+#   Decoded: the fields of an instruction that execution depends on
+#--------------------------------------------------------------------------
+
+class Decoded(object):
+
+    # inst is the 32-bit instruction (expanded if compressed), size its length in bytes
+    def __init__(self, pc, inst, size = WORD_SIZE):
+        self.pc     = int(pc)
+        self.inst   = inst
+        self.size   = size
+        self.opcode = RISCV.opcode(inst)
+        if self.opcode == ILLEGAL:
+            return
+
+        cs = csignals[self.opcode]
+        self.cs     = cs
+        self.br     = cs[CS_BR_TYPE]
+        self.ptype  = ptypes.get(self.opcode, P_N)
+        self.rs1    = SP if self.ptype != P_N else int(RISCV.rs1(inst))
+        self.rs2    = int(RISCV.rs2(inst))
+        self.rd     = int(RISCV.rd(inst))
+        sel         = cs[CS_OP2_SEL]
+        self.imm    = 4 if self.ptype != P_N else \
+                      0 if sel == OP2_RS2    else \
+                      int(IMM_FN[sel](inst)) & MASK32
+        self.cls    = CLASS_INDEX[isa[self.opcode][IN_CLASS]]
+        self.xtype  = isa[self.opcode][IN_TYPE] == X_TYPE
+        self.xexc   = EXC_ECALL if self.opcode == ECALL else EXC_EBREAK
+
+
+#--------------------------------------------------------------------------
+#   Block: a translated basic block
+#--------------------------------------------------------------------------
+
+class Block(object):
+
+    def __init__(self, pc, insts, fn):
+        self.pc     = pc
+        self.insts  = insts             # [ Decoded ]
+        self.size   = len(insts)
+        self.fn     = fn                # fn(x, d) -> (next_pc, retired, exception, taken)
+        self.count  = 0                 # number of complete executions
+        self.classes = [ 0, 0, 0 ]
+        for i in insts:
+            if i.opcode != ILLEGAL:
+                self.classes[i.cls] += 1
+        self.cols   = None              # trace columns, built on first use
+
+    def columns(self):
+        # (pc, op, rd, rs1, rs2) of each instruction, in Trace column order
+        if self.cols is None:
+            self.cols = Trace.columns(self.insts)
+        return self.cols
+
+
+#--------------------------------------------------------------------------
+#   Trace: retired instructions in columnar form
+#--------------------------------------------------------------------------
+
+class Trace(object):
+
+    FIELDS = ( 'pc', 'op', 'rd', 'rs1', 'rs2', 'taken' )
+
+    def __init__(self, pc, op, rd, rs1, rs2, taken):
+        self.pc     = pc                # np.uint32
+        self.op     = op                # np.uint8, index into OPCODES
+        self.rd     = rd                # np.uint8
+        self.rs1    = rs1               # np.uint8 (SP for push/pop, as in ID)
+        self.rs2    = rs2               # np.uint8
+        self.taken  = taken             # np.bool_, branch/jump outcome
+        self.size   = len(pc)
+
+    @staticmethod
+    def columns(insts):
+        return ( np.array([ i.pc for i in insts ], dtype = np.uint32),
+                 np.array([ OP_INDEX[i.opcode] for i in insts ], dtype = np.uint8),
+                 np.array([ i.rd for i in insts ], dtype = np.uint8),
+                 np.array([ i.rs1 for i in insts ], dtype = np.uint8),
+                 np.array([ i.rs2 for i in insts ], dtype = np.uint8) )
+
+    @staticmethod
+    def build(records):
+        # records: [ (Block or Decoded, retired, taken) ] in retirement order
+        parts = [ ]
+        for r, k, taken in records:
+            if k == 0:
+                continue
+            cols = r.columns() if isinstance(r, Block) else Trace.columns([ r ])
+            t = np.zeros(k, dtype = np.bool_)
+            t[k - 1] = bool(taken)
+            parts.append(tuple(c[:k] for c in cols) + (t, ))
+        if not parts:
+            return Trace(*[ np.zeros(0, dtype = d) for d in
+                            (np.uint32, np.uint8, np.uint8, np.uint8, np.uint8, np.bool_) ])
+        return Trace(*[ np.concatenate(c) for c in zip(*parts) ])
+
+    def save(self, filename):
+        np.savez_compressed(filename, **{ f : getattr(self, f) for f in Trace.FIELDS })
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as z:
+            return Trace(*[ z[f] for f in Trace.FIELDS ])
+
+
+#--------------------------------------------------------------------------
+#   Functional: untimed execution on the state of a SNURISC5 instance
+#--------------------------------------------------------------------------
+
+class Functional(object):
+
+    def __init__(self, cpu):
+        self.cpu    = cpu
+        self.blocks = { }               # entry pc -> Block
+        self.owners = { }               # imem word address -> { entry pc }
+        self.icount = 0
+        self.inst_class = [ 0, 0, 0 ]   # ALU, MEM, CTRL
+        self.ds     = int(cpu.dmem.mem_start)
+        self.de     = int(cpu.dmem.mem_end)
+        self.kernel = cpu.kernel
+        self.io     = cpu.bus               # accesses outside dmem (ROM, devices)
+        self.rvc    = cpu.rvc
+        self.now    = 0                     # instructions retired before the current block
+        cpu.imem.on_write = self.invalidate
+
+    def invalidate(self, addr):
+        for pc in self.owners.pop(int(addr), ()):
+            b = self.blocks.pop(pc, None)
+            if b is not None:
+                for c in range(3):
+                    self.inst_class[c] += b.count * b.classes[c]
+
+    def fetch(self, pc):
+        # Returns (inst, size) with a compressed instruction expanded, or
+        # None on an imem error
+        bus = self.cpu.bus
+        if not self.rvc:
+            inst, status = bus.fetch(True, WORD(pc))
+            return (inst, WORD_SIZE) if status else None
+        if pc & 1:
+            return None
+        w, status = bus.fetch(True, WORD(pc & ~3))
+        if not status:
+            return None
+        lo = int(w) >> 16 if pc & 2 else int(w) & 0xffff
+        if lo & 3 != 3:
+            return expand(lo), 2
+        if not pc & 2:
+            return w, WORD_SIZE
+        w, status = bus.fetch(True, WORD(pc + 2))
+        if not status:
+            return None
+        return WORD(lo | (int(w) & 0xffff) << 16), WORD_SIZE
+
+
+    #----------------------------------------------------------------------
+    #   Reference interpreter: decodes and executes one instruction
+    #----------------------------------------------------------------------
+
+    def step(self, pc, x, d):
+        # Returns (next_pc, retired, exception, taken)
+        f = self.fetch(pc)
+        if f is None:
+            return pc, 0, EXC_IMEM_ERROR, 0
+        i = Decoded(pc, *f)
+        if i.opcode == ILLEGAL:
+            return pc, 0, EXC_ILLEGAL_INST, 0
+        self.inst_class[i.cls] += 1
+        if i.xtype:
+            if i.xexc == EXC_ECALL:
+                pc, exc = self.syscall(pc, x, d, self.icount)
+                return pc, 1, exc, 0
+            return pc, 1, EXC_EBREAK, 0
+
+        cs = i.cs
+        a = pc if cs[CS_OP1_SEL] == OP1_PC else x[i.rs1]
+        b = x[i.rs2] if cs[CS_OP2_SEL] == OP2_RS2 else i.imm
+        if i.br in BR_FN:
+            taken = int(bool(BR_FN[i.br](ALU_FN[cs[CS_ALU_FUN]](a, x[i.rs2]))))
+            return ((pc + i.imm) & MASK32 if taken else pc + i.size), 1, EXC_NONE, taken
+        o = ALU_FN[cs[CS_ALU_FUN]](a, b)
+        if i.br == BR_J:
+            x[i.rd] = pc + i.size
+            x[0] = 0
+            return (pc + i.imm) & MASK32, 1, EXC_NONE, 1
+        if i.br == BR_JR:
+            x[i.rd] = pc + i.size
+            x[0] = 0
+            return o & 0xfffffffe, 1, EXC_NONE, 1
+
+        if cs[CS_MEM_EN]:
+            t = a if i.ptype == P_POP else o
+            io = t & 3 or not self.ds <= t < self.de
+            if cs[CS_MEM_FCN] == M_XWR:
+                if io:
+                    exc = self.io.write(t, x[i.rs2])
+                    if exc:
+                        return pc, 1, exc, 0
+                else:
+                    d[(t - self.ds) >> 2] = x[i.rs2]
+                if i.ptype == P_PUSH:
+                    x[SP] = o
+            else:
+                v = self.io.read(t) if io else d[(t - self.ds) >> 2]
+                if v is None:
+                    return pc, 1, EXC_DMEM_ERROR, 0
+                x[i.rd] = v
+                if i.ptype == P_POP:
+                    x[SP] = o
+        elif cs[CS_RF_WEN]:
+            x[i.rd] = o
+        x[0] = 0
+        return pc + i.size, 1, EXC_NONE, 0
+
+
+    #----------------------------------------------------------------------
+    #   Translator: turns a basic block into a compiled Python function
+    #----------------------------------------------------------------------
+
+    @staticmethod
+    def reg(r):
+        return 'x[%d]' % r if r else '0'
+
+    def gen(self, i, n):
+        # Returns the source lines for instruction i, the n-th in its block
+        cs = i.cs
+        pc = i.pc
+        a = '0x%08x' % pc if cs[CS_OP1_SEL] == OP1_PC else self.reg(i.rs1)
+        b = self.reg(i.rs2) if cs[CS_OP2_SEL] == OP2_RS2 else '0x%08x' % i.imm
+        rd = i.rd
+        fail = 'return (0x%08x, %d, %d, 0)' % (pc, n + 1, EXC_DMEM_ERROR)
+
+        if i.xtype:
+            return [ 'return (0x%08x, %d, %d, 0)' % (pc, n + 1, i.xexc) ]
+        if i.br in BR_COND:
+            o = ALU_EXPR[cs[CS_ALU_FUN]].format(a = a, b = self.reg(i.rs2))
+            return [ 'c = 1 if %s else 0' % BR_COND[i.br].format(o = o),
+                     'return (0x%08x if c else 0x%08x, %d, 0, c)' % ((pc + i.imm) & MASK32, pc + i.size, n + 1) ]
+        o = ALU_EXPR[cs[CS_ALU_FUN]].format(a = a, b = b)
+        if i.br == BR_J:
+            return ([ 'x[%d] = 0x%08x' % (rd, pc + i.size) ] if rd else [ ]) + \
+                   [ 'return (0x%08x, %d, 0, 1)' % ((pc + i.imm) & MASK32, n + 1) ]
+        if i.br == BR_JR:
+            return [ 't = (%s) & 0xfffffffe' % o ] + \
+                   ([ 'x[%d] = 0x%08x' % (rd, pc + i.size) ] if rd else [ ]) + \
+                   [ 'return (t, %d, 0, 1)' % (n + 1) ]
+
+        if cs[CS_MEM_EN]:
+            # dmem is accessed directly, anything else (ROM, devices) over the bus
+            lines = [ 't = %s' % (a if i.ptype == P_POP else o),
+                      'if t & 3 or not 0x%08x <= t < 0x%08x:' % (self.ds, self.de) ]
+            word = 'd[(t - 0x%08x) >> 2]' % self.ds
+            if cs[CS_MEM_FCN] == M_XWR:
+                lines += [ '    e = io.write(t, %s)' % self.reg(i.rs2),
+                           '    if e: return (0x%08x, %d, e, 0)' % (pc, n + 1),
+                           'else:',
+                           '    %s = %s' % (word, self.reg(i.rs2)) ]
+                if i.ptype == P_PUSH:
+                    lines.append('x[%d] = t' % SP)
+                return lines
+            lines += [ '    v = io.read(t)',
+                       '    if v is None: %s' % fail ]
+            if rd:
+                lines += [ '    x[%d] = v' % rd,
+                           'else:',
+                           '    x[%d] = %s' % (rd, word) ]
+            if i.ptype == P_POP:
+                lines.append('x[%d] = (t + 4) & 0xffffffff' % SP)
+            return lines
+        if cs[CS_RF_WEN] and rd:
+            return [ 'x[%d] = %s' % (rd, o) ]
+        return [ ]
+
+    def translate(self, pc):
+        insts = [ ]
+        body = [ ]
+        addr = pc
+        while True:
+            f = self.fetch(addr)
+            if f is None:
+                exc, retired = EXC_IMEM_ERROR, len(insts)
+                body.append('return (0x%08x, %d, %d, 0)' % (addr, retired, exc))
+                break
+            i = Decoded(addr, *f)
+            if i.opcode == ILLEGAL:
+                body.append('return (0x%08x, %d, %d, 0)' % (addr, len(insts), EXC_ILLEGAL_INST))
+                break
+            insts.append(i)
+            body.extend(self.gen(i, len(insts) - 1))
+            addr += i.size
+            if i.br != BR_N or i.xtype:
+                break
+            if len(insts) == MAX_BLOCK_SIZE:
+                body.append('return (0x%08x, %d, 0, 0)' % (addr, len(insts)))
+                break
+
+        src = 'def block(x, d):\n' + ''.join('    %s\n' % l for l in body)
+        ns = dict(ALU_NAMES, io = self.io)
+        exec(compile(src, '<block 0x%08x>' % pc, 'exec'), ns)
+        b = Block(pc, insts, ns['block'])
+        b.src = src
+        self.blocks[pc] = b
+        # The word after the last instruction is included since a block may
+        # end on an illegal instruction or an imem error there
+        for a in range(pc & ~3, addr + WORD_SIZE, WORD_SIZE):
+            self.owners.setdefault(a, set()).add(pc)
+        return b
+
+
+    #----------------------------------------------------------------------
+    #   Execution
+    #----------------------------------------------------------------------
+
+    def run(self, pc, max_insts = None, translate = True, trace = False):
+        # Runs from pc until an exception or max_insts instructions have been
+        # retired. Register and dmem state is taken from and written back to
+        # the cpu. Returns (pc, retired, exception), or (pc, retired,
+        # exception, Trace) when trace is set.
+        records = [ ] if trace else None
+        rf = self.cpu.rf
+        dmem = self.cpu.dmem
+        x = [ int(v) for v in rf.reg ]
+        x[0] = 0
+        d = dmem.mem.tolist()
+
+        # Without cycles, the timer counts retired instructions
+        clock = self.cpu.bus.clock
+        self.cpu.bus.clock = lambda: self.now
+        pc, n, exc = self.execute(int(pc), x, d, max_insts, translate, records)
+        self.cpu.bus.clock = clock
+
+        rf.reg[:] = x
+        dmem.mem[:] = d
+        if trace:
+            return WORD(pc), n, exc, Trace.build(records)
+        return WORD(pc), n, exc
+
+    def execute(self, pc, x, d, max_insts = None, translate = True, records = None):
+        # Same as run(), but on the register list x and the dmem word list d
+        # (as ints) instead of the cpu state. Returns (pc, retired, exception)
+        # and appends to records if given.
+        n = 0
+        exc = EXC_NONE
+        blocks = self.blocks
+        limit = max_insts if max_insts is not None else -1
+        while translate:
+            b = blocks.get(pc)
+            if b is None:
+                b = self.translate(pc)
+            if limit >= 0 and n + b.size > limit:
+                break
+            self.now = self.icount + n
+            npc, k, exc, taken = b.fn(x, d)
+            n += k
+            if exc == EXC_ECALL:
+                npc, exc = self.syscall(npc, x, d, self.icount + n)
+            if records is not None:
+                records.append((b, k, taken))
+            if k == b.size:
+                b.count += 1
+            else:
+                for i in b.insts[:k]:
+                    self.inst_class[i.cls] += 1
+            if exc:
+                pc = npc
+                break
+            pc = npc
+
+        # Interpret the remainder (or everything, if translation is off)
+        while exc == EXC_NONE and (limit < 0 or n < limit):
+            if records is not None:
+                f = self.fetch(pc)
+                i = Decoded(pc, *f) if f is not None else None
+            self.now = self.icount + n
+            pc, k, exc, taken = self.step(pc, x, d)
+            n += k
+            if records is not None and k:
+                records.append((i, k, taken))
+
+        self.icount += n
+        return pc, n, exc
+
+    def syscall(self, pc, x, d, cycle):
+        # Runs the ECALL at pc with the proxy kernel. As there are no cycles,
+        # the retired instruction count serves as the clock.
+        # Returns (next pc, exception).
+        if self.kernel.ecall(x, d, cycle):
+            return pc, EXC_EBREAK
+        x[0] = 0
+        return pc + 4, EXC_NONE
+
+    def classes(self):
+        # Instruction class counts (ALU, MEM, CTRL) over all runs so far
+        total = list(self.inst_class)
+        for b in self.blocks.values():
+            for c in range(3):
+                total[c] += b.count * b.classes[c]
+        return total
+
+    def profile(self):
+        # [ (entry pc, executions, block size) ] sorted by executed instructions
+        p = [ (b.pc, b.count, b.size) for b in self.blocks.values() if b.count ]
+        return sorted(p, key = lambda e: -e[1] * e[2])
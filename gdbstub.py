@@ -0,0 +1,345 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   GDB remote serial protocol stub. Runs the pipeline under the control
+#   of a GDB connected over a local TCP socket.
+#
+#==========================================================================
+
+import socket
+import select
+
+from consts import *
+from isa import *
+from program import *
+from components import rname
+from stages import *
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+REG_PC          = NUM_REGS              # GDB register number of pc
+POLL_CYCLES     = 4096                  # cycles between checks for Ctrl-C
+
+SIGINT          = 2
+SIGILL          = 4
+SIGTRAP         = 5
+SIGSEGV         = 11
+
+EXC_SIGNAL = {
+    EXC_IMEM_ERROR      : SIGSEGV,
+    EXC_DMEM_ERROR      : SIGSEGV,
+    EXC_ILLEGAL_INST    : SIGILL,
+}
+
+# Z/z packet types for watchpoints: write, read, access
+WATCH_KIND = {
+    2   : 'watch',
+    3   : 'rwatch',
+    4   : 'awatch',
+}
+
+TARGET_XML = '<?xml version="1.0"?>\n<!DOCTYPE target SYSTEM "gdb-target.dtd">\n' \
+             '<target version="1.0">\n<architecture>riscv:rv32</architecture>\n' \
+             '<feature name="org.gnu.gdb.riscv.cpu">\n' + \
+             ''.join('<reg name="%s" bitsize="32" type="int" regnum="%d"/>\n' % (rname[r], r) for r in range(NUM_REGS)) + \
+             '<reg name="pc" bitsize="32" type="code_ptr" regnum="%d"/>\n' % REG_PC + \
+             '</feature>\n</target>\n'
+
+
+#--------------------------------------------------------------------------
+#   GDBStub: serves one GDB connection
+#--------------------------------------------------------------------------
+
+class GDBStub(object):
+
+    def __init__(self, cpu, port):
+        self.cpu        = cpu
+        self.port       = port
+        self.conn       = None
+        self.buf        = b''
+        self.breakpoints = set()
+        self.watchpoints = { }          # (type, addr, length) -> kind
+        self.last_mm    = None          # latch last seen entering MM
+        self.stop       = 'S%02x' % SIGTRAP
+        self.exception  = EXC_NONE      # set once the program has terminated
+
+    # Runs the program from entry_point under GDB until it terminates, GDB
+    # kills it, or GDB detaches and the program runs to the end
+    def run(self, entry_point):
+        Pipe.IF.reg_pc = entry_point
+        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind(('127.0.0.1', self.port))
+        srv.listen(1)
+        print("Waiting for GDB connection on port %d" % self.port)
+        self.conn, addr = srv.accept()
+        srv.close()
+        print("GDB connected from %s:%d" % addr)
+
+        detached = False
+        while not self.exception:
+            pkt = self.recv_packet()
+            if pkt is None or pkt == 'D':
+                if pkt == 'D':
+                    self.send_packet('OK')
+                detached = True
+                break
+            if pkt == 'k':
+                break
+            reply = self.handle(pkt)
+            if reply is not None:
+                self.send_packet(reply)
+        self.conn.close()
+
+        if detached:
+            print("GDB detached")
+            while Pipe.cycle():
+                pass
+            self.exception = Pipe.WB.exception
+        elif not self.exception:
+            print("Killed by GDB at 0x%08x" % Pipe.IF.reg_pc)
+            return
+        Pipe.finish(self.exception, Pipe.WB.pc)
+
+
+    #----------------------------------------------------------------------
+    #   Packet layer
+    #----------------------------------------------------------------------
+
+    def getc(self, block = True):
+        if not self.buf:
+            if not block and not select.select([ self.conn ], [ ], [ ], 0)[0]:
+                return None
+            try:
+                self.buf = self.conn.recv(4096)
+            except OSError:
+                self.buf = b''
+            if not self.buf:
+                raise EOFError
+        c, self.buf = self.buf[:1], self.buf[1:]
+        return c
+
+    def recv_packet(self):
+        # Returns the packet data, '\x03' for an interrupt, or None when the
+        # connection is closed
+        try:
+            while True:
+                c = self.getc()
+                if c == b'\x03':
+                    return '\x03'
+                if c != b'$':
+                    continue            # acks
+                data = b''
+                c = self.getc()
+                while c != b'#':
+                    data += c
+                    c = self.getc()
+                csum = self.getc() + self.getc()
+                if int(csum, 16) != sum(data) & 0xff:
+                    self.conn.sendall(b'-')
+                    continue
+                self.conn.sendall(b'+')
+                return data.decode('latin-1')
+        except (EOFError, ValueError):
+            return None
+
+    def send_packet(self, data):
+        data = data.encode('latin-1')
+        self.conn.sendall(b'$' + data + b'#%02x' % (sum(data) & 0xff))
+
+    def interrupted(self):
+        # Checks for Ctrl-C from GDB without blocking
+        while True:
+            try:
+                c = self.getc(block = False)
+            except EOFError:
+                return True
+            if c is None:
+                return False
+            if c == b'\x03':
+                return True
+
+
+    #----------------------------------------------------------------------
+    #   Commands
+    #----------------------------------------------------------------------
+
+    def handle(self, pkt):
+        cmd, args = pkt[:1], pkt[1:]
+        if cmd in [ '?', '\x03' ]:
+            return self.stop
+        elif cmd == 'g':
+            return ''.join(self.hex_word(self.get_reg(r)) for r in range(REG_PC + 1))
+        elif cmd == 'G':
+            for r in range(REG_PC + 1):
+                self.set_reg(r, self.word_hex(args[8 * r : 8 * r + 8]))
+            return 'OK'
+        elif cmd == 'p':
+            r = int(args, 16)
+            return self.hex_word(self.get_reg(r)) if r <= REG_PC else 'E01'
+        elif cmd == 'P':
+            r, val = args.split('=')
+            r = int(r, 16)
+            if r > REG_PC:
+                return 'E01'
+            self.set_reg(r, self.word_hex(val))
+            return 'OK'
+        elif cmd == 'm':
+            addr, length = [ int(v, 16) for v in args.split(',') ]
+            data = [ self.read_byte(a) for a in range(addr, addr + length) ]
+            return 'E01' if None in data else ''.join('%02x' % b for b in data)
+        elif cmd == 'M':
+            loc, data = args.split(':')
+            addr, length = [ int(v, 16) for v in loc.split(',') ]
+            for k in range(length):
+                if not self.write_byte(addr + k, int(data[2 * k : 2 * k + 2], 16)):
+                    return 'E01'
+            return 'OK'
+        elif cmd in [ 'c', 's' ]:
+            if args:
+                Pipe.IF.reg_pc = WORD(int(args, 16))
+            self.stop = self.resume(cmd == 's')
+            return self.stop
+        elif cmd in [ 'Z', 'z' ]:
+            return self.set_point(cmd == 'Z', *[ int(v, 16) for v in args.split(',')[:3] ])
+        elif cmd == 'H':
+            return 'OK'
+        elif pkt.startswith('qSupported'):
+            return 'PacketSize=4000;qXfer:features:read+'
+        elif pkt.startswith('qXfer:features:read:target.xml:'):
+            offset, length = [ int(v, 16) for v in pkt.split(':')[-1].split(',') ]
+            chunk = TARGET_XML[offset : offset + length]
+            return ('l' if offset + length >= len(TARGET_XML) else 'm') + chunk
+        elif pkt == 'qAttached':
+            return '1'
+        elif pkt == 'qfThreadInfo':
+            return 'm1'
+        elif pkt == 'qsThreadInfo':
+            return 'l'
+        elif pkt == 'qC':
+            return 'QC1'
+        return ''                       # not supported
+
+    def set_point(self, insert, kind, addr, length):
+        if kind in [ 0, 1 ]:            # software and hardware breakpoints
+            if insert:
+                self.breakpoints.add(addr)
+            else:
+                self.breakpoints.discard(addr)
+        elif kind in WATCH_KIND:
+            if insert:
+                self.watchpoints[(kind, addr, length)] = WATCH_KIND[kind]
+            else:
+                self.watchpoints.pop((kind, addr, length), None)
+        else:
+            return ''
+        return 'OK'
+
+
+    #----------------------------------------------------------------------
+    #   Architectural state. Between commands the pipeline holds nothing
+    #   but bubbles, and IF.reg_pc is the pc of the next instruction.
+    #----------------------------------------------------------------------
+
+    @staticmethod
+    def hex_word(v):
+        return int(v).to_bytes(4, 'little').hex()
+
+    @staticmethod
+    def word_hex(s):
+        return int.from_bytes(bytes.fromhex(s), 'little')
+
+    def get_reg(self, r):
+        return Pipe.IF.reg_pc if r == REG_PC else self.cpu.rf.reg[r]
+
+    def set_reg(self, r, val):
+        if r == REG_PC:
+            Pipe.IF.reg_pc = WORD(val)
+        else:
+            self.cpu.rf.write(r, WORD(val))
+
+    def memory(self, addr):
+        # Only RAM and ROM; reading device registers may have side effects
+        mem = self.cpu.bus.device(addr)
+        return mem if isinstance(mem, Memory) else None
+
+    def read_byte(self, addr):
+        mem = self.memory(addr)
+        if mem is None:
+            return None
+        word, status = mem.access(True, WORD(addr & ~3), 0, M_XRD)
+        return (int(word) >> (8 * (addr & 3))) & 0xff
+
+    def write_byte(self, addr, val):
+        mem = self.memory(addr)
+        if mem is None:
+            return False
+        shift = 8 * (addr & 3)
+        word, status = mem.access(True, WORD(addr & ~3), 0, M_XRD)
+        word = (int(word) & ~(0xff << shift)) | (val << shift)
+        mem.load(WORD(addr & ~3), word)
+        return True
+
+
+    #----------------------------------------------------------------------
+    #   Execution
+    #----------------------------------------------------------------------
+
+    def watch_hit(self, t):
+        # Returns the stop reply if the load/store in latch t triggers a watchpoint
+        if not t.c_dmem_en or not self.watchpoints:
+            return None
+        addr = int(t.sp_data if t.p_type == P_POP else t.alu_out)
+        write = t.c_dmem_rw == M_XWR
+        for (kind, start, length), name in self.watchpoints.items():
+            if start < addr + WORD_SIZE and addr < start + length and \
+               (kind == 4 or (kind == 2) == write):
+                return 'T%02x%s:%x;' % (SIGTRAP, name, max(start, addr))
+        return None
+
+    def resume(self, step):
+        # An instruction is committed when it enters MM. The run stops right
+        # before a committed instruction that hits a breakpoint, follows the
+        # single-stepped one or a watched access, or comes after Ctrl-C.
+        # Returns the stop reply.
+        seen = 0
+        reason = None
+        cycles = 0
+        while True:
+            t = Pipe.MM.reg
+            if t is not self.last_mm:
+                self.last_mm = t
+                if t.inst != BUBBLE:
+                    if seen and (step or int(t.pc) in self.breakpoints):
+                        reason = reason or 'S%02x' % SIGTRAP
+                    if reason:
+                        ok = Pipe.drain()
+                        self.last_mm = None
+                        if ok:
+                            return reason
+                        return self.terminate()
+                    seen += 1
+                    reason = self.watch_hit(t)
+
+            cycles += 1
+            if cycles % POLL_CYCLES == 0 and self.interrupted():
+                reason = reason or 'S%02x' % SIGINT
+
+            if not Pipe.cycle():
+                return self.terminate()
+
+    def terminate(self):
+        # The program has stopped with an exception in WB
+        self.exception = Pipe.WB.exception
+        if self.exception & EXC_EBREAK:
+            return 'W%02x' % ((self.cpu.kernel.exit_code or 0) & 0xff)
+        for exc, sig in EXC_SIGNAL.items():
+            if self.exception & exc:
+                return 'X%02x' % sig
+        return 'X%02x' % SIGTRAP
@@ -64,6 +64,16 @@ EBREAK      = WORD(0b00000000000100000000000001110011)
 PUSH        = WORD(0b00000010000000000000000001101011)
 POP         = WORD(0b00000100000000000000000001101011)
 
+MUL         = WORD(0b00000010000000000000000000110011)
+MULH        = WORD(0b00000010000000000001000000110011)
+MULHSU      = WORD(0b00000010000000000010000000110011)
+MULHU       = WORD(0b00000010000000000011000000110011)
+DIV         = WORD(0b00000010000000000100000000110011)
+
+DIVU        = WORD(0b00000010000000000101000000110011)
+REM         = WORD(0b00000010000000000110000000110011)
+REMU        = WORD(0b00000010000000000111000000110011)
+
 #--------------------------------------------------------------------------
 #   Instruction masks
 #--------------------------------------------------------------------------
@@ -111,6 +121,16 @@ EBREAK_MASK = WORD(0b11111111111111111111111111111111)
 PUSH_MASK   = WORD(0b11111110000000000111000001111111)
 POP_MASK    = WORD(0b11111110000000000111000001111111)
 
+MUL_MASK    = WORD(0b11111110000000000111000001111111)
+MULH_MASK   = WORD(0b11111110000000000111000001111111)
+MULHSU_MASK = WORD(0b11111110000000000111000001111111)
+MULHU_MASK  = WORD(0b11111110000000000111000001111111)
+DIV_MASK    = WORD(0b11111110000000000111000001111111)
+
+DIVU_MASK   = WORD(0b11111110000000000111000001111111)
+REM_MASK    = WORD(0b11111110000000000111000001111111)
+REMU_MASK   = WORD(0b11111110000000000111000001111111)
+
 #--------------------------------------------------------------------------
 #   ISA table: for opcode matching, disassembly, and run-time stats
 #--------------------------------------------------------------------------
@@ -158,6 +178,16 @@ isa         = {
 
     PUSH    : [ "push",     PUSH_MASK,  P_TYPE,   CL_MEM,   ],
     POP     : [ "pop",      POP_MASK,   P_TYPE,   CL_MEM,   ],
+
+    MUL     : [ "mul",      MUL_MASK,   R_TYPE,   CL_ALU,   ],
+    MULH    : [ "mulh",     MULH_MASK,  R_TYPE,   CL_ALU,   ],
+    MULHSU  : [ "mulhsu",   MULHSU_MASK,R_TYPE,   CL_ALU,   ],
+    MULHU   : [ "mulhu",    MULHU_MASK, R_TYPE,   CL_ALU,   ],
+    DIV     : [ "div",      DIV_MASK,   R_TYPE,   CL_ALU,   ],
+
+    DIVU    : [ "divu",     DIVU_MASK,  R_TYPE,   CL_ALU,   ],
+    REM     : [ "rem",      REM_MASK,   R_TYPE,   CL_ALU,   ],
+    REMU    : [ "remu",     REMU_MASK,  R_TYPE,   CL_ALU,   ],
 }
 
 
@@ -236,3 +266,39 @@ class RISCV(object):
         return RISCV.sign_extend(imm, 21)
 
 
+    # Encoders: build an instruction word from a base encoding in the
+    # isa table (which already holds opcode/funct3/funct7) and its fields
+
+    @staticmethod
+    def enc_r(op, rd, rs1, rs2):
+        return WORD(int(op) | (rd << RD_SHIFT) | (rs1 << RS1_SHIFT) | (rs2 << RS2_SHIFT))
+
+    @staticmethod
+    def enc_i(op, rd, rs1, imm):
+        return WORD(int(op) | (rd << RD_SHIFT) | (rs1 << RS1_SHIFT) | ((imm & 0xfff) << 20))
+
+    @staticmethod
+    def enc_s(op, rs1, rs2, imm):
+        imm     &= 0xfff
+        return WORD(int(op) | ((imm & 0x1f) << 7) | (rs1 << RS1_SHIFT) | \
+                    (rs2 << RS2_SHIFT) | ((imm >> 5) << 25))
+
+    @staticmethod
+    def enc_b(op, rs1, rs2, imm):
+        imm     &= 0x1fff
+        return WORD(int(op) | (((imm >> 11) & 1) << 7) | (((imm >> 1) & 0xf) << 8) | \
+                    (rs1 << RS1_SHIFT) | (rs2 << RS2_SHIFT) | \
+                    (((imm >> 5) & 0x3f) << 25) | ((imm >> 12) << 31))
+
+    @staticmethod
+    def enc_u(op, rd, imm):
+        return WORD(int(op) | (rd << RD_SHIFT) | (imm & 0xfffff000))
+
+    @staticmethod
+    def enc_j(op, rd, imm):
+        imm     &= 0x1fffff
+        return WORD(int(op) | (rd << RD_SHIFT) | (((imm >> 12) & 0xff) << 12) | \
+                    (((imm >> 11) & 1) << 20) | (((imm >> 1) & 0x3ff) << 21) | \
+                    ((imm >> 20) << 31))
+
+
@@ -34,7 +34,40 @@ S_EX      = 2
 S_MM      = 3
 S_WB      = 4
 
-S = [ 'IF', 'ID', 'EX', 'MM', 'WB' ]
+# Second halves of IF, EX, and MM when they are split into two sub-stages
+S_IF2     = 5
+S_EX2     = 6
+S_MM2     = 7
+
+S = [ 'IF', 'ID', 'EX', 'MM', 'WB', 'IF2', 'EX2', 'MM2' ]
+
+# Why Pipe.until() returned
+RUN_EXIT        = 'exit'        # an instruction with an exception left WB
+RUN_PC          = 'pc'          # the instruction at pc retired
+RUN_CYCLE       = 'cycle'       # the cycle count reached its target
+RUN_ICOUNT      = 'icount'      # the retired instruction count reached its target
+RUN_PREDICATE   = 'predicate'   # the predicate returned true
+RUN_TIMEOUT     = 'timeout'     # the cycle budget ran out
+RUN_ERROR       = 'error'       # a run forked by SNURISC5.fork() failed
+
+# Pipe.until() runs a loop generated from these lines: only the checks
+# asked for are compiled in, so an unbounded run pays for none of them
+UNTIL_HEAD = """
+def until(step, log_cycle, stat, wb, cpu, pc, cycle, icount, predicate, budget):
+    while True:
+        ok = step()
+"""
+
+UNTIL_CHECKS = {
+    'log'       : "log_cycle()",
+    'exit'      : "if not ok: return RUN_EXIT",
+    'pc'        : "if wb.pc == pc and wb.inst != BUBBLE: return RUN_PC",
+    'pcs'       : "if any(t.pc == pc and t.inst != BUBBLE for t in wb.t[:wb.retired]): return RUN_PC",
+    'cycle'     : "if stat.cycle >= cycle: return RUN_CYCLE",
+    'icount'    : "if stat.icount >= icount: return RUN_ICOUNT",
+    'predicate' : "if predicate(cpu): return RUN_PREDICATE",
+    'budget'    : "if stat.cycle >= budget: return RUN_TIMEOUT",
+}
 
 
 #--------------------------------------------------------------------------
@@ -43,9 +76,14 @@ S = [ 'IF', 'ID', 'EX', 'MM', 'WB' ]
 
 class Pipe(object):
 
+    loops = { }                             # loops of until() by the checks they make
+
     def __init__(self):
         self.name = self.__class__.__name__
 
+    # stages are IF, ID, EX, MM, and WB. cpu.pipeline lists all the stages
+    # in order, including the second halves of split ones (cpu.halves), and
+    # cpu.schedule is Pipe.schedule(cpu.pipeline).
     @staticmethod
     def set_stages(cpu, stages, ctl):
         Pipe.cpu = cpu
@@ -55,61 +93,209 @@ class Pipe(object):
         Pipe.EX = stages[S_EX]
         Pipe.MM = stages[S_MM]
         Pipe.WB = stages[S_WB]
+        Pipe.IF2, Pipe.EX2, Pipe.MM2 = cpu.halves
+        Pipe.computes, Pipe.updates = cpu.schedule
         Pipe.CTL = ctl
 
+    # Returns the compute() methods of the stages in the order they are run,
+    # and the update() methods of all stages but WB
+    @staticmethod
+    def schedule(pipeline):
+        for prev, s in zip(pipeline, pipeline[1:]):
+            prev.succ = s                   # the stage whose pipeline register prev fills
+        return [ s.compute for s in reversed(pipeline) ], [ s.update for s in pipeline[:-1] ]
+
+    # Simulates one cycle of the cpu selected by set_stages()
+    # Returns False when an instruction with an exception leaves WB
+    @staticmethod
+    def step():
+        # Run each stage 
+        # Should be run in the reverse order because forwarding and 
+        # hazard control logic depends on previous instructions
+        for compute in Pipe.computes:
+            compute()
+
+        # Update states (WB last)
+        for update in Pipe.updates:
+            update()
+        ok = Pipe.WB.update()
+
+        Pipe.count()
+        return ok
+
+    # Updates the stats of the cpu for a cycle in which WB has been run
+    @staticmethod
+    def count():
+        cpu = Pipe.cpu
+        stat = cpu.stat
+        stat.cycle      += 1
+        Pipe.WB.count(stat)
+        if cpu.activity is not None:
+            cpu.activity.sample(cpu)
+
+    # Counts a retired instruction by its class
+    @staticmethod
+    def count_inst(stat, inst):
+        stat.icount += 1
+        opcode = RISCV.opcode(inst)
+        if isa[opcode][IN_CLASS] == CL_ALU:
+            stat.inst_alu += 1
+        elif isa[opcode][IN_CLASS] == CL_MEM:
+            stat.inst_mem += 1
+        elif isa[opcode][IN_CLASS] == CL_CTRL:
+            stat.inst_ctrl += 1
+
+    # Shows the logs after a cycle
+    @staticmethod
+    def log_cycle():
+        if Log.level >= 6:
+            Pipe.cpu.rf.dump()                      # dump register file
+        if Log.level >= 7:
+            Pipe.cpu.dmem.dump(skipzero = True)     # dump dmem
+        if Log.level >= 4:
+            print("-" * 50)
+
+    # Simulates one cycle with logging
+    # Returns False when an instruction with an exception leaves WB
+    @staticmethod
+    def cycle():
+        ok = Pipe.step()
+        Pipe.log_cycle()
+        return ok
+
+    # Returns False if the program was stopped at the cycle limit
     @staticmethod
     def run(entry_point):
-        from stages import IF
-
-        IF.reg_pc = entry_point
-        while True:
-            # Run each stage 
-            # Should be run in the reverse order because forwarding and 
-            # hazard control logic depends on previous instructions
-            Pipe.WB.compute()
-            Pipe.MM.compute()
-            Pipe.EX.compute()
-            Pipe.ID.compute()
-            Pipe.IF.compute()
-
-            # Update states
-            Pipe.IF.update()
-            Pipe.ID.update()
-            Pipe.EX.update()
-            Pipe.MM.update()
-            ok = Pipe.WB.update()
 
+        Pipe.IF.reg_pc = entry_point
+        if Pipe.until(budget = Log.max_cycles) == RUN_TIMEOUT:
+            Pipe.stop()
+            Pipe.finish(EXC_NONE, Pipe.WB.pc)
+            return False
+
+        Pipe.finish(Pipe.WB.exception, Pipe.WB.pc)
+        return True
+
+    # Simulates cycles with logging until the program ends (RUN_EXIT) or,
+    # checked in this order at the end of a cycle, the instruction at pc
+    # retires, the cycle or retired instruction count of the cpu reaches
+    # cycle or icount, predicate(cpu) returns true, or the cycle count
+    # reaches budget. Returns the reason (RUN_*).
+    @staticmethod
+    def until(pc = None, cycle = None, icount = None, predicate = None, budget = 0):
+        checks = ('log', ) if Log.level >= 4 else ( )
+        checks += ('exit', )
+        if pc is not None:
+            checks += ('pcs' if Pipe.cpu.machine.issue > 1 else 'pc', )
+        checks += tuple(name for name, arg in [ ('cycle', cycle), ('icount', icount),
+                        ('predicate', predicate), ('budget', budget or None) ] if arg is not None)
+        loop = Pipe.loops.get(checks)
+        if loop is None:
+            src = UNTIL_HEAD + ''.join('        %s\n' % UNTIL_CHECKS[c] for c in checks)
+            ns = { 'BUBBLE' : BUBBLE }
+            ns.update((k, v) for k, v in globals().items() if k.startswith('RUN_'))
+            exec(compile(src, '<until %s>' % ','.join(checks), 'exec'), ns)
+            loop = Pipe.loops[checks] = ns['until']
+        return loop(Pipe.step, Pipe.log_cycle, Pipe.cpu.stat, Pipe.WB, Pipe.cpu,
+                    None if pc is None else WORD(pc), cycle, icount, predicate, budget)
+
+    # Reports that the cycle limit has been reached
+    @staticmethod
+    def stop():
+        Pipe.cpu.kernel.flush()                         # program output
+        Stat.stopped = True
+        print("Cycle limit %d reached -- Program stopped" % Log.max_cycles)
+
+    # Stops at an instruction boundary in one cycle: only the instruction in
+    # WB is retired, and the younger ones are squashed so that fetch restarts
+    # from the instruction in MM, which has not accessed dmem yet.
+    # Returns False when the retired instruction had an exception.
+    @staticmethod
+    def drain():
+        pc = Pipe.MM.reg.pc
+        Pipe.WB.compute()
+        ok = Pipe.WB.update()
+        Pipe.count()
+        Pipe.log_cycle()
+        if ok:
+            Pipe.flush(pc)
+        return ok
+
+    # Empties the pipeline and restarts fetch from pc
+    @staticmethod
+    def flush(pc):
+        for s in Pipe.cpu.pipeline:
+            s.flush(pc)
+
+    # Runs several cores in lockstep until all of them have stopped. Within
+    # a cycle the cores are stepped in hart id order, so that is also the
+    # order in which their MM stages access the shared dmem.
+    @staticmethod
+    def run_cores(cores, entry_point):
+
+        for c in cores:
+            c.stages[S_IF].reg_pc = entry_point
+        running = list(cores)
+        exits = { }
+        while running:
+            for c in list(running):
+                Pipe.set_stages(c, c.stages, c.ctl)
+                ok = Pipe.step()
+                if Log.level >= 6:
+                    print("Core %d" % c.hartid)
+                    c.rf.dump()                         # dump register file
+                if not ok:
+                    running.remove(c)
+                    exits[c.hartid] = (Pipe.WB.exception, Pipe.WB.pc)
             Stat.cycle      += 1
-            if Pipe.WB.inst != BUBBLE:
-                Stat.icount += 1
-                opcode = RISCV.opcode(Pipe.WB.inst)
-                if isa[opcode][IN_CLASS] == CL_ALU:
-                    Stat.inst_alu += 1
-                elif isa[opcode][IN_CLASS] == CL_MEM:
-                    Stat.inst_mem += 1
-                elif isa[opcode][IN_CLASS] == CL_CTRL:
-                    Stat.inst_ctrl += 1
-
-            # Show logs after executing a single instruction
-            if Log.level >= 6:
-                Pipe.cpu.rf.dump()                      # dump register file
             if Log.level >= 7:
-                Pipe.cpu.dmem.dump(skipzero = True)     # dump dmem
+                cores[0].dmem.dump(skipzero = True)     # dump dmem
             if Log.level >= 4:
                 print("-" * 50)
+            if Stat.cycle == Log.max_cycles and running:
+                Pipe.stop()
+                break
+
+        cores[0].kernel.flush()                         # program output
+        for c in cores:
+            print("Core %d: %s" % (c.hartid, Pipe.exit_msg(*exits[c.hartid]) if c.hartid in exits else "Stopped"))
+        Stat.icount     = sum(c.stat.icount for c in cores)
+        Stat.inst_alu   = sum(c.stat.inst_alu for c in cores)
+        Stat.inst_mem   = sum(c.stat.inst_mem for c in cores)
+        Stat.inst_ctrl  = sum(c.stat.inst_ctrl for c in cores)
+        Stat.cores      = [ c.stat for c in cores ]
+
+        if Log.level > 0:
+            if Log.level < 6:
+                for c in cores:
+                    print("Core %d" % c.hartid)
+                    c.rf.dump()                         # dump register file
+            if Log.level > 1 and Log.level < 7:
+                cores[0].dmem.dump(skipzero = True)     # dump dmem
+
+    # Describes how a program terminated
+    @staticmethod
+    def exit_msg(exception, pc):
+        if (exception & EXC_DMEM_ERROR):
+            return "Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_DMEM_ERROR], pc)
+        elif (exception & EXC_EBREAK):
+            return "Execution completed"
+        elif (exception & EXC_ILLEGAL_INST):
+            return "Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_ILLEGAL_INST], pc)
+        elif (exception & EXC_IMEM_ERROR):
+            return "Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_IMEM_ERROR], pc)
+        return None
+
+    # Reports how the program terminated and dumps the final state
+    @staticmethod
+    def finish(exception, pc):
 
-            if not ok:
-                break;
+        Pipe.cpu.kernel.flush()                         # program output
 
         # Handle exceptions, if any
-        if (Pipe.WB.exception & EXC_DMEM_ERROR):
-            print("Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_DMEM_ERROR], Pipe.WB.pc))
-        elif (Pipe.WB.exception & EXC_EBREAK):
-            print("Execution completed")
-        elif (Pipe.WB.exception & EXC_ILLEGAL_INST):
-            print("Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_ILLEGAL_INST], Pipe.WB.pc))
-        elif (Pipe.WB.exception & EXC_IMEM_ERROR):
-            print("Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_IMEM_ERROR], Pipe.WB.pc))
+        msg = Pipe.exit_msg(exception, pc)
+        if msg:
+            print(msg)
 
         if Log.level > 0:
             if Log.level < 6:
@@ -117,16 +303,19 @@ class Pipe(object):
             if Log.level > 1 and Log.level < 7:
                 Pipe.cpu.dmem.dump(skipzero = True)     # dump dmem
        
-    # This function is called by each stage after updating its states
+    # This function is called by each stage after updating its states.
+    # slot is the issue slot in a multiple-issue pipeline.
     @staticmethod
-    def log(stage, pc, inst, info):
+    def log(stage, pc, inst, info, slot = None):
 
         if Stat.cycle < Log.start_cycle:
             return
         if Log.level < 5:
             info = ''
         if Log.level >= 4 or (Log.level == 3 and stage == S_WB):
-            print("%d [%s] 0x%08x: %-30s%-s" % (Stat.cycle, S[stage], pc, Program.disasm(pc, inst), info))
+            name = S[stage] if slot is None else "%s%d" % (S[stage], slot)
+            name = name if Pipe.cpu.machine.cores == 1 else "%d:%s" % (Pipe.cpu.hartid, name)
+            print("%d [%s] 0x%08x: %-30s%-s" % (Stat.cycle, name, pc, Program.disasm(pc, inst), info))
         else:
             return
 
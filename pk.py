@@ -0,0 +1,195 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Proxy kernel: emulates the basic newlib/pk system calls made with
+#   ECALL (a7: syscall number, a0-a2: arguments, a0: return value).
+#
+#==========================================================================
+
+import sys
+
+import numpy as np
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+REG_A0          = 10
+REG_A1          = 11
+REG_A2          = 12
+REG_A7          = 17
+
+MASK32          = 0xffffffff
+
+PK_CLOCK_HZ     = 100000000             # simulated cycles per second
+PK_BUFFER       = 64 * 1024             # output is written to the host in batches
+
+SYS_CLOSE           = 57
+SYS_LSEEK           = 62
+SYS_READ            = 63
+SYS_WRITE           = 64
+SYS_FSTAT           = 80
+SYS_EXIT            = 93
+SYS_EXIT_GROUP      = 94
+SYS_CLOCK_GETTIME   = 113
+SYS_GETTIMEOFDAY    = 169
+SYS_BRK             = 214
+
+SYS_EXITS       = [ SYS_EXIT, SYS_EXIT_GROUP ]
+
+EBADF           = 9
+EFAULT          = 14
+ESPIPE          = 29
+ENOSYS          = 38
+
+
+#--------------------------------------------------------------------------
+#   Kernel: system calls of one program (shared by the cores running it)
+#--------------------------------------------------------------------------
+
+class Kernel(object):
+
+    def __init__(self, dmem_start, dmem_end):
+        self.ds         = int(dmem_start)
+        self.de         = int(dmem_end)
+        self.brk        = self.ds           # raised past the loaded data by Program.load()
+        self.out        = { 1 : bytearray(), 2 : bytearray() }
+        self.exit_code  = None
+        self.record     = None              # (number, a0, stores) of each call, for replay
+
+    # Runs the system call requested by registers x on dmem words d at the
+    # given cycle. Returns True if the program has exited.
+    def ecall(self, x, d, cycle):
+        n = int(x[REG_A7])
+        self.stores = [ ]
+        handler = SYSCALLS.get(n)
+        if handler is None:
+            print("Unknown system call %d" % n)
+            ret = -ENOSYS
+        else:
+            ret = handler(self, d, cycle, int(x[REG_A0]), int(x[REG_A1]), int(x[REG_A2]))
+        if self.record is not None:
+            self.record.append((n, ret, self.stores))
+        if n in SYS_EXITS:
+            return True
+        x[REG_A0] = ret & MASK32
+        return False
+
+    def flush(self):
+        sys.stdout.flush()
+        for fd, f in [ (1, sys.stdout), (2, sys.stderr) ]:
+            if self.out[fd]:
+                f.buffer.write(self.out[fd])
+                f.buffer.flush()
+                self.out[fd].clear()
+
+    # Adds program output for fd 1 or 2 (also used by the UART)
+    def put(self, fd, data):
+        self.out[fd] += data
+        if len(self.out[fd]) >= PK_BUFFER:
+            self.flush()
+
+    # Ends the program with the given exit code (also used by SimCtl)
+    def exit(self, code):
+        self.flush()
+        self.exit_code = code if code < 0x80000000 else code - 0x100000000
+        print("Program exited with code %d" % self.exit_code)
+
+    def valid(self, addr, size):
+        return self.ds <= addr and addr + size <= self.de
+
+    def store(self, d, addr, value):
+        index = (addr - self.ds) >> 2
+        d[index] = value & MASK32
+        self.stores.append((index, value & MASK32))
+
+
+    #----------------------------------------------------------------------
+    #   System calls: (kernel, d, cycle, a0, a1, a2) -> return value
+    #----------------------------------------------------------------------
+
+    def sys_write(self, d, cycle, fd, buf, size):
+        if fd not in self.out:
+            return -EBADF
+        if not self.valid(buf, size):
+            return -EFAULT
+        lo = (buf - self.ds) >> 2
+        hi = (buf + size - self.ds + 3) >> 2
+        data = np.asarray(d[lo:hi], dtype = '<u4').tobytes()
+        off = buf & 3
+        self.put(fd, data[off : off + size])
+        return size
+
+    def sys_read(self, d, cycle, fd, buf, size):
+        return 0 if fd == 0 else -EBADF     # stdin is always at EOF
+
+    def sys_close(self, d, cycle, fd, a1, a2):
+        return 0
+
+    def sys_lseek(self, d, cycle, fd, offset, whence):
+        return -ESPIPE
+
+    def sys_fstat(self, d, cycle, fd, buf, a2):
+        return -ENOSYS                      # newlib then treats stdout as a file
+
+    def sys_exit(self, d, cycle, code, a1, a2):
+        self.exit(code)
+        return 0
+
+    def sys_brk(self, d, cycle, addr, a1, a2):
+        if self.ds <= addr <= self.de:
+            self.brk = addr
+        return self.brk
+
+    # struct timespec/timeval with a 64-bit time_t
+    def sys_clock_gettime(self, d, cycle, clk, tp, a2):
+        return self.put_time(d, tp, cycle, 1000000000)
+
+    def sys_gettimeofday(self, d, cycle, tv, tz, a2):
+        return self.put_time(d, tv, cycle, 1000000)
+
+    def put_time(self, d, addr, cycle, scale):
+        if addr & 3 or not self.valid(addr, 12):
+            return -EFAULT
+        sec = cycle // PK_CLOCK_HZ
+        self.store(d, addr, sec)
+        self.store(d, addr + 4, sec >> 32)
+        self.store(d, addr + 8, (cycle % PK_CLOCK_HZ) * scale // PK_CLOCK_HZ)
+        return 0
+
+
+SYSCALLS = {
+    SYS_CLOSE           : Kernel.sys_close,
+    SYS_LSEEK           : Kernel.sys_lseek,
+    SYS_READ            : Kernel.sys_read,
+    SYS_WRITE           : Kernel.sys_write,
+    SYS_FSTAT           : Kernel.sys_fstat,
+    SYS_EXIT            : Kernel.sys_exit,
+    SYS_EXIT_GROUP      : Kernel.sys_exit,
+    SYS_CLOCK_GETTIME   : Kernel.sys_clock_gettime,
+    SYS_GETTIMEOFDAY    : Kernel.sys_gettimeofday,
+    SYS_BRK             : Kernel.sys_brk,
+}
+
+
+#--------------------------------------------------------------------------
+#   Replay: repeats the results recorded by a Kernel (for cosim)
+#--------------------------------------------------------------------------
+
+class Replay(object):
+
+    def __init__(self, record):
+        self.record     = record
+
+    def ecall(self, x, d, cycle):
+        n, ret, stores = self.record.popleft() if self.record else (int(x[REG_A7]), -ENOSYS, [ ])
+        for index, value in stores:
+            d[index] = value
+        if n in SYS_EXITS:
+            return True
+        x[REG_A0] = ret & MASK32
+        return False
@@ -13,7 +13,11 @@
 #
 #==========================================================================
 
-from elftools.elf import elffile as elf
+import io
+import os
+import struct
+import marshal
+
 from consts import *
 from isa import *
 from components import *
@@ -54,6 +58,19 @@ ELF_ERR_MSG = {
     ELF_ERR_MACH    : 'File %s is not an RISC-V executable file',
 }
 
+# Files with these suffixes are treated as assembly sources by load()
+ASM_SUFFIXES        = ( '.s', '.S' )
+
+# Images read from executables are cached next to them, keyed by the hash
+# of the file, so that warm runs do not parse ELF files at all
+IMAGE_VERSION       = 1         # bump to invalidate cached images
+IMAGE_CACHE_DIR     = '__pycache__'
+
+# Segment permission flags (p_flags) used by Program.save()
+PF_X                = 1
+PF_W                = 2
+PF_R                = 4
+
 class Program(object):
 
 
@@ -83,44 +100,211 @@ class Program(object):
         return ELF_OK
 
 
-    def load(self, cpu, filename):
+    # Loads an executable or assembly source into the memories of cpu and
+    # returns the entry point (0 on an error). image is what read() returned
+    # for the file, if the caller already has it.
+    def load(self, cpu, filename, image = None):
         print("Loading file %s" % filename)
+
+        if image is None:
+            try:
+                image = self.read(filename)
+            except ValueError as e:
+                print(e)
+                return WORD(0)
+
+        entry_point, segments = image
+        data_end = 0
+        for addr, memsz, data in segments:
+            # Segments go into the memory (RAM or ROM) on the bus that holds them
+            mem = cpu.bus.device(addr)
+            if not isinstance(mem, Memory) or addr + memsz > mem.mem_end:
+                print("Invalid address range: 0x%08x - 0x%08x" \
+                    % (addr, addr + memsz - 1))
+                continue
+            if mem is cpu.dmem:
+                data_end = max(data_end, addr + memsz)
+            for i in range(0, len(data), WORD_SIZE):
+                c = int.from_bytes(data[i:i+WORD_SIZE], byteorder='little')
+                mem.load(addr, c)
+                addr += WORD_SIZE
+
+        # The heap of the proxy kernel starts after the data (8-byte aligned)
+        cpu.kernel.brk = max(cpu.kernel.brk, (data_end + 7) & ~7)
+        return WORD(entry_point)
+
+    # Returns the entry point and the PT_LOAD segments, (vaddr, memsz, data),
+    # of an executable or assembly source without loading them anywhere.
+    # Raises ValueError with the message to show if the file is not valid.
+    def read(self, filename):
+
+        # Assembly sources are assembled (or fetched from the cache) first
+        if filename.endswith(ASM_SUFFIXES):
+            from assembler import Assembler, AsmError
+            try:
+                filename = Assembler.build(filename)
+            except IOError:
+                raise ValueError(ELF_ERR_MSG[ELF_ERR_OPEN] % filename)
+            except AsmError as e:
+                raise ValueError(str(e))
+
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except IOError:
+            raise ValueError(ELF_ERR_MSG[ELF_ERR_OPEN] % filename)
+
+        import hashlib
+        key = hashlib.sha256(b'%d:' % IMAGE_VERSION + data).hexdigest()[:16]
+        cache_dir = os.path.dirname(os.path.abspath(filename))
+        if os.path.basename(cache_dir) != IMAGE_CACHE_DIR:  # assembled images are already there
+            cache_dir = os.path.join(cache_dir, IMAGE_CACHE_DIR)
+        cached = os.path.join(cache_dir, '%s.%s.img' % (os.path.basename(filename), key))
         try:
-            f = open(filename, 'rb')
+            with open(cached, 'rb') as f:
+                image = marshal.load(f)
+            if isinstance(image, tuple) and len(image) == 2:
+                return image
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+
+        image = self.read_bytes(filename, data)
+        try:                                # the cache is optional (e.g. read-only directories)
+            os.makedirs(cache_dir, exist_ok = True)
+            tmp = cached + '.%d.tmp' % os.getpid()
+            with open(tmp, 'wb') as f:
+                marshal.dump(image, f)
+            os.replace(tmp, cached)
         except IOError:
-            print(ELF_ERR_MSG[ELF_ERR_OPEN] % filename) 
-            return WORD(0)
+            pass
+        return image
 
-        with f:
+    # Same as read() for an executable image in memory, named filename
+    def read_bytes(self, filename, data):
+        return self.parse(filename, io.BytesIO(data))
+
+    def parse(self, filename, f):
+        from elftools.elf import elffile as elf         # only needed on a cache miss
+        from elftools.common.exceptions import ELFError
+        # Truncated files fail only when the headers are read
+        try:
             ef = elf.ELFFile(f)
             efh = ef.header
             ret = self.check_elf(filename, efh)
             if ret != ELF_OK:
-                print(ELF_ERR_MSG[ret] % filename)
-                return WORD(0)
+                raise ValueError(ELF_ERR_MSG[ret] % filename)
 
-            entry_point = WORD(efh['e_entry'])
-            
+            segments = [ ]
             for seg in ef.iter_segments():
-                addr = seg.header['p_vaddr']
-                memsz = seg.header['p_memsz']
                 if seg.header['p_type'] != 'PT_LOAD':
                     continue
-                if addr >= cpu.imem.mem_start and addr + memsz < cpu.imem.mem_end:
-                    mem = cpu.imem
-                elif addr >= cpu.dmem.mem_start and addr + memsz < cpu.dmem.mem_end:
-                    mem = cpu.dmem
-                else:
-                    print("Invalid address range: 0x%08x - 0x%08x" \
-                        % (addr, addr + memsz - 1))
-                    continue
-                image = seg.data()
-                for i in range(0, len(image), WORD_SIZE):
-                    c = int.from_bytes(image[i:i+WORD_SIZE], byteorder='little')
-                    mem.access(True, addr, c, M_XWR)
-                    addr += WORD_SIZE
-            return entry_point
-                   
+                segments.append((seg.header['p_vaddr'], seg.header['p_memsz'], seg.data()))
+        except ELFError:
+            raise ValueError("File %s is not an ELF file" % filename)
+        return int(efh['e_entry']), segments
+
+    # Returns the names of the functions and labels in the text of an
+    # executable or assembly source by address, for reports. Executables
+    # without a symbol table have none.
+    def symbols(self, filename):
+        names = { }
+        if filename.endswith(ASM_SUFFIXES):
+            from assembler import Assembler, AsmError
+            asm = Assembler(filename)
+            try:
+                with open(filename) as f:
+                    asm.assemble(f.read())
+            except (IOError, AsmError):
+                return names
+            for name, (sect, off) in asm.symbols.items():
+                if sect is not None and sect.startswith('.text'):
+                    names.setdefault(asm.base[sect] + off, name)
+            return names
+
+        from elftools.elf import elffile as elf
+        from elftools.common.exceptions import ELFError
+        try:
+            with open(filename, 'rb') as f:
+                symtab = elf.ELFFile(f).get_section_by_name('.symtab')
+                syms = [ (sym['st_info']['type'] != 'STT_FUNC', sym['st_value'], sym.name)
+                         for sym in (symtab.iter_symbols() if symtab is not None else [ ])
+                         if sym['st_info']['type'] in [ 'STT_FUNC', 'STT_NOTYPE' ] and
+                            isinstance(sym['st_shndx'], int) and sym.name and not sym.name.startswith(('.L', '$')) ]
+        except (IOError, ELFError):
+            return names
+        for notype, addr, name in sorted(syms):     # functions first
+            names.setdefault(addr, name)
+        return names
+
+    # Returns the (start, end) ranges of data in an executable or assembly
+    # source, so that they are not taken for code: the data directives of
+    # a source, or the allocated sections of an ELF file that hold no code,
+    # its objects, and the spans its mapping symbols ($d up to the next $x)
+    # mark as data. Executables without sections or symbols have none.
+    def data_ranges(self, filename):
+        if filename.endswith(ASM_SUFFIXES):
+            from assembler import Assembler, AsmError
+            asm = Assembler(filename)
+            try:
+                with open(filename) as f:
+                    asm.assemble(f.read())
+            except (IOError, AsmError):
+                return [ ]
+            return asm.data_ranges
+
+        from elftools.elf import elffile as elf
+        from elftools.elf.constants import SH_FLAGS
+        from elftools.common.exceptions import ELFError
+        ranges = [ ]
+        try:
+            with open(filename, 'rb') as f:
+                e = elf.ELFFile(f)
+                sections = [ (s['sh_addr'], s['sh_addr'] + s['sh_size'], s['sh_flags'] & SH_FLAGS.SHF_EXECINSTR)
+                             for s in e.iter_sections() if s['sh_flags'] & SH_FLAGS.SHF_ALLOC and s['sh_size'] ]
+                symtab = e.get_section_by_name('.symtab')
+                syms = list(symtab.iter_symbols()) if symtab is not None else [ ]
+        except (IOError, ELFError):
+            return ranges
+        ranges += [ (start, end) for start, end, code in sections if not code ]
+        ranges += [ (s['st_value'], s['st_value'] + s['st_size']) for s in syms
+                    if s['st_info']['type'] == 'STT_OBJECT' and s['st_size'] ]
+        marks = sorted((s['st_value'], s.name[1]) for s in syms
+                       if s.name.startswith(('$d', '$x')) and isinstance(s['st_shndx'], int))
+        for i, (addr, kind) in enumerate(marks):
+            if kind != 'd':
+                continue
+            end = marks[i + 1][0] if i + 1 < len(marks) else \
+                  max([ e for s, e, code in sections if s <= addr < e ] + [ addr ])
+            ranges.append((addr, end))
+        return ranges
+
+    # Writes a minimal ELF32 RISC-V executable with one PT_LOAD segment per
+    # (vaddr, image, flags) tuple. No section headers are emitted; load()
+    # only looks at the program headers.
+    @staticmethod
+    def save(filename, entry_point, segments):
+        EHDR_SIZE   = 52
+        PHDR_SIZE   = 32
+
+        offset = EHDR_SIZE + PHDR_SIZE * len(segments)
+        phdrs = b''
+        images = b''
+        for vaddr, image, flags in segments:
+            pad = (-offset) % WORD_SIZE
+            images += b'\0' * pad
+            offset += pad
+            phdrs += struct.pack('<IIIIIIII', 1, offset, vaddr, vaddr,
+                                 len(image), len(image), flags, WORD_SIZE)
+            images += image
+            offset += len(image)
+
+        e_ident = b'\x7fELF' + bytes([1, 1, 1]) + b'\0' * 9     # ELFCLASS32, LSB, EV_CURRENT
+        ehdr = struct.pack('<16sHHIIIIIHHHHHH', e_ident, 2, 243, 1,   # ET_EXEC, EM_RISCV
+                           int(entry_point), EHDR_SIZE, 0, 0, EHDR_SIZE,
+                           PHDR_SIZE, len(segments), 40, 0, 0)
+        with open(filename, 'wb') as f:
+            f.write(ehdr + phdrs + images)
+
     @staticmethod
     def disasm(pc, inst):
 
@@ -190,7 +374,13 @@ class Log(object):
 
     level           = 2         # default log level
     start_cycle     = 0
-    btb_k           = 4         # For Project #4: default BTB size
+    mode            = 'pipe'    # 'pipe': cycle-level pipeline, 'func': functional only
+    ffwd            = 0         # instructions to fast-forward functionally before 'pipe'
+    cosim           = 0         # check every n-th retired instruction against the functional model (0: off)
+    gdb             = 0         # TCP port to serve GDB on (0: off)
+    max_cycles      = 0         # stops the pipeline after this many cycles (0: no limit)
+    commit_log      = None      # file to write the commit log to (None: off)
+    energy          = None      # energy table of the activity counters (None: off)
 
 
 #--------------------------------------------------------------------------
@@ -206,11 +396,59 @@ class Stat(object):
     inst_mem        = 0         # number of load/store instructions
     inst_ctrl       = 0         # number of control transfer instructions
 
+    cores           = [ ]       # per-core Stat instances of a multi-core run
+    units           = [ ]       # timing models (caches, mul/div) whose counters are shown at the end
+
+    roi_cycles      = 0         # cycles between the ROI markers of SimCtl
+    roi_count       = 0         # number of regions of interest
+
+    stopped         = False     # stopped at the cycle limit (Log.max_cycles)
+
+    # Stat itself holds the totals; instances count a single core
+    def __init__(self, hartid = 0):
+        self.hartid     = hartid
+        self.cycle      = 0
+        self.icount     = 0
+        self.inst_alu   = 0
+        self.inst_mem   = 0
+        self.inst_ctrl  = 0
+
+    # Returns the counters shown by show() as a dictionary
+    @staticmethod
+    def counters():
+        return {
+            'cycles'    : int(Stat.cycle),
+            'icount'    : int(Stat.icount),
+            'inst_alu'  : int(Stat.inst_alu),
+            'inst_mem'  : int(Stat.inst_mem),
+            'inst_ctrl' : int(Stat.inst_ctrl),
+            'roi_cycles': int(Stat.roi_cycles),
+            'roi_count' : int(Stat.roi_count),
+            'stopped'   : Stat.stopped,
+            'cores'     : [ { 'hartid' : s.hartid, 'cycles' : int(s.cycle), 'icount' : int(s.icount) }
+                            for s in Stat.cores ],
+            'units'     : [ s for s in (u.summary() for u in Stat.units) if s is not None ],
+        }
+
     @staticmethod
     def show():
-        print("%d instructions executed in %d cycles. CPI = %.3f" % (Stat.icount, Stat.cycle, 0.0 if Stat.icount == 0 else  Stat.cycle / Stat.icount))
+        for s in Stat.cores:
+            print("Core %d: %d instructions executed in %d cycles. CPI = %.3f" % (s.hartid, s.icount, s.cycle, 0.0 if s.icount == 0 else s.cycle / s.icount))
+        if Stat.cores:
+            print("All cores: %d instructions executed in %d cycles. IPC = %.3f" % (Stat.icount, Stat.cycle, 0.0 if Stat.cycle == 0 else Stat.icount / Stat.cycle))
+        elif Stat.cycle == 0 and Stat.icount > 0:
+            print("%d instructions executed (functional mode)" % Stat.icount)
+        else:
+            print("%d instructions executed in %d cycles. CPI = %.3f" % (Stat.icount, Stat.cycle, 0.0 if Stat.icount == 0 else  Stat.cycle / Stat.icount))
         print("Data transfer:    %d instructions (%.2f%%)" % (Stat.inst_mem, 0.0 if Stat.icount == 0 else Stat.inst_mem * 100.0 / Stat.icount))
         print("ALU operation:    %d instructions (%.2f%%)" % (Stat.inst_alu, 0.0 if Stat.icount == 0 else Stat.inst_alu * 100.0 / Stat.icount))
         print("Control transfer: %d instructions (%.2f%%)" % (Stat.inst_ctrl, 0.0 if Stat.icount == 0 else Stat.inst_ctrl * 100.0 / Stat.icount))
+        if Stat.roi_count:
+            print("Region of interest: %d %s (%d region%s)" % (Stat.roi_cycles,
+                  "instructions" if Stat.cycle == 0 else "cycles", Stat.roi_count, "" if Stat.roi_count == 1 else "s"))
+        for u in Stat.units:
+            s = u.summary()
+            if s is not None:
+                print(s)
 
 
@@ -0,0 +1,224 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   RV32C: expands 16-bit compressed instructions into the 32-bit
+#   instructions they stand for, and compresses 32-bit instructions for
+#   the assembler.
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+C_SP        = 2                     # the stack pointer, implicit in c.*sp
+C_RA        = 1                     # the link register of c.jal and c.jalr
+
+
+#--------------------------------------------------------------------------
+#   Field helpers
+#--------------------------------------------------------------------------
+
+# Bit n of v
+def bit(v, n):
+    return (v >> n) & 1
+
+# Bits hi..lo of v
+def bits(v, hi, lo):
+    return (v >> lo) & ((1 << (hi - lo + 1)) - 1)
+
+# Sign-extends the n-bit value v to a Python int
+def sext(v, n):
+    return v - (1 << n) if v >> (n - 1) else v
+
+# x8-x15, as encoded in the 3-bit register fields
+def creg(v):
+    return v + 8
+
+def is_creg(r):
+    return 8 <= r < 16
+
+
+#--------------------------------------------------------------------------
+#   Expansion
+#--------------------------------------------------------------------------
+
+# Returns the 32-bit instruction for the compressed parcel p (whose low two
+# bits are not 11), or ILLEGAL for reserved encodings and the floating-point
+# instructions. Results are cached as the same parcels come up repeatedly.
+def expand(p):
+    inst = EXPANDED.get(p)
+    if inst is None:
+        inst = EXPANDED[p] = decompress(p)
+    return inst
+
+EXPANDED = { }
+
+def decompress(p):
+    op, f3 = p & 3, bits(p, 15, 13)
+    rd = bits(p, 11, 7)                 # also rs1 of the full-register forms
+    rs2 = bits(p, 6, 2)
+    rs1p, rs2p = creg(bits(p, 9, 7)), creg(bits(p, 4, 2))  # rs1'/rd' and rs2'/rd'
+    imm6 = sext(bit(p, 12) << 5 | bits(p, 6, 2), 6)
+
+    if op == 0:
+        uimm = bits(p, 12, 10) << 3 | bit(p, 6) << 2 | bit(p, 5) << 6
+        if f3 == 0:                     # c.addi4spn
+            nzuimm = bits(p, 12, 11) << 4 | bits(p, 10, 7) << 6 | bit(p, 6) << 2 | bit(p, 5) << 3
+            if nzuimm == 0:
+                return ILLEGAL
+            return RISCV.enc_i(ADDI, rs2p, C_SP, nzuimm)
+        if f3 == 2:                     # c.lw
+            return RISCV.enc_i(LW, rs2p, rs1p, uimm)
+        if f3 == 6:                     # c.sw
+            return RISCV.enc_s(SW, rs1p, rs2p, uimm)
+        return ILLEGAL                  # c.fld, c.flw, c.fsd, c.fsw, reserved
+
+    if op == 1:
+        if f3 == 0:                     # c.addi (c.nop for rd = 0)
+            return RISCV.enc_i(ADDI, rd, rd, imm6)
+        if f3 in [ 1, 5 ]:              # c.jal, c.j
+            off = bit(p, 12) << 11 | bit(p, 11) << 4 | bits(p, 10, 9) << 8 | bit(p, 8) << 10 | \
+                  bit(p, 7) << 6 | bit(p, 6) << 7 | bits(p, 5, 3) << 1 | bit(p, 2) << 5
+            return RISCV.enc_j(JAL, C_RA if f3 == 1 else 0, sext(off, 12))
+        if f3 == 2:                     # c.li
+            return RISCV.enc_i(ADDI, rd, 0, imm6)
+        if f3 == 3:
+            if rd == C_SP:              # c.addi16sp
+                nzimm = sext(bit(p, 12) << 9 | bit(p, 6) << 4 | bit(p, 5) << 6 | \
+                             bits(p, 4, 3) << 7 | bit(p, 2) << 5, 10)
+                if nzimm == 0:
+                    return ILLEGAL
+                return RISCV.enc_i(ADDI, C_SP, C_SP, nzimm)
+            if imm6 == 0:               # c.lui
+                return ILLEGAL
+            return RISCV.enc_u(LUI, rd, imm6 << 12)
+        if f3 == 4:
+            f2 = bits(p, 11, 10)
+            if f2 in [ 0, 1 ]:          # c.srli, c.srai
+                if bit(p, 12):          # shamt[5] must be 0 in RV32
+                    return ILLEGAL
+                return RISCV.enc_i(SRLI if f2 == 0 else SRAI, rs1p, rs1p, rs2)
+            if f2 == 2:                 # c.andi
+                return RISCV.enc_i(ANDI, rs1p, rs1p, imm6)
+            if bit(p, 12):              # c.subw, c.addw (RV64), reserved
+                return ILLEGAL
+            base = [ SUB, XOR, OR, AND ][bits(p, 6, 5)]
+            return RISCV.enc_r(base, rs1p, rs1p, rs2p)
+        off = bit(p, 12) << 8 | bits(p, 11, 10) << 3 | bits(p, 6, 5) << 6 | \
+              bits(p, 4, 3) << 1 | bit(p, 2) << 5
+        return RISCV.enc_b(BEQ if f3 == 6 else BNE, rs1p, 0, sext(off, 9))   # c.beqz, c.bnez
+
+    if f3 == 0:                         # c.slli
+        if bit(p, 12):
+            return ILLEGAL
+        return RISCV.enc_i(SLLI, rd, rd, rs2)
+    if f3 == 2:                         # c.lwsp
+        if rd == 0:
+            return ILLEGAL
+        uimm = bit(p, 12) << 5 | bits(p, 6, 4) << 2 | bits(p, 3, 2) << 6
+        return RISCV.enc_i(LW, rd, C_SP, uimm)
+    if f3 == 4:
+        if not bit(p, 12):
+            if rs2 == 0:                # c.jr
+                return RISCV.enc_i(JALR, 0, rd, 0) if rd else ILLEGAL
+            return RISCV.enc_r(ADD, rd, 0, rs2)                 # c.mv
+        if rs2 == 0:
+            return RISCV.enc_i(JALR, C_RA, rd, 0) if rd else EBREAK    # c.jalr, c.ebreak
+        return RISCV.enc_r(ADD, rd, rd, rs2)                    # c.add
+    if f3 == 6:                         # c.swsp
+        uimm = bits(p, 12, 9) << 2 | bits(p, 8, 7) << 6
+        return RISCV.enc_s(SW, C_SP, rs2, uimm)
+    return ILLEGAL                      # c.fldsp, c.flwsp, c.fsdsp, c.fswsp
+
+
+#--------------------------------------------------------------------------
+#   Compression
+#--------------------------------------------------------------------------
+
+# Returns the 16-bit parcel for the 32-bit instruction inst, or None if it
+# has no compressed form
+def compress(inst):
+    inst = int(inst)
+    opcode = RISCV.opcode(WORD(inst))
+    if opcode == ILLEGAL:
+        return None
+    rd, rs1, rs2 = int(RISCV.rd(inst)), int(RISCV.rs1(inst)), int(RISCV.rs2(inst))
+    t = isa[opcode][IN_TYPE]
+    imm = sext(int(RISCV.imm_i(inst)), 32) if t in [ I_TYPE, IL_TYPE, IJ_TYPE, IS_TYPE ] else \
+          sext(int(RISCV.imm_s(inst)), 32) if t == S_TYPE else \
+          sext(int(RISCV.imm_b(inst)), 32) if t == B_TYPE else \
+          sext(int(RISCV.imm_j(inst)), 32) if t == J_TYPE else 0
+
+    def ci(f3, r, v):                   # c.addi/c.li/c.andi-style 6-bit immediate
+        return f3 << 13 | (v >> 5 & 1) << 12 | r << 7 | (v & 0x1f) << 2 | 1
+
+    if opcode == ADDI:
+        if rd == rs1 and -32 <= imm < 32 and (rd != 0 or imm == 0):
+            return ci(0, rd, imm)                                # c.addi, c.nop
+        if rd == rs1 == C_SP and imm and imm % 16 == 0 and -512 <= imm < 512:
+            v = imm & 0x3ff                                     # c.addi16sp
+            return 3 << 13 | (v >> 9 & 1) << 12 | C_SP << 7 | (v >> 4 & 1) << 6 | \
+                   (v >> 6 & 1) << 5 | (v >> 7 & 3) << 3 | (v >> 5 & 1) << 2 | 1
+        if rs1 == 0 and rd and -32 <= imm < 32:
+            return ci(2, rd, imm)                                # c.li
+        if rs1 == C_SP and is_creg(rd) and imm and imm % 4 == 0 and 0 < imm < 1024:
+            return (imm >> 4 & 3) << 11 | (imm >> 6 & 0xf) << 7 | (imm >> 2 & 1) << 6 | \
+                   (imm >> 3 & 1) << 5 | (rd - 8) << 2          # c.addi4spn
+        if imm == 0 and rd and rs1:
+            return 4 << 13 | rd << 7 | rs1 << 2 | 2             # c.mv
+        return None
+    if opcode == LUI:
+        v = sext(int(inst) >> 12, 20)
+        if rd not in [ 0, C_SP ] and v and -32 <= v < 32:
+            return ci(3, rd, v)                                  # c.lui
+        return None
+    if opcode in [ SRLI, SRAI, ANDI ] and rd == rs1 and is_creg(rd):
+        if opcode == ANDI:
+            return ci(4, 0, imm) | 2 << 10 | (rd - 8) << 7 if -32 <= imm < 32 else None
+        sh = imm & 0x1f
+        return 4 << 13 | (0 if opcode == SRLI else 1) << 10 | (rd - 8) << 7 | sh << 2 | 1
+    if opcode == SLLI and rd == rs1 and rd:
+        return rd << 7 | (imm & 0x1f) << 2 | 2                 # c.slli
+    if opcode in [ SUB, XOR, OR, AND ] and rd == rs1 and is_creg(rd) and is_creg(rs2):
+        f = [ SUB, XOR, OR, AND ].index(opcode)
+        return 4 << 13 | 3 << 10 | (rd - 8) << 7 | f << 5 | (rs2 - 8) << 2 | 1
+    if opcode == ADD and rd and rs2:
+        if rs1 == 0:
+            return 4 << 13 | rd << 7 | rs2 << 2 | 2             # c.mv
+        if rd == rs1:
+            return 4 << 13 | 1 << 12 | rd << 7 | rs2 << 2 | 2   # c.add
+        if rd == rs2:
+            return 4 << 13 | 1 << 12 | rd << 7 | rs1 << 2 | 2
+        return None
+    if opcode in [ LW, SW ]:
+        r = rd if opcode == LW else rs2
+        if rs1 == C_SP and 0 <= imm < 256 and imm % 4 == 0 and (opcode == SW or rd):
+            if opcode == LW:                                    # c.lwsp
+                return 2 << 13 | (imm >> 5 & 1) << 12 | rd << 7 | (imm >> 2 & 7) << 4 | (imm >> 6 & 3) << 2 | 2
+            return 6 << 13 | (imm >> 2 & 0xf) << 9 | (imm >> 6 & 3) << 7 | rs2 << 2 | 2    # c.swsp
+        if is_creg(rs1) and is_creg(r) and 0 <= imm < 128 and imm % 4 == 0:
+            return (2 if opcode == LW else 6) << 13 | (imm >> 3 & 7) << 10 | (rs1 - 8) << 7 | \
+                   (imm >> 2 & 1) << 6 | (imm >> 6 & 1) << 5 | (r - 8) << 2            # c.lw, c.sw
+        return None
+    if opcode == JAL and rd in [ 0, C_RA ] and -2048 <= imm < 2048:
+        v = imm & 0xfff                                         # c.j, c.jal
+        return (5 if rd == 0 else 1) << 13 | (v >> 11 & 1) << 12 | (v >> 4 & 1) << 11 | \
+               (v >> 8 & 3) << 9 | (v >> 10 & 1) << 8 | (v >> 6 & 1) << 7 | (v >> 7 & 1) << 6 | \
+               (v >> 1 & 7) << 3 | (v >> 5 & 1) << 2 | 1
+    if opcode == JALR and imm == 0 and rs1 and rd in [ 0, C_RA ]:
+        return 4 << 13 | (rd == C_RA) << 12 | rs1 << 7 | 2     # c.jr, c.jalr
+    if opcode in [ BEQ, BNE ] and rs2 == 0 and is_creg(rs1) and -256 <= imm < 256:
+        v = imm & 0x1ff                                         # c.beqz, c.bnez
+        return (6 if opcode == BEQ else 7) << 13 | (v >> 8 & 1) << 12 | (v >> 3 & 3) << 10 | \
+               (rs1 - 8) << 7 | (v >> 6 & 3) << 5 | (v >> 1 & 3) << 3 | (v >> 5 & 1) << 2 | 1
+    if opcode == EBREAK:
+        return 0x9002                                           # c.ebreak
+    return None
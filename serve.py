@@ -0,0 +1,323 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Simulation daemon (snurisc5.py serve). Accepts run requests from
+#   client.py over a Unix socket (see client.py for the protocol) and runs
+#   each of them in a worker process forked after all the simulator
+#   modules have been imported. Program images are read once and cached.
+#
+#==========================================================================
+
+import os
+import io
+import sys
+import json
+import stat
+import base64
+import pickle
+import signal
+import socket
+import struct
+import asyncio
+import hashlib
+import traceback
+from collections import OrderedDict
+
+from program import Program, Stat
+from client import SOCKET_PATH
+import snurisc5
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+IMAGE_CACHE     = 64                    # program images kept by the daemon
+CHUNK           = 16 * 1024             # bytes of output in a message
+REQUEST_LIMIT   = 16 * 1024 * 1024      # longest request line (with an image)
+RESULT_LIMIT    = 1024 * 1024           # longest message line from a worker
+
+
+#--------------------------------------------------------------------------
+#   Channel: sends what is written to stdout or stderr of a run as messages
+#--------------------------------------------------------------------------
+
+class Channel(io.RawIOBase):
+
+    def __init__(self, out, stream, send = True):
+        self.out = out
+        self.stream = stream
+        self.send = send
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.send:
+            message(self.out, type = 'output', stream = self.stream,
+                    data = bytes(b).decode('utf-8', 'surrogateescape'))
+        return len(b)
+
+
+def message(out, **msg):
+    out.write(json.dumps(msg).encode() + b'\n')
+    out.flush()
+
+
+#--------------------------------------------------------------------------
+#   Worker: a process that runs one request
+#--------------------------------------------------------------------------
+
+class Worker(object):
+
+    # Forks a process that waits for its job on a pipe. It shares the
+    # imported modules with the daemon and runs a single job, so that the
+    # state of the simulator (class attributes of Pipe, Stat, Log, ...)
+    # starts afresh for every run.
+    def __init__(self):
+        jr, self.jobs = os.pipe()
+        self.results, rw = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                os.closerange(3, min(jr, rw))       # sockets and other workers' pipes
+                os.closerange(min(jr, rw) + 1, max(jr, rw))
+                os.closerange(max(jr, rw) + 1, os.sysconf('SC_OPEN_MAX'))
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                Worker.main(jr, rw)
+            finally:
+                os._exit(0)
+        os.close(jr)
+        os.close(rw)
+
+    # Runs the job and streams the messages of the worker to writer
+    async def run(self, job, writer):
+        data = pickle.dumps(job)
+        with open(self.jobs, 'wb') as f:
+            f.write(struct.pack('<Q', len(data)) + data)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit = RESULT_LIMIT)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                                    open(self.results, 'rb', 0))
+        last = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(line)
+                await writer.drain()
+                last = line
+        finally:
+            transport.close()
+            if last is None or json.loads(last)['type'] != 'exit':
+                os.kill(self.pid, signal.SIGKILL)   # the client has gone
+                last = None
+        if last is None:
+            message_async(writer, type = 'error', message = "the worker exited without a status")
+            await writer.drain()
+
+    @staticmethod
+    def main(jobs, results):
+        with open(jobs, 'rb') as f:
+            head = f.read(8)
+            if len(head) < 8:
+                return                              # the daemon has exited
+            job = pickle.loads(f.read(struct.unpack('<Q', head)[0]))
+
+        out = open(results, 'wb')
+        sys.stdout = io.TextIOWrapper(io.BufferedWriter(Channel(out, 'stdout', job['output']), CHUNK))
+        sys.stderr = io.TextIOWrapper(io.BufferedWriter(Channel(out, 'stderr'), CHUNK))
+        status = 1
+        try:
+            os.chdir(job['cwd'])
+            args = snurisc5.parse_args(job['args'])
+            if not args:
+                snurisc5.show_usage(job['args'][0])
+                status = 0
+            else:
+                filename, machine = args
+                status = snurisc5.simulate(filename, machine, job['image'])
+                sys.stdout.flush()
+                message(out, type = 'stats', **Stat.counters())
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        message(out, type = 'exit', status = status)
+
+
+def message_async(writer, **msg):
+    writer.write(json.dumps(msg).encode() + b'\n')
+
+
+#--------------------------------------------------------------------------
+#   Server: accepts requests and hands them to the workers
+#--------------------------------------------------------------------------
+
+class Server(object):
+
+    # At most workers requests run at the same time. A worker is forked in
+    # advance for each of them and replaced once it has run its request.
+    def __init__(self, path, workers):
+        self.path = path
+        self.workers = workers
+        self.images = OrderedDict()         # key -> what Program.read() returned
+        self.idle = None                    # forked workers waiting for a job
+
+    def run(self):
+        if os.path.exists(self.path):
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise OSError("%s is not a socket" % self.path)
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(self.path)
+                raise OSError("a daemon is already serving %s" % self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)        # left by a daemon that has exited
+            finally:
+                s.close()
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)   # workers are reaped by the kernel
+        try:
+            asyncio.run(self.serve())
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def serve(self):
+        self.idle = asyncio.Queue()
+        for _ in range(self.workers):
+            self.idle.put_nowait(Worker())
+        server = await asyncio.start_unix_server(self.handle, self.path, limit = REQUEST_LIMIT)
+        print("Serving on %s with %d workers" % (self.path, self.workers))
+        sys.stdout.flush()
+        stop = asyncio.Event()
+        for sig in [ signal.SIGINT, signal.SIGTERM ]:
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        async with server:
+            await stop.wait()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    job = self.job(json.loads(line))
+                except ValueError as e:
+                    message_async(writer, type = 'error', message = str(e))
+                    await writer.drain()
+                    continue
+                worker = await self.idle.get()
+                try:
+                    await worker.run(job, writer)
+                finally:
+                    self.idle.put_nowait(Worker())
+        except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Returns the job for a request. Raises ValueError if it is not valid.
+    def job(self, req):
+        if not isinstance(req, dict):
+            raise ValueError("a request should be an object")
+        args = req.get('args')
+        if not isinstance(args, list) or not args or not all(isinstance(a, str) for a in args):
+            raise ValueError("args should be a command line")
+        cwd = req.get('cwd', os.getcwd())
+        output = req.get('output', True)
+        elf = req.get('elf')
+        if not isinstance(cwd, str) or not isinstance(output, bool) or not isinstance(elf, (str, type(None))):
+            raise ValueError("invalid cwd, output, or elf")
+
+        # A valid command line ends with the file name after pairs of options
+        filename = args[-1] if len(args) % 2 == 0 else None
+        if elf is not None:
+            if filename is None:
+                raise ValueError("no name for the elf image")
+            try:
+                data = base64.b64decode(elf, validate = True)
+            except ValueError:
+                raise ValueError("elf is not in base64")
+            image = self.image(hashlib.sha256(data).digest(),
+                               lambda: Program().read_bytes(filename, data))
+        elif filename is not None:
+            path = os.path.abspath(os.path.join(cwd, filename))
+            try:
+                st = os.stat(path)
+                image = self.image((path, st.st_mtime_ns, st.st_size), lambda: Program().read(path))
+            except Exception:
+                image = None                # the worker reports the error as the CLI does
+        else:
+            image = None
+        return { 'args' : args, 'cwd' : cwd, 'output' : output, 'image' : image }
+
+    # Returns the image cached for key, reading it with read() if there is none
+    def image(self, key, read):
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            return image
+        image = self.images[key] = read()
+        if len(self.images) > IMAGE_CACHE:
+            self.images.popitem(last = False)
+        return image
+
+
+#--------------------------------------------------------------------------
+#   Utility functions for command line parsing
+#--------------------------------------------------------------------------
+
+def show_usage(name):
+    print("SNURISC5 daemon: serves simulation requests from client.py")
+    print("Usage: %s serve [--socket path] [--workers n]" % name)
+    print("\t--socket listens on the Unix socket path (default: %s)" % SOCKET_PATH)
+    print("\t--workers runs up to n requests at the same time (default: %d)" % (os.cpu_count() or 1))
+
+
+# Returns (socket path, workers), or None on an error
+def parse_args(args):
+    if len(args) % 2 != 0:
+        return None
+
+    path = SOCKET_PATH
+    workers = os.cpu_count() or 1
+    index = 2
+    while index < len(args):
+        if args[index] == '--socket':
+            path = args[index + 1]
+        elif args[index] == '--workers':
+            try:
+                workers = int(args[index + 1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print("Invalid number of workers '%s'" % args[index + 1])
+                return None
+        else:
+            print("Invalid option '%s'" % args[index])
+            return None
+        index += 2
+    return path, workers
+
+
+def serve_main(argv):
+    args = parse_args(argv)
+    if not args:
+        show_usage(argv[0])
+        sys.exit()
+    try:
+        Server(*args).run()
+    except OSError as e:
+        print("Cannot serve: %s" % e)
+        sys.exit(1)
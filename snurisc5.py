@@ -21,20 +21,31 @@ from consts import *
 from isa import *
 from components import *
 from stages import *
+from superscalar import *
+from deep import *
+from cache import Cache
+from pk import Kernel
+from bus import Bus, ROM, UART, Timer, SimCtl
+from config import *
 
 
 #--------------------------------------------------------------------------
 #   Configurations
 #--------------------------------------------------------------------------
 
-# Memory configurations
-#   IMEM: 0x80000000 - 0x8000ffff (64KB)
-#   DMEM: 0x80010000 - 0x8001ffff (64KB)
+# The memory map, branch prediction, RV32C support, multiplier/divider
+# latencies, caches, number of cores, issue width, the stage that resolves
+# branches, and the stages split for a deeper pipeline are described by a
+# Machine (see config.py for the defaults)
 
-IMEM_START  = WORD(0x80000000)      # IMEM: 0x80000000 - 0x8000ffff (64KB)
-IMEM_SIZE   = WORD(64 * 1024)
-DMEM_START  = WORD(0x80010000)      # DMEM: 0x80010000 - 0x8001ffff (64KB)
-DMEM_SIZE   = WORD(64 * 1024)
+REG_A0      = 10                    # holds the hart id when a core starts
+TIMEOUT_STATUS = 124                # exit status when --max-cycles stops the run, as timeout(1)
+
+DEVICE_CLASSES = {
+    'uart'      : lambda bus, start, kernel: UART(bus, start, kernel),
+    'timer'     : lambda bus, start, kernel: Timer(bus, start),
+    'simctl'    : lambda bus, start, kernel: SimCtl(bus, start, kernel),
+}
 
 
 #--------------------------------------------------------------------------
@@ -43,22 +54,324 @@ DMEM_SIZE   = WORD(64 * 1024)
 
 class SNURISC5(object):
 
-    def __init__(self):
+    STAGES  = [ IF, ID, EX, MM, WB ]
+    CONTROL = Control
+
+    # Additional cores of a multi-core target share the bus (imem, dmem, and
+    # the devices) and the proxy kernel with the first one, boot. Each core
+    # starts with its hart id in a0.
+    def __init__(self, machine = None, hartid = 0, boot = None):
 
-        stages = [ IF(), ID(), EX(), MM(), WB() ]
-        self.ctl = Control()
-        Pipe.set_stages(self, stages, self.ctl)
+        self.stages = [ stage() for stage in self.STAGES ]
+        self.ctl = self.CONTROL()
+        self.pipeline, self.halves = self.stages, (None, None, None)
+        self.schedule = Pipe.schedule(self.pipeline)
+        Pipe.set_stages(self, self.stages, self.ctl)
        
+        self.hartid = hartid
         self.rf = RegisterFile()
+        self.rf.write(REG_A0, WORD(hartid))
         self.alu = ALU()
-        self.imem = Memory(IMEM_START, IMEM_SIZE, WORD_SIZE)
-        self.dmem = Memory(DMEM_START, DMEM_SIZE, WORD_SIZE)
+        if boot is None:
+            m = self.machine = machine if machine is not None else Machine()
+            self.kernel = Kernel(m.dmem_start, m.dmem_start + m.dmem_size)
+            self.bus = Bus()
+            self.imem = self.bus.map(ROM(WORD(m.imem_start), WORD(m.imem_size), WORD_SIZE), fetch = True)
+            self.dmem = self.bus.map(Memory(WORD(m.dmem_start), WORD(m.dmem_size), WORD_SIZE))
+            for name, start in m.devices.items():
+                self.bus.map(DEVICE_CLASSES[name](self.bus, start, self.kernel))
+        else:
+            m = self.machine = boot.machine
+            self.kernel, self.bus = boot.kernel, boot.bus
+            self.imem, self.dmem = boot.imem, boot.dmem
         self.adder_brtarget = Adder()
         self.adder_pcplus4 = Adder()
-        self.btb = BTB(Log.btb_k)
+        self.early_branch = m.resolve == RESOLVE_ID
+        self.resolver = self.stages[S_ID if self.early_branch else S_EX]     # updates the BTB
+        self.brcmp = ALU()                  # branch comparator in ID (early branch resolution)
+        self.rvc = m.rvc
+        self.stat = Stat if m.cores == 1 else Stat(hartid)
+
+        # Caches and the multiplier/divider are private to each core and only model timing
+        prefix = "" if m.cores == 1 else "Core %d " % hartid
+        self.btb = BTB(m.btb_k, 1 if m.rvc else 2, prefix + "BTB") if m.predictor == PRED_BTB else NoPredictor()
+        self.cpi = CPIStack(prefix + "CPI stack", self.stat)
+        self.fetch = FetchCounter(prefix + "Fetch")
+        self.icache = Cache(prefix + "I-cache", **m.icache) if m.icache is not None else None
+        self.dcache = Cache(prefix + "D-cache", **m.dcache) if m.dcache is not None else None
+        self.muldiv = MulDiv(prefix + "Mul/div", m.mul_lat, m.div_lat)
+        if Log.energy is not None:
+            from energy import Activity
+            self.activity = Activity(prefix + "Energy", self, Log.energy)
+        else:
+            self.activity = None
+        Stat.units += self.units()
+        self.cosim = None
+        self.prefix = prefix
+
+        # The cores of a multi-core target share the commit log of the first
+        if boot is not None:
+            self.commits = boot.commits
+        elif Log.commit_log is not None:
+            from commitlog import CommitLog
+            self.commits = CommitLog(Log.commit_log)
+            Stat.units.append(self.commits)
+        else:
+            self.commits = None
+
+    # Returns the timing models whose counters are shown at the end
+    def units(self):
+        return [ self.cpi, self.fetch, self.btb ] + [ c for c in [ self.icache, self.dcache ] if c is not None ] + \
+               [ self.muldiv ] + ([ self.activity ] if self.activity is not None else [ ])
 
+    # The functional model, cosim and the GDB stub are imported only when
+    # they are used, to keep the startup of plain runs short
     def run(self, entry_point):
-        Pipe.run(entry_point)
+        if Log.mode == 'func' or Log.ffwd > 0:
+            from functional import Functional
+            f = Functional(self)
+            pc, n, exception = f.run(entry_point, None if Log.mode == 'func' else Log.ffwd)
+            if Log.mode == 'func' or exception:
+                Stat.icount = f.icount
+                Stat.inst_alu, Stat.inst_mem, Stat.inst_ctrl = f.classes()
+                Pipe.finish(exception, pc)
+                return
+            print("Fast-forwarded %d instructions to 0x%08x" % (n, pc))
+            entry_point = pc
+        if Log.cosim:
+            from cosim import Cosim
+            self.cosim = Cosim(self, entry_point, Log.cosim)
+        if Log.gdb:
+            from gdbstub import GDBStub
+            GDBStub(self, Log.gdb).run(entry_point)
+        elif not Pipe.run(entry_point):
+            return
+        if self.cosim is not None:
+            self.cosim.finish(Pipe.WB.exception, Pipe.WB.pc)
+
+    #----------------------------------------------------------------------
+    #   Run control API
+    #----------------------------------------------------------------------
+
+    # Starts the program at entry_point (see Program.load()) for step() and
+    # run_until(), which return a RunResult instead of printing anything
+    # but the logs of Log.level. budget is a hard limit on the cycle count
+    # of the core for all the calls (0: none, default: Log.max_cycles).
+    def start(self, entry_point, budget = None):
+        Pipe.set_stages(self, self.stages, self.ctl)
+        Pipe.IF.reg_pc = entry_point
+        self.budget = Log.max_cycles if budget is None else budget
+        self.result = None                  # how the program ended, once it has
+
+    # Runs n_cycles cycles, or fewer if the program ends or the budget runs out
+    def step(self, n_cycles = 1):
+        return self.run_until(cycle = self.stat.cycle + n_cycles)
+
+    # Runs until the program ends, the instruction at pc retires, the cycle
+    # count reaches cycle, the retired instruction count reaches icount,
+    # predicate(cpu) returns true at the end of a cycle, or the budget runs
+    # out, whichever comes first. Conditions already met return at once.
+    def run_until(self, pc = None, cycle = None, icount = None, predicate = None):
+        if self.result is not None:
+            return self.result
+        stat = self.stat
+        for status, met in [ (RUN_CYCLE, cycle is not None and stat.cycle >= cycle),
+                             (RUN_ICOUNT, icount is not None and stat.icount >= icount),
+                             (RUN_TIMEOUT, 0 < self.budget <= stat.cycle) ]:
+            if met:
+                return RunResult(self, status)
+
+        Pipe.set_stages(self, self.stages, self.ctl)
+        result = RunResult(self, Pipe.until(pc, cycle, icount, predicate, self.budget))
+        if result.status == RUN_EXIT:
+            self.kernel.flush()             # program output
+            self.result = result
+        return result
+
+    # Runs the rest of the program once for each of deltas, each in a child
+    # process forked from this one. The children start from the current
+    # (warm) state of the core and share its memory copy-on-write. Each
+    # applies its delta (see apply()), runs run_until(**until), and sends
+    # back the RunResult with the delta and the Stat counters added. Up to
+    # workers children run at the same time (default: one per CPU).
+    # Returns the results in the order of deltas.
+    def fork(self, deltas, workers = None, **until):
+        import os, pickle, select
+        if self.machine.cores > 1:
+            raise ValueError("fork() supports a single core")
+        self.kernel.flush()                 # so that the children do not repeat it
+        sys.stdout.flush()
+
+        workers = workers or os.cpu_count() or 1
+        pending = list(enumerate(deltas))
+        results = [ None ] * len(pending)
+        running = { }                       # read end of the pipe -> (pid, index, data)
+        while pending or running:
+            while pending and len(running) < workers:
+                index, delta = pending.pop(0)
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        self.commits = None         # the file belongs to the parent
+                        os.close(r)
+                        for fd in running:
+                            os.close(fd)
+                        try:
+                            self.apply(delta)
+                            result = self.run_until(**until)
+                        except Exception as e:
+                            result = RunResult(self, RUN_ERROR)
+                            result.message = "%s: %s" % (e.__class__.__name__, e)
+                        result.delta, result.stats = delta, Stat.counters()
+                        with open(w, 'wb') as f:
+                            f.write(pickle.dumps(result))
+                        sys.stdout.flush()
+                    finally:
+                        os._exit(0)
+                os.close(w)
+                running[r] = (pid, index, b'')
+
+            for r in select.select(list(running), [ ], [ ])[0]:
+                pid, index, data = running[r]
+                chunk = os.read(r, 65536)
+                if chunk:
+                    running[r] = (pid, index, data + chunk)
+                    continue
+                os.close(r)
+                os.waitpid(pid, 0)
+                del running[r]
+                if data:
+                    results[index] = pickle.loads(data)
+                else:
+                    results[index] = RunResult(self, RUN_ERROR)
+                    results[index].message = "the child exited without a result"
+                    results[index].delta = deltas[index]
+        return results
+
+    # Applies a delta to the machine description in the middle of a run.
+    # It may change btb (a resized BTB keeps the entries that fit),
+    # predictor, muldiv latencies, and icache and dcache (a cache keeps its
+    # contents if only lat changes, and starts cold otherwise). The counters
+    # carry on from the current values. Raises ValueError otherwise.
+    def apply(self, delta):
+        base = dict(self.machine.desc, icache = self.machine.icache, dcache = self.machine.dcache)
+        m = Machine(Machine.merge(base, delta, 'machine'))
+        for key in [ 'memory', 'rvc', 'cores', 'issue', 'resolve', 'split' ]:
+            if m.desc[key] != self.machine.desc[key]:
+                raise ValueError("%s cannot change in the middle of a run" % key)
+
+        if m.predictor != self.machine.predictor or m.btb_k != self.machine.btb_k:
+            if m.predictor == PRED_NONE:
+                self.btb = NoPredictor()
+            elif isinstance(self.btb, BTB):
+                self.btb = self.btb.resize(m.btb_k)
+            else:
+                self.btb = BTB(m.btb_k, 1 if m.rvc else 2, self.prefix + "BTB")
+        self.muldiv.mul_lat, self.muldiv.div_lat = m.mul_lat, m.div_lat
+        for key, name in [ ('icache', "I-cache"), ('dcache', "D-cache") ]:
+            params, cache = getattr(m, key), getattr(self, key)
+            if params is None:
+                cache = None
+            elif cache is not None and all(getattr(cache, p) == v for p, v in params.items() if p != 'lat'):
+                cache.lat = params['lat']
+            else:
+                new = Cache(self.prefix + name, **params)
+                if cache is not None:
+                    for c in [ 'reads', 'writes', 'read_misses', 'write_misses', 'writebacks', 'stall_cycles' ]:
+                        setattr(new, c, getattr(cache, c))
+                cache = new
+            setattr(self, key, cache)
+        Stat.units = self.units()
+        self.machine = m
+
+
+#--------------------------------------------------------------------------
+#   RunResult: where a call of the run control API stopped
+#--------------------------------------------------------------------------
+
+class RunResult(object):
+
+    def __init__(self, cpu, status):
+        self.status     = status            # RUN_* (see pipe.py)
+        self.cycle      = int(cpu.stat.cycle)
+        self.icount     = int(cpu.stat.icount)
+        wb = cpu.stages[S_WB]
+        pc = getattr(wb, 'pc', 0)           # WB has not run yet before the first cycle
+        self.pc         = int(pc)           # of the (last) instruction in WB
+        self.exception  = int(getattr(wb, 'exception', EXC_NONE)) if status == RUN_EXIT else EXC_NONE
+        self.message    = Pipe.exit_msg(self.exception, pc) if status == RUN_EXIT else None
+        self.exit_code  = cpu.kernel.exit_code     # passed to exit(), if it was called
+        self.delta      = None              # for the results of fork()
+        self.stats      = None              # Stat.counters(), for the results of fork()
+
+    # The program has ended: later calls return the same result
+    @property
+    def done(self):
+        return self.status == RUN_EXIT
+
+    def __repr__(self):
+        return "RunResult(%s, cycle=%d, icount=%d, pc=0x%08x%s)" % (self.status, self.cycle,
+               self.icount, self.pc, "" if self.message is None else ", %s" % self.message)
+
+
+#--------------------------------------------------------------------------
+#   SNURISC5x2: 2-wide in-order variant
+#--------------------------------------------------------------------------
+
+# Same components as SNURISC5, plus a second ALU, with the stages of
+# superscalar.py. The register file has four read and two write ports.
+class SNURISC5x2(SNURISC5):
+
+    STAGES  = [ DualIF, DualID, DualEX, DualMM, DualWB ]
+    CONTROL = DualControl
+
+    def __init__(self, machine = None, hartid = 0, boot = None):
+        super().__init__(machine, hartid, boot)
+        self.alu2 = ALU()
+        self.issue = IssueCounter(self.prefix + "Issue", WIDTH, self.stat)
+        Stat.units.insert(Stat.units.index(self.fetch), self.issue)
+
+
+#--------------------------------------------------------------------------
+#   SNURISC5Deep: deeper variant with split stages
+#--------------------------------------------------------------------------
+
+# Same as SNURISC5, with the second halves of the stages split by the
+# machine description (IF2, EX2, MM2 of deep.py) inserted after them.
+# Branches then resolve in EX2 unless ID resolves them.
+class SNURISC5Deep(SNURISC5):
+
+    CONTROL = DeepControl
+
+    HALVES  = { S_IF : (SPLIT_IF, S_IF2, IF2), S_EX : (SPLIT_EX, S_EX2, EX2), S_MM : (SPLIT_MM, S_MM2, MM2) }
+
+    def __init__(self, machine = None, hartid = 0, boot = None):
+        super().__init__(machine, hartid, boot)
+        halves = { }
+        pipeline, ids = [ ], [ ]
+        for s, stage in enumerate(self.stages):
+            pipeline.append(stage)
+            ids.append(s)
+            split, s2, half = self.HALVES.get(s, (None, None, None))
+            if split in self.machine.split:
+                halves[s] = half()
+                pipeline.append(halves[s])
+                ids.append(s2)
+        self.pipeline = pipeline
+        self.halves = tuple(halves.get(s) for s in [ S_IF, S_EX, S_MM ])
+        self.schedule = Pipe.schedule(pipeline)
+        if S_EX in halves and not self.early_branch:
+            self.resolver = halves[S_EX]
+        self.ctl.setup(pipeline, ids)
+        Pipe.set_stages(self, self.stages, self.ctl)
+
+
+# Returns the machine class for the issue width and depth of machine
+def machine_class(machine):
+    return SNURISC5x2   if machine.issue == WIDTH   else \
+           SNURISC5Deep if machine.split            else \
+           SNURISC5
 
 
 #--------------------------------------------------------------------------
@@ -67,8 +380,10 @@ class SNURISC5(object):
 
 def show_usage(name):
     print("SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator in Python")
-    print("Usage: %s [-l n] [-c m] filename" % name)
-    print("\tfilename: RISC-V executable file name")
+    print("Usage: %s [-l n] [-c m] [-b k] [-m mode] [-f n] [--config file] [--cores n] [--issue n] [--resolve s] [--split l] [--icache p] [--dcache p] [--cosim n] [--gdb port] [--max-cycles n] [--commit-log file] [--energy file] filename" % name)
+    print("       %s serve [--socket path] [--workers n]" % name)
+    print("       %s analyze [--config file] [--resolve s] [--split l] [-o output] filename" % name)
+    print("\tfilename: RISC-V executable file name or assembly source (.s)")
     print("\t-l sets the desired log level n (default: 4)")
     print("\t   0: shows no output message")
     print("\t   1: dumps registers at the end of the execution")
@@ -79,12 +394,48 @@ def show_usage(name):
     print("\t   6: 5 + dumps registers for each cycle")
     print("\t   7: 6 + dumps data memory for each cycle")
     print("\t-c shows logs after cycle m (default: 0, only effective for log level 3 or higher)")
+    print("\t-b sets the BTB size to 2^k entries (default: 4)")
+    print("\t-m selects the execution mode (default: pipe)")
+    print("\t   pipe: cycle-level 5-stage pipeline")
+    print("\t   func: functional execution with basic-block translation (no timing)")
+    print("\t-f fast-forwards n instructions functionally before the pipeline starts")
+    print("\t--config loads the machine description (memory map, BTB, predictor, RV32C, mul/div")
+    print("\t   latencies, caches, cores, issue width, branch resolution, split stages) from a JSON")
+    print("\t   or TOML file; -b, --cores, --issue, --resolve, --split, --icache, and --dcache override it")
+    print("\t--cores runs n pipelines in lockstep sharing dmem (default: 1, pipe mode only)")
+    print("\t   every core starts at the entry point with its hart id in a0")
+    print("\t--issue sets the issue width to 1 or 2 (default: 1, pipe mode only)")
+    print("\t--resolve selects the stage that resolves branches and jumps (default: ex)")
+    print("\t   ex: 2-cycle mispredict penalty; id: 1-cycle penalty, but a branch waits for")
+    print("\t   an operand computed by the previous instruction or loaded by either of the")
+    print("\t   two previous ones (single issue only)")
+    print("\t--split splits each of the comma-separated stages into two sub-stages for a deeper")
+    print("\t   pipeline: if, ex, and/or mm (default: none, single issue only)")
+    print("\t--icache, --dcache add an instruction/data cache (pipe mode only)")
+    print("\t   p is a comma-separated list of key=value (default: size=4k,line=32,ways=1,repl=lru,write=wb,lat=10)")
+    print("\t   repl: lru, fifo, or random; write: wb (write-back, write-allocate) or wt (write-through)")
+    print("\t--cosim checks every n-th retired instruction against the functional model (pipe mode only)")
+    print("\t   execution stops at the first divergence")
+    print("\t--gdb waits for GDB to connect to localhost:port and runs under its control (pipe mode only)")
+    print("\t--max-cycles stops the pipeline after n cycles (default: 0, no limit, pipe mode only)")
+    print("\t   and exits with status %d" % TIMEOUT_STATUS)
+    print("\t--commit-log writes a compressed record of every retired instruction to file (pipe mode only)")
+    print("\t   commitlog.py converts it to the text of spike --log-commits")
+    print("\t--energy counts the activity of each component and reports the energy and EDP of the run")
+    print("\t   and of each function, with the energy per event in a JSON or TOML file (pipe mode with")
+    print("\t   issue width 1 only, see configs/energy.json)")
+    print("\tserve runs a simulation daemon on a Unix socket for client.py (see serve.py)")
+    print("\tanalyze reports the data hazards of a program and their stalls without running it")
+    print("\t   and, with -o, writes a copy with instructions reordered to hide them (see analyze.py)")
 
 
+# Returns (filename, Machine), or None on an error
 def parse_args(args):
-    if (not len(args) in [ 2, 4, 6, 8 ]):
+    if len(args) < 2 or len(args) % 2 != 0:
         return None
 
+    config = None
+    overrides = { }                 # applied on top of the machine description
     index = 1
     while True:
         if args[index].startswith('-'):
@@ -109,11 +460,110 @@ def parse_args(args):
             elif args[index] == '-b':
                 try:
                     k = int(args[index + 1])
-                except ValuelError:
+                except ValueError:
+                    k = -1
+                if k < 0:
                     print("Invalid btb size '%s'" % args[index + 1])
                     return None
                 index += 2
-                Log.btb_k = k
+                overrides['btb'] = { 'entries' : 2 ** k }
+            elif args[index] == '-m':
+                if args[index + 1] not in [ 'pipe', 'func' ]:
+                    print("Invalid execution mode '%s'" % args[index + 1])
+                    return None
+                Log.mode = args[index + 1]
+                index += 2
+            elif args[index] == '-f':
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    print("Invalid instruction count '%s'" % args[index + 1])
+                    return None
+                index += 2
+                Log.ffwd = n
+            elif args[index] == '--cores':
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    n = 0
+                if n < 1:
+                    print("Invalid number of cores '%s'" % args[index + 1])
+                    return None
+                index += 2
+                overrides['cores'] = n
+            elif args[index] == '--issue':
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    n = 0
+                if n not in [ 1, 2 ]:
+                    print("Invalid issue width '%s'" % args[index + 1])
+                    return None
+                index += 2
+                overrides['issue'] = n
+            elif args[index] == '--resolve':
+                if args[index + 1] not in RESOLVE_STAGES:
+                    print("Invalid branch resolution stage '%s'" % args[index + 1])
+                    return None
+                overrides['resolve'] = args[index + 1]
+                index += 2
+            elif args[index] == '--split':
+                split = [ s for s in args[index + 1].split(',') if s ]
+                if any(s not in SPLITS for s in split):
+                    print("Invalid stages to split '%s'" % args[index + 1])
+                    return None
+                overrides['split'] = split
+                index += 2
+            elif args[index] == '--gdb':
+                try:
+                    port = int(args[index + 1])
+                except ValueError:
+                    port = 0
+                if not 0 < port < 65536:
+                    print("Invalid port number '%s'" % args[index + 1])
+                    return None
+                index += 2
+                Log.gdb = port
+            elif args[index] == '--cosim':
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    n = 0
+                if n < 1:
+                    print("Invalid cosim interval '%s'" % args[index + 1])
+                    return None
+                index += 2
+                Log.cosim = n
+            elif args[index] == '--max-cycles':
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    n = 0
+                if n < 1:
+                    print("Invalid cycle limit '%s'" % args[index + 1])
+                    return None
+                index += 2
+                Log.max_cycles = n
+            elif args[index] == '--commit-log':
+                Log.commit_log = args[index + 1]
+                index += 2
+            elif args[index] == '--energy':
+                from energy import load_table
+                try:
+                    Log.energy = load_table(args[index + 1])
+                except IOError:
+                    print("Energy table %s not found" % args[index + 1])
+                    return None
+                except ValueError as e:
+                    print("Invalid energy table: %s" % e)
+                    return None
+                index += 2
+            elif args[index] in [ '--icache', '--dcache' ]:
+                overrides[args[index][2:]] = args[index + 1]
+                index += 2
+            elif args[index] == '--config':
+                config = args[index + 1]
+                index += 2
             else:
                 print("Invalid option '%s'" % args[index])
                 return None
@@ -124,27 +574,99 @@ def parse_args(args):
         print("Invalid argument '%s'" % args[index + 1:])
         return None
 
-    return args[index]      # executable file name
+    try:
+        machine = Machine.load(config, overrides) if config else Machine(overrides)
+    except IOError:
+        print("Machine description %s not found" % config)
+        return None
+    except ValueError as e:
+        print("Invalid machine description: %s" % e)
+        return None
+
+    if machine.cores > 1 and (Log.mode != 'pipe' or Log.ffwd > 0):
+        print("Multiple cores are supported only in pipe mode without fast-forwarding")
+        return None
+
+    if Log.gdb and (Log.mode != 'pipe' or machine.cores > 1 or machine.issue > 1 or machine.split or Log.cosim):
+        print("GDB is supported only in pipe mode with a single-issue 5-stage core and without cosim")
+        return None
+
+    if Log.cosim and (Log.mode != 'pipe' or machine.cores > 1):
+        print("Cosim is supported only in pipe mode with a single core")
+        return None
+
+    if (machine.icache is not None or machine.dcache is not None) and Log.mode != 'pipe':
+        print("Caches are supported only in pipe mode")
+        return None
+
+    if machine.issue > 1 and Log.mode != 'pipe':
+        print("Multiple issue is supported only in pipe mode")
+        return None
+
+    if Log.commit_log is not None and Log.mode != 'pipe':
+        print("The commit log is supported only in pipe mode")
+        return None
+
+    if Log.energy is not None and (Log.mode != 'pipe' or machine.issue > 1):
+        print("The energy model is supported only in pipe mode with issue width 1")
+        return None
+
+    if Log.max_cycles and (Log.mode != 'pipe' or Log.gdb):
+        print("The cycle limit is supported only in pipe mode without GDB")
+        return None
+
+    return args[index], machine     # executable file name
 
 
 #--------------------------------------------------------------------------
 #   Simulator main
 #--------------------------------------------------------------------------
 
+# Runs the program and returns the exit status of the simulator. image is
+# what Program.read() returned for filename, if it has already been read.
+def simulate(filename, machine, image = None):
+
+    cpu = machine_class(machine)(machine)   # make a CPU instance with hw components
+    prog = Program()                        # make a program instance
+    entry_point = prog.load(cpu, filename, image)   # load a program
+    if not entry_point:                     # if no entry point, exit
+        return 0
+    if Log.energy is not None:              # name the functions in the energy report
+        from energy import Activity
+        Activity.names = prog.symbols(filename)
+    if machine.cores > 1:                   # add cores sharing the memories of the first one
+        cores = [ cpu ] + [ machine_class(machine)(machine, k, cpu) for k in range(1, machine.cores) ]
+        Pipe.run_cores(cores, entry_point)
+    else:
+        cpu.run(entry_point)                # run the program starting from entry_point
+    cpu.kernel.flush()
+    if cpu.commits is not None:
+        cpu.commits.close()
+    Stat.show()                             # show stats
+    if Stat.stopped:                        # at the cycle limit
+        return TIMEOUT_STATUS
+    return (cpu.kernel.exit_code or 0) & 0xff       # the status passed to exit()
+
+
 def main():
 
-    filename = parse_args(sys.argv)         # parse arguments
-    if not filename:                        # if parse error, exit
+    if sys.argv[1:2] == [ 'serve' ]:        # simulation daemon
+        from serve import serve_main
+        serve_main(sys.argv)
+        return
+    if sys.argv[1:2] == [ 'analyze' ]:      # static hazard analyzer
+        from analyze import analyze_main
+        analyze_main(sys.argv)
+        return
+
+    args = parse_args(sys.argv)             # parse arguments
+    if not args:                            # if parse error, exit
         show_usage(sys.argv[0])
         sys.exit()
 
-    cpu = SNURISC5()                        # make a CPU instance with hw components
-    prog = Program()                        # make a program instance
-    entry_point = prog.load(cpu, filename)  # load a program
-    if not entry_point:                     # if no entry point, exit
-        sys.exit()
-    cpu.run(entry_point)                    # run the program starting from entry_point
-    Stat.show()                             # show stats
+    status = simulate(*args)
+    if status:                              # exit with the status passed to exit()
+        sys.exit(status)
 
 
 if __name__ == '__main__':
@@ -22,6 +22,30 @@ from consts import *
 from isa import *
 from program import *
 from pipe import *
+from rvc import expand
+
+
+#--------------------------------------------------------------------------
+#   NoPredictor: predicts every branch not taken (the 'none' predictor)
+#--------------------------------------------------------------------------
+
+class NoPredictor(object):
+
+    def __init__(self):
+        self.lookups    = 0             # counted by IF, as for the BTB
+        self.hits       = 0
+
+    def summary(self):
+        return None
+
+    def lookup(self, pc):
+        return None
+
+    def add(self, pc, target):
+        return
+
+    def remove(self, pc):
+        return
 
 
 #--------------------------------------------------------------------------
@@ -29,23 +53,34 @@ from pipe import *
 #--------------------------------------------------------------------------
 
 class BTB(object):
-    def __init__(self, k):
+    # The BTB is indexed by pc >> shift: 2 for 32-bit instructions, and 1
+    # when RV32C allows instructions at every halfword
+    def __init__(self, k, shift = 2, name = "BTB"):
         self.k = k
         self.btb        = [0 for i in range(2 ** self.k)]
+        self.name       = name
+
+        # Counters: lookups and hits are counted by IF
+        self.lookups    = 0
+        self.hits       = 0
+        self.adds       = 0
+        self.replaced   = 0             # adds that evicted the entry of another pc
+        self.removes    = 0
         
         # for block
-        self.V_MASK     = (0b1 << (62 - k))
-        self.T_MASK     = (0b1 << (62 - k)) - (0b1 << 32)
+        self.V_MASK     = (0b1 << (64 - k - shift))
+        self.T_MASK     = (0b1 << (64 - k - shift)) - (0b1 << 32)
         self.A_MASK     = (0b1 << 32) - 0b1
         
-        self.V_SHIFT    = 62 - k
+        self.V_SHIFT    = 64 - k - shift
         self.T_SHIFT    = 32
 
         # for pc
-        self.INDEX_MASK = (0b1 << (k + 2)) - (0b1 << 2)
-        self.TAG_MASK   = (0b1 << 32) - (0b1 << (k + 2))
+        self.SHIFT      = shift
+        self.INDEX_MASK = (0b1 << (k + shift)) - (0b1 << shift)
+        self.TAG_MASK   = (0b1 << 32) - (0b1 << (k + shift))
 
-        self.TAG_SHIFT  = k + 2
+        self.TAG_SHIFT  = k + shift
     
     def get_block_V(self, block):
         return (block & self.V_MASK) >> self.V_SHIFT
@@ -57,7 +92,7 @@ class BTB(object):
         return (block & self.A_MASK)
     
     def get_pc_index(self, pc):
-        return (pc & self.INDEX_MASK) >> 2
+        return (pc & self.INDEX_MASK) >> self.SHIFT
     
     def get_pc_tag(self, pc):
         return (pc & self.TAG_MASK) >> self.TAG_SHIFT
@@ -68,6 +103,7 @@ class BTB(object):
     # Lookup the entry corresponding to the pc
     # It will return the target address if there is a matching entry
     def lookup(self, pc):
+        pc          = int(pc)
         pc_index    = self.get_pc_index(pc)
         pc_tag      = self.get_pc_tag(pc)
 
@@ -83,23 +119,51 @@ class BTB(object):
     
     # Add an entry 
     def add(self, pc, target):
+        pc          = int(pc)
+        target      = int(target)
         pc_index    = self.get_pc_index(pc)
         pc_tag      = self.get_pc_tag(pc)
 
         block       = self.make_block(0b1, pc_tag, target)
 
+        old         = self.btb[pc_index]
+        if self.get_block_V(old) == 1 and self.get_block_T(old) != pc_tag:
+            self.replaced += 1
+        self.adds   += 1
         self.btb[pc_index] = block
 
         return
     
     # Remove an entry
     def remove(self, pc):
+        pc          = int(pc)
         pc_index    = self.get_pc_index(pc)
 
+        self.removes += 1
         self.btb[pc_index] = 0
 
         return
 
+    # Returns a BTB with 2^k entries that holds the entries of this one (the
+    # last of those that share an index when it is smaller) and its counters
+    def resize(self, k):
+        new = BTB(k, self.SHIFT, self.name)
+        for index, block in enumerate(self.btb):
+            if self.get_block_V(block) == 1:
+                pc = (self.get_block_T(block) << self.TAG_SHIFT) | (index << self.SHIFT)
+                new.btb[new.get_pc_index(pc)] = new.make_block(0b1, new.get_pc_tag(pc), self.get_block_A(block))
+        new.lookups, new.hits, new.adds, new.replaced = self.lookups, self.hits, self.adds, self.replaced
+        new.removes = self.removes
+        return new
+
+    def summary(self):
+        if self.lookups == 0:
+            return None
+        used = sum(self.get_block_V(b) for b in self.btb)
+        return "%s: %d entries (%d in use), %d hits in %d lookups (%.2f%%), %d adds (%d replaced another pc)" % \
+               (self.name, len(self.btb), used, self.hits, self.lookups,
+                self.hits * 100.0 / self.lookups, self.adds, self.replaced)
+
 #--------------------------------------------------------------------------
 #   Control signal table
 #--------------------------------------------------------------------------
@@ -157,97 +221,355 @@ csignals = {
     # Add entries for PUSH and POP instructions
     PUSH   : [ Y, BR_N  , OP1_RS1, OP2_IMI, OEN_1, OEN_1, ALU_SUB  , WB_X  , REN_1, MEN_1, M_XWR, MT_W, ],
     POP    : [ Y, BR_N  , OP1_RS1, OP2_IMI, OEN_1, OEN_0, ALU_ADD  , WB_MEM, REN_1, MEN_1, M_XRD, MT_W, ],
+
+    # RV32M: executed by the multi-cycle multiplier/divider in EX
+    MUL    : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_MUL  , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+    MULH   : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_MULH , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+    MULHSU : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_MULHSU, WB_ALU, REN_1, MEN_0, M_X , MT_X, ],
+    MULHU  : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_MULHU, WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+    DIV    : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_DIV  , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+
+    DIVU   : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_DIVU , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+    REM    : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_REM  , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+    REMU   : [ Y, BR_N  , OP1_RS1, OP2_RS2, OEN_1, OEN_1, ALU_REMU , WB_ALU, REN_1, MEN_0, M_X  , MT_X, ],
+}
+
+# Stack instructions: their rs1 is implicitly sp (P_N for all other opcodes)
+ptypes = {
+    PUSH   : P_PUSH,
+    POP    : P_POP,
 }
 
 
 #--------------------------------------------------------------------------
-#   IF: Instruction fetch stage
+#   Control tables: csignals and the hazard rules specialized for lookup
 #--------------------------------------------------------------------------
 
-class IF(Pipe):
+# Next PC selection for the branch type in EX, indexed by bool(EX alu_out)
+PC_SEL = {
+    BR_N   : ( PC_4,     PC_4     ),
+    BR_NE  : ( PC_BRJMP, PC_4     ),
+    BR_EQ  : ( PC_4,     PC_BRJMP ),
+    BR_GE  : ( PC_BRJMP, PC_4     ),
+    BR_GEU : ( PC_BRJMP, PC_4     ),
+    BR_LT  : ( PC_4,     PC_BRJMP ),
+    BR_LTU : ( PC_4,     PC_BRJMP ),
+    BR_J   : ( PC_BRJMP, PC_BRJMP ),
+    BR_JR  : ( PC_JALR,  PC_JALR  ),
+}
+
+# (pc_sel, EX taken) pairs for which the BTB prediction was right
+RIGHT_PREDICT = { (PC_BRJMP, TAKEN_1), (PC_4, TAKEN_0), (PC_4, TAKEN_N) }
+
+# Conditional branches compare R[rs1] with R[rs2] instead of the immediate
+BR_COND = { BR_NE, BR_EQ, BR_GE, BR_GEU, BR_LT, BR_LTU }
+
+# Forwarded value for a register written by the instruction in EX/MM/WB
+FWD_REG = {
+    S_EX   : lambda: Pipe.EX.alu_out,
+    S_MM   : lambda: Pipe.MM.wbdata,
+    S_WB   : lambda: Pipe.WB.wbdata,
+}
+
+# Forwarded value for sp updated by push/pop in EX/MM/WB
+FWD_SP = {
+    (S_EX, P_PUSH) : lambda: Pipe.EX.alu_out,
+    (S_EX, P_POP)  : lambda: Pipe.EX.alu_out,
+    (S_MM, P_PUSH) : lambda: Pipe.MM.alu_out,
+    (S_MM, P_POP)  : lambda: Pipe.MM.sp_data_plus4,
+    (S_WB, P_PUSH) : lambda: Pipe.WB.wbdata,
+    (S_WB, P_POP)  : lambda: Pipe.WB.sp_data_plus4,
+}
+
+# Values computed in EX. With early branch resolution, they come too late
+# for the comparator in ID.
+FWD_FROM_EX = { FWD_REG[S_EX], FWD_SP[(S_EX, P_PUSH)], FWD_SP[(S_EX, P_POP)] }
+
+IMM_SEL = {
+    OP2_IMI : RISCV.imm_i,
+    OP2_IMS : RISCV.imm_s,
+    OP2_IMB : RISCV.imm_b,
+    OP2_IMU : RISCV.imm_u,
+    OP2_IMJ : RISCV.imm_j,
+}
+
 
-    # Pipeline registers ------------------------------
+# Everything Control and ID need to know about an instruction word
+class Signals(object):
 
-    reg_pc          = WORD(0)       # IF.reg_pc
+    def __init__(self, inst):
+        opcode = RISCV.opcode(inst)
+        self.exception  = EXC_EBREAK        if opcode == EBREAK             else \
+                          EXC_ILLEGAL_INST  if opcode == ILLEGAL            else \
+                          EXC_NONE
+        self.valid      = opcode != ILLEGAL     # illegal instructions become BUBBLE
+        self.p_type     = ptypes.get(opcode, P_N)
+
+        cs = csignals[opcode if self.valid else RISCV.opcode(BUBBLE)]
+        self.br_type    = cs[CS_BR_TYPE]
+        self.op1_sel    = cs[CS_OP1_SEL]
+        self.op2_sel    = cs[CS_OP2_SEL]
+        self.alu_fun    = cs[CS_ALU_FUN]
+        self.wb_sel     = cs[CS_WB_SEL]
+        self.rf_wen     = cs[CS_RF_WEN]
+        self.rs1_oen    = cs[CS_RS1_OEN]
+        self.rs2_oen    = cs[CS_RS2_OEN]
+        self.dmem_en    = cs[CS_MEM_EN]
+        self.dmem_rw    = cs[CS_MEM_FCN]
+
+        self.rs1        = SP if self.p_type in [P_PUSH, P_POP] else RISCV.rs1(inst)
+        self.rs2        = RISCV.rs2(inst)
+        self.rd         = RISCV.rd(inst)
+
+        # ALU operand 2 when it is not R[rs2]
+        self.op2_rs2    = self.op2_sel == OP2_RS2
+        self.imm        = None                          if self.op2_rs2                 else \
+                          RISCV.sign_extend(4, 12)      if self.p_type != P_N           else \
+                          IMM_SEL[self.op2_sel](inst)   if self.op2_sel in IMM_SEL      else \
+                          WORD(0)
+
+
+#--------------------------------------------------------------------------
+#   Latches: contents of the pipeline registers
+#--------------------------------------------------------------------------
 
-    #--------------------------------------------------
+# IF/ID register. It is double-buffered: IF fills in Pipe.ID.nxt while ID
+# reads Pipe.ID.reg, and the two are swapped unless ID is stalled.
+class FetchLatch(object):
+
+    __slots__ = ( 'pc', 'inst', 'exception', 'pcplus4', 'taken', 'cause' )
+
+    def bubble(self, pc, cause = CPI_FILL):
+        self.pc             = pc
+        self.inst           = WORD(BUBBLE)
+        self.exception      = WORD(EXC_NONE)
+        self.pcplus4        = WORD(0)
+        self.taken          = TAKEN_N           # for BTB
+        self.cause          = cause             # for the CPI stack
+
+
+# ID/EX, EX/MM, and MM/WB registers. ID fills in one latch per instruction
+# and the same object then moves down the pipeline, so committing a cycle
+# passes references instead of copying fields. EX adds alu_out (and
+# sp_data_plus4) and MM adds wbdata on the way.
+class InstLatch(object):
+
+    __slots__ = ( 'pc', 'inst', 'exception', 'rd',
+                  'c_rf_wen', 'c_wb_sel', 'c_dmem_en', 'c_dmem_rw', 'c_br_type', 'c_alu_fun',
+                  'op1_data', 'op2_data', 'rs2_data', 'pcplus4',
+                  'p_type', 'sp_data', 'taken',         # for PUSH, POP and BTB
+                  'alu_out', 'sp_data_plus4',           # from EX
+                  'wbdata' )                            # from MM
+
+    @staticmethod
+    def bubble(pc, exception):
+        b = InstLatch()
+        b.pc                = pc
+        b.inst              = WORD(BUBBLE)
+        b.exception         = exception
+        b.rd                = WORD(0)
+        b.c_rf_wen          = False
+        b.c_wb_sel          = WORD(WB_X)
+        b.c_dmem_en         = False
+        b.c_dmem_rw         = WORD(M_X)
+        b.c_br_type         = WORD(BR_N)
+        b.c_alu_fun         = WORD(ALU_X)
+        b.op1_data          = WORD(0)
+        b.op2_data          = WORD(0)
+        b.rs2_data          = WORD(0)
+        b.pcplus4           = WORD(0)
+        b.p_type            = P_N
+        b.sp_data           = WORD(0)
+        b.taken             = TAKEN_N
+        b.alu_out           = WORD(0)
+        b.sp_data_plus4     = WORD(0)
+        b.wbdata            = WORD(0)
+        return b
+
+
+#--------------------------------------------------------------------------
+#   IF: Instruction fetch stage
+#--------------------------------------------------------------------------
 
+class IF(Pipe):
 
     def __init__(self):
         super().__init__()
 
+        # Pipeline registers ------------------------------
+
+        self.reg_pc         = WORD(0)       # Pipe.IF.reg_pc
+
+        #--------------------------------------------------
+
+        # I-cache miss in progress: address being read and cycles left
+        self.wait_pc        = None
+        self.wait           = 0
+
+        # RV32C alignment buffer: the upper parcel of the last word read and
+        # its address (None if empty)
+        self.buf_pc         = None
+        self.buf            = 0
+
         # Internal signals:----------------------------
         #
-        #   self.pc                 # Pipe.IF.pc
-        #   self.inst               # Pipe.IF.inst
-        #   self.exception          # Pipe.IF.exception
+        #   self.out                # Pipe.IF.out (IF/ID latch being filled)
         #   self.pc_next            # Pipe.IF.pc_next
-        #   self.pcplus4            # Pipe.IF.pcplus4
+        #   self.miss               # Pipe.IF.miss (waiting for the I-cache)
+        #   self.split              # Pipe.IF.split (reading the first half of a split instruction)
+        #   self.addr               # Pipe.IF.addr (imem word read, None if none)
+        #   self.size               # Pipe.IF.size (instruction size in bytes)
+        #   self.buf_next           # Pipe.IF.buf_next (alignment buffer after this fetch)
         #
         #----------------------------------------------
 
     def compute(self):
 
+        # Results go directly into the back buffer of the IF/ID register
+        # (IF/IF2 if IF is split)
+        o = self.out = self.succ.nxt
+
         # Readout pipeline register values 
-        self.pc     = IF.reg_pc
+        o.pc = self.reg_pc
 
-        # Fetch an instruction from instruction memory (imem)
-        self.inst, status = Pipe.cpu.imem.access(Pipe.CTL.imem_en, self.pc, 0, Pipe.CTL.imem_rw)
+        # Fetch an instruction from instruction memory (imem) over the bus.
+        # With RV32C, it is put together from 16-bit parcels.
+        self.split = False
+        if Pipe.cpu.rvc:
+            o.inst, status, self.size = self.fetch_rvc(int(o.pc))
+        else:
+            o.inst, status = Pipe.cpu.bus.fetch(Pipe.CTL.imem_en, o.pc)
+            self.addr, self.size = o.pc, 4
 
         # Handle exception during imem access
         if not status:
-            self.exception = EXC_IMEM_ERROR
-            self.inst = BUBBLE
+            o.exception = EXC_IMEM_ERROR
+            o.inst = BUBBLE
         else:
-            self.exception = EXC_NONE
-
-        # Compute PC + 4 using an adder
-        self.pcplus4 = Pipe.cpu.adder_pcplus4.op(self.pc, 4)
+            o.exception = EXC_NONE
+
+        # Look up the I-cache once per imem read. On a miss, IF keeps the pc
+        # and sends bubbles to ID until the line arrives.
+        self.miss = False
+        if Pipe.cpu.icache is not None and status and self.addr is not None:
+            if self.addr != self.wait_pc:
+                self.wait_pc = self.addr
+                self.wait = Pipe.cpu.icache.access(self.addr, False)
+            if self.wait > 0:
+                self.wait -= 1
+                self.miss = True
+
+        # Compute the pc of the next instruction using an adder (pcplus4 is
+        # pc + 2 for a compressed instruction)
+        o.pcplus4 = Pipe.cpu.adder_pcplus4.op(o.pc, self.size)
 
         # for BTB
-        target = Pipe.cpu.btb.lookup(self.pc)
-        self.taken = TAKEN_0    if target == None   else \
-                     TAKEN_1
-
-        # Select next PC
-        self.pc_next =  target                  if (Pipe.EX.inst == BUBBLE) and (self.taken == TAKEN_1) else \
-                        self.pcplus4            if (Pipe.EX.inst == BUBBLE) and (self.taken == TAKEN_0) else \
-                        Pipe.EX.jump_reg_target if Pipe.CTL.pc_sel == PC_JALR                           else \
-                        target                  if (Pipe.CTL.right_predict) and (self.taken == TAKEN_1) else \
-                        self.pcplus4            if (Pipe.CTL.right_predict) and (self.taken == TAKEN_0) else \
-                        Pipe.EX.pcplus4         if (not Pipe.CTL.right_predict) and (EX.taken == TAKEN_1) else \
-                        Pipe.EX.brjmp_target    if (not Pipe.CTL.right_predict) and (EX.taken == TAKEN_0) else \
-                        self.pcplus4
-
+        target = Pipe.cpu.btb.lookup(o.pc)
+        o.taken = TAKEN_0       if target == None   else \
+                  TAKEN_1
+
+        # Select next PC: the predicted one unless a mispredicted branch
+        # redirects IF
+        self.pc_next =  Pipe.CTL.redirect       if Pipe.CTL.redirect is not None                        else \
+                        target                  if o.taken == TAKEN_1                                   else \
+                        o.pcplus4
+
+
+    # Returns (inst, status, size) of the instruction at pc, with a compressed
+    # instruction expanded. The upper parcel of each word read is kept in
+    # the alignment buffer, so a 32-bit instruction that straddles two words
+    # needs one read when reached sequentially. When reached by a jump, the
+    # first half is read into the buffer in an extra cycle (self.split).
+    def fetch_rvc(self, pc):
+        bus = Pipe.cpu.bus
+        self.addr = None
+        self.buf_next = ( self.buf_pc, self.buf )
+        if pc & 1:
+            return WORD(BUBBLE), False, 2
+        if pc & 2 and self.buf_pc == pc:
+            lo = self.buf
+        else:
+            self.addr = pc & ~3
+            w, status = bus.fetch(Pipe.CTL.imem_en, WORD(self.addr))
+            if not status:
+                return WORD(BUBBLE), False, 4
+            w = int(w)
+            if pc & 2:
+                lo = w >> 16
+            elif w & 3 == 3:
+                return WORD(w), True, 4
+            else:
+                self.buf_next = ( pc + 2, w >> 16 )
+                return expand(w & 0xffff), True, 2
+        if lo & 3 != 3:
+            return expand(lo), True, 2
+        if self.addr is not None:
+            self.buf_next = ( pc, lo )
+            self.split = True
+            return WORD(BUBBLE), True, 4
+        self.addr = pc + 2
+        w, status = bus.fetch(Pipe.CTL.imem_en, WORD(self.addr))
+        if not status:
+            return WORD(BUBBLE), False, 4
+        w = int(w)
+        self.buf_next = ( pc + 4, w >> 16 )
+        return WORD(lo | (w & 0xffff) << 16), True, 4
 
     def update(self):
 
-        if not Pipe.CTL.IF_stall:
-            IF.reg_pc           = self.pc_next
+        o = self.out
+        hold = self.miss or self.split
+
+        # A mispredicted branch redirects IF even during an I-cache miss
+        if not Pipe.CTL.IF_stall and (not hold or Pipe.CTL.ID_bubble):
+            self.reg_pc         = self.pc_next
+            self.wait_pc        = None
+
+        # Count the fetch once it is done (not while IF waits)
+        if not Pipe.CTL.IF_stall and not self.miss:
+            f = Pipe.cpu.fetch
+            if self.addr is not None:
+                f.reads += 1
+            if self.split:
+                f.split_stalls += 1
+            else:
+                f.insts += 1
+                if self.size == 2:
+                    f.compressed += 1
+                btb = Pipe.cpu.btb
+                btb.lookups += 1
+                if o.taken == TAKEN_1:
+                    btb.hits += 1
+            if Pipe.cpu.rvc:
+                self.buf_pc, self.buf = self.buf_next
 
         if (Pipe.CTL.ID_bubble and Pipe.CTL.ID_stall):
             sys.exit(1)
         
+        succ = self.succ
         if Pipe.CTL.ID_bubble:
-            ID.reg_pc           = self.pc
-            ID.reg_inst         = WORD(BUBBLE)
-            ID.reg_exception    = WORD(EXC_NONE)
-            ID.reg_pcplus4      = WORD(0)
+            # ID has consumed its front buffer already
+            succ.reg.bubble(o.pc, CPI_MISPREDICT)
+        elif hold and not Pipe.CTL.ID_stall:
+            succ.reg.bubble(o.pc, CPI_SPLIT if self.split else CPI_ICACHE)
         elif not Pipe.CTL.ID_stall:
-            ID.reg_pc           = self.pc
-            ID.reg_inst         = self.inst
-            ID.reg_exception    = self.exception
-            ID.reg_pcplus4      = self.pcplus4
-
-            # for BTB
-            ID.reg_taken        = self.taken
+            succ.reg, succ.nxt = o, succ.reg
         else:               # Pipe.CTL.ID_stall
             pass            # Do not update
 
-        Pipe.log(S_IF, self.pc, self.inst, self.log())
+        Pipe.log(S_IF, o.pc, o.inst, self.log())
+
+    def flush(self, pc):
+        self.reg_pc         = WORD(pc)
+        self.wait_pc        = None
+        self.buf_pc         = None
 
     def log(self):
-        return ("# inst=0x%08x, pc_next=0x%08x" % (self.inst, self.pc_next))
+        if self.miss:
+            return ("# I-cache miss, %d cycles left" % self.wait)
+        if self.split:
+            return ("# split instruction, first half 0x%04x" % self.buf_next[1])
+        return ("# inst=0x%08x, pc_next=0x%08x" % (self.out.inst, self.pc_next))
 
 
 #--------------------------------------------------------------------------
@@ -256,36 +578,32 @@ class IF(Pipe):
 
 class ID(Pipe):
 
+    def __init__(self):
+        super().__init__()
 
-    # Pipeline registers ------------------------------
-
-    reg_pc          = WORD(0)           # ID.reg_pc
-    reg_inst        = WORD(BUBBLE)      # ID.reg_inst
-    reg_exception   = WORD(EXC_NONE)    # ID.reg_exception
-    reg_pcplus4     = WORD(0)           # ID.reg_pcplus4
-
-    # for BTB
-    reg_taken       = TAKEN_N
-
-    #--------------------------------------------------
+        # Pipeline registers ------------------------------
 
+        self.reg            = FetchLatch()  # Pipe.ID.reg
+        self.nxt            = FetchLatch()  # Pipe.ID.nxt (back buffer)
+        self.reg.bubble(WORD(0))
+        self.nxt.bubble(WORD(0))
 
-    def __init__(self):
-        super().__init__()
+        #--------------------------------------------------
 
         # Internal signals:----------------------------
         #
         #   self.pc                 # Pipe.ID.pc
         #   self.inst               # Pipe.ID.inst
         #   self.exception          # Pipe.ID.exception
-        #   self.pcplus4            # Pipe.ID.pcplus4
         #
         #   self.rs1                # Pipe.ID.rs1
         #   self.rs2                # Pipe.ID.rs2
         #   self.rd                 # Pipe.ID.rd
-        #   self.op1_data           # Pipe.ID.op1_data
-        #   self.op2_data           # Pipe.ID.op2_data
-        #   self.rs2_data           # Pipe.ID.rs2_data
+        #   self.out                # Pipe.ID.out (ID/EX latch being filled)
+        #   self.cause              # Pipe.ID.cause (why a bubble is in ID, for the CPI stack)
+        #
+        #   With early branch resolution:
+        #   self.brjmp_target       # Pipe.ID.brjmp_target
         #
         #----------------------------------------------
 
@@ -293,30 +611,21 @@ class ID(Pipe):
     def compute(self):
 
         # Readout pipeline register values
-        self.pc         = ID.reg_pc
-        self.inst       = ID.reg_inst
-        self.exception  = ID.reg_exception
-        self.pcplus4    = ID.reg_pcplus4
-
-        self.rs1        = RISCV.rs1(self.inst)          # for CTL (forwarding check)
-        self.rs2        = RISCV.rs2(self.inst)          # for CTL (forwarding check)
-        self.rd         = RISCV.rd(self.inst)
-
-        # for BTB
-        self.taken      = ID.reg_taken
-
-        imm_i           = RISCV.imm_i(self.inst)
-        imm_s           = RISCV.imm_s(self.inst)
-        imm_b           = RISCV.imm_b(self.inst)
-        imm_u           = RISCV.imm_u(self.inst)
-        imm_j           = RISCV.imm_j(self.inst)
-        imm_p           = RISCV.sign_extend(4, 12)      # for PUSH, POP
+        r               = self.reg
+        self.pc         = r.pc
+        self.inst       = r.inst
+        self.exception  = r.exception
+        self.cause      = r.cause
+
+        # Register numbers and immediates come from the decoded signal table
+        # (rs1 is sp for PUSH, POP)
+        sig             = Pipe.CTL.decode(self.inst)
+        self.rs1        = sig.rs1                       # for CTL (forwarding check)
+        self.rs2        = sig.rs2                       # for CTL (forwarding check)
+        self.rd         = sig.rd
 
         Pipe.CTL.preGen(self.inst)
 
-        if Pipe.CTL.p_type in [P_PUSH, P_POP] :
-            self.rs1 = SP
-        
         rf_rs1_data, rf_rs2_data = Pipe.cpu.rf.read(self.rs1, self.rs2)
 
         # Generate control signals
@@ -325,106 +634,139 @@ class ID(Pipe):
         if not Pipe.CTL.gen(self.inst):
             self.inst = BUBBLE
 
-        # Determine ALU operand 2: R[rs2] or immediate values
-        alu_op2 =       rf_rs2_data     if Pipe.CTL.op2_sel == OP2_RS2          else \
-                        imm_p           if Pipe.CTL.p_type in [P_PUSH, P_POP]   else \
-                        imm_i           if Pipe.CTL.op2_sel == OP2_IMI          else \
-                        imm_s           if Pipe.CTL.op2_sel == OP2_IMS          else \
-                        imm_b           if Pipe.CTL.op2_sel == OP2_IMB          else \
-                        imm_u           if Pipe.CTL.op2_sel == OP2_IMU          else \
-                        imm_j           if Pipe.CTL.op2_sel == OP2_IMJ          else \
-                        WORD(0)
+        # Operands are written directly into a new ID/EX latch
+        o = self.out = InstLatch()
+
+        # Get forwarded values if necessary. CTL.fwd maps each register
+        # written by an instruction in EX/MM/WB to the value to forward from
+        # the closest stage.
+        fwd = Pipe.CTL.fwd
 
         # Determine ALU operand 1: PC or R[rs1]
-        # Get forwarded value for rs1 if necessary
-        # The order matters: EX -> MM -> WB (forwarding from the closest stage)
-        self.op1_data = self.pc                 if Pipe.CTL.op1_sel == OP1_PC                                   else \
-                        Pipe.EX.alu_out         if Pipe.CTL.fwd_op1 == FWD_EX                                   else \
-                        Pipe.EX.alu_out         if Pipe.CTL.fwd_sp_op1 == FWD_EX                                else \
-                        Pipe.MM.wbdata          if Pipe.CTL.fwd_op1 == FWD_MM                                   else \
-                        Pipe.MM.alu_out         if Pipe.CTL.fwd_sp_op1 == FWD_MM and MM.reg_p_type == P_PUSH    else \
-                        Pipe.MM.sp_data_plus4   if Pipe.CTL.fwd_sp_op1 == FWD_MM and MM.reg_p_type == P_POP     else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_op1 == FWD_WB                                   else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_sp_op1 == FWD_WB and WB.reg_p_type == P_PUSH    else \
-                        Pipe.WB.sp_data_plus4   if Pipe.CTL.fwd_sp_op1 == FWD_WB and WB.reg_p_type == P_POP     else \
+        src = fwd.get(self.rs1) if sig.rs1_oen else None
+        o.op1_data  =   self.pc     if sig.op1_sel == OP1_PC    else \
+                        src()       if src                      else \
                         rf_rs1_data
 
-        # Get forwarded value for rs2 if necessary
-        # The order matters: EX -> MM -> WB (forwarding from the closest stage)
-        self.op2_data = Pipe.EX.alu_out         if Pipe.CTL.fwd_op2 == FWD_EX                                   else \
-                        Pipe.EX.alu_out         if Pipe.CTL.fwd_sp_op2 == FWD_EX                                else \
-                        Pipe.MM.wbdata          if Pipe.CTL.fwd_op2 == FWD_MM                                   else \
-                        Pipe.MM.alu_out         if Pipe.CTL.fwd_sp_op2 == FWD_MM and MM.reg_p_type == P_PUSH    else \
-                        Pipe.MM.sp_data_plus4   if Pipe.CTL.fwd_sp_op2 == FWD_MM and MM.reg_p_type == P_POP     else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_op2 == FWD_WB                                   else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_sp_op2 == FWD_WB and WB.reg_p_type == P_PUSH    else \
-                        Pipe.WB.sp_data_plus4   if Pipe.CTL.fwd_sp_op2 == FWD_WB and WB.reg_p_type == P_POP     else \
-                        alu_op2
-
-        # Get forwarded value for rs2 if necessary
-        # The order matters: EX -> MM -> WB (forwarding from the closest stage)
+        # Determine ALU operand 2: R[rs2] or immediate values
+        src = fwd.get(self.rs2) if sig.op2_rs2 else None
+        o.op2_data  =   src()       if src                      else \
+                        rf_rs2_data if sig.op2_rs2              else \
+                        sig.imm
+
         # For sw and branch instructions, we need to carry R[rs2] as well
         # -- in these instructions, op2_data will hold an immediate value
-        self.rs2_data = Pipe.EX.alu_out         if Pipe.CTL.fwd_rs2 == FWD_EX                                   else \
-                        Pipe.EX.alu_out         if Pipe.CTL.fwd_sp_rs2 == FWD_EX                                else \
-                        Pipe.MM.wbdata          if Pipe.CTL.fwd_rs2 == FWD_MM                                   else \
-                        Pipe.MM.alu_out         if Pipe.CTL.fwd_sp_rs2 == FWD_MM and MM.reg_p_type == P_PUSH    else \
-                        Pipe.MM.sp_data_plus4   if Pipe.CTL.fwd_sp_rs2 == FWD_MM and MM.reg_p_type == P_POP     else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_rs2 == FWD_WB                                   else \
-                        Pipe.WB.wbdata          if Pipe.CTL.fwd_sp_rs2 == FWD_WB and WB.reg_p_type == P_PUSH    else \
-                        Pipe.WB.sp_data_plus4   if Pipe.CTL.fwd_sp_rs2 == FWD_WB and WB.reg_p_type == P_POP     else \
+        src = fwd.get(self.rs2) if sig.rs2_oen else None
+        o.rs2_data  =   src()       if src                      else \
                         rf_rs2_data
         
         # for PUSH, POP
-        self.sp_data = self.op1_data
+        o.sp_data   =   o.op1_data
 
+        o.pcplus4   =   r.pcplus4
 
-    def update(self):
+        # for BTB
+        o.taken     =   r.taken
 
-        EX.reg_pc                   = self.pc
+        # With early branch resolution, branches and jumps are resolved
+        # here as they leave for EX
+        if Pipe.cpu.early_branch and sig.br_type != BR_N and not Pipe.CTL.ID_stall:
+            self.resolve(sig, o)
 
-        if Pipe.CTL.EX_bubble:
-            EX.reg_inst             = WORD(BUBBLE)
-            EX.reg_exception        = WORD(EXC_NONE)
-            EX.reg_c_br_type        = WORD(BR_N)
-            EX.reg_c_rf_wen         = False
-            EX.reg_c_dmem_en        = False
 
-            # for PUSH, POP
-            EX.reg_p_type           = P_N
+    # The comparator and the target adders sit in ID. A mispredict cancels
+    # only the instruction in IF.
+    def resolve(self, sig, o):
+
+        C = Pipe.CTL
+        cmp_data = o.rs2_data if sig.br_type in BR_COND else o.op2_data
+        cmp_out = Pipe.cpu.brcmp.op(sig.alu_fun, o.op1_data, cmp_data)
+        C.pc_sel = PC_SEL[sig.br_type][bool(cmp_out)]
+        C.right_predict = (C.pc_sel, o.taken) in RIGHT_PREDICT
+        self.brjmp_target = Pipe.cpu.adder_brtarget.op(self.pc, o.op2_data)
+        if not C.right_predict:
+            C.redirect = cmp_out & WORD(0xfffffffe)     if C.pc_sel == PC_JALR    else \
+                         o.pcplus4                      if o.taken == TAKEN_1     else \
+                         self.brjmp_target
+            C.ID_bubble = True
 
-            # for BTB
-            EX.reg_taken            = TAKEN_N
+
+    def update(self):
+
+        C = Pipe.CTL
+        if C.EX_stall:
+            Pipe.cpu.cpi.add(CPI_DCACHE if Pipe.MM.stall else CPI_MULDIV)
+        elif C.EX_bubble:
+            Pipe.cpu.cpi.add(CPI_MISPREDICT if C.mispredict     else \
+                             CPI_LOAD_USE   if C.load_use       else \
+                             CPI_ALU_USE    if C.alu_use        else \
+                             CPI_BRANCH     if C.branch_wait    else \
+                             CPI_ECALL)
+            Pipe.EX.reg             = InstLatch.bubble(self.pc, WORD(EXC_NONE))
         else:
-            EX.reg_inst             = self.inst
-            EX.reg_exception        = self.exception
-            EX.reg_rd               = self.rd
-            EX.reg_op1_data         = self.op1_data
-            EX.reg_op2_data         = self.op2_data
-            EX.reg_rs2_data         = self.rs2_data
-            EX.reg_c_br_type        = Pipe.CTL.br_type
-            EX.reg_c_alu_fun        = Pipe.CTL.alu_fun
-            EX.reg_c_wb_sel         = Pipe.CTL.wb_sel
-            EX.reg_c_rf_wen         = Pipe.CTL.rf_wen
-            EX.reg_c_dmem_en        = Pipe.CTL.dmem_en
-            EX.reg_c_dmem_rw        = Pipe.CTL.dmem_rw
-            EX.reg_pcplus4          = self.pcplus4
+            if self.inst == BUBBLE:
+                Pipe.cpu.cpi.add(CPI_OTHER if self.exception else self.cause)
+            elif Pipe.cpu.early_branch and C.br_type != BR_N:
+                if self.out.taken == TAKEN_1 and C.pc_sel != PC_BRJMP:
+                    Pipe.cpu.btb.remove(self.pc)
+                elif self.out.taken == TAKEN_0 and C.pc_sel == PC_BRJMP:
+                    Pipe.cpu.btb.add(self.pc, self.brjmp_target)
+            o = self.out
+            o.pc                    = self.pc
+            o.inst                  = self.inst
+            o.exception             = self.exception
+            o.rd                    = self.rd
+            o.c_br_type             = Pipe.CTL.br_type
+            o.c_alu_fun             = Pipe.CTL.alu_fun
+            o.c_wb_sel              = Pipe.CTL.wb_sel
+            o.c_rf_wen              = Pipe.CTL.rf_wen
+            o.c_dmem_en             = Pipe.CTL.dmem_en
+            o.c_dmem_rw             = Pipe.CTL.dmem_rw
 
             # for PUSH, POP
-            EX.reg_p_type           = Pipe.CTL.p_type
-            EX.reg_sp_data          = self.sp_data
-
-            # for BTB
-            EX.reg_taken            = self.taken
+            o.p_type                = Pipe.CTL.p_type
 
+            Pipe.EX.reg             = o
 
         Pipe.log(S_ID, self.pc, self.inst, self.log())
 
+    def flush(self, pc):
+        self.reg.bubble(WORD(0))
+        self.nxt.bubble(WORD(0))
+
     def log(self):
         if self.inst in [ BUBBLE, ILLEGAL ]:
             return('# -')
         else:
-            return("# rd=%d rs1=%d rs2=%d op1=0x%08x op2=0x%08x" % (self.rd, self.rs1, self.rs2, self.op1_data, self.op2_data))
+            return("# rd=%d rs1=%d rs2=%d op1=0x%08x op2=0x%08x" % (self.rd, self.rs1, self.rs2, self.out.op1_data, self.out.op2_data))
+
+
+# EX log for each ALU function: o is the output, a and b the inputs, and
+# sh the shift amount. Only the entry in use is formatted.
+ALU_LOG = {
+    ALU_X       : '# -',
+    ALU_ADD     : '# {o:#010x} <- {a:#010x} + {b:#010x}',
+    ALU_SUB     : '# {o:#010x} <- {a:#010x} - {b:#010x}',
+    ALU_AND     : '# {o:#010x} <- {a:#010x} & {b:#010x}',
+    ALU_OR      : '# {o:#010x} <- {a:#010x} | {b:#010x}',
+    ALU_XOR     : '# {o:#010x} <- {a:#010x} ^ {b:#010x}',
+    ALU_SLT     : '# {o:#010x} <- {a:#010x} < {b:#010x} (signed)',
+    ALU_SLTU    : '# {o:#010x} <- {a:#010x} < {b:#010x} (unsigned)',
+    ALU_SLL     : '# {o:#010x} <- {a:#010x} << {sh}',
+    ALU_SRL     : '# {o:#010x} <- {a:#010x} >> {sh} (logical)',
+    ALU_SRA     : '# {o:#010x} <- {a:#010x} >> {sh} (arithmetic)',
+    ALU_COPY1   : '# {o:#010x} <- {a:#010x} (pass 1)',
+    ALU_COPY2   : '# {o:#010x} <- {b:#010x} (pass 2)',
+    ALU_SEQ     : '# {o:#010x} <- {a:#010x} == {b:#010x}',
+    ALU_MUL     : '# {o:#010x} <- {a:#010x} * {b:#010x}',
+    ALU_MULH    : '# {o:#010x} <- {a:#010x} * {b:#010x} (high, signed)',
+    ALU_MULHSU  : '# {o:#010x} <- {a:#010x} * {b:#010x} (high, signed x unsigned)',
+    ALU_MULHU   : '# {o:#010x} <- {a:#010x} * {b:#010x} (high, unsigned)',
+    ALU_DIV     : '# {o:#010x} <- {a:#010x} / {b:#010x} (signed)',
+    ALU_DIVU    : '# {o:#010x} <- {a:#010x} / {b:#010x} (unsigned)',
+    ALU_REM     : '# {o:#010x} <- {a:#010x} % {b:#010x} (signed)',
+    ALU_REMU    : '# {o:#010x} <- {a:#010x} % {b:#010x} (unsigned)',
+}
 
 
 #--------------------------------------------------------------------------
@@ -433,52 +775,28 @@ class ID(Pipe):
 
 class EX(Pipe):
 
-    # Pipeline registers ------------------------------
-
-    reg_pc              = WORD(0)           # EX.reg_pc
-    reg_inst            = WORD(BUBBLE)      # EX.reg_inst
-    reg_exception       = WORD(EXC_NONE)    # EX.exception
-    reg_rd              = WORD(0)           # EX.reg_rd
-    reg_c_rf_wen        = False             # EX.reg_c_rf_wen
-    reg_c_wb_sel        = WORD(WB_X)        # EX.reg_c_wb_sel
-    reg_c_dmem_en       = False             # EX.reg_c_dmem_en
-    reg_c_dmem_rw       = WORD(M_X)         # EX.reg_c_dmem_rw
-    reg_c_br_type       = WORD(BR_N)        # EX.reg_c_br_type
-    reg_c_alu_fun       = WORD(ALU_X)       # EX.reg_c_alu_fun
-    reg_op1_data        = WORD(0)           # EX.reg_op1_data
-    reg_op2_data        = WORD(0)           # EX.reg_op2_data
-    reg_rs2_data        = WORD(0)           # EX.reg_rs2_data
-    reg_pcplus4         = WORD(0)           # EX.reg_pcplus4
+    def __init__(self):
+        super().__init__()
 
-    # for PUSH, POP
-    reg_p_type          = P_N
-    reg_sp_data         = WORD(0)
+        # Pipeline registers ------------------------------
 
-    # for BTB
-    reg_taken           = TAKEN_N
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))     # Pipe.EX.reg
 
-    #--------------------------------------------------
+        #--------------------------------------------------
 
-
-    def __init__(self):
-        super().__init__()
+        # Multiply/divide in progress: latch of the instruction and cycles left
+        self.wait_t         = None
+        self.wait           = 0
 
         # Internal signals:----------------------------
         #
+        #   self.t                  # Pipe.EX.t (latch of the instruction in EX)
+        #   self.stall              # Pipe.EX.stall (waiting for the multiplier/divider)
         #   self.pc                 # Pipe.EX.pc
         #   self.inst               # Pipe.EX.inst
         #   self.exception          # Pipe.EX.exception
-        #   self.rd                 # Pipe.EX.rd
-        #   self.c_rf_wen           # Pipe.EX.c_rf_wen
-        #   self.c_wb_sel           # Pipe.EX.c_wb_sel
-        #   self.c_dmem_en          # Pipe.EX.c_dmem_en
-        #   self.c_dmem_rw          # Pipe.EX.c_dmem_fcn
-        #   self.c_br_type          # Pipe.EX.c_br_type
-        #   self.c_alu_fun          # Pipe.EX.c_alu_fun
-        #   self.op1_data           # Pipe.EX.op1_data
-        #   self.op2_data           # Pipe.EX.op2_data
-        #   self.rs2_data           # Pipe.EX.rs2_data
         #   self.pcplus4            # Pipe.EX.pcplus4
+        #   self.taken              # Pipe.EX.taken
         #
         #   self.alu2_data          # Pipe.EX.alu2_data
         #   self.alu_out            # Pipe.EX.alu_out
@@ -491,108 +809,97 @@ class EX(Pipe):
     def compute(self):
 
         # Readout pipeline register values
-        self.pc                 = EX.reg_pc
-        self.inst               = EX.reg_inst
-        self.exception          = EX.reg_exception
-        self.rd                 = EX.reg_rd
-        self.c_rf_wen           = EX.reg_c_rf_wen
-        self.c_wb_sel           = EX.reg_c_wb_sel
-        self.c_dmem_en          = EX.reg_c_dmem_en
-        self.c_dmem_rw          = EX.reg_c_dmem_rw
-        self.c_br_type          = EX.reg_c_br_type
-        self.c_alu_fun          = EX.reg_c_alu_fun
-        self.op1_data           = EX.reg_op1_data
-        self.op2_data           = EX.reg_op2_data
-        self.rs2_data           = EX.reg_rs2_data
-        self.pcplus4            = EX.reg_pcplus4
-
-        # for PUSH, POP
-        self.p_type             = EX.reg_p_type
-        self.sp_data            = EX.reg_sp_data
+        t = self.t              = self.reg
+        self.pc                 = t.pc
+        self.inst               = t.inst
+        self.exception          = t.exception
+        self.pcplus4            = t.pcplus4
 
         # for BTB
-        self.taken              = EX.reg_taken
+        self.taken              = t.taken
 
 
         # For branch instructions, we use ALU to make comparisons between rs1 and rs2.
         # Since op2_data has an immediate value (offset) for branch instructions,
         # we change the input of ALU to rs2_data.
-        self.alu2_data  = self.rs2_data     if self.c_br_type in [ BR_NE, BR_EQ, BR_GE, BR_GEU, BR_LT, BR_LTU ] else \
-                          self.op2_data
+        self.alu2_data  = t.rs2_data        if t.c_br_type in BR_COND else \
+                          t.op2_data
         
         # Perform ALU operation
-        self.alu_out = Pipe.cpu.alu.op(self.c_alu_fun, self.op1_data, self.alu2_data)
+        self.alu_out = Pipe.cpu.alu.op(t.c_alu_fun, t.op1_data, self.alu2_data)
+
+        # RV32M instructions stay in EX for the latency of the multiplier/divider,
+        # and their result is forwarded once it is ready. Cycles are charged to
+        # the unit only when it alone holds the pipeline (not a D-cache miss).
+        self.stall = False
+        if t.c_alu_fun in MULDIV_OPS and not t.exception:
+            if t is not self.wait_t:
+                self.wait_t = t
+                self.wait = Pipe.cpu.muldiv.access(t.c_alu_fun)
+            if self.wait > 0:
+                self.wait -= 1
+                self.stall = True
+                if not Pipe.MM.stall:
+                    Pipe.cpu.muldiv.stall_cycles += 1
 
         # Adjust the output for jalr instruction (forwarded to IF)
         self.jump_reg_target    = self.alu_out & WORD(0xfffffffe) 
 
         # Calculate the branch/jump target address using an adder (forwarded to IF)
-        self.brjmp_target       = Pipe.cpu.adder_brtarget.op(self.pc, self.op2_data) 
+        self.brjmp_target       = Pipe.cpu.adder_brtarget.op(t.pc, t.op2_data) 
 
         # For jal and jalr instructions, pc+4 should be written to the rd
-        if self.c_wb_sel == WB_PC4:                   
-            self.alu_out        = self.pcplus4
+        if t.c_wb_sel == WB_PC4:                   
+            self.alu_out        = t.pcplus4
 
 
     def update(self):
 
-        MM.reg_pc                   = self.pc
         # Exception should not be cleared in MM even if MM_bubble is enabled.
         # Otherwise we will lose any exception status.
         # For cancelled instructions, exception has been cleared already
         # as they enter ID or EX stage.
-        MM.reg_exception            = self.exception
-
-        if Pipe.CTL.MM_bubble:
-            MM.reg_inst             = WORD(BUBBLE)
-            MM.reg_c_rf_wen         = False
-            MM.reg_c_dmem_en        = False
-
-            # for PUSH, POP
-            MM.reg_p_type           = P_N
+        # The next stage is MM, or EX2 if EX is split. An instruction
+        # cancelled by a mispredict resolved in EX2 is squashed here.
+        if Pipe.CTL.MM_stall:
+            pass                    # MM keeps its instruction; EX redoes this one
+        elif self.stall or Pipe.CTL.EX_squash:
+            self.succ.reg           = InstLatch.bubble(self.pc, WORD(EXC_NONE))
+        elif Pipe.CTL.MM_bubble:
+            self.succ.reg           = InstLatch.bubble(self.pc, self.exception)
         else:
-            MM.reg_inst             = self.inst
-            MM.reg_rd               = self.rd
-            MM.reg_c_rf_wen         = self.c_rf_wen
-            MM.reg_c_wb_sel         = self.c_wb_sel
-            MM.reg_c_dmem_en        = self.c_dmem_en
-            MM.reg_c_dmem_rw        = self.c_dmem_rw
-            MM.reg_alu_out          = self.alu_out
-            MM.reg_rs2_data         = self.rs2_data
+            t = self.t
+            t.alu_out               = self.alu_out
 
             # for PUSH, POP
-            MM.reg_p_type           = self.p_type
-            MM.reg_sp_data          = self.sp_data
-            MM.reg_sp_data_plus4    = self.alu_out
+            t.sp_data_plus4         = self.alu_out
 
-            # for BTB
-            if (self.inst != BUBBLE) and (self.taken == TAKEN_1) and (Pipe.CTL.pc_sel != PC_BRJMP):
+            self.succ.reg           = t
+
+            # for BTB (updated by ID or EX2 if it resolves branches)
+            if Pipe.cpu.resolver is not self:
+                pass
+            elif (self.inst != BUBBLE) and (self.taken == TAKEN_1) and (Pipe.CTL.pc_sel != PC_BRJMP):
                 Pipe.cpu.btb.remove(self.pc)
             elif (self.inst != BUBBLE) and (self.taken == TAKEN_0) and (Pipe.CTL.pc_sel == PC_BRJMP):
                 Pipe.cpu.btb.add(self.pc, self.brjmp_target)
         
         Pipe.log(S_EX, self.pc, self.inst, self.log())
 
+    def flush(self, pc):
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))
+        self.wait_t         = None
+
 
     def log(self):
 
-        ALU_OPS = {
-            ALU_X       : f'# -',
-            ALU_ADD     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} + {self.alu2_data:#010x}',
-            ALU_SUB     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} - {self.alu2_data:#010x}',
-            ALU_AND     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} & {self.alu2_data:#010x}',
-            ALU_OR      : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} | {self.alu2_data:#010x}',
-            ALU_XOR     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} ^ {self.alu2_data:#010x}',
-            ALU_SLT     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} < {self.alu2_data:#010x} (signed)',
-            ALU_SLTU    : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} < {self.alu2_data:#010x} (unsigned)',
-            ALU_SLL     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} << {self.alu2_data & 0x1f}',
-            ALU_SRL     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} >> {self.alu2_data & 0x1f} (logical)',
-            ALU_SRA     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} >> {self.alu2_data & 0x1f} (arithmetic)',
-            ALU_COPY1   : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} (pass 1)',
-            ALU_COPY2   : f'# {self.alu_out:#010x} <- {self.alu2_data:#010x} (pass 2)',
-            ALU_SEQ     : f'# {self.alu_out:#010x} <- {self.op1_data:#010x} == {self.alu2_data:#010x}',
-        }
-        return('# -' if self.inst == BUBBLE else ALU_OPS[self.c_alu_fun]);
+        t = self.t
+        if self.stall:
+            return('# multiply/divide, %d cycles left' % self.wait)
+        if self.inst == BUBBLE:
+            return('# -')
+        return(ALU_LOG[t.c_alu_fun].format(o = self.alu_out, a = t.op1_data, b = self.alu2_data,
+                                           sh = self.alu2_data & 0x1f))
 
 
 #--------------------------------------------------------------------------
@@ -601,41 +908,27 @@ class EX(Pipe):
 
 class MM(Pipe):
 
-    # Pipeline registers ------------------------------
+    def __init__(self):
+        super().__init__()
 
-    reg_pc              = WORD(0)           # MM.reg_pc
-    reg_inst            = WORD(BUBBLE)      # MM.reg_inst
-    reg_exception       = WORD(EXC_NONE)    # MM.reg_exception
-    reg_rd              = WORD(0)           # MM.reg_rd
-    reg_c_rf_wen        = False             # MM.reg_c_rf_wen
-    reg_c_wb_sel        = WORD(WB_X)        # MM.reg_c_wb_sel
-    reg_c_dmem_en       = False             # MM.reg_c_dmem_en
-    reg_c_dmem_rw       = WORD(M_X)         # MM.reg_c_dmem_rw
-    reg_alu_out         = WORD(0)           # MM.reg_alu_out
-    reg_rs2_data        = WORD(0)           # MM.reg_rs2_data
+        # Pipeline registers ------------------------------
 
-    # for PUSH, POP
-    reg_p_type          = P_N
-    reg_sp_data         = WORD(0)
-    reg_sp_data_plus4   = WORD(0)
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))     # Pipe.MM.reg
 
-    #--------------------------------------------------
+        #--------------------------------------------------
 
-    def __init__(self):
-        super().__init__()
+        # D-cache miss in progress: latch of the instruction and cycles left
+        self.wait_t         = None
+        self.wait           = 0
 
         # Internal signals:----------------------------
         #
-        #   self.pc                 # Pipe.MM.pc
-        #   self.inst               # Pipe.MM.inst
+        #   self.t                  # Pipe.MM.t (latch of the instruction in MM)
+        #   self.stall              # Pipe.MM.stall (waiting for the D-cache)
         #   self.exception          # Pipe.MM.exception
-        #   self.rd                 # Pipe.MM.rd
         #   self.c_rf_wen           # Pipe.MM.c_rf_wen
-        #   self.c_wb_sel           # Pipe.MM.c_rf_wen
-        #   self.c_dmem_en          # Pipe.MM.c_dmem_en
-        #   self.c_dmem_rw          # Pipe.MM.c_dmem_rw
         #   self.alu_out            # Pipe.MM.alu_out
-        #   self.rs2_data           # Pipe.MM.rs2_data
+        #   self.sp_data_plus4      # Pipe.MM.sp_data_plus4
         #
         #   self.wbdata             # Pipe.MM.wbdata
         #
@@ -643,62 +936,72 @@ class MM(Pipe):
 
     def compute(self):
 
-        self.pc             = MM.reg_pc
-        self.inst           = MM.reg_inst
-        self.exception      = MM.reg_exception
-        self.rd             = MM.reg_rd
-        self.c_rf_wen       = MM.reg_c_rf_wen
-        self.c_wb_sel       = MM.reg_c_wb_sel
-        self.c_dmem_en      = MM.reg_c_dmem_en
-        self.c_dmem_rw      = MM.reg_c_dmem_rw
-        self.alu_out        = MM.reg_alu_out  
-        self.rs2_data       = MM.reg_rs2_data 
+        t = self.t          = self.reg
+        self.exception      = t.exception
+        self.c_rf_wen       = t.c_rf_wen
 
         # for PUSH, POP
-        self.p_type         = MM.reg_p_type
-        self.sp_data        = MM.reg_sp_data
-        self.sp_data_plus4  = MM.reg_sp_data_plus4
+        self.sp_data_plus4  = t.sp_data_plus4
 
+        self.alu_out        = t.sp_data             if t.p_type == P_POP else    \
+                              t.alu_out
 
-        self.alu_out        = self.sp_data          if self.p_type == P_POP else    \
-                              self.alu_out
+        # Look up the D-cache once per instruction. On a miss, the instruction
+        # stays in MM and accesses dmem only when the line has arrived.
+        self.stall = False
+        if Pipe.cpu.dcache is not None and t.c_dmem_en:
+            if t is not self.wait_t:
+                self.wait_t = t
+                self.wait = Pipe.cpu.dcache.access(self.alu_out, t.c_dmem_rw == M_XWR)
+            if self.wait > 0:
+                self.wait -= 1
+                self.stall = True
 
-        # Access data memory (dmem) if needed
-        mem_data, status = Pipe.cpu.dmem.access(self.c_dmem_en, self.alu_out, self.rs2_data, self.c_dmem_rw)
+        # Access data memory (dmem) or a device over the bus if needed
+        mem_data, status = Pipe.cpu.bus.access(t.c_dmem_en and not self.stall, self.alu_out, t.rs2_data, t.c_dmem_rw)
 
         # Handle exception during dmem access
         if not status:
             self.exception |= EXC_DMEM_ERROR
             self.c_rf_wen   = False
+        elif Pipe.cpu.bus.halt:
+            Pipe.cpu.bus.halt = False
+            self.exception |= EXC_EBREAK    # exit through SimCtl ends the run like EBREAK
 
         # For load instruction, we need to store the value read from dmem
-        self.wbdata         = mem_data          if self.c_wb_sel == WB_MEM  else \
+        self.wbdata         = mem_data          if t.c_wb_sel == WB_MEM  else \
                               self.alu_out
 
 
     def update(self):
     
-        WB.reg_pc           = self.pc
-        WB.reg_inst         = self.inst
-        WB.reg_exception    = self.exception
-        WB.reg_rd           = self.rd
-        WB.reg_c_rf_wen     = self.c_rf_wen
-        WB.reg_wbdata       = self.wbdata
+        # The next stage is WB, or MM2 if MM is split
+        t = self.t
+        if self.stall:
+            self.succ.reg   = InstLatch.bubble(t.pc, WORD(EXC_NONE))
+        else:
+            t.exception     = self.exception
+            t.c_rf_wen      = self.c_rf_wen
+            t.wbdata        = self.wbdata
+            self.succ.reg   = t
 
-        # for PUSH, POP
-        WB.reg_p_type           = self.p_type
-        WB.reg_sp_data_plus4    = self.sp_data_plus4
+        Pipe.log(S_MM, t.pc, t.inst, self.log())
 
-        Pipe.log(S_MM, self.pc, self.inst, self.log())
+    def flush(self, pc):
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))
+        self.wait_t         = None
 
 
     def log(self):
-        if not self.c_dmem_en:
+        t = self.t
+        if self.stall:
+            return('# D-cache miss, %d cycles left' % self.wait)
+        elif not t.c_dmem_en:
             return('# -')
-        elif self.c_dmem_rw == M_XRD:
+        elif t.c_dmem_rw == M_XRD:
             return('# 0x%08x <- M[0x%08x]' % (self.wbdata, self.alu_out))
         else:
-            return('# M[0x%08x] <- 0x%08x' % (self.alu_out, self.rs2_data))
+            return('# M[0x%08x] <- 0x%08x' % (self.alu_out, t.rs2_data))
 
 
 #--------------------------------------------------------------------------
@@ -707,62 +1010,83 @@ class MM(Pipe):
 
 class WB(Pipe):
 
-    # Pipeline registers ------------------------------
-
-    reg_pc              = WORD(0)           # WB.reg_pc
-    reg_inst            = WORD(BUBBLE)      # WB.reg_inst
-    reg_exception       = WORD(EXC_NONE)    # WB.reg_exception
-    reg_rd              = WORD(0)           # WB.reg_rd
-    reg_c_rf_wen        = False             # WB.reg_c_rf_wen
-    reg_wbdata          = WORD(0)           # WB.reg_wbdata
+    def __init__(self):
+        super().__init__()
 
-    # for PUSH, POP
-    reg_p_type          = P_N
-    reg_sp_data_plus4   = WORD(0)
+        # Pipeline registers ------------------------------
 
-    #--------------------------------------------------
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))     # Pipe.WB.reg
 
+        #--------------------------------------------------
 
-    def __init__(self):
-        super().__init__()
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.WB.t (latch of the instruction in WB)
+        #   self.pc                 # Pipe.WB.pc
+        #   self.inst               # Pipe.WB.inst
+        #   self.exception          # Pipe.WB.exception
+        #   self.wbdata             # Pipe.WB.wbdata
+        #   self.sp_data_plus4      # Pipe.WB.sp_data_plus4
+        #
+        #----------------------------------------------
 
     def compute(self):
 
         # Readout pipeline register values
-        self.pc                 = WB.reg_pc    
-        self.inst               = WB.reg_inst  
-        self.exception          = WB.reg_exception      
-        self.rd                 = WB.reg_rd    
-        self.c_rf_wen           = WB.reg_c_rf_wen 
-        self.wbdata             = WB.reg_wbdata
+        t = self.t              = self.reg
+        self.pc                 = t.pc
+        self.inst               = t.inst
+        self.exception          = t.exception
+        self.wbdata             = t.wbdata
 
         # for PUSH, POP
-        self.p_type             = WB.reg_p_type
-        self.sp_data_plus4      = WB.reg_sp_data_plus4
+        self.sp_data_plus4      = t.sp_data_plus4
 
 
     def update(self):
 
-        if self.c_rf_wen:
-            if self.p_type == P_PUSH :
+        t = self.t
+        if t.c_rf_wen:
+            if t.p_type == P_PUSH :
                 Pipe.cpu.rf.write(SP, self.wbdata)
-            elif self.p_type == P_POP :
-                Pipe.cpu.rf.write(self.rd, self.wbdata, SP, self.sp_data_plus4)
+            elif t.p_type == P_POP :
+                Pipe.cpu.rf.write(t.rd, self.wbdata, SP, self.sp_data_plus4)
             else :
-                Pipe.cpu.rf.write(self.rd, self.wbdata)
+                Pipe.cpu.rf.write(t.rd, self.wbdata)
+
+        # System calls take effect as ECALL retires
+        if self.inst == ECALL:
+            if Pipe.cpu.kernel.ecall(Pipe.cpu.rf.reg, Pipe.cpu.dmem.mem, int(Pipe.cpu.stat.cycle)):
+                self.exception |= EXC_EBREAK    # exit() ends the run like EBREAK
 
         Pipe.log(S_WB, self.pc, self.inst, self.log())
 
+        if Pipe.cpu.commits is not None and self.inst != BUBBLE:
+            Pipe.cpu.commits.record(Pipe.cpu, t)
+
+        # Check the retired instruction against the reference model
+        if Pipe.cpu.cosim is not None and self.inst != BUBBLE:
+            if not Pipe.cpu.cosim.retire(t):
+                return False
+
         if (self.exception):
             return False
         else:
             return True
 
+    def flush(self, pc):
+        self.reg            = InstLatch.bubble(WORD(0), WORD(EXC_NONE))
+
+    # Counts the instruction retired in this cycle, if any
+    def count(self, stat):
+        if self.inst != BUBBLE:
+            Pipe.count_inst(stat, self.inst)
+
     def log(self):
-        if self.inst == BUBBLE or (not self.c_rf_wen):
+        if self.inst == BUBBLE or (not self.t.c_rf_wen):
             return('# -')
         else:
-            return('# R[%d] <- 0x%08x' % (self.rd, self.wbdata))
+            return('# R[%d] <- 0x%08x' % (self.t.rd, self.wbdata))
 
 
 
@@ -778,14 +1102,15 @@ class Control(object):
         # Internal signals:----------------------------
         #
         #   self.pc_sel             # Pipe.CTL.pc_sel
+        #   self.right_predict      # Pipe.CTL.right_predict
+        #   self.redirect           # Pipe.CTL.redirect (next pc after a mispredict, None if none)
         #   self.br_type            # Pipe.CTL.br_type
         #   self.op1_sel            # Pipe.CTL.op1_sel
         #   self.op2_sel            # Pipe.CTL.op2_sel
         #   self.alu_fun            # Pipe.CTL.alu_fun
         #   self.wb_sel             # Pipe.CTL.wb_sel
         #   self.rf_wen             # Pipe.CTL.rf_wen
-        #   self.fwd_op1            # Pipe.CTL.fwd_op1
-        #   self.fwd_op2            # Pipe.CTL.fwd_op2
+        #   self.fwd                # Pipe.CTL.fwd
         #   self.imem_en            # Pipe.CTL.imem_en
         #   self.imem_rw            # Pipe.CTL.imem_rw
         #   self.dmem_en            # Pipe.CTL.dmem_en
@@ -793,8 +1118,17 @@ class Control(object):
         #   self.IF_stall           # Pipe.CTL.IF_stall
         #   self.ID_stall           # Pipe.CTL.ID_stall
         #   self.ID_bubble          # Pipe.CTL.ID_bubble
+        #   self.EX_stall           # Pipe.CTL.EX_stall
         #   self.EX_bubble          # Pipe.CTL.EX_bubble
+        #   self.MM_stall           # Pipe.CTL.MM_stall
         #   self.MM_bubble          # Pipe.CTL.MM_bubble
+        #   self.EX_squash          # Pipe.CTL.EX_squash (EX cancelled by a mispredict in EX2)
+        #
+        #   Why EX gets a bubble, for the CPI stack:
+        #   self.mispredict         # Pipe.CTL.mispredict
+        #   self.load_use           # Pipe.CTL.load_use
+        #   self.alu_use            # Pipe.CTL.alu_use (ALU result not ready in split EX)
+        #   self.branch_wait        # Pipe.CTL.branch_wait
         #
         #----------------------------------------------
 
@@ -802,136 +1136,155 @@ class Control(object):
         # These signals are used before gen() is called
         self.imem_en        = True
         self.imem_rw        = M_XRD
-    
-    def preGen(self, inst):
-        opcode = RISCV.opcode(inst)
 
-        self.p_type = P_PUSH    if opcode == PUSH   else \
-                      P_POP     if opcode == POP    else \
-                      P_N
+        # Only set by the control of deeper pipelines (see deep.py)
+        self.EX_squash      = False
+        self.alu_use        = False
+
+        # Decoded Signals for each instruction word seen so far, and
+        # forwarding maps for each occupancy pattern of EX/MM/WB
+        self.signals        = { }
+        self.fwd_maps       = { }
+
+        for inst in [ BUBBLE, NOP ]:
+            self.decode(inst)
+        self.fwd_map((0, P_N, 0, P_N, 0, P_N))
+
+    def decode(self, inst):
+        sig = self.signals.get(inst)
+        if sig is None:
+            sig = self.signals[inst] = Signals(inst)
+        return sig
+
+    # Maps register number -> function returning the value to forward.
+    # key is (rd, p_type) of EX, MM, and WB, where rd is 0 unless the
+    # instruction writes the register file. Closer stages win, and within
+    # a stage a write to rd wins over the sp update of push/pop.
+    def fwd_map(self, key):
+        fwd = self.fwd_maps.get(key)
+        if fwd is None:
+            fwd = { }
+            for s in [ S_WB, S_MM, S_EX ]:
+                rd, p_type = key[2 * (s - S_EX)], key[2 * (s - S_EX) + 1]
+                if p_type != P_N:
+                    fwd[int(SP)] = FWD_SP[(s, p_type)]
+                if rd != 0:
+                    fwd[rd] = FWD_REG[s]
+            self.fwd_maps[key] = fwd
+        return fwd
+
+    def preGen(self, inst):
+        self.p_type = self.decode(inst).p_type
 
 
     def gen(self, inst):
 
-        opcode = RISCV.opcode(inst)
-        if opcode in [ EBREAK, ECALL ]:
-            Pipe.ID.exception |= EXC_EBREAK
-        elif opcode == ILLEGAL:
-            Pipe.ID.exception |= EXC_ILLEGAL_INST
-            inst = BUBBLE
-            opcode = RISCV.opcode(inst)
+        sig = self.decode(inst)
+        if sig.exception:
+            Pipe.ID.exception |= sig.exception
+            inst = inst if sig.valid else BUBBLE
 
         self.IF_stall       = False
         self.ID_stall       = False
         self.ID_bubble      = False
+        self.EX_stall       = False
         self.EX_bubble      = False
+        self.MM_stall       = False
         self.MM_bubble      = False     
 
-        cs = csignals[opcode]
-
-        self.br_type        = cs[CS_BR_TYPE]
-        self.op1_sel        = cs[CS_OP1_SEL]
-        self.op2_sel        = cs[CS_OP2_SEL]
-        self.alu_fun        = cs[CS_ALU_FUN]
-        self.wb_sel         = cs[CS_WB_SEL]
-        self.rf_wen         = cs[CS_RF_WEN]
-
-        rs1_oen             = cs[CS_RS1_OEN]
-        rs2_oen             = cs[CS_RS2_OEN]
-
-        self.dmem_en        = cs[CS_MEM_EN]
-        self.dmem_rw        = cs[CS_MEM_FCN]
-
-        # Control signal to select the next PC
-        self.pc_sel         =   PC_BRJMP    if (EX.reg_c_br_type == BR_NE  and (not Pipe.EX.alu_out)) or    \
-                                               (EX.reg_c_br_type == BR_EQ  and Pipe.EX.alu_out) or          \
-                                               (EX.reg_c_br_type == BR_GE  and (not Pipe.EX.alu_out)) or    \
-                                               (EX.reg_c_br_type == BR_GEU and (not Pipe.EX.alu_out)) or    \
-                                               (EX.reg_c_br_type == BR_LT  and Pipe.EX.alu_out) or          \
-                                               (EX.reg_c_br_type == BR_LTU and Pipe.EX.alu_out) or          \
-                                               (EX.reg_c_br_type == BR_J) else                              \
-                                PC_JALR     if  EX.reg_c_br_type == BR_JR else                              \
-                                PC_4
-        
-        # for BTB
-        self.right_predict  =   ((self.pc_sel == PC_BRJMP) and (EX.reg_taken == TAKEN_1)) or \
-                                ((self.pc_sel == PC_4) and (EX.reg_taken == TAKEN_0))
+        self.br_type        = sig.br_type
+        self.op1_sel        = sig.op1_sel
+        self.op2_sel        = sig.op2_sel
+        self.alu_fun        = sig.alu_fun
+        self.wb_sel         = sig.wb_sel
+        self.rf_wen         = sig.rf_wen
 
-        # Control signal for forwarding rs1 value to op1_data
+        rs1_oen             = sig.rs1_oen
+        rs2_oen             = sig.rs2_oen
+
+        self.dmem_en        = sig.dmem_en
+        self.dmem_rw        = sig.dmem_rw
+
+        ex, mm, wb          = Pipe.EX.reg, Pipe.MM.reg, Pipe.WB.reg
+
+        # Branches resolved in EX: control signal to select the next PC, and
+        # the pc to fetch from if the BTB prediction was wrong. With early
+        # branch resolution, ID sets them after reading its operands.
+        if Pipe.cpu.early_branch:
+            self.pc_sel         = PC_4
+            self.right_predict  = True
+            self.redirect       = None
+        else:
+            self.pc_sel         = PC_SEL[ex.c_br_type][bool(Pipe.EX.alu_out)]
+            self.right_predict  = (self.pc_sel, ex.taken) in RIGHT_PREDICT
+            self.redirect       = None                      if self.right_predict       else \
+                                  Pipe.EX.jump_reg_target   if self.pc_sel == PC_JALR   else \
+                                  Pipe.EX.pcplus4           if ex.taken == TAKEN_1      else \
+                                  Pipe.EX.brjmp_target
+
+        # Forwarding sources for the registers written by EX, MM, and WB
         # The c_rf_wen signal can be disabled when we have an exception during dmem access,
-        # so Pipe.MM.c_rf_wen should be used instead of MM.reg_c_rf_wen.
-        self.fwd_op1        =   FWD_EX      if (EX.reg_rd == Pipe.ID.rs1) and rs1_oen and   \
-                                               (EX.reg_rd != 0) and EX.reg_c_rf_wen else    \
-                                FWD_MM      if (MM.reg_rd == Pipe.ID.rs1) and rs1_oen and   \
-                                               (MM.reg_rd != 0) and Pipe.MM.c_rf_wen else   \
-                                FWD_WB      if (WB.reg_rd == Pipe.ID.rs1) and rs1_oen and   \
-                                               (WB.reg_rd != 0) and WB.reg_c_rf_wen else    \
-                                FWD_NONE
-
-        # Control signal for forwarding rs2 value to op2_data
-        self.fwd_op2        =   FWD_EX      if (EX.reg_rd == Pipe.ID.rs2) and               \
-                                               (EX.reg_rd != 0) and EX.reg_c_rf_wen and     \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_MM      if (MM.reg_rd == Pipe.ID.rs2) and               \
-                                               (MM.reg_rd != 0) and Pipe.MM.c_rf_wen and    \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_WB      if (WB.reg_rd == Pipe.ID.rs2) and               \
-                                               (WB.reg_rd != 0) and WB.reg_c_rf_wen and     \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_NONE
-
-        # Control signal for forwarding rs2 value to rs2_data
-        self.fwd_rs2        =   FWD_EX      if (EX.reg_rd == Pipe.ID.rs2) and rs2_oen and   \
-                                               (EX.reg_rd != 0) and EX.reg_c_rf_wen  else   \
-                                FWD_MM      if (MM.reg_rd == Pipe.ID.rs2) and rs2_oen and   \
-                                               (MM.reg_rd != 0) and Pipe.MM.c_rf_wen else   \
-                                FWD_WB      if (WB.reg_rd == Pipe.ID.rs2) and rs2_oen and   \
-                                               (WB.reg_rd != 0) and WB.reg_c_rf_wen  else   \
-                                FWD_NONE
-        
-        # for sp dependency
-        self.fwd_sp_op1     =   FWD_EX      if (SP == Pipe.ID.rs1) and rs1_oen and          \
-                                               (EX.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_MM      if (SP == Pipe.ID.rs1) and rs1_oen and          \
-                                               (MM.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_WB      if (SP == Pipe.ID.rs1) and rs1_oen and          \
-                                               (WB.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_NONE
-        
-        self.fwd_sp_op2     =   FWD_EX      if (SP == Pipe.ID.rs2) and                      \
-                                               (EX.reg_p_type in [P_PUSH, P_POP]) and       \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_MM      if (SP == Pipe.ID.rs2) and                      \
-                                               (MM.reg_p_type in [P_PUSH, P_POP]) and       \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_WB      if (SP == Pipe.ID.rs2) and                      \
-                                               (WB.reg_p_type in [P_PUSH, P_POP]) and       \
-                                               self.op2_sel == OP2_RS2 else                 \
-                                FWD_NONE
-        
-        self.fwd_sp_rs2     =   FWD_EX      if (SP == Pipe.ID.rs2) and rs2_oen and          \
-                                               (EX.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_MM      if (SP == Pipe.ID.rs2) and rs2_oen and          \
-                                               (MM.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_WB      if (SP == Pipe.ID.rs2) and rs2_oen and          \
-                                               (WB.reg_p_type in [P_PUSH, P_POP]) else      \
-                                FWD_NONE
+        # so Pipe.MM.c_rf_wen should be used instead of mm.c_rf_wen.
+        self.fwd            = self.fwd_map((int(ex.rd) if ex.c_rf_wen else 0, ex.p_type,
+                                            int(mm.rd) if Pipe.MM.c_rf_wen else 0, mm.p_type,
+                                            int(wb.rd) if wb.c_rf_wen else 0, wb.p_type))
 
         # Check for load-use data hazard
-        EX_load_inst = EX.reg_c_dmem_en and EX.reg_c_dmem_rw == M_XRD
-        load_use_hazard     = (EX_load_inst and EX.reg_rd != 0) and             \
-                              ((EX.reg_rd == Pipe.ID.rs1 and rs1_oen) or        \
-                               (EX.reg_rd == Pipe.ID.rs2 and rs2_oen))
+        EX_load_inst = ex.c_dmem_en and ex.c_dmem_rw == M_XRD
+        load_use_hazard     = (EX_load_inst and ex.rd != 0) and                 \
+                              ((ex.rd == Pipe.ID.rs1 and rs1_oen) or            \
+                               (ex.rd == Pipe.ID.rs2 and rs2_oen))
 
         # Check for mispredicted branch/jump
         EX_brjmp            = not self.right_predict
 
+        # With early branch resolution, a branch or jump in ID compares its
+        # operands in the same cycle. It waits while one of them is still
+        # computed in EX or loaded in MM: one cycle after an ALU instruction,
+        # and two after a load.
+        branch_wait         = False
+        if Pipe.cpu.early_branch and sig.br_type != BR_N:
+            for rs, oen in [ (Pipe.ID.rs1, rs1_oen), (Pipe.ID.rs2, rs2_oen) ]:
+                src = self.fwd.get(rs) if oen else None
+                if src in FWD_FROM_EX or (src is FWD_REG[S_MM] and mm.c_dmem_en and mm.c_dmem_rw == M_XRD):
+                    branch_wait = True
+
         # For load-use hazard, ID and IF are stalled for one cycle (and EX bubbled)
         # For mispredicted branches, instructions in ID and IF should be cancelled (become BUBBLE)
-        self.IF_stall       = load_use_hazard 
-        self.ID_stall       = load_use_hazard
+        self.IF_stall       = load_use_hazard or branch_wait
+        self.ID_stall       = load_use_hazard or branch_wait
         self.ID_bubble      = EX_brjmp 
-        self.EX_bubble      = load_use_hazard or EX_brjmp
+        self.EX_bubble      = load_use_hazard or branch_wait or EX_brjmp
+
+        self.mispredict     = EX_brjmp
+        self.load_use       = load_use_hazard
+        self.branch_wait    = branch_wait
+
+        # ECALL is run by the proxy kernel as it leaves WB. The instruction
+        # after it waits in ID until then to see the results (and EX gets bubbles).
+        if ex.inst == ECALL or mm.inst == ECALL or wb.inst == ECALL:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.EX_bubble  = True
+
+        # For a D-cache miss, IF through MM are stalled (and WB bubbled) until
+        # the line arrives. Hazards are handled after the stall.
+        if Pipe.MM.stall:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
+            self.MM_stall   = True
+
+        # For a multiply/divide in progress, IF through EX are stalled (and MM
+        # bubbled) until the result is ready. Hazards are handled after the stall.
+        elif Pipe.EX.stall:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
 
         # Any instruction with an exception becomes BUBBLE as it enters the MM stage. 
         # This is because the instruction can be cancelled while it is in IF and ID due to mispredicted 
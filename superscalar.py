@@ -0,0 +1,747 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Stages of the 2-wide in-order variant. Every pipeline register holds a
+#   pair of instructions, where slot 0 is the older one. IF fetches two
+#   sequential instructions, and ID issues both when the second one does
+#   not depend on the first and they do not compete for a unit.
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+from program import *
+from stages import *
+
+
+#--------------------------------------------------------------------------
+#   Configurations
+#--------------------------------------------------------------------------
+
+WIDTH       = 2
+
+# Why the second instruction of a pair waits for the next cycle
+HOLD_SERIAL     = 'serializing'     # ECALL first, or an exception in either
+HOLD_CONTROL    = 'control'         # branch or jump first
+HOLD_DEPEND     = 'dependency'      # reads a register the first one writes
+HOLD_LOADUSE    = 'load-use'        # reads the result of a load in EX
+HOLD_MEMPORT    = 'memory port'     # both access dmem
+HOLD_MULDIV     = 'mul/div'         # both use the multiplier/divider
+HOLD_WRPORT     = 'write ports'     # more than two register writes (pop)
+
+# Forwarded value for a register written by the instruction in slot s of EX/MM/WB
+FWD_REG2 = { }
+FWD_SP2 = { }
+for s in range(WIDTH):
+    FWD_REG2[(S_EX, s)]         = lambda s = s: Pipe.EX.alu_out[s]
+    FWD_REG2[(S_MM, s)]         = lambda s = s: Pipe.MM.wbdata[s]
+    FWD_REG2[(S_WB, s)]         = lambda s = s: Pipe.WB.wbdata[s]
+    FWD_SP2[(S_EX, s, P_PUSH)]  = lambda s = s: Pipe.EX.alu_out[s]
+    FWD_SP2[(S_EX, s, P_POP)]   = lambda s = s: Pipe.EX.alu_out[s]
+    FWD_SP2[(S_MM, s, P_PUSH)]  = lambda s = s: Pipe.MM.alu_out[s]
+    FWD_SP2[(S_MM, s, P_POP)]   = lambda s = s: Pipe.MM.sp_data_plus4[s]
+    FWD_SP2[(S_WB, s, P_PUSH)]  = lambda s = s: Pipe.WB.wbdata[s]
+    FWD_SP2[(S_WB, s, P_POP)]   = lambda s = s: Pipe.WB.sp_data_plus4[s]
+
+
+def bubbles(pcs, exceptions = None):
+    return [ InstLatch.bubble(pcs[s], exceptions[s] if exceptions else WORD(EXC_NONE)) for s in range(WIDTH) ]
+
+
+#--------------------------------------------------------------------------
+#   DualIF: fetches two sequential instructions
+#--------------------------------------------------------------------------
+
+class DualIF(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg_pc         = WORD(0)       # Pipe.IF.reg_pc
+
+        #--------------------------------------------------
+
+        # I-cache miss in progress: pc being fetched and cycles left
+        self.wait_pc        = None
+        self.wait           = 0
+
+        # Internal signals:----------------------------
+        #
+        #   self.out                # Pipe.IF.out (IF/ID latches being filled)
+        #   self.pc_next            # Pipe.IF.pc_next
+        #   self.miss               # Pipe.IF.miss (waiting for the I-cache)
+        #   self.reads              # Pipe.IF.reads (imem words read)
+        #
+        #----------------------------------------------
+
+
+    # Fills in o with the instruction at pc and returns the BTB target
+    def fetch(self, o, pc):
+        o.pc = pc
+        o.inst, status = Pipe.cpu.bus.fetch(Pipe.CTL.imem_en, pc)
+        if not status:
+            o.exception = EXC_IMEM_ERROR
+            o.inst = BUBBLE
+        else:
+            o.exception = EXC_NONE
+        o.pcplus4 = Pipe.cpu.adder_pcplus4.op(pc, 4)
+        target = Pipe.cpu.btb.lookup(pc)
+        o.taken = TAKEN_0 if target is None else TAKEN_1
+        return target
+
+    def compute(self):
+
+        # The second instruction is fetched unless the first one is predicted
+        # taken or cannot be fetched
+        o0, o1 = self.out = [ FetchLatch(), FetchLatch() ]
+        pc = self.reg_pc
+        target = self.fetch(o0, pc)
+        if target is None and not o0.exception:
+            target = self.fetch(o1, o0.pcplus4)
+            predict = target if target is not None else o1.pcplus4
+            self.reads = 2
+        else:
+            o1.bubble(o0.pcplus4)
+            predict = target if target is not None else o0.pcplus4
+            self.reads = 1
+
+        # Look up the I-cache once per fetch, and again for the second
+        # instruction when it is on another line
+        self.miss = False
+        icache = Pipe.cpu.icache
+        if icache is not None and not o0.exception:
+            if pc != self.wait_pc:
+                self.wait_pc = pc
+                self.wait = icache.access(pc, False)
+                if self.reads == 2 and int(pc) // icache.line != int(o1.pc) // icache.line:
+                    self.wait += icache.access(o1.pc, False)
+            if self.wait > 0:
+                self.wait -= 1
+                self.miss = True
+
+        # Select next PC: the target of a mispredicted instruction in EX, or the prediction
+        self.pc_next = Pipe.CTL.redirect if Pipe.CTL.redirect is not None else predict
+
+
+    def update(self):
+
+        out = self.out
+        if not Pipe.CTL.IF_stall and (not self.miss or Pipe.CTL.ID_bubble):
+            self.reg_pc         = self.pc_next
+            self.wait_pc        = None
+
+        # Count the fetch once it is done (not while IF waits)
+        if not Pipe.CTL.IF_stall and not self.miss:
+            f = Pipe.cpu.fetch
+            f.reads += self.reads
+            f.insts += self.reads
+            btb = Pipe.cpu.btb
+            for o in out[:self.reads]:
+                btb.lookups += 1
+                if o.taken == TAKEN_1:
+                    btb.hits += 1
+
+        if Pipe.CTL.ID_bubble or (self.miss and not Pipe.CTL.ID_stall):
+            Pipe.ID.reg[0].bubble(out[0].pc)
+            Pipe.ID.reg[1].bubble(out[1].pc)
+        elif not Pipe.CTL.ID_stall:
+            Pipe.ID.reg = out
+
+        for s in range(WIDTH):
+            Pipe.log(S_IF, out[s].pc, out[s].inst, self.log(s), s)
+
+    def flush(self, pc):
+        self.reg_pc         = WORD(pc)
+        self.wait_pc        = None
+
+    def log(self, s):
+        if self.miss:
+            return ("# I-cache miss, %d cycles left" % self.wait)
+        return ("# inst=0x%08x, pc_next=0x%08x" % (self.out[s].inst, self.pc_next))
+
+
+#--------------------------------------------------------------------------
+#   DualID: decodes a pair and issues zero, one, or two instructions
+#--------------------------------------------------------------------------
+
+class DualID(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = [ FetchLatch(), FetchLatch() ]    # Pipe.ID.reg
+        for r in self.reg:
+            r.bubble(WORD(0))
+
+        #--------------------------------------------------
+
+        # Internal signals:----------------------------
+        #
+        #   self.pc                 # Pipe.ID.pc
+        #   self.inst               # Pipe.ID.inst
+        #   self.exception          # Pipe.ID.exception
+        #   self.sig                # Pipe.ID.sig (decoded Signals)
+        #   self.out                # Pipe.ID.out (ID/EX latches being filled)
+        #
+        #----------------------------------------------
+
+
+    def compute(self):
+
+        # Readout pipeline register values
+        self.pc         = [ r.pc for r in self.reg ]
+        self.inst       = [ r.inst for r in self.reg ]
+        self.exception  = [ r.exception for r in self.reg ]
+        self.sig        = [ Pipe.CTL.decode(i) for i in self.inst ]
+
+        # Four read ports
+        rf_data         = [ Pipe.cpu.rf.read(sig.rs1, sig.rs2) for sig in self.sig ]
+
+        # Generate control signals (this also decides how many instructions issue)
+        Pipe.CTL.gen()
+
+        # Get forwarded values if necessary. Both instructions of a pair use
+        # the same forwarding paths, as the second one never needs the result
+        # of the first.
+        fwd = Pipe.CTL.fwd
+        self.out = [ ]
+        for s in range(WIDTH):
+            sig = self.sig[s]
+            r = self.reg[s]
+            rf_rs1_data, rf_rs2_data = rf_data[s]
+            o = InstLatch()
+            o.pc            = r.pc
+            o.inst          = self.inst[s]
+            o.exception     = self.exception[s]
+            o.rd            = sig.rd
+            o.c_br_type     = sig.br_type
+            o.c_alu_fun     = sig.alu_fun
+            o.c_wb_sel      = sig.wb_sel
+            o.c_rf_wen      = sig.rf_wen
+            o.c_dmem_en     = sig.dmem_en
+            o.c_dmem_rw     = sig.dmem_rw
+            o.p_type        = sig.p_type
+
+            src = fwd.get(sig.rs1) if sig.rs1_oen else None
+            o.op1_data  =   r.pc        if sig.op1_sel == OP1_PC    else \
+                            src()       if src                      else \
+                            rf_rs1_data
+            src = fwd.get(sig.rs2) if sig.op2_rs2 else None
+            o.op2_data  =   src()       if src                      else \
+                            rf_rs2_data if sig.op2_rs2              else \
+                            sig.imm
+            src = fwd.get(sig.rs2) if sig.rs2_oen else None
+            o.rs2_data  =   src()       if src                      else \
+                            rf_rs2_data
+            o.sp_data       = o.op1_data
+            o.pcplus4       = r.pcplus4
+            o.taken         = r.taken
+            self.out.append(o)
+
+
+    def update(self):
+
+        C = Pipe.CTL
+        if C.EX_stall:
+            pass                    # EX keeps its instructions
+        elif C.EX_bubble:
+            Pipe.EX.reg             = bubbles(self.pc)
+        else:
+            Pipe.EX.reg             = self.out[:C.issue] + bubbles(self.pc)[C.issue:]
+
+            # When only the first instruction issues, the second one moves up
+            # and waits for the next cycle
+            if C.ID_stall and C.issue:
+                self.reg            = [ self.reg[1], FetchLatch() ]
+                self.reg[1].bubble(self.pc[1])
+
+        # Issue slot utilization (empty slots do not count)
+        issued = 0 if C.EX_stall or C.EX_bubble else \
+                 sum(1 for s in range(C.issue) if self.inst[s] != BUBBLE or self.exception[s])
+        counter = Pipe.cpu.issue
+        counter.issued[issued] += 1
+        if C.hold is not None:
+            counter.held[C.hold] = counter.held.get(C.hold, 0) + 1
+
+        for s in range(WIDTH):
+            Pipe.log(S_ID, self.pc[s], self.inst[s], self.log(s), s)
+
+    def flush(self, pc):
+        for r in self.reg:
+            r.bubble(WORD(0))
+
+    def log(self, s):
+        if self.inst[s] in [ BUBBLE, ILLEGAL ]:
+            return('# -')
+        sig = self.sig[s]
+        held = '' if s < Pipe.CTL.issue else ' (held: %s)' % (Pipe.CTL.hold or 'stall')
+        return("# rd=%d rs1=%d rs2=%d op1=0x%08x op2=0x%08x%s" % (sig.rd, sig.rs1, sig.rs2,
+               self.out[s].op1_data, self.out[s].op2_data, held))
+
+
+#--------------------------------------------------------------------------
+#   DualEX: two ALUs, one multiplier/divider, and one branch unit
+#--------------------------------------------------------------------------
+
+class DualEX(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)     # Pipe.EX.reg
+
+        #--------------------------------------------------
+
+        # Multiply/divide in progress: latch of the instruction and cycles left
+        self.wait_t         = None
+        self.wait           = 0
+
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.EX.t (latches of the instructions in EX)
+        #   self.stall              # Pipe.EX.stall (waiting for the multiplier/divider)
+        #   self.pc                 # Pipe.EX.pc
+        #   self.inst               # Pipe.EX.inst
+        #   self.exception          # Pipe.EX.exception
+        #
+        #   self.alu2_data          # Pipe.EX.alu2_data
+        #   self.alu_out            # Pipe.EX.alu_out
+        #   self.brjmp_target       # Pipe.EX.brjmp_target
+        #   self.jump_reg_target    # Pipe.EX.jump_reg_target
+        #
+        #----------------------------------------------
+
+
+    def compute(self):
+
+        t = self.t              = self.reg
+        self.pc                 = [ x.pc for x in t ]
+        self.inst               = [ x.inst for x in t ]
+        self.exception          = [ x.exception for x in t ]
+
+        # Branches compare rs1 and rs2 (op2_data holds the offset)
+        self.alu2_data  = [ x.rs2_data if x.c_br_type in [ BR_NE, BR_EQ, BR_GE, BR_GEU, BR_LT, BR_LTU ] else \
+                            x.op2_data for x in t ]
+        self.alu_out    = [ alu.op(x.c_alu_fun, x.op1_data, b)
+                            for alu, x, b in zip([ Pipe.cpu.alu, Pipe.cpu.alu2 ], t, self.alu2_data) ]
+
+        # A pair has at most one RV32M instruction, which holds the pair in EX
+        self.stall = False
+        for x in t:
+            if x.c_alu_fun in MULDIV_OPS and not x.exception:
+                if x is not self.wait_t:
+                    self.wait_t = x
+                    self.wait = Pipe.cpu.muldiv.access(x.c_alu_fun)
+                if self.wait > 0:
+                    self.wait -= 1
+                    self.stall = True
+                    if not Pipe.MM.stall:
+                        Pipe.cpu.muldiv.stall_cycles += 1
+
+        # A pair has at most one control transfer, so the targets are computed
+        # for both but used for one
+        self.jump_reg_target    = [ a & WORD(0xfffffffe) for a in self.alu_out ]
+        self.brjmp_target       = [ Pipe.cpu.adder_brtarget.op(x.pc, x.op2_data) for x in t ]
+
+        # For jal and jalr instructions, pc+4 should be written to the rd
+        for s in range(WIDTH):
+            if t[s].c_wb_sel == WB_PC4:
+                self.alu_out[s] = t[s].pcplus4
+
+
+    def update(self):
+
+        # Only the last instruction of a pair can be a control transfer or be
+        # predicted taken, so a mispredict never cancels the other slot.
+        C = Pipe.CTL
+        if C.MM_stall:
+            pass                    # MM keeps its instructions; EX redoes these
+        elif self.stall:
+            Pipe.MM.reg             = bubbles(self.pc)
+        elif C.MM_bubble:
+            Pipe.MM.reg             = bubbles(self.pc, self.exception)
+        else:
+            for s in range(WIDTH):
+                x = self.t[s]
+                x.alu_out           = self.alu_out[s]
+                x.sp_data_plus4     = self.alu_out[s]
+
+                # for BTB
+                if x.inst != BUBBLE and x.taken == TAKEN_1 and C.pc_sel[s] != PC_BRJMP:
+                    Pipe.cpu.btb.remove(x.pc)
+                elif x.inst != BUBBLE and x.taken == TAKEN_0 and C.pc_sel[s] == PC_BRJMP:
+                    Pipe.cpu.btb.add(x.pc, self.brjmp_target[s])
+            Pipe.MM.reg             = self.t
+
+        for s in range(WIDTH):
+            Pipe.log(S_EX, self.pc[s], self.inst[s], self.log(s), s)
+
+    def flush(self, pc):
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)
+        self.wait_t         = None
+
+    def log(self, s):
+        x = self.t[s]
+        if self.stall:
+            return('# multiply/divide, %d cycles left' % self.wait)
+        if self.inst[s] == BUBBLE:
+            return('# -')
+        b = self.alu2_data[s]
+        return(ALU_LOG[x.c_alu_fun].format(o = self.alu_out[s], a = x.op1_data, b = b, sh = b & 0x1f))
+
+
+#--------------------------------------------------------------------------
+#   DualMM: one dmem port shared by the pair
+#--------------------------------------------------------------------------
+
+class DualMM(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)     # Pipe.MM.reg
+
+        #--------------------------------------------------
+
+        # D-cache miss in progress: latch of the instruction and cycles left
+        self.wait_t         = None
+        self.wait           = 0
+
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.MM.t (latches of the instructions in MM)
+        #   self.stall              # Pipe.MM.stall (waiting for the D-cache)
+        #   self.exception          # Pipe.MM.exception
+        #   self.c_rf_wen           # Pipe.MM.c_rf_wen
+        #   self.alu_out            # Pipe.MM.alu_out
+        #   self.sp_data_plus4      # Pipe.MM.sp_data_plus4
+        #
+        #   self.wbdata             # Pipe.MM.wbdata
+        #
+        #----------------------------------------------
+
+    def compute(self):
+
+        t = self.t          = self.reg
+        self.exception      = [ x.exception for x in t ]
+        self.c_rf_wen       = [ x.c_rf_wen for x in t ]
+        self.sp_data_plus4  = [ x.sp_data_plus4 for x in t ]
+        self.alu_out        = [ x.sp_data if x.p_type == P_POP else x.alu_out for x in t ]
+        self.wbdata         = list(self.alu_out)
+
+        # A pair has at most one load or store
+        self.stall = False
+        for s in range(WIDTH):
+            x = t[s]
+            if not x.c_dmem_en:
+                continue
+            if Pipe.cpu.dcache is not None:
+                if x is not self.wait_t:
+                    self.wait_t = x
+                    self.wait = Pipe.cpu.dcache.access(self.alu_out[s], x.c_dmem_rw == M_XWR)
+                if self.wait > 0:
+                    self.wait -= 1
+                    self.stall = True
+                    break
+
+            mem_data, status = Pipe.cpu.bus.access(True, self.alu_out[s], x.rs2_data, x.c_dmem_rw)
+            if not status:
+                self.exception[s] |= EXC_DMEM_ERROR
+                self.c_rf_wen[s] = False
+            elif Pipe.cpu.bus.halt:
+                Pipe.cpu.bus.halt = False
+                self.exception[s] |= EXC_EBREAK
+            if x.c_wb_sel == WB_MEM:
+                self.wbdata[s] = mem_data
+
+
+    def update(self):
+
+        t = self.t
+        if self.stall:
+            Pipe.WB.reg     = bubbles([ x.pc for x in t ])
+        else:
+            for s in range(WIDTH):
+                t[s].exception  = self.exception[s]
+                t[s].c_rf_wen   = self.c_rf_wen[s]
+                t[s].wbdata     = self.wbdata[s]
+
+            # The second instruction of a pair is cancelled when the first one
+            # ends the run
+            if self.exception[0]:
+                t = [ t[0], InstLatch.bubble(t[1].pc, WORD(EXC_NONE)) ]
+            Pipe.WB.reg     = t
+
+        for s in range(WIDTH):
+            Pipe.log(S_MM, self.t[s].pc, self.t[s].inst, self.log(s), s)
+
+    def flush(self, pc):
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)
+        self.wait_t         = None
+
+    def log(self, s):
+        x = self.t[s]
+        if self.stall:
+            return('# D-cache miss, %d cycles left' % self.wait)
+        elif not x.c_dmem_en:
+            return('# -')
+        elif x.c_dmem_rw == M_XRD:
+            return('# 0x%08x <- M[0x%08x]' % (self.wbdata[s], self.alu_out[s]))
+        else:
+            return('# M[0x%08x] <- 0x%08x' % (self.alu_out[s], x.rs2_data))
+
+
+#--------------------------------------------------------------------------
+#   DualWB: retires the pair in order through two write ports
+#--------------------------------------------------------------------------
+
+class DualWB(Pipe):
+
+    def __init__(self):
+        super().__init__()
+
+        # Pipeline registers ------------------------------
+
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)     # Pipe.WB.reg
+
+        #--------------------------------------------------
+
+        # Internal signals:----------------------------
+        #
+        #   self.t                  # Pipe.WB.t (latches of the instructions in WB)
+        #   self.wbdata             # Pipe.WB.wbdata
+        #   self.sp_data_plus4      # Pipe.WB.sp_data_plus4
+        #   self.pc                 # Pipe.WB.pc (of the last instruction retired)
+        #   self.inst               # Pipe.WB.inst
+        #   self.exception          # Pipe.WB.exception
+        #
+        #----------------------------------------------
+
+    def compute(self):
+
+        t = self.t              = self.reg
+        self.wbdata             = [ x.wbdata for x in t ]
+        self.sp_data_plus4      = [ x.sp_data_plus4 for x in t ]
+        self.retired            = 0
+
+
+    def update(self):
+
+        # The register file has two write ports: pop uses both, and the
+        # instructions of a pair then write no register (see DualControl)
+        rf = Pipe.cpu.rf
+        for s in range(WIDTH):
+            t = self.t[s]
+            self.pc, self.inst, self.exception = t.pc, t.inst, t.exception
+            if t.c_rf_wen:
+                if t.p_type == P_PUSH:
+                    rf.write(SP, t.wbdata)
+                elif t.p_type == P_POP:
+                    rf.write(t.rd, t.wbdata, SP, t.sp_data_plus4)
+                else:
+                    rf.write(t.rd, t.wbdata)
+
+            # System calls take effect as ECALL retires
+            if t.inst == ECALL:
+                if Pipe.cpu.kernel.ecall(rf.reg, Pipe.cpu.dmem.mem, int(Pipe.cpu.stat.cycle)):
+                    self.exception |= EXC_EBREAK
+
+            Pipe.log(S_WB, t.pc, t.inst, self.log(t), s)
+            self.retired = s + 1
+
+            if Pipe.cpu.commits is not None and t.inst != BUBBLE:
+                Pipe.cpu.commits.record(Pipe.cpu, t)
+
+            # Check the retired instruction against the reference model
+            if Pipe.cpu.cosim is not None and t.inst != BUBBLE:
+                if not Pipe.cpu.cosim.retire(t):
+                    return False
+
+            if self.exception:
+                return False
+        return True
+
+    def flush(self, pc):
+        self.reg            = bubbles([ WORD(0) ] * WIDTH)
+
+    # Counts the instructions retired in this cycle
+    def count(self, stat):
+        for t in self.t[:self.retired]:
+            if t.inst != BUBBLE:
+                Pipe.count_inst(stat, t.inst)
+
+    def log(self, t):
+        if t.inst == BUBBLE or not t.c_rf_wen:
+            return('# -')
+        return('# R[%d] <- 0x%08x' % (t.rd, t.wbdata))
+
+
+#--------------------------------------------------------------------------
+#   DualControl: hazard and issue logic (executed in ID stage)
+#--------------------------------------------------------------------------
+
+class DualControl(Control):
+
+    def __init__(self):
+        super().__init__()
+
+        # Internal signals:----------------------------
+        #
+        #   self.issue              # Pipe.CTL.issue (instructions of ID moving to EX)
+        #   self.hold               # Pipe.CTL.hold (why the second one waits, if it does)
+        #   self.pc_sel             # Pipe.CTL.pc_sel (for each slot of EX)
+        #   self.redirect           # Pipe.CTL.redirect (next pc after a mispredict in EX)
+        #   self.fwd                # Pipe.CTL.fwd
+        #   self.IF_stall .. self.MM_bubble as in Control
+        #
+        #----------------------------------------------
+
+        self.pair_fwd_maps  = { }
+        self.redirect       = None
+
+    # Maps register number -> function returning the value to forward.
+    # key is (rd, p_type) of each slot of EX, MM, and WB. Closer stages
+    # win, and within a stage the younger slot wins.
+    def pair_fwd_map(self, key):
+        fwd = self.pair_fwd_maps.get(key)
+        if fwd is None:
+            fwd = { }
+            for st in [ S_WB, S_MM, S_EX ]:
+                for s in range(WIDTH):
+                    k = 2 * (WIDTH * (st - S_EX) + s)
+                    rd, p_type = key[k], key[k + 1]
+                    if p_type != P_N:
+                        fwd[int(SP)] = FWD_SP2[(st, s, p_type)]
+                    if rd != 0:
+                        fwd[rd] = FWD_REG2[(st, s)]
+            self.pair_fwd_maps[key] = fwd
+        return fwd
+
+    # Returns why the second instruction of a pair cannot issue with the
+    # first one, or None
+    @staticmethod
+    def pair_hold(inst0, sig0, sig1, exceptions):
+        if inst0 == ECALL or any(exceptions):
+            return HOLD_SERIAL
+        if sig0.br_type != BR_N:
+            return HOLD_CONTROL
+        writes = set()
+        if sig0.rf_wen and sig0.rd != 0:
+            writes.add(int(sig0.rd))
+        if sig0.p_type != P_N:
+            writes.add(int(SP))
+        if (sig1.rs1_oen and int(sig1.rs1) in writes) or \
+           ((sig1.rs2_oen or sig1.op2_rs2) and int(sig1.rs2) in writes):
+            return HOLD_DEPEND
+        if sig0.dmem_en and sig1.dmem_en:
+            return HOLD_MEMPORT
+        if sig0.alu_fun in MULDIV_OPS and sig1.alu_fun in MULDIV_OPS:
+            return HOLD_MULDIV
+        ports = lambda sig: 2 if sig.p_type == P_POP else 1 if sig.rf_wen and sig.rd != 0 else 0
+        if ports(sig0) + ports(sig1) > WIDTH:
+            return HOLD_WRPORT
+        return None
+
+    def gen(self):
+
+        ID = Pipe.ID
+        sig = ID.sig
+        for s in range(WIDTH):
+            if sig[s].exception:
+                ID.exception[s] |= sig[s].exception
+                if not sig[s].valid:
+                    ID.inst[s] = BUBBLE
+
+        self.IF_stall       = False
+        self.ID_stall       = False
+        self.ID_bubble      = False
+        self.EX_stall       = False
+        self.EX_bubble      = False
+        self.MM_stall       = False
+        self.MM_bubble      = False
+        self.hold           = None
+
+        ex, mm, wb          = Pipe.EX.reg, Pipe.MM.reg, Pipe.WB.reg
+
+        # Control signal to select the next PC, for each slot of EX. At most
+        # one of them can be mispredicted.
+        self.pc_sel         = [ PC_SEL[t.c_br_type][bool(a)] for t, a in zip(ex, Pipe.EX.alu_out) ]
+        self.redirect       = None
+        for s in range(WIDTH):
+            t = ex[s]
+            if (self.pc_sel[s], t.taken) not in RIGHT_PREDICT:
+                self.redirect = Pipe.EX.jump_reg_target[s] if self.pc_sel[s] == PC_JALR  else \
+                                t.pcplus4                   if t.taken == TAKEN_1           else \
+                                Pipe.EX.brjmp_target[s]
+
+        # Forwarding sources for the registers written by each slot of EX, MM, and WB
+        key = [ ]
+        for st, lat in [ (S_EX, ex), (S_MM, mm), (S_WB, wb) ]:
+            for s in range(WIDTH):
+                wen = Pipe.MM.c_rf_wen[s] if st == S_MM else lat[s].c_rf_wen
+                key += [ int(lat[s].rd) if wen else 0, lat[s].p_type ]
+        self.fwd            = self.pair_fwd_map(tuple(key))
+
+        # Load-use data hazard of each instruction of ID against both slots of EX
+        loads = [ t.rd for t in ex if t.c_dmem_en and t.c_dmem_rw == M_XRD and t.rd != 0 ]
+        load_use = [ any((rd == x.rs1 and x.rs1_oen) or (rd == x.rs2 and x.rs2_oen) for rd in loads)
+                     for x in sig ]
+
+        # The instruction after ECALL waits in ID until ECALL has left WB.
+        # Nothing issues behind an exception, which ends the run.
+        ecall = any(t.inst == ECALL for t in ex + mm + wb)
+        drain = any(t.exception for t in ex + wb) or any(Pipe.MM.exception)
+
+        # Decide how many instructions issue. A bubble in slot 1 is empty
+        # and moves along with slot 0.
+        empty1 = ID.inst[1] == BUBBLE and not ID.exception[1]
+        if load_use[0] or ecall or drain:
+            self.issue = 0
+        elif empty1:
+            self.issue = WIDTH
+        else:
+            self.hold = HOLD_LOADUSE if load_use[1] else \
+                        self.pair_hold(ID.inst[0], sig[0], sig[1], ID.exception)
+            self.issue = 1 if self.hold else WIDTH
+
+        # A partial issue keeps ID (the second one moves up) and IF
+        mispredict          = self.redirect is not None
+        self.IF_stall       = self.issue < WIDTH
+        self.ID_stall       = self.issue < WIDTH
+        self.ID_bubble      = mispredict
+        self.EX_bubble      = self.issue == 0 or mispredict
+        if mispredict:
+            self.IF_stall   = False
+            self.ID_stall   = False
+            self.hold       = None
+
+        # D-cache misses and multiplies/divides stall the pipeline as in Control
+        if Pipe.MM.stall:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
+            self.MM_stall   = True
+        elif Pipe.EX.stall:
+            self.IF_stall   = True
+            self.ID_stall   = True
+            self.ID_bubble  = False
+            self.EX_stall   = True
+            self.EX_bubble  = False
+        if self.EX_stall:
+            self.hold       = None
+
+        # Instructions with exceptions become BUBBLE as they enter MM (see Control)
+        self.MM_bubble = any(e and e != EXC_EBREAK for e in Pipe.EX.exception) or any(Pipe.MM.exception)
@@ -0,0 +1,37 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests: the simulator modules live at the top of the tree and are run
+#   as scripts, so they are imported from there.
+#
+#==========================================================================
+
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import subprocess
+
+
+# Runs snurisc5.py (or another script of the tree) with args in a fresh
+# process, as the simulator keeps its counters in class attributes.
+# Returns (stdout, exit status).
+def snurisc5(*args, script = 'snurisc5.py', cwd = None):
+    r = subprocess.run([ sys.executable, os.path.join(ROOT, script) ] + [ str(a) for a in args ],
+                       cwd = cwd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+    return r.stdout, r.returncode
+
+# Returns the final register and dmem dumps in the output of a run with -l 2
+def state(out):
+    return [ l for l in out.splitlines() if re.match(r'\s*\w+ \(\$\d+\):|0x[0-9a-f]{8}: ', l) ]
+
+# Returns the value of a register (by its ABI name) in a register dump
+def register(out, name):
+    return int(re.search(r'\b%s \(\$\d+\):\s+(0x[0-9a-f]+)' % name, out).group(1), 16)
@@ -0,0 +1,59 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the static hazard analyzer (snurisc5.py analyze)
+#
+#==========================================================================
+
+import os
+import re
+import sys
+import subprocess
+
+from conftest import ROOT
+
+
+# A load-use stall next to the exit through SimCtl, followed by a table in
+# the text whose words decode as instructions
+TABLE = """
+    .equ    SIMCTL, 0x00100000
+    .text
+    .globl  _start
+_start:
+    li      s2, SIMCTL
+    la      a1, tbl
+    lw      a0, 0(a1)
+    lw      s1, 4(a1)
+    add     s1, s1, a0
+    sw      zero, 0(s2)
+tbl:
+    .word   0x00500293, 0x13
+"""
+
+def snurisc5(*args):
+    r = subprocess.run([ sys.executable, os.path.join(ROOT, 'snurisc5.py') ] + list(args),
+                       stdout = subprocess.PIPE, text = True)
+    assert r.returncode == 0
+    return r.stdout
+
+def register(out, name):
+    return int(re.search(r'\b%s \(\$\d+\):\s+(0x[0-9a-f]+)' % name, out).group(1), 16)
+
+def test_rewrite_keeps_data(tmp_path):
+    src, out = str(tmp_path / 'tbl.s'), str(tmp_path / 'tbl.opt')
+    with open(src, 'w') as f:
+        f.write(TABLE)
+    report = snurisc5('analyze', '-o', out, src)
+    assert '8 bytes of data skipped' in report
+    assert register(snurisc5('-l', '1', src), 's1') == 0x005002a6
+    assert register(snurisc5('-l', '1', out), 's1') == 0x005002a6
+
+def test_rewrite_same_state(tmp_path):
+    out = str(tmp_path / 'devices.opt')
+    src = os.path.join(ROOT, 'asm', 'devices.s')
+    assert '22 bytes of data skipped' in snurisc5('analyze', '-o', out, src)
+    dump = lambda s: [ l for l in s.splitlines() if re.match(r'\s*\w+ \(\$|0x[0-9a-f]{8}:', l) ]
+    assert dump(snurisc5('-l', '2', src)) == dump(snurisc5('-l', '2', out))
@@ -0,0 +1,47 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the built-in assembler (assembler.py)
+#
+#==========================================================================
+
+from consts import *
+from isa import *
+from assembler import Assembler
+
+
+# Returns the entry point and the words of the text of an assembly source
+def text_words(source):
+    entry, segments = Assembler().assemble(source)
+    start, text, flags = segments[0]
+    return int(entry), start, [ int.from_bytes(text[i:i + 4], 'little') for i in range(0, len(text), 4) ]
+
+# Returns the value li leaves in its register, from its lui and addi
+def li_value(words):
+    v = words[0] & 0xfffff000
+    if len(words) > 1 and RISCV.opcode(words[1]) == ADDI:
+        v += ((words[1] >> 20) ^ 0x800) - 0x800
+    return v & 0xffffffff
+
+
+# A label defined before li resolves to its section offset in pass 1, so li
+# should not be sized from it
+def test_li_earlier_label():
+    entry, start, words = text_words("_start:\n\tnop\nlbl:\tli a0, lbl\n\tebreak\n")
+    assert RISCV.opcode(words[1]) == LUI
+    assert RISCV.opcode(words[2]) == ADDI
+    assert li_value(words[1:3]) == start + 4
+    assert words[3] == EBREAK
+
+def test_li_later_label():
+    entry, start, words = text_words("_start:\tli a0, lbl + 4\nlbl:\tebreak\n")
+    assert li_value(words[0:2]) == start + 12
+
+def test_li_constant():
+    entry, start, words = text_words(".equ N, 0x12345000\n_start:\tli a0, N\n\tli a1, 100\n\tebreak\n")
+    assert len(words) == 3
+    assert li_value(words[0:1]) == 0x12345000
+    assert RISCV.opcode(words[1]) == ADDI
@@ -0,0 +1,129 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the cache timing model (cache.py) on a tiny cache: 2 sets of
+#   2 ways with 4-byte lines, so that addresses 0, 8, 16, 24 all map to
+#   set 0 with tags 0, 1, 2, 3 and address 4 maps to set 1.
+#
+#==========================================================================
+
+import pytest
+
+from cache import Cache, REPL_LRU, REPL_FIFO, REPL_RANDOM, WRITE_BACK, WRITE_THROUGH
+
+LAT = 10
+
+
+def tiny(repl = REPL_LRU, write = WRITE_BACK):
+    return Cache('D$', size = 16, line = 4, ways = 2, repl = repl, write = write, lat = LAT)
+
+# Runs a sequence of (addr, write) accesses, returning 'h' or 'm' for each
+def run(c, seq):
+    result = ''
+    for addr, write in seq:
+        before = c.read_misses + c.write_misses
+        c.access(addr, write)
+        result += 'h' if c.read_misses + c.write_misses == before else 'm'
+    return result
+
+def resident(c, s):
+    return sorted(int(t) for t in c.tags[s] if t >= 0)
+
+def reads(*addrs):
+    return [ (a, False) for a in addrs ]
+
+
+def test_geometry():
+    c = tiny()
+    assert c.sets == 2
+    assert run(c, reads(0, 4, 0, 4)) == 'mmhh'
+    assert resident(c, 0) == [ 0 ] and resident(c, 1) == [ 0 ]
+
+def test_lru():
+    c = tiny(REPL_LRU)
+    # 0 is touched after 8, so 16 evicts 8
+    assert run(c, reads(0, 8, 0, 16, 0, 8)) == 'mmhmhm'
+    # and 8 evicted 16, the least recently used
+    assert resident(c, 0) == [ 0, 1 ]
+    assert c.reads == 6 and c.read_misses == 4
+
+def test_fifo():
+    c = tiny(REPL_FIFO)
+    # The hit on 0 does not refresh it, so 16 evicts 0, the first filled
+    assert run(c, reads(0, 8, 0, 16, 8, 0)) == 'mmhmhm'
+    assert resident(c, 0) == [ 0, 2 ]
+
+def test_random():
+    seq = reads(0, 8, 16, 24, 0, 8, 16, 24, 0, 8)
+    a, b = tiny(REPL_RANDOM), tiny(REPL_RANDOM)
+    assert run(a, seq) == run(b, seq)
+    assert (a.tags == b.tags).all()
+    c = tiny(REPL_RANDOM)
+    for addr, _ in seq:
+        old = resident(c, 0)
+        c.access(addr, False)
+        new = resident(c, 0)
+        # The accessed line is resident and at most one line was evicted
+        assert addr // 8 in new and len(new) == min(len(set(old) | { addr // 8 }), 2)
+        assert len(set(old) - set(new)) <= (0 if addr // 8 in old else 1)
+
+def test_stall_cycles():
+    c = tiny()
+    assert [ c.access(a, False) for a in (0, 0, 8, 16) ] == [ LAT, 0, LAT, LAT ]
+    assert c.stall_cycles == 3 * LAT
+
+def test_write_back():
+    c = tiny(write = WRITE_BACK)
+    # A write miss allocates the line dirty
+    assert c.access(0, True) == LAT
+    assert c.write_misses == 1 and resident(c, 0) == [ 0 ]
+    assert run(c, [ (0, False), (8, False) ]) == 'hm'
+    # 16 evicts the dirty 0, which is written back for a double stall
+    assert c.access(16, False) == 2 * LAT
+    assert c.writebacks == 1 and resident(c, 0) == [ 1, 2 ]
+    # A write hit makes 8 dirty; the clean 16 is evicted first, then 8
+    assert c.access(8, True) == 0
+    assert c.access(24, False) == LAT
+    assert c.writebacks == 1 and resident(c, 0) == [ 1, 3 ]
+    assert c.access(0, False) == 2 * LAT
+    assert c.writebacks == 2 and resident(c, 0) == [ 0, 3 ]
+    assert c.stall_cycles == 7 * LAT
+
+def test_write_through():
+    c = tiny(write = WRITE_THROUGH)
+    # A write miss does not allocate and does not stall
+    assert c.access(0, True) == 0
+    assert c.write_misses == 1 and resident(c, 0) == [ ]
+    assert c.access(0, False) == LAT
+    # Write hits leave the line clean, so evictions are never written back
+    assert run(c, [ (0, True), (8, False), (8, True), (16, False), (24, False) ]) == 'hmhmm'
+    assert c.writebacks == 0 and not c.dirty.any()
+    assert c.stall_cycles == 4 * LAT
+
+def test_summary():
+    c = tiny()
+    run(c, reads(0, 0, 8, 0))
+    assert c.summary() == "D$: 4 accesses, 2 misses (50.00%), 0 writebacks, 20 stall cycles"
+
+def test_params():
+    assert Cache.params('I$', 'size=8k,ways=2') == dict(Cache.params('I$', { }), size = 8192, ways = 2)
+    assert Cache.params('I$', { 'size' : '1K', 'lat' : 3 })['size'] == 1024
+    c = Cache.parse('I$', 'size=16,line=4,ways=2,repl=fifo')
+    assert (c.sets, c.repl) == (2, REPL_FIFO)
+
+@pytest.mark.parametrize('spec', [
+    'size=16,line=6',
+    'size=24,line=4,ways=4',
+    'ways=0',
+    'repl=plru',
+    'write=wa',
+    'lat=-1',
+    'size=4m',
+    'sets=2',
+])
+def test_invalid(spec):
+    with pytest.raises(ValueError):
+        Cache.parse('D$', spec)
@@ -0,0 +1,84 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the commit log (commitlog.py): logs written with a small
+#   CHUNK, so that the records span several chunks, read back and
+#   converted to the text of spike --log-commits
+#
+#==========================================================================
+
+import io
+import os
+import re
+import sys
+import subprocess
+
+from conftest import ROOT
+from commitlog import CommitLog
+
+CHUNK = 4
+
+# Runs the simulator with commitlog.CHUNK patched
+RUN = '''
+import sys, runpy
+sys.path.insert(0, %r)
+import commitlog
+commitlog.CHUNK = %d
+sys.argv = [ 'snurisc5.py' ] + sys.argv[1:]
+runpy.run_path(%r, run_name = '__main__')
+'''
+
+# pop writes both t1 and sp, and reads what push stored
+PUSHPOP = '''
+    .text
+    .align  2
+    .globl  _start
+_start:
+    lui     sp, 0x80020
+    li      t0, 0x5a5
+    push    t0
+    li      t0, 7
+    pop     t1
+    ebreak
+'''
+
+
+def commit_log(tmp_path, *args):
+    log = str(tmp_path / 'commits.gz')
+    code = RUN % (ROOT, CHUNK, os.path.join(ROOT, 'snurisc5.py'))
+    out = subprocess.run([ sys.executable, '-c', code, '--commit-log', log ] + [ str(a) for a in args ],
+                         stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True).stdout
+    executed = int(re.search(r'(\d+) instructions executed', out).group(1))
+    written = int(re.search(r'Commit log: (\d+) instructions written', out).group(1))
+    # The final ebreak raises an exception and does not commit
+    assert written == executed - 1
+
+    chunks = [ len(chunk['pc']) for chunk in CommitLog.read(log) ]
+    assert len(chunks) > 1 and max(chunks) <= CHUNK
+    assert sum(chunks) == written
+
+    text = io.StringIO()
+    CommitLog.to_spike(log, text)
+    lines = text.getvalue().splitlines()
+    assert len(lines) == written
+    return lines
+
+def test_pushpop(tmp_path):
+    src = tmp_path / 'pushpop.s'
+    src.write_text(PUSHPOP)
+    lines = commit_log(tmp_path, src)
+    assert len(lines) == 5
+    assert lines[2] == "core   0: 3 0x80000008 (0x0250006b) x2  0x8001fffc mem 0x8001fffc 0x000005a5"
+    assert lines[4] == "core   0: 3 0x80000010 (0x0400036b) x6  0x000005a5 x2  0x80020000 mem 0x8001fffc"
+
+def test_rvc(tmp_path):
+    lines = commit_log(tmp_path, '--config', os.path.join(ROOT, 'configs', 'rvc.json'),
+                       os.path.join(ROOT, 'asm', 'rvc.s'))
+    pcs = [ int(l.split()[3], 16) for l in lines ]
+    insts = [ int(l.split()[4].strip('()'), 16) for l in lines ]
+    # Compressed instructions advance the pc by 2 and are logged expanded
+    assert any(b - a == 2 for a, b in zip(pcs, pcs[1:]))
+    assert all(inst & 3 == 3 for inst in insts)
@@ -0,0 +1,60 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the machine description (config.py): invalid descriptions,
+#   including wrong-typed tables, raise ValueError
+#
+#==========================================================================
+
+import os
+import json
+
+import pytest
+
+from conftest import ROOT, snurisc5
+from config import Machine
+
+
+@pytest.mark.parametrize('desc, msg', [
+    ({ 'btb' : 16 },                            "btb should be a table"),
+    ({ 'muldiv' : None },                       "muldiv should be a table"),
+    ({ 'memory' : None },                       "memory should be a table"),
+    ({ 'memory' : { 'imem' : 0 } },             "memory.imem should be a table"),
+    ({ 'icache' : True },                       "icache should be a table"),
+    ({ 'dcache' : [ 4096 ] },                   "dcache should be a table"),
+    ({ 'icache' : { 'sets' : 2 } },             "I-cache: unknown parameter 'sets'"),
+    ({ 'btb' : { 'entries' : 12 } },            "btb.entries 12 is not a power of two"),
+    ({ 'btb' : { 'entries' : True } },          "invalid value 'True' for btb.entries"),
+    ({ 'muldiv' : { 'mul_lat' : '3x' } },       "invalid value '3x' for muldiv.mul_lat"),
+    ({ 'cores' : 0 },                           "invalid number of cores 0"),
+    ({ 'rvc' : 1 },                             "rvc should be true or false"),
+    ({ 'split' : 'ex' },                        "split should be a list"),
+    ({ 'issue' : 2, 'rvc' : True },             "rvc is supported only with issue width 1"),
+    ({ 'btbs' : { } },                          "unknown key 'machine.btbs'"),
+    ({ 'memory' : { 'uart' : { 'start' : 0x80000000 } } }, "memory.uart shares the page"),
+])
+def test_invalid(desc, msg):
+    with pytest.raises(ValueError, match = msg):
+        Machine(desc)
+
+@pytest.mark.parametrize('off', [ None, False ])
+def test_removed(off):
+    m = Machine({ 'icache' : off, 'dcache' : off, 'memory' : { 'uart' : off } })
+    assert m.icache is None and m.dcache is None
+    assert sorted(m.devices) == [ 'simctl', 'timer' ]
+
+def test_numbers():
+    m = Machine({ 'memory' : { 'dmem' : { 'start' : '0x80100000', 'size' : '1M' } },
+                  'icache' : 'size=8k,ways=2', 'dcache' : { 'size' : '2k' } })
+    assert (m.dmem_start, m.dmem_size) == (0x80100000, 1 << 20)
+    assert (m.icache['size'], m.icache['ways'], m.dcache['size']) == (8192, 2, 2048)
+
+def test_config_file(tmp_path):
+    config = tmp_path / 'bad.json'
+    config.write_text(json.dumps({ 'btb' : 16 }))
+    out, status = snurisc5('--config', config, os.path.join(ROOT, 'asm', 'fib'))
+    assert "Invalid machine description: btb should be a table" in out
+    assert "instructions executed" not in out
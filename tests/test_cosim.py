@@ -0,0 +1,81 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the co-simulation checker (cosim.py): clean runs pass, and a
+#   fault injected into the pipeline's ALU is reported whether it is seen
+#   on a checked retirement, while catching up, or only at the exit.
+#
+#==========================================================================
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, snurisc5
+
+FIB = os.path.join(ROOT, 'asm', 'fib')
+
+# Runs snurisc5.py with ALU.op off by one for 'addi a0, s0, -2' (0x80000038
+# in fib). The reference model has its own ALU, so only the pipeline is hit.
+FAULT = '''
+import sys
+sys.path.insert(0, %r)
+import components
+from consts import *
+op = components.ALU.op
+def faulty(self, alufun, alu1, alu2):
+    out = op(self, alufun, alu1, alu2)
+    return WORD(out + 1) if alufun == ALU_ADD and alu2 == 0xfffffffe else out
+components.ALU.op = faulty
+import snurisc5
+snurisc5.main()
+''' % ROOT
+
+
+def executed(out):
+    return int(re.search(r'(\d+) instructions executed', out).group(1))
+
+def faulty(tmp_path, every):
+    script = tmp_path / 'fault.py'
+    script.write_text(FAULT)
+    out, _ = snurisc5('--cosim', every, FIB, script = str(script))
+    assert 'no divergence' not in out
+    return out
+
+@pytest.mark.parametrize('name', [ 'fib', 'sum100', 'branch', 'psum.s', 'muldiv.s', 'hello.s', 'loaduse.s' ])
+def test_clean(name):
+    out, _ = snurisc5('--cosim', 1, os.path.join(ROOT, 'asm', name))
+    n = executed(out)
+    assert "Cosim: %d of %d retirements checked, no divergence" % (n, n) in out
+
+@pytest.mark.parametrize('every, checked', [ (2, 81), (7, 23), (1000, 0) ])
+def test_clean_sampled(every, checked):
+    out, _ = snurisc5('--cosim', every, FIB)
+    assert "Cosim: %d of 162 retirements checked, no divergence" % checked in out
+
+def test_fault(tmp_path):
+    out = faulty(tmp_path, 1)
+    assert "Cosim: divergence at retirement 45, 0x80000038: addi   a0, s0, -2\n" \
+           "    R[10]: pipe 0x00000001, ref 0x00000000\n" in out
+    # The run stops right after the faulty instruction
+    assert executed(out) == 45
+
+def test_fault_sampled(tmp_path):
+    # The fault is at retirement 45, which is caught up at the check of
+    # retirement 48 and shows in the register file
+    out = faulty(tmp_path, 4)
+    assert "Cosim: divergence at retirement 48, 0x80000014: bge    a5, a0, 0x80000058\n" \
+           "    R[10]: pipe 0x00000001, ref 0x00000000\n" in out
+    assert executed(out) == 48
+
+def test_fault_at_exit(tmp_path):
+    # Nothing is checked before the exit, where the reference catches up
+    # and ends long before the pipeline, which took the wrong path
+    out = faulty(tmp_path, 1000)
+    assert "Cosim: divergence at retirement 163\n" \
+           "    ref stopped at 0x8000000c (ebreak) after 162 of 338 unchecked retirements\n" in out
+    assert executed(out) == 338
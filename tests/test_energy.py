@@ -0,0 +1,32 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the energy model (energy.py): the activity counts of asm/fib
+#   and their split between its functions
+#
+#==========================================================================
+
+import os
+import re
+
+from conftest import ROOT, snurisc5
+
+ENERGY = os.path.join(ROOT, 'configs', 'energy.json')
+
+
+def test_fib():
+    out, status = snurisc5('-l', 0, '--energy', ENERGY, os.path.join(ROOT, 'asm', 'fib'))
+    assert "162 instructions executed in 212 cycles." in out
+    assert "  activity: 207 RF reads, 110 RF writes (+0 on the second port), 243 adder uses, 212 imem reads, " \
+           "21 dmem reads, 21 dmem writes, 212 BTB lookups, 9 BTB updates, 1060 latch loads\n" in out
+    funcs = { name : (int(cycles), int(insts)) for name, cycles, insts in
+              re.findall(r'^    (\w+) .* in +(\d+) cycles, +(\d+) instructions', out, re.M) }
+    assert funcs == { 'fib' : (200, 158), '_start' : (12, 4) }
+
+def test_issue2():
+    out, status = snurisc5('--issue', 2, '--energy', ENERGY, os.path.join(ROOT, 'asm', 'fib'))
+    assert "The energy model is supported only in pipe mode with issue width 1" in out
+    assert "[--commit-log file] [--energy file] filename" in out
@@ -0,0 +1,39 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the analytic timing estimator (estimate.py): its cycle counts
+#   match the pipeline exactly on the machine it models.
+#
+#==========================================================================
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, snurisc5
+from workload import Workload, PRESETS
+
+KS = [ 0, 2, 4 ]
+
+
+def compare(exe):
+    out, status = snurisc5('-b', ','.join(str(k) for k in KS), exe, script = 'estimate.py')
+    assert status == 0
+    estimates = { int(k) : int(c) for k, c in re.findall(r'k = +(\d+): (\d+) cycles', out) }
+    for k in KS:
+        out, status = snurisc5('-l', '0', '-b', k, exe)
+        assert estimates[k] == int(re.search(r'executed in (\d+) cycles', out).group(1))
+
+@pytest.mark.parametrize('name', [ 'fib', 'sum100', 'branch', 'psum.s', 'muldiv.s', 'hello.s', 'loaduse.s' ])
+def test_programs(name):
+    compare(os.path.join(ROOT, 'asm', name))
+
+@pytest.mark.parametrize('preset', [ 'mixed', 'loaduse', 'branch', 'pushpop' ])
+def test_workloads(tmp_path, preset):
+    exe = str(tmp_path / preset)
+    Workload(**dict(PRESETS[preset], count = 5000)).save(exe)
+    compare(exe)
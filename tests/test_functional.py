@@ -0,0 +1,63 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the functional model (functional.py), the reference of cosim
+#   and fast-forwarding: it should end in the same state as the pipeline.
+#
+#==========================================================================
+
+import os
+
+import pytest
+
+from conftest import ROOT, snurisc5, state
+from workload import Workload, PRESETS
+
+
+# devices.s is left out as it reads the timer, which counts instructions
+# instead of cycles in func mode
+PROGRAMS = [ ('fib', [ ]), ('sum100', [ ]), ('branch', [ ]), ('fib.s', [ ]), ('psum.s', [ ]),
+             ('muldiv.s', [ ]), ('hello.s', [ ]), ('loaduse.s', [ ]), ('forward.s', [ ]),
+             ('rvc.s', [ '--config', os.path.join(ROOT, 'configs', 'rvc.json') ]) ]
+
+def same_state(exe, opts):
+    func, fs = snurisc5('-m', 'func', '-l', '2', *(opts + [ exe ]))
+    pipe, ps = snurisc5('-l', '2', *(opts + [ exe ]))
+    assert fs == ps
+    assert state(func) and state(func) == state(pipe)
+
+@pytest.mark.parametrize('name, opts', PROGRAMS)
+def test_programs(name, opts):
+    same_state(os.path.join(ROOT, 'asm', name), opts)
+
+@pytest.mark.parametrize('preset', [ 'mixed', 'pushpop' ])
+def test_workload(tmp_path, preset):
+    exe = str(tmp_path / preset)
+    Workload(**dict(PRESETS[preset], count = 5000)).save(exe)
+    same_state(exe, [ ])
+
+
+# A block translated from imem is dropped when a word of it is written
+def test_invalidate(tmp_path):
+    from snurisc5 import SNURISC5, Program
+    from functional import Functional
+    from assembler import Assembler
+
+    src = str(tmp_path / 'inc.s')
+    with open(src, 'w') as f:
+        f.write("_start:\n\taddi a0, a0, 1\n\tebreak\n")
+    cpu = SNURISC5()
+    entry = Program().load(cpu, src)
+    f = Functional(cpu)
+    f.run(entry)
+    assert int(entry) in f.blocks
+    assert cpu.rf.reg[10] == 1
+
+    _, segments = Assembler().assemble("_start:\n\taddi a0, a0, 5\n\tebreak\n")
+    cpu.imem.load(entry, int.from_bytes(segments[0][1][0:4], 'little'))
+    assert int(entry) not in f.blocks
+    f.run(entry)
+    assert cpu.rf.reg[10] == 6
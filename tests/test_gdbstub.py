@@ -0,0 +1,121 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the GDB stub (gdbstub.py) at the socket level: a session of
+#   remote serial protocol packets against asm/fib, checking the stop
+#   replies and the pc after each of them.
+#
+#==========================================================================
+
+import os
+import sys
+import socket
+import subprocess
+
+import pytest
+
+from conftest import ROOT, register
+
+
+#--------------------------------------------------------------------------
+#   RSP: a minimal remote serial protocol client
+#--------------------------------------------------------------------------
+
+class RSP(object):
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout = 30)
+        self.file = self.sock.makefile('rb')
+
+    # Sends a packet and returns the data of the reply
+    def __call__(self, data):
+        data = data.encode('latin-1')
+        self.sock.sendall(b'$' + data + b'#%02x' % (sum(data) & 0xff))
+        assert self.file.read(1) == b'+'
+        assert self.file.read(1) == b'$'
+        reply = b''
+        c = self.file.read(1)
+        while c != b'#':
+            reply += c
+            c = self.file.read(1)
+        assert int(self.file.read(2), 16) == sum(reply) & 0xff
+        self.sock.sendall(b'+')
+        return reply.decode('latin-1')
+
+    def pc(self):
+        return int.from_bytes(bytes.fromhex(self('p20')), 'little')
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+@pytest.fixture
+def gdb():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    p = subprocess.Popen([ sys.executable, os.path.join(ROOT, 'snurisc5.py'), '--gdb', str(port),
+                           os.path.join(ROOT, 'asm', 'fib') ], stdout = subprocess.PIPE, text = True)
+    try:
+        while 'Waiting for GDB' not in p.stdout.readline():
+            pass
+        rsp = RSP(port)
+        yield p, rsp
+        rsp.close()
+    finally:
+        p.kill()
+        p.wait()
+
+
+def test_session(gdb):
+    p, rsp = gdb
+    assert rsp('?') == 'S05'
+    assert rsp.pc() == 0x80000000
+
+    # Single step over 'lui sp, 0x80020000'
+    assert rsp('s') == 'S05'
+    assert rsp.pc() == 0x80000004
+    assert rsp('p2') == '00000280'
+
+    # Breakpoint at the entry of fib
+    assert rsp('Z0,80000010,4') == 'OK'
+    assert rsp('c') == 'S05'
+    assert rsp.pc() == 0x80000010
+    assert rsp('z0,80000010,4') == 'OK'
+
+    # The first frame saves ra at 0x8001fffc with 'sw ra, 12(sp)' at
+    # 0x8000001c and restores it with 'lw ra, 12(sp)' at 0x80000044 on the
+    # way out; the run stops right after the access
+    assert rsp('Z2,8001fffc,4') == 'OK'
+    assert rsp('c') == 'T05watch:8001fffc;'
+    assert rsp.pc() == 0x80000020
+    assert rsp('m8001fffc,4') == '0c000080'
+    assert rsp('z2,8001fffc,4') == 'OK'
+    assert rsp('Z3,8001fffc,4') == 'OK'
+    assert rsp('c') == 'T05rwatch:8001fffc;'
+    assert rsp.pc() == 0x80000048
+    assert rsp('z3,8001fffc,4') == 'OK'
+
+    # Registers and memory; t0 and 0x80010000 are not used by fib
+    assert rsp('P5=78563412') == 'OK'
+    assert rsp('p5') == '78563412'
+    assert rsp('p21') == 'E01'
+    g = rsp('g')
+    assert len(g) == 33 * 8
+    assert g[5 * 8 : 6 * 8] == '78563412' and g[32 * 8 :] == '48000080'
+    assert rsp('M80010000,4:deadbeef') == 'OK'
+    assert rsp('m80010000,4') == 'deadbeef'
+    assert rsp('m0,4') == 'E01'
+
+    # Run to the end: exit status 0
+    assert rsp('c') == 'W00'
+    out = p.stdout.read()
+    assert p.wait() == 0
+    assert '162 instructions executed' in out
+    assert register(out, 'a0') == 8 and register(out, 't0') == 0x12345678
+    assert '0x80010000:  de ad be ef' in out
@@ -0,0 +1,92 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the RV32M multiplier/divider: muldiv() against a reference
+#   written from the ISA manual, and asm/muldiv.s, which checks the
+#   corner cases of division itself
+#
+#==========================================================================
+
+import os
+import re
+import itertools
+
+import pytest
+
+from conftest import ROOT, snurisc5, register
+from consts import *
+from components import muldiv
+
+
+#--------------------------------------------------------------------------
+#   Reference
+#--------------------------------------------------------------------------
+
+def s(x):
+    return x - (1 << 32) if x & 0x80000000 else x
+
+def quotient(a, b):
+    # Rounds toward zero
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+def reference(op, a, b):
+    if op == ALU_MUL:
+        r = s(a) * s(b)
+    elif op == ALU_MULH:
+        r = (s(a) * s(b)) >> 32
+    elif op == ALU_MULHSU:
+        r = (s(a) * b) >> 32
+    elif op == ALU_MULHU:
+        r = (a * b) >> 32
+    elif op == ALU_DIV:
+        r = -1 if b == 0 else s(a) if (s(a), s(b)) == (-2 ** 31, -1) else quotient(s(a), s(b))
+    elif op == ALU_DIVU:
+        r = 2 ** 32 - 1 if b == 0 else a // b
+    elif op == ALU_REM:
+        r = a if b == 0 else 0 if (s(a), s(b)) == (-2 ** 31, -1) else s(a) - s(b) * quotient(s(a), s(b))
+    else:
+        r = a if b == 0 else a % b
+    return r & 0xffffffff
+
+VALUES = [ 0, 1, 2, 7, 0x7fffffff, 0x80000000, 0x80000001, 0x12345678,
+           0xfffffff9, 0xfffffffe, 0xffffffff ]
+
+OPS = [ ('mul', ALU_MUL), ('mulh', ALU_MULH), ('mulhsu', ALU_MULHSU), ('mulhu', ALU_MULHU),
+        ('div', ALU_DIV), ('divu', ALU_DIVU), ('rem', ALU_REM), ('remu', ALU_REMU) ]
+
+
+@pytest.mark.parametrize('name, op', OPS)
+def test_reference(name, op):
+    for a, b in itertools.product(VALUES, VALUES):
+        assert muldiv(op, a, b) == reference(op, a, b), "%s 0x%08x, 0x%08x" % (name, a, b)
+
+@pytest.mark.parametrize('op, a, b, result', [
+    (ALU_DIV,    7,          0,          0xffffffff),   # x / 0 = -1
+    (ALU_DIVU,   7,          0,          0xffffffff),   # x / 0 = 2^32 - 1
+    (ALU_REM,    0xfffffff9, 0,          0xfffffff9),   # x % 0 = x
+    (ALU_REMU,   7,          0,          7),
+    (ALU_DIV,    0x80000000, 0xffffffff, 0x80000000),   # -2^31 / -1 overflows to -2^31
+    (ALU_REM,    0x80000000, 0xffffffff, 0),
+    (ALU_DIV,    0xfffffff9, 2,          0xfffffffd),   # -7 / 2 = -3, rounded toward zero
+    (ALU_REM,    0xfffffff9, 2,          0xffffffff),   # -7 % 2 = -1, the sign of the dividend
+    (ALU_MULH,   0xffffffff, 0xffffffff, 0),            # -1 x -1
+    (ALU_MULHSU, 0xffffffff, 0xffffffff, 0xffffffff),   # -1 x (2^32 - 1)
+    (ALU_MULHU,  0xffffffff, 0xffffffff, 0xfffffffe),   # (2^32 - 1)^2
+    (ALU_MULH,   0x80000000, 0x80000000, 0x40000000),   # (-2^31)^2
+    (ALU_MULHSU, 0x80000000, 0x80000000, 0xc0000000),   # -2^31 x 2^31
+])
+def test_boundaries(op, a, b, result):
+    assert muldiv(op, a, b) == result
+
+@pytest.mark.parametrize('opts', [ [ ], [ '--split', 'ex' ], [ '-m', 'func' ] ])
+def test_program(opts):
+    out, status = snurisc5(*(opts + [ os.path.join(ROOT, 'asm', 'muldiv.s') ]))
+    assert register(out, 'a0') == 3628800
+    assert register(out, 'a1') == 21
+    assert register(out, 'a2') == 0
+    if '-m' not in opts:
+        assert int(re.search(r'Mul/div: .*, (\d+) stall cycles', out).group(1)) > 0
@@ -0,0 +1,30 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the proxy kernel (pk.py) with asm/hello.s
+#
+#==========================================================================
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, snurisc5, register
+
+
+@pytest.mark.parametrize('mode', [ 'pipe', 'func' ])
+def test_hello(mode):
+    out, status = snurisc5('-m', mode, os.path.join(ROOT, 'asm', 'hello.s'))
+    assert status == 3
+    assert "Hello, world!\nProgram exited with code 3\n" in out
+
+    # brk(0) returns the end of the data, rounded up to 8 bytes, and
+    # brk(s0 + 64) moves it up; the new end is stored at the old one
+    s0 = register(out, 's0')
+    assert s0 == 0x80010010
+    word = re.search(r'0x%08x:  .*\(0x([0-9a-f]{8})\)' % s0, out).group(1)
+    assert int(word, 16) == s0 + 64
@@ -0,0 +1,114 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the run control API and of the cycle limit
+#
+#==========================================================================
+
+import os
+import sys
+import subprocess
+
+from conftest import ROOT, snurisc5
+
+from snurisc5 import *
+
+FIB = os.path.join(ROOT, 'asm', 'fib')
+
+
+# Runs code after starting fib on a fresh core in another process (Stat is
+# shared by the cores of a process) and returns the lines it prints
+def api(code, budget = 0):
+    prelude = "import sys\nsys.path.insert(0, %r)\nfrom snurisc5 import *\ncpu = SNURISC5()\n" \
+              "cpu.start(Program().load(cpu, %r), budget = %d)\n" % (ROOT, FIB, budget)
+    r = subprocess.run([ sys.executable, '-c', prelude + code ], stdout = subprocess.PIPE, text = True)
+    assert r.returncode == 0
+    return r.stdout.splitlines()[1:]            # after 'Loading file'
+
+
+def test_conditions_met_at_start():
+    cpu = SNURISC5()
+    cpu.start(Program().load(cpu, os.path.join(ROOT, 'asm', 'fib')), budget = 20)
+    r = cpu.step(0)
+    assert (r.status, r.cycle, r.pc) == (RUN_CYCLE, 0, 0)
+    assert cpu.run_until().status == RUN_TIMEOUT
+    assert cpu.run_until(icount = 1000).status == RUN_TIMEOUT  # the budget stays exhausted
+    assert RunResult(cpu, RUN_ERROR).status == RUN_ERROR
+
+def test_timeout_status():
+    args = [ sys.executable, os.path.join(ROOT, 'snurisc5.py'), '-l', '0' ]
+    exe = os.path.join(ROOT, 'asm', 'fib')
+    r = subprocess.run(args + [ '--max-cycles', '50', exe ], stdout = subprocess.DEVNULL)
+    assert r.returncode == TIMEOUT_STATUS
+    r = subprocess.run(args + [ exe ], stdout = subprocess.DEVNULL)
+    assert r.returncode == 0
+
+def test_pc():
+    assert api("print(cpu.run_until(pc = 0x80000034))") == [
+        "RunResult(pc, cycle=56, icount=44, pc=0x80000034)" ]
+
+def test_pc_until_exit():
+    # fib returns to 0x80000034 once for each call of the first recursion
+    out = api("""
+r = cpu.run_until(pc = 0x80000034)
+while True:
+    print(r)
+    if r.done:
+        break
+    r = cpu.run_until(pc = 0x80000034)
+print(cpu.run_until(pc = 0x80000034))
+""")
+    assert [ l.split(',')[:2] for l in out ] == \
+           [ [ 'RunResult(pc', ' cycle=%d' % c ] for c in [ 56, 75, 92, 114, 139, 170, 187 ] ] + \
+           [ [ 'RunResult(exit', ' cycle=212' ] ] * 2
+    assert out[-1] == "RunResult(exit, cycle=212, icount=162, pc=0x8000000c, Execution completed)"
+
+def test_icount_and_predicate():
+    assert api("""
+print(cpu.run_until(icount = 100))
+print(cpu.run_until(predicate = lambda cpu: cpu.rf.reg[10] == 3))
+print(cpu.run_until(icount = 100))
+print(cpu.run_until(cycle = 100))
+""") == [ "RunResult(icount, cycle=132, icount=100, pc=0x80000044)",
+          "RunResult(predicate, cycle=140, icount=106, pc=0x80000038)",
+          "RunResult(icount, cycle=140, icount=106, pc=0x80000038)",
+          "RunResult(cycle, cycle=140, icount=106, pc=0x80000038)" ]
+
+def test_steps():
+    out = api("""
+r = cpu.step(0)
+while not r.done:
+    r = cpu.step(50)
+    print(r.status, r.cycle)
+print(r.exit_code, r.exception == EXC_EBREAK)
+""")
+    assert out == [ "cycle 50", "cycle 100", "cycle 150", "cycle 200", "exit 212", "None True" ]
+
+def test_budget():
+    assert api("print(cpu.run_until(pc = 0x80000034))\nprint(cpu.run_until())", budget = 100) == [
+        "RunResult(pc, cycle=56, icount=44, pc=0x80000034)",
+        "RunResult(timeout, cycle=100, icount=76, pc=0x8000001c)" ]
+
+def test_fork():
+    out = api("""
+cpu.run_until(icount = 50)
+deltas = [ { }, { 'btb' : { 'entries' : 64 } }, { 'btb' : { 'entries' : 1 } }, { 'rvc' : True } ]
+for r in cpu.fork(deltas):
+    print(r.status, r.cycle, r.delta, r.message, r.stats and r.stats['units'][-1])
+print(cpu.run_until(), cpu.rf.reg[10])
+""")
+    # The empty delta reproduces the unforked run, a delta that cannot be
+    # applied comes back with the counters at the fork, and the parent goes
+    # on from where it forked as if nothing had happened
+    unforked, status = snurisc5('-l', '0', FIB)
+    assert "162 instructions executed in 212 cycles." in unforked
+    assert out == [
+        "exit 212 {} Execution completed BTB: 16 entries (3 in use), 20 hits in 212 lookups (9.43%), 6 adds (0 replaced another pc)",
+        "exit 212 {'btb': {'entries': 64}} Execution completed BTB: 64 entries (3 in use), 20 hits in 212 lookups (9.43%), 6 adds (0 replaced another pc)",
+        "exit 230 {'btb': {'entries': 1}} Execution completed BTB: 1 entries (0 in use), 7 hits in 230 lookups (3.04%), 17 adds (13 replaced another pc)",
+        "error 64 {'rvc': True} ValueError: rvc cannot change in the middle of a run "
+        "BTB: 16 entries (4 in use), 4 hits in 64 lookups (6.25%), 4 adds (0 replaced another pc)",
+        "RunResult(exit, cycle=212, icount=162, pc=0x8000000c, Execution completed) 8" ]
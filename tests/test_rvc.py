@@ -0,0 +1,59 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of RV32C (rvc.py): expansion of known parcels into the 32-bit
+#   instructions they stand for, and asm/rvc.s on a machine with rvc
+#
+#==========================================================================
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, snurisc5, register
+from consts import *
+from rvc import expand, compress
+
+
+@pytest.mark.parametrize('parcel, inst, asm', [
+    (0x0808, 0x01010513, "c.addi4spn a0, sp, 16  -> addi a0, sp, 16"),
+    (0x41c8, 0x0045a503, "c.lw a0, 4(a1)         -> lw a0, 4(a1)"),
+    (0xc1c8, 0x00a5a223, "c.sw a0, 4(a1)         -> sw a0, 4(a1)"),
+    (0xa021, 0x0080006f, "c.j 8                  -> jal zero, 8"),
+    (0x3ff5, 0xffdff0ef, "c.jal -4               -> jal ra, -4"),
+    (0xc501, 0x00050463, "c.beqz a0, 8           -> beq a0, zero, 8"),
+    (0xfc75, 0xfe041ee3, "c.bnez s0, -4          -> bne s0, zero, -4"),
+    (0x8082, 0x00008067, "c.jr ra                -> jalr zero, 0(ra)"),
+    (0x9502, 0x000500e7, "c.jalr a0              -> jalr ra, 0(a0)"),
+    (0x952e, 0x00b50533, "c.add a0, a1           -> add a0, a0, a1"),
+    (0x852e, 0x00b00533, "c.mv a0, a1            -> add a0, zero, a1"),
+    (0x9002, 0x00100073, "c.ebreak               -> ebreak"),
+])
+def test_expand(parcel, inst, asm):
+    assert expand(parcel) == inst
+    # The assembler's compressed form, if any, expands back
+    p = compress(inst)
+    assert p is None or expand(p) == inst
+
+@pytest.mark.parametrize('parcel, asm', [
+    (0x0000, "c.addi4spn with nzuimm = 0 (all zeros)"),
+    (0x6000, "c.flw"),
+    (0x6101, "c.addi16sp with nzimm = 0"),
+    (0x6501, "c.lui with nzimm = 0"),
+    (0x9001, "c.srli with shamt[5] = 1"),
+    (0x9c01, "c.subw (RV64)"),
+    (0x4002, "c.lwsp with rd = 0"),
+    (0x8002, "c.jr with rs1 = 0"),
+])
+def test_reserved(parcel, asm):
+    assert expand(parcel) == ILLEGAL
+
+def test_program():
+    out, status = snurisc5('--config', os.path.join(ROOT, 'configs', 'rvc.json'), os.path.join(ROOT, 'asm', 'rvc.s'))
+    assert register(out, 'a0') == register(out, 'a1') == 55
+    assert register(out, 'a2') == 0
+    assert int(re.search(r'Fetch: .*, (\d+) split stalls', out).group(1)) == 1
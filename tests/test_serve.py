@@ -0,0 +1,58 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the simulation daemon (serve.py) and client.py: a run through
+#   the daemon prints the same and exits with the same status as a direct
+#   run, including for files that cannot be loaded
+#
+#==========================================================================
+
+import os
+import sys
+import shutil
+import signal
+import subprocess
+
+import pytest
+
+from conftest import ROOT, snurisc5
+
+
+@pytest.fixture(scope = 'module')
+def daemon(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('serve') / 'sock')
+    p = subprocess.Popen([ sys.executable, os.path.join(ROOT, 'snurisc5.py'), 'serve', '--socket', path,
+                           '--workers', '2' ], stdout = subprocess.PIPE, text = True)
+    try:
+        assert p.stdout.readline().startswith("Serving on %s" % path)
+        yield path
+    finally:
+        p.send_signal(signal.SIGTERM)
+        p.wait(timeout = 30)
+
+
+@pytest.fixture
+def programs(tmp_path):
+    for name in [ 'fib', 'hello.s' ]:
+        shutil.copy(os.path.join(ROOT, 'asm', name), tmp_path)
+    with open(os.path.join(ROOT, 'asm', 'fib'), 'rb') as f:
+        (tmp_path / 'truncated').write_bytes(f.read()[:100])
+    (tmp_path / 'junk').write_bytes(b'junk')
+    return tmp_path
+
+@pytest.mark.parametrize('args', [
+    [ 'fib' ],
+    [ '-l', '3', 'fib' ],
+    [ 'hello.s' ],                      # exits with status 3
+    [ '--max-cycles', '50', 'fib' ],    # timeout status
+    [ 'truncated' ],
+    [ 'junk' ],
+    [ 'missing' ],
+])
+def test_same_as_cli(daemon, programs, args):
+    direct = snurisc5(*args, cwd = programs)
+    served = snurisc5('--socket', daemon, *args, script = 'client.py', cwd = programs)
+    assert served == direct
@@ -0,0 +1,38 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the startup of plain runs: a run of an executable whose image
+#   is cached does not import the modules that are only used on demand.
+#
+#==========================================================================
+
+import os
+import sys
+import shutil
+import subprocess
+
+from conftest import ROOT
+
+DEFERRED = [ 'elftools', 'functional', 'cosim', 'gdbstub', 'json' ]
+
+
+# Returns the names of the modules imported by a run, from -X importtime
+def imported(args, cwd):
+    r = subprocess.run([ sys.executable, '-X', 'importtime', os.path.join(ROOT, 'snurisc5.py') ] + args,
+                       cwd = cwd, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True)
+    assert r.returncode == 0
+    return [ line.split('|')[-1].strip() for line in r.stderr.splitlines() if line.startswith('import time:') ]
+
+def test_warm_startup(tmp_path):
+    exe = str(tmp_path / 'fib')
+    shutil.copy(os.path.join(ROOT, 'asm', 'fib'), exe)
+    cold = imported([ '-l', '0', exe ], str(tmp_path))      # parses the ELF and caches the image
+    assert 'elftools' in [ m.split('.')[0] for m in cold ]
+    assert os.path.isdir(str(tmp_path / '__pycache__'))
+    modules = imported([ '-l', '0', exe ], str(tmp_path))
+    assert 'program' in modules
+    for m in modules:
+        assert m.split('.')[0] not in DEFERRED, "%s is imported on a warm run" % m
@@ -0,0 +1,71 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the 2-wide in-order variant (superscalar.py): cosim finds no
+#   divergence, and the issue counts of a program whose pairing is known
+#
+#==========================================================================
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, snurisc5
+from workload import Workload, PRESETS
+
+# Pairs issued, in order: both li; add, then the dependent add; lui, then
+# the sw through t4; lw, then the sw competing for the memory port; addi,
+# then ebreak, which does not pair. Nothing issues behind ebreak.
+PAIRS = '''
+    .text
+    .align  2
+    .globl  _start
+_start:
+    li      t0, 1
+    li      t1, 2
+    add     t2, t0, t1
+    add     t3, t2, t0
+    lui     t4, 0x80010
+    sw      t3, 0(t4)
+    lw      t5, 0(t4)
+    sw      t0, 4(t4)
+    addi    t6, t0, 3
+    ebreak
+'''
+
+
+def cosim(exe):
+    out, status = snurisc5('--issue', 2, '--cosim', 1, exe)
+    n = int(re.search(r'(\d+) instructions executed', out).group(1))
+    assert "Cosim: %d of %d retirements checked, no divergence" % (n, n) in out
+
+# ex1 and ex2 use push and pop
+@pytest.mark.parametrize('name', [ 'fib', 'psum.s', 'muldiv.s', 'ex1', 'ex2', 'sum100', 'loaduse.s' ])
+def test_cosim(name):
+    cosim(os.path.join(ROOT, 'asm', name))
+
+@pytest.mark.parametrize('preset', [ 'pushpop', 'mixed' ])
+def test_cosim_workload(tmp_path, preset):
+    exe = str(tmp_path / preset)
+    Workload(**dict(PRESETS[preset], count = 3000)).save(exe)
+    cosim(exe)
+
+def test_issue(tmp_path):
+    src = tmp_path / 'pairs.s'
+    src.write_text(PAIRS)
+    out, status = snurisc5('--issue', 2, src)
+    assert "10 instructions executed in 13 cycles." in out
+    assert "Issue: 2-wide, IPC = 0.769, 10 of 26 issue slots used (38.46%), cycles issuing 2/1/0: 1/8/4, " \
+           "held by dependency 2, memory port 1, serializing 1\n" in out
+
+@pytest.mark.parametrize('name', [ 'fib', 'sum100', 'psum.s', 'muldiv.s' ])
+def test_slots_used(name):
+    # Every issued instruction retires: wrong-path instructions never pair
+    # with a branch, and nothing issues behind the final ebreak
+    out, status = snurisc5('--issue', 2, os.path.join(ROOT, 'asm', name))
+    n = int(re.search(r'(\d+) instructions executed', out).group(1))
+    assert re.search(r'Issue: .*, %d of \d+ issue slots used' % n, out)
@@ -0,0 +1,48 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Tests of the synthetic workload generator (workload.py)
+#
+#==========================================================================
+
+import pytest
+
+from conftest import snurisc5
+from workload import Workload, PRESETS
+
+
+@pytest.mark.parametrize('params', [
+    { 'bias' : 1.5 },
+    { 'bias' : -0.1 },
+    { 'branch' : -0.1 },
+    { 'branch' : 0.6, 'mem' : 0.5 },
+    { 'count' : -5 },
+    { 'loaduse' : -1 },
+    { 'body' : 0 },
+    { 'footprint' : -4 },
+])
+def test_invalid_params(params):
+    with pytest.raises(ValueError):
+        Workload(**params)
+
+
+@pytest.mark.parametrize('bias', [ 0.0, 0.3, 1.0 ])
+def test_same_seed(bias):
+    a = Workload(count = 1000, bias = bias, seed = 7).generate()
+    b = Workload(count = 1000, bias = bias, seed = 7).generate()
+    c = Workload(count = 1000, bias = bias, seed = 8).generate()
+    assert a == b
+    assert a[0] != c[0]
+
+
+@pytest.mark.parametrize('preset', sorted(PRESETS))
+@pytest.mark.parametrize('bias', [ 0.0, 0.3, 1.0 ])
+def test_runs_to_completion(tmp_path, preset, bias):
+    exe = str(tmp_path / 'w')
+    Workload(**dict(PRESETS[preset], count = 2000, bias = bias)).save(exe)
+    out, status = snurisc5('-l', '0', exe)
+    assert status == 0
+    assert 'Execution completed' in out
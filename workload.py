@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Synthetic RV32I workload generator. Emits ELF executables that follow
+#   the memory layout of asm/link.ld without requiring a cross toolchain.
+#
+#==========================================================================
+
+import sys
+import random
+
+from consts import *
+from isa import *
+from program import *
+from config import IMEM_START, IMEM_SIZE, DMEM_START, DMEM_SIZE
+
+
+#--------------------------------------------------------------------------
+#   Register allocation
+#--------------------------------------------------------------------------
+
+R_ZERO      = 0
+R_SP        = 2
+R_GP        = 3                                 # base of the data region
+R_TP        = 4                                 # scratch for branch conditions
+R_LOOP      = [ 8, 9, 18, 19 ]                  # s0, s1, s2, s3: loop counters
+R_MASK      = 25                                # s9:  footprint - 1
+R_OFF       = 26                                # s10: offset of the window
+R_PTR       = 27                                # s11: gp + offset
+R_TEMP      = [ 5, 6, 7, 10, 11, 12, 13, 14, 15, 16, 17, 28, 29, 30, 31 ]
+
+MAX_DEPTH   = len(R_LOOP)
+MAX_FOOTPRINT = 32 * 1024                       # leaves the upper half of dmem to the stack
+STRIDE      = 64                                # window advance per inner iteration
+
+ALU_R_OPS   = [ ADD, SUB, AND, OR, XOR, SLT, SLTU, SLL, SRL, SRA ]
+ALU_I_OPS   = [ ADDI, ANDI, ORI, XORI, SLTI, SLTIU ]
+ALU_S_OPS   = [ SLLI, SRLI, SRAI ]
+
+# Taken rates that a single branch can realize with 'andi tp, ctr, 2^k-1'
+# followed by beq/bne against zero, plus the two static cases
+TAKEN_RATES = [ 0.0, 1/8, 1/4, 1/2, 3/4, 7/8, 1.0 ]
+
+
+#--------------------------------------------------------------------------
+#   Presets: one microbenchmark per hazard type
+#--------------------------------------------------------------------------
+
+PRESETS = {
+    'mixed'     : { },
+    'forward'   : { 'branch': 0.0, 'mem': 0.0,  'pushpop': 0.0 },
+    'loaduse'   : { 'branch': 0.0, 'mem': 0.4,  'pushpop': 0.0, 'loaduse': 0 },
+    'branch'    : { 'branch': 0.3, 'mem': 0.0,  'pushpop': 0.0, 'bias': 0.5 },
+    'pushpop'   : { 'branch': 0.0, 'mem': 0.0,  'pushpop': 0.3 },
+}
+
+
+#--------------------------------------------------------------------------
+#   Workload: generates a synthetic program from a set of parameters
+#--------------------------------------------------------------------------
+
+class Workload(object):
+
+    # Default parameters
+    #   count:      approximate number of dynamic instructions
+    #   depth:      loop nesting (1 - 4)
+    #   body:       number of instruction slots in the innermost loop body
+    #   branch:     fraction of body slots that are conditional branches
+    #   bias:       average taken rate of those branches
+    #   mem:        fraction of body slots that are loads or stores
+    #   loaduse:    number of independent instructions between a load and its
+    #               first use (0 = back-to-back, causing a stall)
+    #   pushpop:    fraction of body slots that start a push ... pop pair
+    #   footprint:  bytes of data memory touched (rounded up to a power of 2)
+    #   seed:       random seed
+
+    DEFAULTS = {
+        'count'     : 100000,
+        'depth'     : 2,
+        'body'      : 64,
+        'branch'    : 0.1,
+        'bias'      : 0.5,
+        'mem'       : 0.25,
+        'loaduse'   : 2,
+        'pushpop'   : 0.05,
+        'footprint' : 4096,
+        'seed'      : 0,
+    }
+
+    def __init__(self, **params):
+        for k in params:
+            if k not in Workload.DEFAULTS:
+                raise ValueError("Unknown workload parameter '%s'" % k)
+        self.p = dict(Workload.DEFAULTS, **params)
+
+        if not 1 <= self.p['depth'] <= MAX_DEPTH:
+            raise ValueError("Loop depth should be between 1 and %d" % MAX_DEPTH)
+        for k, lo in [ ('count', 1), ('body', 1), ('loaduse', 0), ('footprint', 1) ]:
+            if self.p[k] < lo:
+                raise ValueError("Parameter '%s' should be at least %d" % (k, lo))
+        if not 0.0 <= self.p['bias'] <= 1.0:
+            raise ValueError("Branch bias should be between 0 and 1")
+        for k in [ 'branch', 'mem', 'pushpop' ]:
+            if self.p[k] < 0.0:
+                raise ValueError("Density of '%s' should not be negative" % k)
+        if self.p['branch'] + self.p['mem'] + self.p['pushpop'] > 1.0:
+            raise ValueError("Densities of branch, mem, and pushpop should sum to at most 1")
+        fp = STRIDE
+        while fp < self.p['footprint']:
+            fp *= 2
+        if fp > MAX_FOOTPRINT:
+            raise ValueError("Memory footprint should be at most %d bytes" % MAX_FOOTPRINT)
+        self.footprint = fp
+
+        self.rng    = random.Random(self.p['seed'])
+        self.text   = [ ]
+
+
+    #----------------------------------------------------------------------
+    #   Instruction emitters
+    #----------------------------------------------------------------------
+
+    def emit(self, inst):
+        self.text.append(inst)
+
+    def li(self, rd, value):
+        lo = ((value & 0xfff) ^ 0x800) - 0x800
+        if -2048 <= value < 2048:
+            self.emit(RISCV.enc_i(ADDI, rd, R_ZERO, value))
+        else:
+            self.emit(RISCV.enc_u(LUI, rd, (value - lo) & 0xfffff000))
+            if lo:
+                self.emit(RISCV.enc_i(ADDI, rd, rd, lo))
+
+    def alu(self, rd, srcs):
+        r = self.rng
+        kind = r.random()
+        if kind < 0.5:
+            self.emit(RISCV.enc_r(r.choice(ALU_R_OPS), rd, r.choice(srcs), r.choice(srcs)))
+        elif kind < 0.85:
+            self.emit(RISCV.enc_i(r.choice(ALU_I_OPS), rd, r.choice(srcs), r.randrange(-2048, 2048)))
+        else:
+            self.emit(RISCV.enc_i(r.choice(ALU_S_OPS), rd, r.choice(srcs), r.randrange(32)))
+
+
+    #----------------------------------------------------------------------
+    #   Loop body
+    #----------------------------------------------------------------------
+
+    def branch(self, ctr, free):
+        # Pick one of the realizable taken rates so that their mean
+        # over many branches approaches the requested bias
+        bias = self.p['bias']
+        hi = next(x for x in TAKEN_RATES if x >= bias)
+        lo = max(x for x in TAKEN_RATES if x <= bias)
+        rate = lo if hi == lo or self.rng.random() < (hi - bias) / (hi - lo) else hi
+
+        skip = self.rng.randint(1, 2)
+        offset = (skip + 1) * WORD_SIZE
+        if rate == 0.0:
+            self.emit(RISCV.enc_b(BNE, R_ZERO, R_ZERO, offset))
+        elif rate == 1.0:
+            self.emit(RISCV.enc_b(BEQ, R_ZERO, R_ZERO, offset))
+        else:
+            k = { 1/8: 3, 7/8: 3, 1/4: 2, 3/4: 2, 1/2: 1 }[rate]
+            self.emit(RISCV.enc_i(ANDI, R_TP, ctr, (1 << k) - 1))
+            op = BEQ if rate < 0.5 or (rate == 0.5 and self.rng.random() < 0.5) else BNE
+            self.emit(RISCV.enc_b(op, R_TP, R_ZERO, offset))
+
+        for _ in range(skip):
+            self.alu(self.rng.choice(free), free)
+
+    def body(self, ctr):
+        r = self.p
+        rng = self.rng
+        window = min(self.footprint, 2048)
+
+        pending = [ ]           # [ distance, reg ] for loads waiting for their use
+        pushed = 0              # pushes not yet matched by a pop
+        last = [ R_TEMP[0] ]    # recently written registers, to create forwarding
+
+        for _ in range(r['body']):
+            # Registers holding a load result stay untouched until their use
+            busy = [ reg for _, reg in pending ]
+            free = [ x for x in R_TEMP if x not in busy ]
+            recent = [ x for x in last if x not in busy ] or free
+
+            # Consume a loaded value once its distance has elapsed
+            if pending and pending[0][0] <= 0:
+                _, src = pending.pop(0)
+                rd = rng.choice(free)
+                self.emit(RISCV.enc_r(ADD, rd, src, rng.choice(recent)))
+                last = [ rd ] + last[:3]
+            else:
+                x = rng.random()
+                if x < r['branch']:
+                    self.branch(ctr, free)
+                elif x < r['branch'] + r['mem']:
+                    off = rng.randrange(0, window, WORD_SIZE)
+                    if rng.random() < 0.7 and len(free) > 1:
+                        rd = rng.choice(free)
+                        self.emit(RISCV.enc_i(LW, rd, R_PTR, off))
+                        pending.append([ r['loaduse'] + 1, rd ])
+                    else:
+                        self.emit(RISCV.enc_s(SW, R_PTR, rng.choice(free), off))
+                elif x < r['branch'] + r['mem'] + r['pushpop']:
+                    if pushed and rng.random() < 0.5:
+                        rd = rng.choice(free)
+                        self.emit(RISCV.enc_r(POP, rd, 0, 0))
+                        last = [ rd ] + last[:3]
+                        pushed -= 1
+                    else:
+                        self.emit(RISCV.enc_r(PUSH, 0, 0, rng.choice(recent)))
+                        pushed += 1
+                else:
+                    rd = rng.choice(free)
+                    self.alu(rd, recent if rng.random() < 0.5 else free)
+                    last = [ rd ] + last[:3]
+            for p in pending:
+                p[0] -= 1
+
+        # Drain outstanding loads and pops so that every iteration is balanced
+        for _, src in pending:
+            self.emit(RISCV.enc_r(ADD, src, src, src))
+        for _ in range(pushed):
+            self.emit(RISCV.enc_r(POP, 0, 0, 0))
+
+
+    #----------------------------------------------------------------------
+    #   Program
+    #----------------------------------------------------------------------
+
+    def trips(self):
+        depth = self.p['depth']
+        per_iter = self.p['body'] + 5
+        iters = max(1, self.p['count'] // per_iter)
+        t = max(1, int(round(iters ** (1.0 / depth))))
+        trips = [ t ] * (depth - 1)
+        outer = 1
+        for x in trips:
+            outer *= x
+        trips.append(max(1, -(-iters // outer)))
+        return trips
+
+    def generate(self):
+        self.text = [ ]
+        depth = self.p['depth']
+        trips = self.trips()
+
+        self.emit(RISCV.enc_u(LUI, R_SP, int(DMEM_START + DMEM_SIZE)))
+        self.emit(RISCV.enc_u(LUI, R_GP, int(DMEM_START)))
+        self.li(R_MASK, self.footprint - 1)
+        self.emit(RISCV.enc_i(ADDI, R_OFF, R_ZERO, 0))
+        self.emit(RISCV.enc_i(ADDI, R_PTR, R_GP, 0))
+        for reg in R_TEMP:
+            self.emit(RISCV.enc_i(ADDI, reg, R_ZERO, self.rng.randrange(-2048, 2048)))
+
+        heads = [ ]
+        for level in range(depth):
+            self.li(R_LOOP[level], trips[level])
+            heads.append(len(self.text))
+
+        ctr = R_LOOP[depth - 1]
+        self.body(ctr)
+        self.emit(RISCV.enc_i(ADDI, R_OFF, R_OFF, STRIDE))
+        self.emit(RISCV.enc_r(AND, R_OFF, R_OFF, R_MASK))
+        self.emit(RISCV.enc_r(ADD, R_PTR, R_GP, R_OFF))
+
+        for level in reversed(range(depth)):
+            self.emit(RISCV.enc_i(ADDI, R_LOOP[level], R_LOOP[level], -1))
+            offset = (heads[level] - len(self.text)) * WORD_SIZE
+            self.emit(RISCV.enc_b(BNE, R_LOOP[level], R_ZERO, offset))
+        self.emit(EBREAK)
+
+        text = b''.join(int(w).to_bytes(WORD_SIZE, 'little') for w in self.text)
+        if len(text) >= IMEM_SIZE:
+            raise ValueError("Generated text (%d bytes) does not fit in imem" % len(text))
+        data = bytes(self.rng.getrandbits(8) for _ in range(self.footprint))
+        return text, data
+
+    def save(self, filename):
+        text, data = self.generate()
+        Program.save(filename, IMEM_START, [ (int(IMEM_START), text, PF_R | PF_X),
+                                             (int(DMEM_START), data, PF_R | PF_W) ])
+        return len(text) // WORD_SIZE
+
+
+#--------------------------------------------------------------------------
+#   Utility functions for command line parsing
+#--------------------------------------------------------------------------
+
+OPTIONS = {
+    '-n'    : ('count',     int),
+    '-d'    : ('depth',     int),
+    '-k'    : ('body',      int),
+    '-b'    : ('branch',    float),
+    '-p'    : ('bias',      float),
+    '-m'    : ('mem',       float),
+    '-u'    : ('loaduse',   int),
+    '-s'    : ('pushpop',   float),
+    '-f'    : ('footprint', int),
+    '-r'    : ('seed',      int),
+}
+
+def show_usage(name):
+    print("Synthetic RV32I workload generator for SNURISC5")
+    print("Usage: %s [-t preset] [options] filename" % name)
+    print("\tfilename: output ELF file name")
+    print("\t-t preset: one of %s (default: mixed)" % ', '.join(PRESETS))
+    print("\t-n approximate dynamic instruction count (default: %d)" % Workload.DEFAULTS['count'])
+    print("\t-d loop nesting depth, 1-%d (default: %d)" % (MAX_DEPTH, Workload.DEFAULTS['depth']))
+    print("\t-k instruction slots in the innermost loop body (default: %d)" % Workload.DEFAULTS['body'])
+    print("\t-b branch density (default: %.2f)" % Workload.DEFAULTS['branch'])
+    print("\t-p branch taken bias (default: %.2f)" % Workload.DEFAULTS['bias'])
+    print("\t-m load/store density (default: %.2f)" % Workload.DEFAULTS['mem'])
+    print("\t-u load-use distance (default: %d)" % Workload.DEFAULTS['loaduse'])
+    print("\t-s push/pop frequency (default: %.2f)" % Workload.DEFAULTS['pushpop'])
+    print("\t-f memory footprint in bytes (default: %d)" % Workload.DEFAULTS['footprint'])
+    print("\t-r random seed (default: %d)" % Workload.DEFAULTS['seed'])
+
+
+def parse_args(args):
+    if len(args) < 2 or len(args) % 2 != 0:
+        return None, None
+
+    params = { }
+    preset = 'mixed'
+    index = 1
+    while index < len(args) - 1:
+        opt, val = args[index], args[index + 1]
+        if opt == '-t':
+            if val not in PRESETS:
+                print("Invalid preset '%s'" % val)
+                return None, None
+            preset = val
+        elif opt in OPTIONS:
+            key, conv = OPTIONS[opt]
+            try:
+                params[key] = conv(val)
+            except ValueError:
+                print("Invalid value '%s' for option '%s'" % (val, opt))
+                return None, None
+        else:
+            print("Invalid option '%s'" % opt)
+            return None, None
+        index += 2
+
+    return args[index], dict(PRESETS[preset], **params)
+
+
+def main():
+
+    filename, params = parse_args(sys.argv)
+    if not filename:
+        show_usage(sys.argv[0])
+        sys.exit()
+
+    try:
+        w = Workload(**params)
+        n = w.save(filename)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    print("%s: %d instructions, trip counts %s, footprint %d bytes" % \
+          (filename, n, w.trips(), w.footprint))
+
+
+if __name__ == '__main__':
+    main()